@@ -28,7 +28,7 @@ async def decide(req: DecideRequest):
     try:
         # 并行调用 Task 1（环境）和 Task 2（广告）
         context_task = asyncio.create_task(get_current_context(req.location_id))
-        ads = fetch_available_ads(None)
+        ads = await fetch_available_ads(None)
         context = await context_task
 
         if not context:
@@ -43,7 +43,7 @@ async def decide(req: DecideRequest):
             raise HTTPException(status_code=500, detail="AI 决策失败")
 
         # 获取完整广告素材（不传 db 避免 generator throw 问题）
-        ad_content = get_ad_by_id(result.selected_ad_id, None)
+        ad_content = await get_ad_by_id(result.selected_ad_id, None)
 
         # 若请求了推送，执行推送到设备
         push_success = None
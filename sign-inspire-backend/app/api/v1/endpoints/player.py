@@ -0,0 +1,54 @@
+"""
+Player 聚合接口：城市模式一次请求拿到轮播所需的全部内容
+"""
+import asyncio
+from typing import Optional
+from fastapi import APIRouter
+
+from app.services.recommendation_service import get_current_recommended_stores
+from app.services.media_service import get_image_urls
+
+router = APIRouter(tags=["player"])
+
+# 商家无图且品类图也取不到时的兜底品类（与 Player 原逻辑一致）
+FALLBACK_TARGET = "coffee_ad"
+
+
+@router.get("/player/slides")
+async def get_player_slides(
+    city: str = "Adelaide",
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+    target_id: Optional[str] = None,
+    limit: int = 15,
+):
+    """
+    城市模式轮播：推荐目标 + 推送文案 + 门店卡片（含照片）+ 品类图，一次返回
+    替代 Player 先调 /recommendations 再逐个调 /stores/.../media/{target_id} 的串行请求：
+    - 推荐与品类图并发获取（推荐、图片均走已有缓存）
+    - slides 为可直接轮播的图片 URL 列表：商家照片优先，无照片时用品类图，再兜底 coffee_ad
+    """
+    target_id = target_id.strip() if target_id else None
+    # 品类图不依赖推荐结果的部分先并发解析，推荐结束后通常已在缓存中
+    prefetch = {FALLBACK_TARGET} | ({target_id} if target_id else set())
+    rec, prefetched = await asyncio.gather(
+        get_current_recommended_stores(limit=min(limit, 20), city=city.strip(), lat=lat, lon=lon, target_id=target_id),
+        get_image_urls(prefetch),
+    )
+
+    resolved_target = rec.get("target_id") or "default"
+    media = dict(prefetched)
+    if resolved_target not in media:
+        media.update(await get_image_urls({resolved_target}))
+    category_image_url = media.get(resolved_target)
+
+    slides = [url for store in rec.get("stores") or [] for url in store.get("photos") or []]
+    if not slides:
+        slides = [u for u in (category_image_url, media.get(FALLBACK_TARGET)) if u][:1]
+
+    return {
+        **rec,
+        "target_id": resolved_target,
+        "category_image_url": category_image_url,
+        "slides": slides,
+    }
@@ -1,283 +1,262 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, Query, Header, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from app.schemas.rule import RuleCreate, RuleUpdate
+from app.schemas.playlist import CurrentContentBatchRequest, MAX_BATCH_IDS
+from app.api.v1.http_cache import etag_matches
+from app.api.v1.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, encode_cursor, page_after
 from app.services.llm_service import parse_rule_with_langchain
-from app.services import scheduler_service
-from app.database import get_db, get_db_optional, USE_DATABASE
-from app.models.rule_model import Rule
-from app.models.rule_storage import MOCK_DB
+from app.services import scheduler_service, rule_repository, rule_templates
+from app.database_async import get_async_db_optional
+from app.models.rule_model import rule_content_hash
+from app.models.rule_storage import MOCK_DB, DuplicateRuleError
 import uuid
 import asyncio
+import hashlib
+import json
+import logging
+from app.logging_config import get_logger, log_sampled
+
+logger = get_logger("api")
 
 router = APIRouter()
 
 @router.post("/stores/{store_id}/rules:parse", response_model=RuleCreate)
-async def parse_rule(store_id: str, text: str, db: Optional[Session] = Depends(get_db_optional)):
+async def parse_rule(store_id: str, text: str):
     """
     接收自然语言 -> 使用动态词汇表解析（新词自动创建）-> 返回 JSON 规则
     """
     try:
-        rule_result = await parse_rule_with_langchain(text, store_id, db)
+        rule_result = await parse_rule_with_langchain(text, store_id)
         return rule_result
     except Exception as e:
-        print(f"❌ 规则解析失败: {e}")
+        logger.error(f"❌ 规则解析失败: {e}")
         raise HTTPException(status_code=500, detail=f"规则解析失败: {str(e)}")
 
 @router.post("/stores/{store_id}/rules")
-async def create_rule(store_id: str, rule: RuleCreate, db: Optional[Session] = Depends(get_db_optional)):
+async def create_rule(store_id: str, rule: RuleCreate, db: Optional[AsyncSession] = Depends(get_async_db_optional)):
     """
     创建规则：生成随机ID，存入数据库或内存，返回保存后的对象
+    同一门店内条件与动作相同（内容哈希相同）的规则视为重复，直接返回已有规则
     """
     # 生成随机ID
     rule_id = str(uuid.uuid4())
     
-    # 将规则转换为字典
+    # 将规则转换为字典（条件、动作均为普通字典，用于 JSON 序列化）
     rule_dict = rule.model_dump()
     rule_dict["id"] = rule_id
     rule_dict["store_id"] = store_id
+    rule_dict["content_hash"] = rule_content_hash(rule_dict["conditions"], rule_dict["action"])
     
-    if USE_DATABASE and db is not None:
+    if db is not None:
         try:
-            # 检查是否已存在相同的规则（根据名称和条件判断）
-            existing_rules = db.query(Rule).filter(
-                Rule.store_id == store_id,
-                Rule.name == rule.name
-            ).all()
-            
-            # 检查条件是否相同
-            conditions_dict = [c.model_dump() if hasattr(c, 'model_dump') else c for c in rule.conditions]
-            action_dict = rule.action.model_dump() if hasattr(rule.action, 'model_dump') else rule.action
+            # 去重：规则仓库按 (store_id, content_hash) 一次探测；并发重复由数据库唯一约束兜底
+            await rule_repository.ensure_fresh(db)
+            existing_rule = rule_repository.find_by_content(store_id, rule_dict["content_hash"])
+            if existing_rule is not None:
+                logger.warning(f"⚠️ 规则已存在，跳过保存: {rule.name}")
+                return existing_rule
             
-            for existing_rule in existing_rules:
-                existing_conditions = existing_rule.conditions
-                existing_action = existing_rule.action
-                
-                # 比较条件（转换为字典后比较）
-                if (existing_conditions == conditions_dict and 
-                    existing_action == action_dict):
-                    print(f"⚠️ 规则已存在，跳过保存: {rule.name}")
-                    return existing_rule.to_dict()
+            # 保存到数据库（写穿透：同时更新规则仓库）
+            rule_dict = await rule_repository.add_rule(db, rule_dict)
+            logger.info(f"💾 [DB] 保存规则到数据库: {rule_dict}")
             
-            # 将 Pydantic 模型转换为字典（用于 JSON 序列化）
-            conditions_json = [c.model_dump() if hasattr(c, 'model_dump') else c for c in rule.conditions]
-            action_json = rule.action.model_dump() if hasattr(rule.action, 'model_dump') else rule.action
-            
-            # 保存到数据库
-            db_rule = Rule(
-                id=rule_id,
-                store_id=store_id,
-                name=rule.name,
-                priority=rule.priority,
-                conditions=conditions_json,  # 使用字典而不是 Pydantic 对象
-                action=action_json  # 使用字典而不是 Pydantic 对象
-            )
-            db.add(db_rule)
-            db.commit()
-            db.refresh(db_rule)
-            rule_dict = db_rule.to_dict()
-            print(f"💾 [DB] 保存规则到数据库: {rule_dict}")
-            
-            rule_count = db.query(Rule).filter(Rule.store_id == store_id).count()
-            print(f"📊 [DB] 门店 {store_id} 共有 {rule_count} 条规则")
+            rule_count = len(rule_repository.rules_for_stores([store_id]))
+            logger.info(f"📊 [DB] 门店 {store_id} 共有 {rule_count} 条规则")
             
             # 保存后立即触发规则检查，无需等待后台任务
             asyncio.create_task(scheduler_service.check_rules_job())
-            print("⚡ [API] 已触发立即规则检查")
+            logger.info("⚡ [API] 已触发立即规则检查")
+            return rule_dict
         except Exception as e:
-            import traceback
-            print(f"⚠️ 数据库保存失败，使用内存数据库: {e}")
-            print(traceback.format_exc())
-            # 检查内存数据库中是否已存在
-            existing_in_memory = [r for r in MOCK_DB 
-                                 if r.get("store_id") == store_id 
-                                 and r.get("name") == rule.name
-                                 and r.get("conditions") == rule_dict.get("conditions")
-                                 and r.get("action") == rule_dict.get("action")]
-            if existing_in_memory:
-                print(f"⚠️ 内存数据库中规则已存在，跳过保存")
-                return existing_in_memory[0]
-            MOCK_DB.append(rule_dict)
-            print(f"💾 [Memory] 保存规则到内存: {rule_dict}")
-            print(f"📊 [Memory] 当前 MOCK_DB 中共有 {len(MOCK_DB)} 条规则")
-            
-            # 保存后立即触发规则检查
-            asyncio.create_task(scheduler_service.check_rules_job())
-            print("⚡ [API] 已触发立即规则检查")
-    else:
-        # 降级到内存数据库
-        # 检查是否已存在相同的规则
-        existing_in_memory = [r for r in MOCK_DB 
-                             if r.get("store_id") == store_id 
-                             and r.get("name") == rule.name
-                             and r.get("conditions") == rule_dict.get("conditions")
-                             and r.get("action") == rule_dict.get("action")]
-        if existing_in_memory:
-            print(f"⚠️ 内存数据库中规则已存在，跳过保存")
-            return existing_in_memory[0]
-        
-        MOCK_DB.append(rule_dict)
-        print(f"💾 [Memory] 保存规则到内存: {rule_dict}")
-        print(f"📊 [Memory] 当前 MOCK_DB 中共有 {len(MOCK_DB)} 条规则")
-        
-        # 保存后立即触发规则检查
-        asyncio.create_task(scheduler_service.check_rules_job())
-        print("⚡ [API] 已触发立即规则检查")
+            logger.warning(f"⚠️ 数据库保存失败，使用内存数据库: {e}", exc_info=True)
+    
+    # 内存数据库（数据库未启用或写入失败时降级）
+    existing_in_memory = MOCK_DB.find_by_content(store_id, rule_dict["content_hash"])
+    if existing_in_memory:
+        logger.warning(f"⚠️ 内存数据库中规则已存在，跳过保存")
+        return existing_in_memory
     
+    rule_dict = MOCK_DB.add_rule(rule_dict)
+    logger.info(f"💾 [Memory] 保存规则到内存: {rule_dict}")
+    logger.info(f"📊 [Memory] 当前 MOCK_DB 中共有 {len(MOCK_DB)} 条规则")
+    
+    # 保存后立即触发规则检查
+    asyncio.create_task(scheduler_service.check_rules_job())
+    logger.info("⚡ [API] 已触发立即规则检查")
     return rule_dict
 
+async def _override_inherited(store_id: str, rule_id: str, update_data: dict, db: Optional[AsyncSession]):
+    """
+    修改门店继承的模板规则：复制为门店自有规则（应用修改）并在门店屏蔽原规则，模板与其他门店不受影响
+    不是继承规则时返回 None；门店内已有同内容规则时抛 DuplicateRuleError
+    """
+    if db is not None:
+        await rule_repository.ensure_fresh(db)
+    source = rule_repository if db is not None else MOCK_DB
+    inherited = rule_templates.inherited_rule(source, await rule_templates.get_subscription(store_id, db), rule_id)
+    if inherited is None:
+        return None
+    values = {k: inherited[k] for k in ("name", "priority", "conditions", "action")}
+    values.update({k: v for k, v in update_data.items() if k in values})
+    values.update(id=str(uuid.uuid4()), store_id=store_id)
+    values["content_hash"] = rule_content_hash(values["conditions"], values["action"])
+    if source.find_by_content(store_id, values["content_hash"]) is not None:
+        raise DuplicateRuleError(values["content_hash"])
+    rule = await rule_repository.add_rule(db, values) if db is not None else MOCK_DB.add_rule(values)
+    await rule_templates.disable_rules(db, store_id, [rule_id])
+    logger.info(f"✏️ 门店 {store_id} 覆盖模板规则 {rule_id} -> {rule['id']}")
+    return rule
+
+
 @router.patch("/stores/{store_id}/rules/{rule_id}")
 async def update_rule(
     store_id: str,
     rule_id: str,
     update: RuleUpdate,
-    db: Optional[Session] = Depends(get_db_optional),
+    db: Optional[AsyncSession] = Depends(get_async_db_optional),
 ):
     """
     更新规则（支持部分更新，如修改优先级）
     """
-    if USE_DATABASE and db is not None:
+    if db is not None:
         try:
-            db_rule = db.query(Rule).filter(
-                Rule.id == rule_id,
-                Rule.store_id == store_id,
-            ).first()
-            if not db_rule:
-                raise HTTPException(status_code=404, detail="规则不存在")
             update_data = update.model_dump(exclude_unset=True)
-            for key, value in update_data.items():
-                if hasattr(db_rule, key):
-                    setattr(db_rule, key, value)
-            db.commit()
-            db.refresh(db_rule)
-            print(f"✏️ [DB] 更新规则: {rule_id}, 更新内容: {update_data}")
+            updated = await rule_repository.update_rule(db, store_id, rule_id, update_data)
+            if updated is None:
+                updated = await _override_inherited(store_id, rule_id, update_data, db)
+            if updated is None:
+                raise HTTPException(status_code=404, detail="规则不存在")
+            logger.info(f"✏️ [DB] 更新规则: {rule_id}, 更新内容: {update_data}")
             asyncio.create_task(scheduler_service.check_rules_job())
-            return db_rule.to_dict()
+            return updated
         except HTTPException:
             raise
+        except (IntegrityError, DuplicateRuleError):
+            raise HTTPException(status_code=409, detail="门店内已存在条件与动作相同的规则")
         except Exception as e:
-            print(f"⚠️ 数据库更新失败: {e}")
+            logger.warning(f"⚠️ 数据库更新失败: {e}")
             raise HTTPException(status_code=500, detail=str(e))
 
     # 内存数据库
-    idx = next((i for i, r in enumerate(MOCK_DB) if r.get("id") == rule_id and r.get("store_id") == store_id), None)
-    if idx is None:
+    try:
+        update_data = update.model_dump(exclude_unset=True)
+        updated = MOCK_DB.update_rule(store_id, rule_id, update_data)
+        if updated is None:
+            updated = await _override_inherited(store_id, rule_id, update_data, None)
+    except DuplicateRuleError:
+        raise HTTPException(status_code=409, detail="门店内已存在条件与动作相同的规则")
+    if updated is None:
         raise HTTPException(status_code=404, detail="规则不存在")
-    update_data = update.model_dump(exclude_unset=True)
-    for key, value in update_data.items():
-        if key in MOCK_DB[idx]:
-            MOCK_DB[idx][key] = value
-    print(f"✏️ [Memory] 更新规则: {rule_id}")
+    logger.info(f"✏️ [Memory] 更新规则: {rule_id}")
     asyncio.create_task(scheduler_service.check_rules_job())
-    return MOCK_DB[idx]
+    return updated
 
 
 @router.post("/stores/{store_id}/rules:reset")
 async def reset_rules(
     store_id: str,
-    db: Optional[Session] = Depends(get_db_optional),
+    db: Optional[AsyncSession] = Depends(get_async_db_optional),
 ):
     """
-    清空规则并恢复为默认全球规则种子（澳洲+中国城市）
+    清空门店自有规则并恢复为默认全球规则（澳洲+中国城市）：
+    门店改为订阅 default 模板、清空屏蔽列表，不再复制默认规则；
+    store_id 为 template:default 时把该模板恢复为种子规则。其他模板没有种子数据，
+    重置会清空模板、所有订阅门店随之失去规则，返回 409
     """
-    if USE_DATABASE and db is not None:
+    is_template = rule_templates.is_template_scope(store_id)
+    if is_template and store_id != rule_templates.template_scope(rule_templates.DEFAULT_TEMPLATE):
+        raise HTTPException(status_code=409, detail="该模板没有种子规则，无法重置；请逐条删除或修改模板规则")
+    done = "已恢复 default 模板种子规则" if is_template else "订阅默认模板"
+    if db is not None:
         try:
-            deleted = db.query(Rule).filter(Rule.store_id == store_id).delete()
-            db.commit()
-            from app.database import _seed_rules_if_empty, engine
+            if not is_template and not await rule_templates.subscribe(db, store_id, rule_templates.DEFAULT_TEMPLATE):
+                raise HTTPException(status_code=404, detail="门店不存在")
+            deleted = await rule_repository.delete_store_rules(db, store_id)
+            from app.database import _seed_rule_templates, engine
             if engine:
-                _seed_rules_if_empty(engine)
-            print(f"🔄 [DB] 已重置规则，删除 {deleted} 条，并重新写入默认种子")
+                # 模板缺失时补写种子（同步引擎，放到线程中执行）；之后重载规则仓库
+                await asyncio.to_thread(_seed_rule_templates, engine)
+                await rule_repository.ensure_fresh(db, force=True)
+            logger.info(f"🔄 [DB] 已重置 {store_id} 规则，删除 {deleted} 条，{done}")
             asyncio.create_task(scheduler_service.check_rules_job())
             return {"status": "success", "message": "规则已恢复为默认"}
+        except HTTPException:
+            raise
         except Exception as e:
-            import traceback
-            print(f"⚠️ 重置规则失败: {e}\n{traceback.format_exc()}")
+            logger.warning(f"⚠️ 重置规则失败: {e}", exc_info=True)
             raise HTTPException(status_code=500, detail=str(e))
 
     # 内存模式：清空后写入默认种子
-    before = len(MOCK_DB)
-    for i in range(len(MOCK_DB) - 1, -1, -1):
-        if MOCK_DB[i].get("store_id") == store_id:
-            del MOCK_DB[i]
+    deleted = MOCK_DB.delete_store_rules(store_id)
     from app.database import _seed_rules_to_mock_db
     _seed_rules_to_mock_db(store_id)
-    print(f"🔄 [Memory] 已重置规则，清空 {before - len(MOCK_DB)} 条并写入默认种子")
+    logger.info(f"🔄 [Memory] 已重置 {store_id} 规则，清空 {deleted} 条，{done}")
     asyncio.create_task(scheduler_service.check_rules_job())
     return {"status": "success", "message": "规则已恢复为默认"}
 
 
+async def _disable_inherited(store_id: str, rule_id: str, db: Optional[AsyncSession]) -> bool:
+    """删除门店继承的模板规则 = 在门店屏蔽列表中加入该规则（模板本身不变），不是继承规则返回 False"""
+    if db is not None:
+        await rule_repository.ensure_fresh(db)
+    source = rule_repository if db is not None else MOCK_DB
+    if rule_templates.inherited_rule(source, await rule_templates.get_subscription(store_id, db), rule_id) is None:
+        return False
+    return await rule_templates.disable_rules(db, store_id, [rule_id])
+
+
 @router.delete("/stores/{store_id}/rules/{rule_id}")
 async def delete_rule(
     store_id: str,
     rule_id: str,
-    db: Optional[Session] = Depends(get_db_optional),
+    db: Optional[AsyncSession] = Depends(get_async_db_optional),
 ):
     """
     删除规则
     """
-    if USE_DATABASE and db is not None:
+    if db is not None:
         try:
-            db_rule = db.query(Rule).filter(
-                Rule.id == rule_id,
-                Rule.store_id == store_id,
-            ).first()
-            if not db_rule:
-                raise HTTPException(status_code=404, detail="规则不存在")
-            db.delete(db_rule)
-            db.commit()
-            print(f"🗑️ [DB] 删除规则: {rule_id}")
+            if not await rule_repository.delete_rule(db, store_id, rule_id):
+                if not await _disable_inherited(store_id, rule_id, db):
+                    raise HTTPException(status_code=404, detail="规则不存在")
+            logger.info(f"🗑️ [DB] 删除规则: {rule_id}")
             asyncio.create_task(scheduler_service.check_rules_job())
             return {"status": "success", "deleted_id": rule_id}
         except HTTPException:
             raise
         except Exception as e:
-            print(f"⚠️ 数据库删除失败: {e}")
+            logger.warning(f"⚠️ 数据库删除失败: {e}")
             raise HTTPException(status_code=500, detail=str(e))
 
     # 内存数据库
-    idx = next((i for i, r in enumerate(MOCK_DB) if r.get("id") == rule_id and r.get("store_id") == store_id), None)
-    if idx is None:
+    if not MOCK_DB.delete_rule(store_id, rule_id) and not await _disable_inherited(store_id, rule_id, None):
         raise HTTPException(status_code=404, detail="规则不存在")
-    del MOCK_DB[idx]
-    print(f"🗑️ [Memory] 删除规则: {rule_id}")
+    logger.info(f"🗑️ [Memory] 删除规则: {rule_id}")
     asyncio.create_task(scheduler_service.check_rules_job())
     return {"status": "success", "deleted_id": rule_id}
 
 
-@router.get("/stores/{store_id}/rules")
-async def get_rules(
-    store_id: str,
-    city: Optional[str] = None,
-    db: Optional[Session] = Depends(get_db_optional),
-):
-    """
-    获取指定门店的所有规则列表
-    city: 可选，传入时根据该城市天气+文化圈计算每条规则是否适用当前上下文，返回 matches_current
-    """
-    raw_rules = []
-    if USE_DATABASE and db is not None:
-        try:
-            rules = db.query(Rule).filter(Rule.store_id == store_id).all()
-            raw_rules = [rule.to_dict() for rule in rules]
-        except Exception as e:
-            print(f"⚠️ 数据库查询失败，使用内存数据库: {e}")
-            raw_rules = [r for r in MOCK_DB if r.get("store_id") == store_id]
-    else:
-        raw_rules = [r for r in MOCK_DB if r.get("store_id") == store_id]
+def _rule_matches_filters(rule: dict, target: Optional[str], condition_type: Optional[str]) -> bool:
+    """规则列表过滤：按动作 target_id、按包含的条件类型"""
+    if target and (rule.get("action") or {}).get("target_id") != target:
+        return False
+    if condition_type and not any(c.get("type") == condition_type for c in rule.get("conditions") or []):
+        return False
+    return True
 
-    if not city or not raw_rules:
-        return raw_rules if not city else {"rules": raw_rules, "context": None}
 
-    # 根据 city 计算每条规则是否匹配当前上下文
+async def _current_context(city: str):
+    """city 当前的天气 + 文化圈上下文（展示用字典），无法解析或失败返回 None"""
     try:
         from app.services.geocoding_service import geocode_city_sync
         from app.services.scheduler_service import get_weather_context
         from app.services.region_service import get_region_from_country
-        from app.services.matching_engine import _conditions_match
         geo = geocode_city_sync(city)
         if not geo:
-            return raw_rules
+            return None
         lat, lon = geo.get("lat"), geo.get("lon")
         country_code = geo.get("country_code")
         region = get_region_from_country(country_code)
@@ -298,61 +277,215 @@ async def get_rules(
         hour = ctx.get("hour") if ctx else None
         weekday = ctx.get("weekday") if ctx else None
         season = ctx.get("season") if ctx else None
-
-        result = []
-        for r in raw_rules:
-            d = dict(r)
-            conds = r.get("conditions") or []
-            d["matches_current"] = _conditions_match(conds, weather, city_display or city, temp_c=temp_c, region=region, hour=hour, weekday=weekday, china_subregion=china_subregion, solar_terms=solar_terms)
-            result.append(d)
-        return {"rules": result, "context": {"weather": weather, "temp_c": temp_c, "region": region, "city": city_display or city, "hour": hour, "weekday": weekday, "season": season, "china_subregion": china_subregion, "solar_terms": solar_terms}}
+        return {"weather": weather, "temp_c": temp_c, "region": region, "city": city_display or city, "hour": hour, "weekday": weekday, "season": season, "china_subregion": china_subregion, "solar_terms": solar_terms}
     except Exception as e:
-        print(f"⚠️ 计算 matches_current 失败: {e}")
-        return raw_rules
+        logger.warning(f"⚠️ 计算 matches_current 失败: {e}")
+        return None
 
-@router.get("/debug/current-state")
-async def debug_current_state(db: Optional[Session] = Depends(get_db_optional)):
+
+def _match_context(context: dict) -> dict:
+    """展示用上下文 -> 求值上下文"""
+    from app.services.matching_engine import build_match_context
+    return build_match_context(
+        context["weather"], context["city"], context["temp_c"], context["region"], context["hour"],
+        context["weekday"], context["china_subregion"], context["solar_terms"],
+    )
+
+
+def _annotate(raw_rules: list, context: dict) -> list:
+    """每条规则附加 matches_current（返回副本，不修改仓库中的共享字典）"""
+    from app.services.rule_evaluator import compile_conditions, evaluate_conditions
+    from app.services.scheduler_service import normalize_weather_value
+    ctx = _match_context(context)
+    result = []
+    for r in raw_rules:
+        d = dict(r)
+        d["matches_current"] = evaluate_conditions(compile_conditions(r.get("conditions"), normalize_weather_value), ctx)
+        result.append(d)
+    return result
+
+
+def _matching(rules: list, context: dict) -> list:
+    """只保留适用当前上下文的规则（附 matches_current）"""
+    return [r for r in _annotate(rules, context) if r["matches_current"]]
+
+
+def _rule_cursor(cursor: str) -> tuple:
+    """规则列表游标 -> 分页排序键 (-priority, id)，格式不符时返回 400"""
+    key = decode_cursor(cursor, 2)
+    if not isinstance(key[0], int) or isinstance(key[0], bool) or not isinstance(key[1], str):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+    return key
+
+
+async def _query_rules(db, store_id, subscription, context, target, condition_type, after, size):
+    """
+    数据库模式：SQL 查询门店规则，返回 (规则, next 游标)
+    context 给定时只返回适用的规则（先经 rule_conditions 预筛选，再对候选求值）；size 给定时取 after 之后一页
+    """
+    from app.services.rule_prefilter import query_store_rules
+    ctx = _match_context(context) if context else None
+    if size is None:
+        rules = await query_store_rules(db, store_id, subscription, ctx, target, condition_type)
+        return (_matching(rules, context) if context else rules), None
+    # 多取一条判断是否有下一页；候选规则求值后不足一页时继续往后取
+    found = []
+    while len(found) <= size:
+        chunk = await query_store_rules(db, store_id, subscription, ctx, target, condition_type, after, size + 1)
+        found.extend(_matching(chunk, context) if context else chunk)
+        if len(chunk) <= size:
+            break
+        after = rule_repository.page_order_key(chunk[-1])
+    page = found[:size]
+    return page, encode_cursor(rule_repository.page_order_key(page[-1])) if len(found) > size else None
+
+
+@router.get("/stores/{store_id}/rules")
+async def get_rules(
+    store_id: str,
+    city: Optional[str] = None,
+    target: Optional[str] = None,
+    condition_type: Optional[str] = None,
+    matches_only: bool = False,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Optional[AsyncSession] = Depends(get_async_db_optional),
+):
     """
-    调试接口：查看当前状态
+    获取指定门店的规则列表（按优先级降序，同优先级按 id）：自有规则 + 继承的模板规则（带 "template": 模板名）
+    city: 可选，传入时根据该城市天气+文化圈计算每条规则是否适用当前上下文，返回 matches_current
+    matches_only: 与 city 同用，只返回适用当前上下文的规则
+    target / condition_type: 可选，按动作 target_id / 条件类型过滤
+    limit / cursor: 传入任一时按 (priority, id) 键集分页，返回 {"items", "next"}（next 为下一页游标，末页为 null）；
+    不传时保持原返回格式（全部规则）
+    数据库模式直接由 SQL 查询门店作用域内的规则（不经规则仓库全量副本），过滤与分页均在 SQL 中完成；
+    matches_only 时先经 rule_conditions 排除必不命中的规则，只加载、求值候选规则
     """
-    if USE_DATABASE and db is not None:
+    context = await _current_context(city) if city and matches_only else None
+    paginated = limit is not None or cursor is not None
+    size = limit or DEFAULT_PAGE_SIZE
+    after = _rule_cursor(cursor) if cursor else None
+    raw_rules = None
+    next_cursor = None
+    if db is not None:
         try:
-            total_rules = db.query(Rule).count()
-            store_001_rules = db.query(Rule).filter(Rule.store_id == "store_001").all()
-            all_rules = db.query(Rule).all()
-            return {
-                "current_playlist": scheduler_service.CURRENT_PLAYLIST,
-                "current_weather": scheduler_service.CURRENT_CONTEXT.get("weather"),
-                "weather_updated_at": scheduler_service.CURRENT_CONTEXT.get("updated_at"),
-                "database_mode": "MySQL",
-                "total_rules": total_rules,
-                "rules": [rule.to_dict() for rule in all_rules],
-                "store_001_rules": [rule.to_dict() for rule in store_001_rules]
-            }
+            subscription = await rule_templates.get_subscription(store_id, db)
+            raw_rules, next_cursor = await _query_rules(
+                db, store_id, subscription, context, target, condition_type, after, size if paginated else None
+            )
         except Exception as e:
-            print(f"⚠️ 数据库查询失败: {e}")
-            return {
-                "current_playlist": scheduler_service.CURRENT_PLAYLIST,
-                "current_weather": scheduler_service.CURRENT_CONTEXT.get("weather"),
-                "weather_updated_at": scheduler_service.CURRENT_CONTEXT.get("updated_at"),
-                "database_mode": "Memory (fallback)",
-                "total_rules": len(MOCK_DB),
-                "rules": MOCK_DB,
-                "store_001_rules": [rule for rule in MOCK_DB if rule.get("store_id") == "store_001"]
-            }
+            logger.warning(f"⚠️ 数据库查询失败，使用内存数据库: {e}")
+    if raw_rules is None:
+        subscription = rule_templates.memory_subscription(store_id) or (None, frozenset())
+        ordered = rule_templates.effective_rules(MOCK_DB, store_id, subscription)
+        if target or condition_type:
+            ordered = [r for r in ordered if _rule_matches_filters(r, target, condition_type)]
+        if context:
+            ordered = _matching(ordered, context)
+        if paginated:
+            raw_rules, next_cursor = page_after(ordered, rule_repository.page_order_key, size, cursor)
+        else:
+            raw_rules = ordered
+
+    if city and not matches_only:
+        context = await _current_context(city) if raw_rules else None
+
+    annotated = context is not None and (bool(raw_rules) or matches_only)
+    if annotated:
+        # matches_only 时已在分页前求值
+        rules = raw_rules if matches_only else _annotate(raw_rules, context)
     else:
-        return {
-            "current_playlist": scheduler_service.CURRENT_PLAYLIST,
-            "current_weather": scheduler_service.CURRENT_CONTEXT.get("weather"),
-            "weather_updated_at": scheduler_service.CURRENT_CONTEXT.get("updated_at"),
-            "database_mode": "Memory",
-            "total_rules": len(MOCK_DB),
-            "rules": MOCK_DB,
-            "store_001_rules": [rule for rule in MOCK_DB if rule.get("store_id") == "store_001"]
-        }
+        rules, context = raw_rules, None
+    if paginated:
+        page = {"items": rules, "next": next_cursor}
+        if city:
+            page["context"] = context
+        return page
+    if not city:
+        return rules
+    # 保持原有行为：有规则但城市无法解析或计算失败时返回纯列表
+    return {"rules": rules, "context": context} if annotated or not raw_rules else rules
+
+@router.get("/rule-templates")
+async def list_rule_templates(db: Optional[AsyncSession] = Depends(get_async_db_optional)):
+    """
+    共享规则模板列表；模板规则通过 /stores/template:<名称>/rules 增删改，
+    门店通过 PATCH /stores/{store_id} 的 rule_template / disabled_rules 订阅与屏蔽
+    """
+    source = rule_repository if db is not None and await rule_repository.ensure_fresh(db) else MOCK_DB
+    return rule_templates.list_templates(source)
+
+@router.post("/rules:import")
+async def import_rules(request: Request, db: Optional[AsyncSession] = Depends(get_async_db_optional)):
+    """
+    批量导入规则（NDJSON，每行一条，需带 store_id，可跨多个门店）
+    逐行校验与去重，分批事务插入，全部完成后只触发一次规则检查；返回导入/重复/失败计数与出错行
+    """
+    from app.services.rule_transfer_service import import_rules as do_import
+    return await do_import(request.stream(), db)
+
+
+@router.get("/rules:export")
+async def export_rules(store_id: Optional[str] = None):
+    """导出规则为 NDJSON（流式，store_id 可选），输出可直接用于 /rules:import"""
+    from app.services.rule_transfer_service import export_rules as do_export
+    return StreamingResponse(do_export(store_id), media_type="application/x-ndjson")
+
+
+@router.get("/debug/current-state")
+async def debug_current_state(
+    store_id: str = "store_001",
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Optional[AsyncSession] = Depends(get_async_db_optional),
+):
+    """
+    调试接口：查看当前状态（db_pool 为连接池检出统计）
+    rules 为 store_id 门店的规则（自有 + 继承的模板规则，与 GET /stores/{store_id}/rules 一致），
+    按 (priority, id) 键集分页，next 为下一页游标；store_rule_count 为这些规则的总数
+    """
+    from app.db_pool import pool_status
+    state = {
+        "current_playlist": scheduler_service.CURRENT_PLAYLIST,
+        "current_weather": scheduler_service.CURRENT_CONTEXT.get("weather"),
+        "weather_updated_at": scheduler_service.CURRENT_CONTEXT.get("updated_at"),
+        "db_pool": pool_status(),
+        "database_mode": "Memory",
+    }
+    after = _rule_cursor(cursor) if cursor else None
+    rules = None
+    if db is not None:
+        try:
+            from sqlalchemy import func, select
+            from app.database import DATABASE_URL
+            from app.db_sqlite import backend_name
+            from app.models.rule_model import Rule
+            from app.services.rule_prefilter import count_store_rules
+            subscription = await rule_templates.get_subscription(store_id, db)
+            total_rules = (await db.execute(select(func.count()).select_from(Rule))).scalar_one()
+            store_rule_count = await count_store_rules(db, store_id, subscription)
+            rules, next_cursor = await _query_rules(db, store_id, subscription, None, None, None, after, limit)
+            state["database_mode"] = backend_name(DATABASE_URL)
+        except Exception as e:
+            logger.warning(f"⚠️ 数据库查询失败: {e}")
+            state["database_mode"] = "Memory (fallback)"
+            rules = None
+    if rules is None:
+        subscription = rule_templates.memory_subscription(store_id) or (None, frozenset())
+        ordered = rule_templates.effective_rules(MOCK_DB, store_id, subscription)
+        total_rules, store_rule_count = len(MOCK_DB), len(ordered)
+        rules, next_cursor = page_after(ordered, rule_repository.page_order_key, limit, cursor)
+    return {
+        **state,
+        "total_rules": total_rules,
+        "store_id": store_id,
+        "store_rule_count": store_rule_count,
+        "rules": rules,
+        "next": next_cursor,
+    }
 
 @router.post("/debug/add-test-rule")
-async def add_test_rule(db: Optional[Session] = Depends(get_db_optional)):
+async def add_test_rule(db: Optional[AsyncSession] = Depends(get_async_db_optional)):
     """
     调试接口：添加一个测试规则（用于快速测试）
     """
@@ -373,26 +506,23 @@ async def add_test_rule(db: Optional[Session] = Depends(get_db_optional)):
             "target_id": "coffee_ads"
         }
     }
+    rule_dict["content_hash"] = rule_content_hash(rule_dict["conditions"], rule_dict["action"])
     
-    if USE_DATABASE and db is not None:
+    if db is not None:
         try:
-            test_rule = Rule(**rule_dict)
-            db.add(test_rule)
-            db.commit()
-            db.refresh(test_rule)
-            rule_dict = test_rule.to_dict()
-            print(f"🧪 [DEBUG] 添加测试规则到数据库: {rule_dict}")
-            rule_count = db.query(Rule).count()
-            print(f"📊 [DB] 数据库中共有 {rule_count} 条规则")
+            rule_dict = await rule_repository.add_rule(db, rule_dict)
+            logger.info(f"🧪 [DEBUG] 添加测试规则到数据库: {rule_dict}")
+            rule_count = len(rule_repository.all_rules())
+            logger.info(f"📊 [DB] 数据库中共有 {rule_count} 条规则")
         except Exception as e:
-            print(f"⚠️ 数据库保存失败，使用内存数据库: {e}")
-            MOCK_DB.append(rule_dict)
-            print(f"🧪 [DEBUG] 添加测试规则到内存: {rule_dict}")
-            print(f"📊 [Memory] 当前 MOCK_DB 中共有 {len(MOCK_DB)} 条规则")
+            logger.warning(f"⚠️ 数据库保存失败，使用内存数据库: {e}")
+            rule_dict = MOCK_DB.add_rule(rule_dict)
+            logger.info(f"🧪 [DEBUG] 添加测试规则到内存: {rule_dict}")
+            logger.info(f"📊 [Memory] 当前 MOCK_DB 中共有 {len(MOCK_DB)} 条规则")
     else:
-        MOCK_DB.append(rule_dict)
-        print(f"🧪 [DEBUG] 添加测试规则到内存: {rule_dict}")
-        print(f"📊 [Memory] 当前 MOCK_DB 中共有 {len(MOCK_DB)} 条规则")
+        rule_dict = MOCK_DB.add_rule(rule_dict)
+        logger.info(f"🧪 [DEBUG] 添加测试规则到内存: {rule_dict}")
+        logger.info(f"📊 [Memory] 当前 MOCK_DB 中共有 {len(MOCK_DB)} 条规则")
     
     return {"status": "success", "rule": rule_dict}
 
@@ -403,53 +533,163 @@ async def get_weather():
     """
     return scheduler_service.CURRENT_CONTEXT
 
+def _content_etag(store_id: str, version: int, content: str) -> str:
+    """根据门店播放版本号生成 ETag（含内容摘要，避免重启后版本号重复）"""
+    digest = hashlib.md5(f"{store_id}|{version}|{content}".encode()).hexdigest()[:16]
+    return f'"{digest}"'
+
+
+async def _conditional_content(store_id: str, if_none_match: Optional[str], wait: int, extra: Optional[dict] = None):
+    """
+    条件请求 + 长轮询：ETag 未变化时挂起最多 wait 秒等待内容变化，仍未变化则返回 304
+    """
+    content, version = scheduler_service.get_store_content(store_id)
+    etag = _content_etag(store_id, version, content)
+    if etag_matches(if_none_match, etag) and wait > 0:
+        await scheduler_service.wait_for_store_change(store_id, version, wait)
+        content, version = scheduler_service.get_store_content(store_id)
+        etag = _content_etag(store_id, version, content)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    not_modified = etag_matches(if_none_match, etag)
+    # 每块屏幕每 2 秒一次，采样输出
+    log_sampled(logger, logging.INFO, "current-content", "current-content store=%s -> %s", store_id, content,
+                store_id=store_id, content=content, not_modified=not_modified)
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({"content": content, **(extra or {})}, headers=headers)
+
+
 @router.get("/stores/{store_id}/current-content")
-async def get_current_content(store_id: str):
+async def get_current_content(
+    store_id: str,
+    wait: int = Query(0, ge=0, le=60, description="长轮询秒数：ETag 未变化时最多等待的时间"),
+    if_none_match: Optional[str] = Header(None),
+):
     """
     获取指定门店当前应播放的内容（支持多门店）
+    返回 ETag；携带 If-None-Match 且未变化时返回 304，配合 ?wait=30 实现长轮询
     """
-    by_store = getattr(scheduler_service, "CURRENT_PLAYLIST_BY_STORE", {})
-    content = by_store.get(store_id) if by_store else scheduler_service.CURRENT_PLAYLIST
-    if content is None:
-        content = scheduler_service.CURRENT_PLAYLIST if store_id == "store_001" else "default"
-    print(f"📡 [API] current-content store={store_id} -> {content}")
-    return {"content": content}
+    return await _conditional_content(store_id, if_none_match, wait)
 
 
 @router.get("/signs/{sign_id}/current-content")
-async def get_current_content_by_sign(sign_id: str, db: Optional[Session] = Depends(get_db_optional)):
+async def get_current_content_by_sign(
+    sign_id: str,
+    wait: int = Query(0, ge=0, le=60, description="长轮询秒数：ETag 未变化时最多等待的时间"),
+    if_none_match: Optional[str] = Header(None),
+):
     """
     根据屏幕 ID 获取当前应播放的内容（App/Player 用）
+    与门店接口一致支持 ETag / If-None-Match / ?wait= 长轮询；sign_id -> 门店走内存索引
+    """
+    from app.services.sign_index_service import get_store_by_sign
+    store = get_store_by_sign(sign_id)
+    store_id = store["id"] if store else None
+    if store_id is None and sign_id == "sign_001":
+        store_id = "store_001"
+    if store_id is None:
+        return {"content": "default", "store_id": None}
+    return await _conditional_content(store_id, if_none_match, wait, {"store_id": store_id})
+
+
+# 超过该条数时流式输出：条目边生成边序列化，不在内存中拼装完整列表与响应体
+_BATCH_STREAM_THRESHOLD = 500
+
+
+@router.post("/current-content:batch")
+async def get_current_content_batch(req: CurrentContentBatchRequest):
+    """
+    批量获取当前应播内容（舰队控制 / Dashboard 用），一次请求替代 N 次 current-content
+    所有条目来自同一份播放快照（同一 generation），并附带解析后的媒体 URL；大批量时流式返回
+    """
+    if len(req.store_ids) + len(req.sign_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"单次最多查询 {MAX_BATCH_IDS} 个 ID")
+    from app.services.sign_index_service import get_store_by_sign
+    from app.services.media_service import get_image_urls
+
+    sign_to_store = {}
+    for sign_id in req.sign_ids:
+        store = get_store_by_sign(sign_id)
+        store_id = store["id"] if store else None
+        if store_id is None and sign_id == "sign_001":
+            store_id = "store_001"
+        sign_to_store[sign_id] = store_id
+
+    store_ids = list(dict.fromkeys(req.store_ids + [s for s in sign_to_store.values() if s]))
+    generation, contents = scheduler_service.get_store_contents(store_ids)
+
+    # 同一 target 只解析一次（在生成条目之前完成全部 await，条目生成本身是纯同步的）
+    targets = {content for content, _ in contents.values()}
+    if None in sign_to_store.values():
+        targets.add("default")
+    media = await get_image_urls(targets)
+
+    def _items():
+        """按请求顺序从快照逐条生成"""
+        for sid in req.store_ids:
+            content, version = contents[sid]
+            yield {"store_id": sid, "content": content, "version": version, "media_url": media.get(content)}
+        for sign_id, store_id in sign_to_store.items():
+            content, version = contents[store_id] if store_id else ("default", 0)
+            yield {"sign_id": sign_id, "store_id": store_id, "content": content, "version": version,
+                   "media_url": media.get(content)}
+
+    if len(req.store_ids) + len(sign_to_store) <= _BATCH_STREAM_THRESHOLD:
+        return {"generation": generation, "items": list(_items())}
+
+    def _stream():
+        yield f'{{"generation": {generation}, "items": ['
+        for i, item in enumerate(_items()):
+            yield ("," if i else "") + json.dumps(item, ensure_ascii=False)
+        yield "]}"
+
+    return StreamingResponse(_stream(), media_type="application/json")
+
+
+@router.get("/playlists/changes")
+async def get_playlist_changes(since: int = Query(0, ge=0, description="客户端已同步到的 generation")):
     """
-    if USE_DATABASE and db is not None:
-        from app.models.store_model import Store
-        store = db.query(Store).filter(Store.sign_id == sign_id, Store.is_active == True).first()
-        if store:
-            by_store = getattr(scheduler_service, "CURRENT_PLAYLIST_BY_STORE", {})
-            content = by_store.get(store.id) or scheduler_service.CURRENT_PLAYLIST
-            return {"content": content, "store_id": store.id}
-    if sign_id == "sign_001":
-        return {"content": scheduler_service.CURRENT_PLAYLIST, "store_id": "store_001"}
-    return {"content": "default", "store_id": None}
+    增量同步：返回 generation 大于 since 的门店内容变化（每门店仅最新一条）
+    since 过旧（已超出变更日志范围）时返回全量并标记 reset=true；target_id 为 null 表示门店已移除
+    """
+    return scheduler_service.PLAYLIST_STATE.changes_since(since)
 
 
 @router.get("/stores/{store_id}/media/{target_id}")
-async def get_media_for_target(store_id: str, target_id: str, db: Optional[Session] = Depends(get_db_optional)):
+async def get_media_for_target(store_id: str, target_id: str, db: Optional[AsyncSession] = Depends(get_async_db_optional)):
     """
     根据 target_id 获取对应图片 URL。
     自动从 Unsplash 搜索相关图片并缓存，无需手动维护 IMAGE_MAP。
     若未配置 UNSPLASH_ACCESS_KEY，则使用 Picsum 占位图。
     """
     from app.services.media_service import get_image_url
-    url = get_image_url(target_id, db)
+    url = await get_image_url(target_id, db)
     return {"url": url}
 
+
+@router.get("/stores/{store_id}/media-manifest")
+async def get_media_manifest(
+    store_id: str,
+    if_none_match: Optional[str] = Header(None),
+    db: Optional[AsyncSession] = Depends(get_async_db_optional),
+):
+    """
+    媒体预缓存清单：该门店规则可能产出的全部 target_id 及其 URL、sha256、字节数、宽高
+    屏幕提前下载全部素材后可直接从本地切换；version 即 ETag，规则或 MediaCache 变化时才变化
+    """
+    from app.services.media_manifest_service import build_media_manifest
+    manifest = await build_media_manifest(store_id, db)
+    etag = f'"{manifest["version"]}"'
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(manifest, headers={"ETag": etag})
+
 @router.post("/stores/{store_id}/check-rules")
 async def trigger_check_rules(store_id: str):
     """
     手动触发规则检查（用于测试和调试）
     """
-    print(f"🔧 [API] 手动触发规则检查，当前 CURRENT_PLAYLIST = '{scheduler_service.CURRENT_PLAYLIST}'")
+    logger.info(f"🔧 [API] 手动触发规则检查，当前 CURRENT_PLAYLIST = '{scheduler_service.CURRENT_PLAYLIST}'")
     
     # 执行规则检查
     await scheduler_service.check_rules_job()
@@ -458,7 +698,7 @@ async def trigger_check_rules(store_id: str):
     result_playlist = scheduler_service.CURRENT_PLAYLIST
     result_weather = scheduler_service.CURRENT_CONTEXT.get("weather")
     
-    print(f"🔧 [API] 规则检查完成，当前 CURRENT_PLAYLIST = '{result_playlist}'")
+    logger.info(f"🔧 [API] 规则检查完成，当前 CURRENT_PLAYLIST = '{result_playlist}'")
     return {
         "status": "success",
         "current_playlist": result_playlist,
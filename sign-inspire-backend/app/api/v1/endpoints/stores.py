@@ -1,12 +1,20 @@
 """门店 API"""
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
 import uuid
 
-from app.database import get_db_optional, USE_DATABASE
+from app.database_async import get_async_db_optional
 from app.models.store_model import Store
 from app.schemas.store import StoreCreate, StoreUpdate
+from app.services import sign_index_service
+from app.api.v1.http_cache import etag_matches
+from app.api.v1.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, encode_cursor
+from app.logging_config import get_logger
+
+logger = get_logger("api")
 
 router = APIRouter()
 
@@ -18,39 +26,74 @@ async def list_cities():
 
 
 @router.get("/cities/{city}/stores")
-async def list_stores_by_city(city: str, db: Optional[Session] = Depends(get_db_optional)):
+async def list_stores_by_city(city: str, db: Optional[AsyncSession] = Depends(get_async_db_optional)):
     """某城市门店列表"""
-    if not USE_DATABASE or db is None:
+    if db is None:
         return []
-    stores = db.query(Store).filter(Store.city == city, Store.is_active == True).all()
+    stores = (await db.execute(select(Store).where(Store.city == city, Store.is_active == True))).scalars().all()
     return [s.to_dict() for s in stores]
 
 
 @router.get("/stores")
-async def list_all_stores(db: Optional[Session] = Depends(get_db_optional)):
-    """全部门店"""
-    if not USE_DATABASE or db is None:
-        return []
-    stores = db.query(Store).all()
-    return [s.to_dict() for s in stores]
+async def list_all_stores(
+    city: Optional[str] = None,
+    active: Optional[bool] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Optional[AsyncSession] = Depends(get_async_db_optional),
+):
+    """
+    全部门店（city / active 过滤在 SQL 中完成）
+    limit / cursor: 传入任一时按 id（主键）键集分页，返回 {"items", "next"}；不传时返回全部门店列表
+    （不用 created_at 排序：秒级精度下批量创建的门店大量同值，SQLite 又按文本比较时间，游标不可靠）
+    """
+    paginated = limit is not None or cursor is not None
+    if db is None:
+        return {"items": [], "next": None} if paginated else []
+    stmt = select(Store).order_by(Store.id)
+    if city is not None:
+        stmt = stmt.where(Store.city == city)
+    if active is not None:
+        stmt = stmt.where(Store.is_active == active)
+    if not paginated:
+        return [s.to_dict() for s in (await db.execute(stmt)).scalars()]
+
+    limit = limit or DEFAULT_PAGE_SIZE
+    if cursor:
+        (after_id,) = decode_cursor(cursor, 1)
+        stmt = stmt.where(Store.id > str(after_id))
+    # 多取一条判断是否还有下一页
+    rows = (await db.execute(stmt.limit(limit + 1))).scalars().all()
+    page = rows[:limit]
+    next_cursor = encode_cursor([page[-1].id]) if len(rows) > limit else None
+    return {"items": [s.to_dict() for s in page], "next": next_cursor}
 
 
 @router.get("/stores/{store_id}")
-async def get_store(store_id: str, db: Optional[Session] = Depends(get_db_optional)):
+async def get_store(store_id: str, db: Optional[AsyncSession] = Depends(get_async_db_optional)):
     """门店详情"""
-    if not USE_DATABASE or db is None:
+    if db is None:
         raise HTTPException(status_code=404, detail="门店不存在")
-    store = db.query(Store).filter(Store.id == store_id).first()
+    store = await db.get(Store, store_id)
     if not store:
         raise HTTPException(status_code=404, detail="门店不存在")
     return store.to_dict()
 
 
+async def _check_template(name: Optional[str], db: AsyncSession) -> None:
+    """订阅的规则模板须已存在（有规则）"""
+    from app.services import rule_repository
+    from app.services.rule_templates import template_scope
+    if name and await rule_repository.ensure_fresh(db) and not rule_repository.store_rule_count(template_scope(name)):
+        raise HTTPException(status_code=400, detail=f"规则模板不存在: {name}")
+
+
 @router.post("/stores")
-async def create_store(store: StoreCreate, db: Optional[Session] = Depends(get_db_optional)):
+async def create_store(store: StoreCreate, db: Optional[AsyncSession] = Depends(get_async_db_optional)):
     """创建门店"""
-    if not USE_DATABASE or db is None:
+    if db is None:
         raise HTTPException(status_code=503, detail="数据库不可用")
+    await _check_template(store.rule_template, db)
     store_id = f"store_{uuid.uuid4().hex[:8]}"
     db_store = Store(
         id=store_id,
@@ -62,42 +105,63 @@ async def create_store(store: StoreCreate, db: Optional[Session] = Depends(get_d
         opening_hours=store.opening_hours,
         timezone=store.timezone,
         is_active=store.is_active,
+        rule_template=store.rule_template,
     )
     db.add(db_store)
-    db.commit()
-    db.refresh(db_store)
-    print(f"🏪 [API] 创建门店: {store_id}")
-    return db_store.to_dict()
+    await db.commit()
+    await db.refresh(db_store)
+    store_dict = db_store.to_dict()
+    sign_index_service.upsert_store(store_dict)
+    logger.info(f"🏪 [API] 创建门店: {store_id}")
+    return store_dict
+
+
+@router.post("/stores:bulk")
+async def bulk_create_stores(request: Request, db: Optional[AsyncSession] = Depends(get_async_db_optional)):
+    """
+    批量开通门店（CSV 或 NDJSON，每行一个门店）
+    城市去重后批量地理编码，推断经纬度 / 时区 / 文化圈 / 中国子区域，分批事务插入并分配 sign_id，
+    完成后只为新门店触发一次增量重算；返回创建/失败计数、新门店 ID 与出错行
+    """
+    if db is None:
+        raise HTTPException(status_code=503, detail="数据库不可用")
+    from app.services.store_provisioning_service import provision_stores
+    return await provision_stores(await request.body(), request.headers.get("content-type"), db)
 
 
 @router.patch("/stores/{store_id}")
-async def update_store(store_id: str, update: StoreUpdate, db: Optional[Session] = Depends(get_db_optional)):
+async def update_store(store_id: str, update: StoreUpdate, db: Optional[AsyncSession] = Depends(get_async_db_optional)):
     """更新门店"""
-    if not USE_DATABASE or db is None:
+    if db is None:
         raise HTTPException(status_code=503, detail="数据库不可用")
-    db_store = db.query(Store).filter(Store.id == store_id).first()
+    db_store = await db.get(Store, store_id)
     if not db_store:
         raise HTTPException(status_code=404, detail="门店不存在")
     data = update.model_dump(exclude_unset=True)
+    if "rule_template" in data:
+        await _check_template(data["rule_template"], db)
     for k, v in data.items():
         setattr(db_store, k, v)
-    db.commit()
-    db.refresh(db_store)
-    print(f"🏪 [API] 更新门店: {store_id}")
-    return db_store.to_dict()
+    await db.commit()
+    await db.refresh(db_store)
+    store_dict = db_store.to_dict()
+    sign_index_service.upsert_store(store_dict)
+    logger.info(f"🏪 [API] 更新门店: {store_id}")
+    return store_dict
 
 
 @router.delete("/stores/{store_id}")
-async def delete_store(store_id: str, db: Optional[Session] = Depends(get_db_optional)):
+async def delete_store(store_id: str, db: Optional[AsyncSession] = Depends(get_async_db_optional)):
     """删除门店（软删除：is_active=False）"""
-    if not USE_DATABASE or db is None:
+    if db is None:
         raise HTTPException(status_code=503, detail="数据库不可用")
-    db_store = db.query(Store).filter(Store.id == store_id).first()
+    db_store = await db.get(Store, store_id)
     if not db_store:
         raise HTTPException(status_code=404, detail="门店不存在")
     db_store.is_active = False
-    db.commit()
-    print(f"🏪 [API] 停用门店: {store_id}")
+    await db.commit()
+    sign_index_service.remove_store(store_id)
+    logger.info(f"🏪 [API] 停用门店: {store_id}")
     return {"status": "success", "store_id": store_id}
 
 
@@ -125,11 +189,26 @@ async def get_recommendations(
 
 
 @router.get("/signs/{sign_id}/store")
-async def get_store_by_sign(sign_id: str, db: Optional[Session] = Depends(get_db_optional)):
-    """根据 sign_id 获取门店"""
-    if not USE_DATABASE or db is None:
-        raise HTTPException(status_code=404, detail="门店不存在")
-    store = db.query(Store).filter(Store.sign_id == sign_id, Store.is_active == True).first()
+async def get_store_by_sign(sign_id: str):
+    """根据 sign_id 获取门店（内存索引，无数据库访问）"""
+    store = sign_index_service.get_store_by_sign(sign_id)
     if not store:
         raise HTTPException(status_code=404, detail="未找到该屏幕对应的门店")
-    return store.to_dict()
+    return store
+
+
+@router.get("/signs/{sign_id}/bundle")
+async def get_sign_bundle(sign_id: str, if_none_match: Optional[str] = Header(None)):
+    """
+    屏幕端 edge bundle：已编译规则 + 未来 48 小时逐小时预报 + 营业时间/时区 + 媒体 URL
+    Player 本地求值选择内容，仅在 version（即 ETag）变化时重新下载
+    """
+    from app.services.bundle_service import resolve_sign_store, build_sign_bundle
+    store = resolve_sign_store(sign_id)
+    if not store:
+        raise HTTPException(status_code=404, detail="未找到该屏幕对应的门店")
+    bundle = await build_sign_bundle(store)
+    etag = f'"{bundle["version"]}"'
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(bundle, headers={"ETag": etag})
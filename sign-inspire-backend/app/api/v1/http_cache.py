@@ -0,0 +1,13 @@
+"""HTTP 条件请求工具：ETag / If-None-Match"""
+from typing import Optional
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """解析 If-None-Match（支持多个值、W/ 弱校验前缀与 *）"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
@@ -0,0 +1,50 @@
+"""键集分页工具：不透明游标（next token）编解码、已排序列表分页"""
+import base64
+import json
+from bisect import bisect_right
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+
+# 仅传 cursor 未传 limit 时的默认页大小
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(key: Sequence[Any]) -> str:
+    """排序键 -> 不透明游标（base64url JSON，客户端不应解析）"""
+    raw = json.dumps(list(key), ensure_ascii=False, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, size: int) -> Tuple[Any, ...]:
+    """游标 -> 排序键，格式不符时返回 400"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        key = json.loads(raw)
+    except (ValueError, UnicodeDecodeError):
+        key = None
+    if not isinstance(key, list) or len(key) != size:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+    return tuple(key)
+
+
+def page_after(
+    items: List[Any], key: Callable[[Any], tuple], limit: int, cursor: Optional[str]
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    已按 key 升序排好的列表取游标之后的一页，返回 (本页, next 游标)
+    翻页期间有插入/删除时不重复、不遗漏已存在的条目（与 SQL 键集分页语义一致）
+    """
+    if not items:
+        return [], None
+    start = 0
+    if cursor:
+        after = decode_cursor(cursor, len(key(items[0])))
+        try:
+            start = bisect_right(items, after, key=key)
+        except TypeError:
+            raise HTTPException(status_code=400, detail="无效的分页游标")
+    page = items[start:start + limit]
+    has_more = start + limit < len(items)
+    return page, encode_cursor(key(page[-1])) if has_more and page else None
@@ -17,31 +17,42 @@ DB_USER = os.getenv("DB_USER", "root")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 DB_NAME = os.getenv("DB_NAME", "sign_inspire")
 
-# 是否使用数据库（如果连接失败会自动设为 False）
-USE_DATABASE = True
+# 是否使用数据库：导入时不连接，由 lifespan 异步建立连接成功后设为 True（见 db_connect.py）
+USE_DATABASE = False
 
 # 构建数据库 URL
 # 格式: mysql+pymysql://用户名:密码@主机:端口/数据库名
-DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4"
+# 单机部署可设置 DATABASE_URL=sqlite:////绝对路径/sign_inspire.db（嵌入式 SQLite，WAL 模式，见 db_sqlite.py）
+DATABASE_URL = os.getenv("DATABASE_URL", "").strip() or (
+    f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4"
+)
 
 # 创建数据库引擎
 engine = None
 SessionLocal = None
 Base = declarative_base()
 
-def test_connection():
+def test_connection(verbose: bool = True):
     """
-    测试数据库连接
+    测试数据库连接（同步，驱动层短超时；由 db_connect 在线程中调用）
+    verbose=False 时失败只输出一行（后台重连时使用）
     """
     global engine, SessionLocal, USE_DATABASE
     
     try:
+        from app.db_pool import pool_options, instrument_engine
+        from app.db_sqlite import tune_sqlite_engine
+        from app.db_connect import connect_options
+        if engine is not None:
+            engine.dispose()
         engine = create_engine(
             DATABASE_URL,
-            pool_pre_ping=True,
-            pool_recycle=3600,
-            echo=False
+            echo=False,
+            **pool_options("sync", DATABASE_URL),
+            **connect_options(DATABASE_URL),
         )
+        instrument_engine("sync", engine)
+        tune_sqlite_engine(engine, DATABASE_URL)
         
         # 尝试连接
         with engine.connect() as conn:
@@ -57,10 +68,13 @@ def test_connection():
         return True
     except Exception as e:
         USE_DATABASE = False
+        if not verbose:
+            return False
         try:
             print(f"⚠️ 数据库连接失败: {e}")
-            print("   将使用内存数据库模式（数据不会持久化）")
+            print("   将使用内存数据库模式（数据不会持久化），后台会按退避间隔自动重连")
             print("\n💡 解决方案：")
+            print("   0. 单机部署可改用嵌入式 SQLite：DATABASE_URL=sqlite:////绝对路径/sign_inspire.db")
             print("   1. 检查 MySQL 服务是否启动")
             print("   2. 检查 .env 文件中的数据库配置是否正确")
             print("   3. 确认数据库是否存在：CREATE DATABASE sign_inspire;")
@@ -69,9 +83,6 @@ def test_connection():
             print(f"[DB] Connection failed: {e}, using memory mode")
         return False
 
-# 初始化时测试连接
-test_connection()
-
 
 def _seed_vocabulary_if_empty(eng):
     """若词汇表为空，写入默认天气与动作映射"""
@@ -125,6 +136,7 @@ def _seed_stores_if_empty(eng):
             sign_id="sign_001",
             timezone="Australia/Adelaide",
             is_active=True,
+            rule_template="default",
         )
         session.add(default_store)
         session.commit()
@@ -184,44 +196,54 @@ DEFAULT_RULES = [
 
 
 def _seed_rules_to_mock_db(store_id: str = "store_001"):
-    """将默认规则写入 MOCK_DB（内存模式用）"""
+    """内存模式：默认规则写入 default 模板（只写一次），门店按引用订阅该模板（不再逐店复制）"""
     import uuid
     from app.models.rule_storage import MOCK_DB
-    for d in DEFAULT_RULES:
-        MOCK_DB.append({
-            "id": str(uuid.uuid4()),
-            "store_id": store_id,
-            "name": d["name"],
-            "priority": d["priority"],
-            "conditions": d["conditions"],
-            "action": d["action"],
-        })
-    print(f"📋 [Memory] 默认规则种子已写入 MOCK_DB")
+    from app.models.rule_model import rule_content_hash
+    from app.services.rule_templates import DEFAULT_TEMPLATE, is_template_scope, subscribe_in_memory, template_scope
+    scope = template_scope(DEFAULT_TEMPLATE)
+    if not MOCK_DB.store_rule_count(scope):
+        for d in DEFAULT_RULES:
+            MOCK_DB.add_rule({
+                "id": str(uuid.uuid4()),
+                "store_id": scope,
+                "name": d["name"],
+                "priority": d["priority"],
+                "conditions": d["conditions"],
+                "action": d["action"],
+                "content_hash": rule_content_hash(d["conditions"], d["action"]),
+            })
+        print(f"📋 [Memory] 默认规则模板已写入 MOCK_DB")
+    if not is_template_scope(store_id):
+        subscribe_in_memory(store_id, DEFAULT_TEMPLATE)
 
 
-def _seed_rules_if_empty(eng):
-    """若规则表为空，写入澳洲+中国城市专用种子规则"""
+def _seed_rule_templates(eng):
+    """若 default 模板没有规则，写入澳洲+中国城市专用种子规则（门店通过 stores.rule_template 订阅）"""
     import uuid
     try:
-        from app.models.rule_model import Rule
+        from app.models.rule_model import Rule, bump_rules_version
+        from app.services.rule_templates import DEFAULT_TEMPLATE, template_scope
         from sqlalchemy.orm import Session
+        scope = template_scope(DEFAULT_TEMPLATE)
         session = Session(bind=eng)
-        if session.query(Rule).count() > 0:
+        if session.query(Rule).filter(Rule.store_id == scope).count() > 0:
             session.close()
             return
         for d in DEFAULT_RULES:
             r = Rule(
                 id=str(uuid.uuid4()),
-                store_id="store_001",
+                store_id=scope,
                 name=d["name"],
                 priority=d["priority"],
                 conditions=d["conditions"],
                 action=d["action"],
             )
             session.add(r)
+        session.execute(bump_rules_version())
         session.commit()
         session.close()
-        print("📋 全球规则种子数据已写入")
+        print("📋 默认规则模板种子数据已写入")
     except Exception as e:
         print(f"⚠️ 规则种子写入失败（可忽略）: {e}")
 
@@ -277,13 +299,16 @@ def init_db():
         from app.models.store_model import Store
         from app.models.vocabulary_model import Vocabulary
         from app.models.media_model import MediaCache
+        from app.models.rule_condition_model import RuleCondition
+        from app.migrations import run_migrations
         
-        # 创建所有表
+        # 创建所有表，再执行未执行过的结构迁移（旧库补列、补索引、回填）
         Base.metadata.create_all(bind=engine)
+        run_migrations(engine)
         # 种子数据
         _seed_vocabulary_if_empty(engine)
         _seed_stores_if_empty(engine)
-        _seed_rules_if_empty(engine)
+        _seed_rule_templates(engine)
         print("✅ 数据库表创建成功！")
         return True
     except Exception as e:
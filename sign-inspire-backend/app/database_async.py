@@ -0,0 +1,106 @@
+"""
+异步数据库访问层（SQLAlchemy asyncio）
+请求处理与调度路径上的数据库 I/O 走异步驱动，慢查询不再阻塞事件循环上的其他请求（如屏幕轮询）
+- MySQL：mysql+aiomysql；嵌入式 SQLite（DATABASE_URL=sqlite:///...）：sqlite+aiosqlite
+- 连接地址默认由 app.database.DATABASE_URL 推导，可用 ASYNC_DATABASE_URL 覆盖
+- 建表、种子数据等一次性操作仍走 app.database 的同步引擎
+"""
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+
+from app.db_pool import instrument_engine, pool_options
+from app.db_sqlite import tune_sqlite_engine
+from app.logging_config import get_logger
+
+logger = get_logger("db")
+
+# 同步驱动 -> 异步驱动
+_ASYNC_DRIVERS = {
+    "mysql+pymysql": "mysql+aiomysql",
+    "mysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+async_engine: Optional[AsyncEngine] = None
+AsyncSessionLocal: Optional[async_sessionmaker] = None
+
+
+def async_database_url(sync_url: str) -> str:
+    """同步连接地址 -> 异步驱动地址（ASYNC_DATABASE_URL 优先）"""
+    override = os.getenv("ASYNC_DATABASE_URL", "").strip()
+    if override:
+        return override
+    scheme, sep, rest = sync_url.partition("://")
+    return f"{_ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+
+async def init_async_db() -> bool:
+    """
+    创建异步引擎并验证连接（在 lifespan 中调用）
+    同步数据库未启用、驱动未安装或连接失败时返回 False，调用方走内存模式
+    """
+    global async_engine, AsyncSessionLocal
+    from app import database
+    from app.db_connect import connect_options
+    if not database.USE_DATABASE:
+        return False
+    url = async_database_url(database.DATABASE_URL)
+    try:
+        engine = create_async_engine(
+            url, echo=False, **pool_options("async", url, is_async=True), **connect_options(url)
+        )
+        instrument_engine("async", engine.sync_engine)
+        tune_sqlite_engine(engine.sync_engine, url)
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception as e:
+        logger.warning(f"[DB] Async engine unavailable ({url.split('://')[0]}): {e}")
+        return False
+    async_engine = engine
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+    logger.info(f"[DB] Async engine ready ({url.split('://')[0]})")
+    return True
+
+
+async def dispose_async_db() -> None:
+    """关闭异步连接池（lifespan 结束时调用）"""
+    global async_engine, AsyncSessionLocal
+    if async_engine is not None:
+        await async_engine.dispose()
+    async_engine = None
+    AsyncSessionLocal = None
+
+
+def async_db_available() -> bool:
+    from app import database
+    return database.USE_DATABASE and AsyncSessionLocal is not None
+
+
+async def get_async_db_optional() -> AsyncIterator[Optional[AsyncSession]]:
+    """可选的异步数据库会话（依赖注入；数据库未启用时为 None）"""
+    if not async_db_available():
+        yield None
+        return
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+@asynccontextmanager
+async def async_session_scope(db: Optional[AsyncSession] = None) -> AsyncIterator[Optional[AsyncSession]]:
+    """
+    服务层取会话：传入 db 时直接复用（不关闭），否则新建并在退出时关闭
+    数据库未启用时得到 None
+    """
+    if db is not None:
+        yield db
+        return
+    if not async_db_available():
+        yield None
+        return
+    async with AsyncSessionLocal() as session:
+        yield session
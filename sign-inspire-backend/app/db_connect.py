@@ -0,0 +1,183 @@
+"""
+数据库连接生命周期：导入时不再连接数据库，由 lifespan 异步建立
+- 启动时尝试一次（驱动层短超时），失败先以内存模式启动，后台按指数退避重连
+- 重连成功后在运行中切换到数据库模式（建表/种子、异步引擎、sign 索引、规则仓库、词汇表）
+- 数据库模式下后台任务定期探活，连续失败后切回内存模式并重新开始重连
+冷启动与测试收集耗时不再取决于数据库是否可达
+
+环境变量：
+    DB_CONNECT_TIMEOUT       建立连接超时秒数（默认 3；MySQL 驱动 connect_timeout）
+    DB_RETRY_INITIAL         首次重连等待秒数（默认 2），之后每次翻倍
+    DB_RETRY_MAX             重连等待上限秒数（默认 60）
+    DB_HEALTH_FAILURES       连续探活失败多少次后切回内存模式（默认 2）
+"""
+import asyncio
+import os
+import random
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+
+from app.db_sqlite import is_sqlite, sqlite_engine_options
+from app.logging_config import get_logger
+
+logger = get_logger("db")
+
+CONNECT_TIMEOUT = float(os.getenv("DB_CONNECT_TIMEOUT", "3"))
+RETRY_INITIAL = float(os.getenv("DB_RETRY_INITIAL", "2"))
+RETRY_MAX = float(os.getenv("DB_RETRY_MAX", "60"))
+HEALTH_FAILURES = int(os.getenv("DB_HEALTH_FAILURES", "2"))
+
+_reconnect_task: Optional[asyncio.Task] = None
+_health_failures = 0
+_lock: Optional[asyncio.Lock] = None
+
+
+def _get_lock() -> asyncio.Lock:
+    global _lock
+    if _lock is None:
+        _lock = asyncio.Lock()
+    return _lock
+
+
+def connect_options(url: str) -> Dict[str, Any]:
+    """create_engine / create_async_engine 的连接参数：SQLite 见 db_sqlite，MySQL 设置短连接超时"""
+    if is_sqlite(url):
+        return sqlite_engine_options(url)
+    if url.startswith("mysql"):
+        return {"connect_args": {"connect_timeout": max(1, int(CONNECT_TIMEOUT))}}
+    return {}
+
+
+async def _warm_up() -> None:
+    """切换到数据库模式后加载内存索引（与原启动流程一致）"""
+    from app.services import rule_repository
+    from app.services.sign_index_service import rebuild_sign_index
+    from app.services.vocabulary_service import load_vocabulary
+    # 构建 sign_id -> 门店 内存索引，屏幕轮询不再查库
+    await rebuild_sign_index()
+    # 规则仓库：全量加载一次，之后 tick / 规则接口读内存（重连时库中数据可能已变化，强制重载）
+    await rule_repository.ensure_fresh(force=True)
+    await load_vocabulary()
+
+
+async def connect(verbose: bool = True) -> bool:
+    """
+    尝试建立数据库连接并切换到数据库模式，返回是否成功
+    同步引擎的连接测试、建表与种子写入放到线程中执行，不阻塞事件循环
+    """
+    global _health_failures
+    from app import database
+    from app.database_async import async_db_available, init_async_db
+    async with _get_lock():
+        if async_db_available():
+            return True
+        if not await asyncio.to_thread(database.test_connection, verbose):
+            return False
+        try:
+            await asyncio.to_thread(database.init_db)
+            logger.info("[OK] Database initialized")
+        except Exception as e:
+            logger.warning(f"[Warn] DB init: {e}")
+        if not database.USE_DATABASE:
+            return False
+        # 请求与调度路径上的查询走异步引擎（建表、种子数据仍用同步引擎）
+        if not await init_async_db():
+            database.USE_DATABASE = False
+            return False
+        await _warm_up()
+        _health_failures = 0
+        logger.info("[DB] Database mode active")
+        return True
+
+
+def use_memory_mode() -> None:
+    """内存模式：默认门店既无自有规则也未订阅模板时，写入默认模板并订阅"""
+    from app.database import _seed_rules_to_mock_db
+    from app.models.rule_storage import MOCK_DB
+    from app.services.rule_templates import memory_subscription
+    if not MOCK_DB.store_rule_count("store_001") and memory_subscription("store_001") is None:
+        _seed_rules_to_mock_db("store_001")
+        logger.info("[OK] Seeded default rules")
+
+
+async def _reconnect_loop() -> None:
+    """按指数退避（带抖动）重连，成功后触发一次规则检查"""
+    delay = RETRY_INITIAL
+    attempt = 0
+    while True:
+        await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+        attempt += 1
+        try:
+            connected = await connect(verbose=False)
+        except Exception as e:
+            logger.warning(f"[DB] Reconnect attempt {attempt} error: {e}")
+            connected = False
+        if connected:
+            logger.info(f"[DB] Reconnected after {attempt} attempt(s), switched to database mode")
+            from app.services.scheduler_service import check_rules_job
+            asyncio.create_task(check_rules_job())
+            return
+        delay = min(delay * 2, RETRY_MAX)
+        logger.info(f"[DB] Reconnect attempt {attempt} failed, next in ~{delay:.0f}s")
+
+
+def start_reconnect() -> None:
+    """后台重连（已在重连时不重复启动）"""
+    global _reconnect_task
+    if _reconnect_task is None or _reconnect_task.done():
+        _reconnect_task = asyncio.create_task(_reconnect_loop())
+
+
+async def _switch_to_memory() -> None:
+    """运行中数据库不可用：切回内存模式并开始重连"""
+    from app import database
+    from app.database_async import dispose_async_db
+    async with _get_lock():
+        if not database.USE_DATABASE:
+            return
+        database.USE_DATABASE = False
+        try:
+            await dispose_async_db()
+        except Exception:
+            pass
+    logger.warning("[DB] Database unreachable, switched to memory mode")
+    use_memory_mode()
+    start_reconnect()
+
+
+async def check_health() -> bool:
+    """
+    数据库模式下探活（由后台任务定期调用）：SELECT 1 超过 DB_CONNECT_TIMEOUT 或失败计一次，
+    连续 DB_HEALTH_FAILURES 次后切回内存模式；内存模式下返回 False
+    """
+    global _health_failures
+    from app import database
+    from app import database_async
+    if not database.USE_DATABASE or database_async.async_engine is None:
+        return False
+    try:
+        async def _ping():
+            async with database_async.async_engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+        await asyncio.wait_for(_ping(), timeout=CONNECT_TIMEOUT)
+        _health_failures = 0
+        return True
+    except Exception as e:
+        _health_failures += 1
+        logger.warning(f"[DB] Health check failed ({_health_failures}/{HEALTH_FAILURES}): {type(e).__name__}: {e}")
+        if _health_failures >= HEALTH_FAILURES:
+            await _switch_to_memory()
+        return False
+
+
+async def stop() -> None:
+    """停止后台重连（lifespan 结束时调用）"""
+    global _reconnect_task
+    if _reconnect_task is not None:
+        _reconnect_task.cancel()
+        try:
+            await _reconnect_task
+        except asyncio.CancelledError:
+            pass
+    _reconnect_task = None
@@ -0,0 +1,192 @@
+"""
+数据库连接池：参数可由环境变量配置，并对连接检出做埋点
+容量不足时表现为可观测的数字（检出等待、占用数、溢出数、失效数），而不是莫名的延迟
+- 同步引擎（建表/种子）与异步引擎（请求/调度路径）各自一份统计
+- 统计经 /debug/current-state 的 db_pool 字段与后台任务每分钟一条结构化日志输出
+
+环境变量：
+    DB_POOL_SIZE            常驻连接数（默认 5）
+    DB_MAX_OVERFLOW         超出常驻数后允许临时创建的连接数（默认 10）
+    DB_POOL_TIMEOUT         检出等待超时秒数（默认 30）
+    DB_POOL_RECYCLE         连接回收秒数（默认 3600，需小于 MySQL wait_timeout）
+    DB_POOL_WAIT_WARN_MS    单次检出等待超过该毫秒数时输出告警（默认 100）
+"""
+import os
+import threading
+from collections import deque
+from time import perf_counter
+from typing import Any, Dict, Optional, Type
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+from app.logging_config import get_logger
+
+logger = get_logger("db")
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+WAIT_WARN_MS = float(os.getenv("DB_POOL_WAIT_WARN_MS", "100"))
+
+# 内部取连接方法（SQLAlchemy 2.0 / 2.1 均有）；缺失时改用公开的 connect() 计时
+_HAS_DO_GET = all(callable(getattr(cls, "_do_get", None)) for cls in (QueuePool, AsyncAdaptedQueuePool))
+if not _HAS_DO_GET:
+    logger.warning("[DB] Pool._do_get not available, timing Pool.connect() instead")
+
+# 计算分位数保留的最近等待样本数
+_WAIT_SAMPLES = 1000
+
+_STATS: Dict[str, "PoolStats"] = {}
+
+
+class PoolStats:
+    """单个连接池的累计统计（检出在工作线程与事件循环中都会发生，计数加锁）"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool: Optional[Pool] = None
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.peak_in_use = 0
+        self.peak_overflow = 0
+        self._waits: deque = deque(maxlen=_WAIT_SAMPLES)
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self._waits.append(seconds)
+            if timed_out:
+                self.timeouts += 1
+        if seconds * 1000 >= WAIT_WARN_MS:
+            logger.warning(
+                f"[DB] Slow pool checkout ({self.name}): {seconds * 1000:.0f}ms",
+                extra={"pool": self.name, "wait_ms": round(seconds * 1000, 1), "timed_out": timed_out, **self._usage()},
+            )
+
+    def on_checkout(self) -> None:
+        usage = self._usage()
+        with self._lock:
+            self.checkouts += 1
+            self.peak_in_use = max(self.peak_in_use, usage.get("in_use") or 0)
+            self.peak_overflow = max(self.peak_overflow, usage.get("overflow") or 0)
+
+    def on_connect(self) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def on_invalidate(self) -> None:
+        with self._lock:
+            self.invalidations += 1
+
+    def _usage(self) -> Dict[str, Any]:
+        """连接池实时占用（QueuePool 才有 size / overflow）"""
+        pool = self.pool
+        if pool is None or not hasattr(pool, "checkedout"):
+            return {}
+        return {
+            "size": pool.size(),
+            "in_use": pool.checkedout(),
+            "idle": pool.checkedin(),
+            # overflow() 在常驻连接未建满时为负数，对外只报告实际溢出的连接
+            "overflow": max(pool.overflow(), 0),
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            count = len(waits)
+            return {
+                **self._usage(),
+                "max_overflow": MAX_OVERFLOW,
+                "timeout_s": POOL_TIMEOUT,
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "peak_in_use": self.peak_in_use,
+                "peak_overflow": self.peak_overflow,
+                "wait_avg_ms": round(self.wait_total / self.wait_count * 1000, 2) if self.wait_count else 0.0,
+                "wait_p95_ms": round(waits[min(int(count * 0.95), count - 1)] * 1000, 2) if count else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 2),
+            }
+
+
+def _instrumented_pool_class(base: Type[Pool], stats: PoolStats) -> Type[Pool]:
+    """
+    在 _do_get（从池中取连接、池满时排队等待的位置）外计时
+    _do_get 为 SQLAlchemy 内部方法：当前版本没有时退化为对公开的 Pool.connect() 计时
+    （此时等待时间包含 pre_ping 的一次往返）
+    连接池在 engine.dispose() 时按 self.__class__ 重建，埋点随之保留
+    """
+    hook = "_do_get" if _HAS_DO_GET else "connect"
+    wrapped = getattr(base, hook)
+
+    def timed(self):
+        stats.pool = self
+        start = perf_counter()
+        try:
+            conn = wrapped(self)
+        except PoolTimeoutError:
+            stats.record_wait(perf_counter() - start, timed_out=True)
+            raise
+        stats.record_wait(perf_counter() - start)
+        return conn
+
+    return type(f"Instrumented{base.__name__}", (base,), {hook: timed})
+
+
+def pool_options(name: str, url: str, is_async: bool = False) -> Dict[str, Any]:
+    """
+    create_engine / create_async_engine 的连接池参数（按环境变量配置并带埋点）
+    SQLite 内存库使用单连接池，不适用队列池参数，只保留默认行为
+    """
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":")):
+        return {}
+    stats = _STATS[name] = PoolStats(name)
+    base = AsyncAdaptedQueuePool if is_async else QueuePool
+    return {
+        "poolclass": _instrumented_pool_class(base, stats),
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_recycle": POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+def instrument_engine(name: str, engine) -> None:
+    """为引擎注册连接池事件（异步引擎传入其 sync_engine）"""
+    stats = _STATS.get(name)
+    if stats is None:
+        return
+    stats.pool = engine.pool
+    event.listen(engine, "checkout", lambda *_: stats.on_checkout())
+    event.listen(engine, "connect", lambda *_: stats.on_connect())
+    event.listen(engine, "invalidate", lambda *_: stats.on_invalidate())
+    event.listen(engine, "soft_invalidate", lambda *_: stats.on_invalidate())
+
+
+def pool_status() -> Dict[str, Dict[str, Any]]:
+    """各连接池当前统计：{"sync": {...}, "async": {...}}"""
+    return {name: stats.snapshot() for name, stats in _STATS.items()}
+
+
+def log_pool_status() -> None:
+    """每个连接池输出一条结构化日志（由后台任务定期调用）"""
+    for name, snap in pool_status().items():
+        logger.info(
+            f"[DB] Pool {name}: in_use={snap.get('in_use')} overflow={snap.get('overflow')} "
+            f"wait_p95={snap['wait_p95_ms']}ms timeouts={snap['timeouts']}",
+            extra={"pool": name, **snap},
+        )
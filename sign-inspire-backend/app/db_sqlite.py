@@ -0,0 +1,70 @@
+"""
+嵌入式 SQLite 后端（单机部署 / 压测）：DATABASE_URL=sqlite:////绝对路径/sign_inspire.db
+与 MySQL 使用同一套模型（规则、门店、词汇表、媒体缓存），无需单独的数据库进程
+- WAL 模式：读不阻塞写，多个 worker 可同时读
+- 每个连接建立时设置 pragma（同步级别、页缓存、mmap、忙等待、外键）
+
+环境变量：
+    SQLITE_SYNCHRONOUS        NORMAL（默认，WAL 下断电最多丢最近事务）| FULL | OFF
+    SQLITE_CACHE_SIZE_MB      每连接页缓存（默认 64）
+    SQLITE_MMAP_SIZE_MB       内存映射读取大小（默认 256，0 关闭）
+    SQLITE_BUSY_TIMEOUT_MS    写锁等待毫秒数（默认 5000）
+"""
+import os
+from typing import Any, Dict
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+CACHE_SIZE_MB = int(os.getenv("SQLITE_CACHE_SIZE_MB", "64"))
+MMAP_SIZE_MB = int(os.getenv("SQLITE_MMAP_SIZE_MB", "256"))
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def _is_memory(url: str) -> bool:
+    database = make_url(url).database
+    return not database or database == ":memory:"
+
+
+def sqlite_engine_options(url: str) -> Dict[str, Any]:
+    """create_engine 附加参数：连接跨线程使用（后台线程写种子、to_thread 等），忙等待与 pragma 一致"""
+    if not is_sqlite(url):
+        return {}
+    database = make_url(url).database
+    if database and database != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(database)), exist_ok=True)
+    return {"connect_args": {"check_same_thread": False, "timeout": BUSY_TIMEOUT_MS / 1000}}
+
+
+def tune_sqlite_engine(engine, url: str) -> None:
+    """为 SQLite 引擎注册连接 pragma（异步引擎传入其 sync_engine）"""
+    if not is_sqlite(url):
+        return
+    pragmas = [
+        f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+        "PRAGMA foreign_keys=ON",
+        f"PRAGMA synchronous={SYNCHRONOUS}",
+        f"PRAGMA cache_size={-CACHE_SIZE_MB * 1024}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    if not _is_memory(url):
+        pragmas = ["PRAGMA journal_mode=WAL", f"PRAGMA mmap_size={MMAP_SIZE_MB * 1024 * 1024}"] + pragmas
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def backend_name(url: str) -> str:
+    """调试接口展示用的数据库类型"""
+    return "SQLite" if is_sqlite(url) else "MySQL"
@@ -0,0 +1,103 @@
+"""
+日志配置：队列 + 后台线程输出，结构化 JSON，按子系统分级，高频事件采样
+- 业务代码只把日志记录放入队列（QueueHandler），格式化与 stdout I/O 由 QueueListener 后台线程完成，不阻塞事件循环
+- 子系统：scheduler / matching / providers / api / stores / db，各自可单独设置级别
+- 每 2 秒一次的屏幕轮询等高频事件用 log_sampled 采样，日志开销不再随轮询频率线性增长
+
+环境变量：
+- LOG_LEVEL：默认级别（INFO）
+- LOG_LEVEL_<SUBSYSTEM>：子系统级别，如 LOG_LEVEL_SCHEDULER=DEBUG、LOG_LEVEL_API=WARNING
+- LOG_FORMAT：json（默认）| text
+- LOG_SAMPLE_EVERY：高频事件每 N 次输出 1 次（默认 100）
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+ROOT_LOGGER = "sign_inspire"
+SUBSYSTEMS = ("scheduler", "matching", "providers", "api", "stores", "db")
+
+# LogRecord 自带属性，其余通过 extra= 传入的字段作为结构化字段输出
+_RESERVED_ATTRS = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_sample_counts: Dict[str, int] = {}
+_sample_lock = threading.Lock()
+_SAMPLE_EVERY = max(1, int(os.getenv("LOG_SAMPLE_EVERY", "100")))
+
+
+class JsonFormatter(logging.Formatter):
+    """每条记录输出一行 JSON：ts / level / logger / msg + extra 字段"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                out[key] = value
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+def get_logger(subsystem: str) -> logging.Logger:
+    """获取子系统 logger，如 get_logger("scheduler") -> sign_inspire.scheduler"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{subsystem}")
+
+
+def log_sampled(logger: logging.Logger, level: int, key: str, msg: str, *args, **extra) -> None:
+    """
+    高频事件采样：同一 key 每 LOG_SAMPLE_EVERY 次只输出 1 次，并带上 sampled=N
+    级别未启用时直接返回，不计数、不格式化
+    """
+    if not logger.isEnabledFor(level):
+        return
+    with _sample_lock:
+        n = _sample_counts.get(key, 0) + 1
+        _sample_counts[key] = n
+    if (n - 1) % _SAMPLE_EVERY:
+        return
+    logger.log(level, msg, *args, extra={**extra, "sampled": _SAMPLE_EVERY})
+
+
+def setup_logging() -> None:
+    """初始化日志（幂等）：根 logger 挂 QueueHandler，后台线程负责格式化与输出"""
+    global _listener
+    if _listener is not None:
+        return
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    for name in SUBSYSTEMS:
+        level = os.getenv(f"LOG_LEVEL_{name.upper()}")
+        if level:
+            get_logger(name).setLevel(level.upper())
+
+    stream = logging.StreamHandler(sys.stdout)
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+    else:
+        stream.setFormatter(JsonFormatter())
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root.propagate = False
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """停止后台输出线程，并刷新队列中剩余日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -8,73 +8,113 @@ if hasattr(sys.stdout, "reconfigure"):
         sys.stdout.reconfigure(encoding="utf-8")
     except Exception:
         pass
+# 日志：队列 + 后台线程输出，需在导入业务模块前初始化
+from app.logging_config import setup_logging, shutdown_logging, get_logger
+setup_logging()
+logger = get_logger("scheduler")
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware  # <--- 新增这行
 from contextlib import asynccontextmanager
 import asyncio
-from app.api.v1.endpoints import rules, stores, decide
-from app.services.scheduler_service import check_rules_job
+from app.api.v1.endpoints import rules, stores, decide, player
+from app.services.scheduler_service import check_rules_job, sync_shared_state
+from app.services import media_manifest_service, shared_state, snapshot_service
+from app.services.sign_index_service import refresh_sign_index_if_stale
+from app.database_async import dispose_async_db
+from app import db_connect
+from app.db_pool import log_pool_status
 
 # 后台任务控制
 background_task = None
 
-async def weather_check_loop():
+async def weather_check_loop(initial_delay: float = 5):
     """
     后台任务：定期检查天气并更新规则
+    initial_delay：首次检查前等待秒数（从快照热启动时为 0，立即在后台刷新）
     """
     # 等待一段时间，避免与启动时的检查冲突
-    await asyncio.sleep(5)
+    await asyncio.sleep(initial_delay)
     
     while True:
         try:
-            print("[Background] Rules check...")
+            logger.debug("[Background] Rules check...")
             await check_rules_job()
         except Exception as e:
-            print(f"[Error] Weather check: {e}")
+            logger.exception(f"[Error] Weather check: {e}")
+        # 数据库探活：连续失败切回内存模式并后台重连
+        await db_connect.check_health()
+        # 门店表有库外修改时重建 sign_id 索引
+        await refresh_sign_index_if_stale()
+        # 媒体清单素材元数据：新规则的素材在后台下载，清单接口只读缓存
+        try:
+            await media_manifest_service.refresh_asset_meta()
+        except Exception as e:
+            logger.warning(f"[Warn] Media manifest refresh failed: {e}")
+        # 连接池统计（检出等待、占用、溢出、失效）每分钟一条结构化日志
+        log_pool_status()
+        # 定期写热重启快照（多 worker 时只由写入方写）
+        if shared_state.is_leader():
+            await asyncio.to_thread(snapshot_service.save_snapshot_if_due)
         # 每60秒执行一次
         await asyncio.sleep(60)
 
+async def shared_state_sync_loop():
+    """
+    多 worker 模式：非写入方 worker 每 SHARED_STATE_SYNC_INTERVAL 秒同步一次共享状态
+    （仅比对 generation，有变化才拉取增量），使本进程的轮询/长轮询及时看到新内容
+    """
+    while True:
+        try:
+            if not shared_state.is_leader():
+                await sync_shared_state()
+        except Exception as e:
+            logger.warning(f"[SharedState] Sync failed: {e}")
+        await asyncio.sleep(shared_state.SYNC_INTERVAL)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global background_task
-    print("[System] Smart scheduler starting...")
+    logger.info("[System] Smart scheduler starting...")
+    
+    # 连接数据库（建表、种子、异步引擎、内存索引）：短超时尝试一次，
+    # 失败则以内存模式启动，后台按退避重连，连上后运行中切换到数据库模式
+    if not await db_connect.connect():
+        logger.info("[Info] Using memory DB mode")
+        db_connect.use_memory_mode()
+        db_connect.start_reconnect()
     
-    # 初始化数据库（创建表）
-    from app.database import init_db, USE_DATABASE
-    if USE_DATABASE:
+    # 热重启：先加载快照（缓存 + 播放状态），恢复成功则首次检查放到后台，不阻塞启动
+    restored = snapshot_service.load_snapshot()
+    if not restored:
+        # 启动时立即执行一次，获取初始天气
         try:
-            init_db()
-            print("[OK] Database initialized")
+            await check_rules_job()
         except Exception as e:
-            print(f"[Warn] DB init: {e}")
-    else:
-        print("[Info] Using memory DB mode")
-        from app.database import _seed_rules_to_mock_db
-        from app.models.rule_storage import MOCK_DB
-        if not any(r.get("store_id") == "store_001" for r in MOCK_DB):
-            _seed_rules_to_mock_db("store_001")
-            print("[OK] Seeded default rules")
-    
-    # 启动时立即执行一次，获取初始天气
-    try:
-        await check_rules_job()
-    except Exception as e:
-        print(f"[Warn] First rules check failed: {e}")
+            logger.warning(f"[Warn] First rules check failed: {e}")
     
     # 启动后台任务，定期检查天气
-    background_task = asyncio.create_task(weather_check_loop())
+    background_task = asyncio.create_task(weather_check_loop(initial_delay=0 if restored else 5))
+    # 多 worker 共享状态：读取方同步任务（未配置 SHARED_STATE_PATH 时不启动）
+    sync_task = asyncio.create_task(shared_state_sync_loop()) if shared_state.enabled() else None
     
     yield
     
     # 关闭时取消后台任务
-    if background_task:
-        background_task.cancel()
-        try:
-            await background_task
-        except asyncio.CancelledError:
-            pass
+    for task in (background_task, sync_task):
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    if shared_state.is_leader():
+        snapshot_service.save_snapshot()
+    shared_state.release_leadership()
+    await db_connect.stop()
+    await dispose_async_db()
     
-    print("[System] Scheduler shutting down...")
+    logger.info("[System] Scheduler shutting down...")
+    shutdown_logging()
 
 app = FastAPI(lifespan=lifespan, title="Sign Inspire Backend")
 
@@ -96,12 +136,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],  # current-content 条件请求需读取 ETag
 )
 # --------------------
 
 app.include_router(rules.router, prefix="/api/v1")
 app.include_router(stores.router, prefix="/api/v1")
 app.include_router(decide.router, prefix="/api/v1")
+app.include_router(player.router, prefix="/api/v1")
 
 @app.get("/")
 def health_check():
@@ -0,0 +1,203 @@
+"""
+数据库结构迁移：按版本号顺序执行，已执行的版本记录在 schema_migrations 表
+- 新库由 create_all 按模型建好表和索引，迁移检查后跳过；旧库由迁移补列、补索引、回填数据
+- 每个迁移需可重复执行（多 worker 同时启动、或执行中途失败后重试）
+- 新增迁移：在 MIGRATIONS 末尾追加 (版本号, 说明, 函数)，函数接收同步引擎
+"""
+import json
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, insert, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import func
+
+from app.logging_config import get_logger
+
+logger = get_logger("db")
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(200), nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+def _index_names(eng, table: str) -> set:
+    insp = inspect(eng)
+    return {i["name"] for i in insp.get_indexes(table)} | {u["name"] for u in insp.get_unique_constraints(table)}
+
+
+def _create_indexes(eng, table: str, indexes: List[Tuple[str, str]]) -> None:
+    """缺失的索引才创建：[(索引名, 列清单)]"""
+    existing = _index_names(eng, table)
+    with eng.begin() as conn:
+        for name, columns in indexes:
+            if name not in existing:
+                conn.execute(text(f"CREATE INDEX {name} ON {table} ({columns})"))
+                logger.info(f"[Migrate] Created index {name} ON {table} ({columns})")
+
+
+def _rule_content_hash(eng) -> None:
+    """
+    rules 表缺少 content_hash 列时补列、回填并建门店内唯一索引
+    历史上已重复的规则只保留最早一条的哈希，其余置空（不删除数据）
+    """
+    from app.models.rule_model import rule_content_hash
+    columns = {c["name"] for c in inspect(eng).get_columns("rules")}
+    indexes = _index_names(eng, "rules")
+    if "content_hash" in columns and "uq_rules_store_content" in indexes:
+        return
+    with eng.begin() as conn:
+        if "content_hash" not in columns:
+            conn.execute(text("ALTER TABLE rules ADD COLUMN content_hash VARCHAR(64) NULL"))
+        rows = conn.execute(text(
+            "SELECT id, store_id, conditions, action FROM rules WHERE content_hash IS NULL ORDER BY created_at, id"
+        )).all()
+        taken = set(conn.execute(text(
+            "SELECT store_id, content_hash FROM rules WHERE content_hash IS NOT NULL"
+        )).all())
+        updates = []
+        for rid, store_id, conditions, action in rows:
+            if isinstance(conditions, str):
+                conditions = json.loads(conditions)
+            if isinstance(action, str):
+                action = json.loads(action)
+            key = (store_id, rule_content_hash(conditions, action))
+            if key not in taken:
+                taken.add(key)
+                updates.append({"id": rid, "h": key[1]})
+        if updates:
+            conn.execute(text("UPDATE rules SET content_hash = :h WHERE id = :id"), updates)
+        if "uq_rules_store_content" not in indexes:
+            conn.execute(text("CREATE UNIQUE INDEX uq_rules_store_content ON rules (store_id, content_hash)"))
+    logger.info(f"[Migrate] rules.content_hash backfilled {len(updates)}, {len(rows) - len(updates)} duplicates left unhashed")
+
+
+def _query_indexes(eng) -> None:
+    """按实际查询补复合索引（与模型 __table_args__ 一致）"""
+    _create_indexes(eng, "stores", [
+        ("ix_stores_city_active", "city, is_active, id"),
+        ("ix_stores_created_at", "created_at"),
+        ("ix_stores_updated_at", "updated_at"),
+    ])
+    _create_indexes(eng, "rules", [
+        ("ix_rules_store_id_id", "store_id, id"),
+        ("ix_rules_created_at", "created_at"),
+        ("ix_rules_updated_at", "updated_at"),
+    ])
+
+
+def _rule_conditions(eng) -> None:
+    """rule_conditions 表（create_all 已建）按现有规则全量回填"""
+    from app.models.rule_condition_model import RuleCondition, condition_rows
+    from app.models.rule_model import Rule
+    with eng.begin() as conn:
+        conn.execute(RuleCondition.__table__.delete())
+        rows = []
+        for rid, conditions in conn.execute(select(Rule.id, Rule.conditions)):
+            if isinstance(conditions, str):
+                conditions = json.loads(conditions)
+            rows.extend(condition_rows(rid, conditions))
+        for start in range(0, len(rows), 1000):
+            conn.execute(insert(RuleCondition), rows[start:start + 1000])
+    logger.info(f"[Migrate] rule_conditions backfilled {len(rows)} rows")
+
+
+def _store_geo_columns(eng) -> None:
+    """stores 增加 country_code / region / china_subregion（批量开通时写入）"""
+    columns = {c["name"] for c in inspect(eng).get_columns("stores")}
+    with eng.begin() as conn:
+        for name, ddl in (("country_code", "VARCHAR(2)"), ("region", "VARCHAR(20)"), ("china_subregion", "VARCHAR(20)")):
+            if name not in columns:
+                conn.execute(text(f"ALTER TABLE stores ADD COLUMN {name} {ddl} NULL"))
+
+
+def _rule_templates(eng) -> None:
+    """
+    stores 增加 rule_template / disabled_rules；
+    完整持有一份默认规则副本（内容与优先级均未改动）的门店改为订阅 default 模板，删除副本
+    （模板规则由 init_db 的种子写入）
+    """
+    from app.database import DEFAULT_RULES
+    from app.models.rule_condition_model import RuleCondition
+    from app.models.rule_model import Rule, rule_content_hash
+    from app.models.store_model import Store
+    from app.services.rule_templates import DEFAULT_TEMPLATE, is_template_scope
+    columns = {c["name"] for c in inspect(eng).get_columns("stores")}
+    defaults = {(rule_content_hash(d["conditions"], d["action"]), d["priority"]) for d in DEFAULT_RULES}
+    with eng.begin() as conn:
+        for name, ddl in (("rule_template", "VARCHAR(50)"), ("disabled_rules", "JSON")):
+            if name not in columns:
+                conn.execute(text(f"ALTER TABLE stores ADD COLUMN {name} {ddl} NULL"))
+        copies: dict = {}
+        rows = conn.execute(
+            select(Rule.id, Rule.store_id, Rule.content_hash, Rule.priority)
+            .where(Rule.content_hash.in_(sorted({h for h, _ in defaults})))
+        )
+        for rid, store_id, content_hash, priority in rows:
+            if (content_hash, priority) in defaults and not is_template_scope(store_id):
+                copies.setdefault(store_id, {})[(content_hash, priority)] = rid
+        stores = set(conn.execute(select(Store.id)).scalars())
+        converted = [sid for sid, found in copies.items() if len(found) == len(defaults) and sid in stores]
+        removed = 0
+        for sid in converted:
+            ids = list(copies[sid].values())
+            conn.execute(RuleCondition.__table__.delete().where(RuleCondition.rule_id.in_(ids)))
+            removed += conn.execute(Rule.__table__.delete().where(Rule.id.in_(ids))).rowcount
+            conn.execute(Store.__table__.update().where(Store.id == sid).values(rule_template=DEFAULT_TEMPLATE))
+    logger.info(f"[Migrate] {len(converted)} stores now inherit template {DEFAULT_TEMPLATE}, removed {removed} rule copies")
+
+
+def _rules_version(eng) -> None:
+    """rules_version 表（create_all 已建）写入唯一一行，初始版本 0"""
+    from app.models.rule_model import RULES_VERSION_ROW, RulesVersion
+    with eng.connect() as conn:
+        if conn.execute(select(RulesVersion.id).where(RulesVersion.id == RULES_VERSION_ROW)).first():
+            return
+    try:
+        with eng.begin() as conn:
+            conn.execute(insert(RulesVersion).values(id=RULES_VERSION_ROW, version=0))
+    except IntegrityError:
+        # 其他 worker 已同时写入
+        pass
+
+
+def _rule_conditions_all(eng) -> None:
+    """rule_conditions 改为每个条件至少一行（按条件类型过滤在 SQL 中完成），重新回填；规则列表分页索引"""
+    _rule_conditions(eng)
+    _create_indexes(eng, "rules", [("ix_rules_store_priority_id", "store_id, priority, id")])
+
+
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "rules.content_hash 列与门店内唯一索引", _rule_content_hash),
+    (2, "stores / rules 查询复合索引", _query_indexes),
+    (3, "rule_conditions 规范化条件表回填", _rule_conditions),
+    (4, "stores 地理字段（country_code / region / china_subregion）", _store_geo_columns),
+    (5, "共享规则模板：stores.rule_template / disabled_rules，默认规则副本改为订阅", _rule_templates),
+    (6, "rules_version 规则版本计数器", _rules_version),
+    (7, "rule_conditions 每个条件至少一行 + rules (store_id, priority, id) 索引", _rule_conditions_all),
+]
+
+
+def run_migrations(eng) -> int:
+    """执行未执行过的迁移（在 create_all 之后调用），返回本次执行数"""
+    schema_migrations.create(eng, checkfirst=True)
+    with eng.connect() as conn:
+        applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+    count = 0
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        migrate(eng)
+        try:
+            with eng.begin() as conn:
+                conn.execute(insert(schema_migrations).values(version=version, name=name))
+        except IntegrityError:
+            # 其他 worker 已同时执行并记录
+            pass
+        logger.info(f"[Migrate] Applied {version}: {name}")
+        count += 1
+    return count
@@ -0,0 +1,60 @@
+"""
+规则条件规范化表：rules.conditions（JSON）按条件拆成行，供 SQL 在加载规则前按条件预筛选
+随规则写入维护（ORM 插入/更新由 rule_model 的事件写入，批量导入显式写入，删除由外键级联）
+"""
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Column, ForeignKey, Index, Integer, String
+from app.database import Base
+
+# value 列长度；超长的条件值写为 NULL（预筛选时该行不参与排除，结果仍是超集）
+VALUE_MAX_LENGTH = 100
+# 忽略大小写比较的条件类型（与 rule_evaluator 编译时一致）
+_LOWERCASE_TYPES = ("weather", "city", "region", "china_region")
+
+
+class RuleCondition(Base):
+    """rule_conditions 表：每条规则的每个条件至少一行（weather 的 in 条件每个取值一行）"""
+    __tablename__ = "rule_conditions"
+    __table_args__ = (
+        Index("ix_rule_conditions_type_value", "type", "value"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    rule_id = Column(String(36), ForeignKey("rules.id", ondelete="CASCADE"), nullable=False, index=True)
+    type = Column(String(20), nullable=False)
+    value = Column(String(VALUE_MAX_LENGTH), nullable=True)
+
+
+def _normalize_value(ctype: str, value: Any) -> Optional[str]:
+    if value is None or not str(value).strip():
+        return None
+    text = str(value).strip()
+    return text.lower() if ctype in _LOWERCASE_TYPES else text
+
+
+def condition_rows(rule_id: str, conditions: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    规则条件 -> rule_conditions 行（按条件类型过滤依赖每个条件至少一行）
+    value 为 NULL 表示该行不参与预筛选排除：city / region 非 == 或值为空（求值器忽略该条件）、weather 非 == / in、值超长
+    """
+    rows: List[Dict[str, Any]] = []
+    for cond in conditions or []:
+        ctype = cond.get("type")
+        if not ctype or len(ctype) > 20:
+            continue
+        op = cond.get("operator", "==")
+        raw = cond.get("value")
+        if ctype in ("city", "region") and (op != "==" or not raw):
+            values = [None]
+        elif ctype == "weather" and op == "in":
+            values = [_normalize_value(ctype, v) for v in str(raw).split(",")]
+        elif ctype == "weather" and op != "==":
+            values = [None]
+        else:
+            values = [_normalize_value(ctype, raw)]
+        for value in values:
+            if value is not None and len(value) > VALUE_MAX_LENGTH:
+                value = None
+            rows.append({"rule_id": rule_id, "type": ctype, "value": value})
+    return rows
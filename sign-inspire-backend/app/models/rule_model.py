@@ -1,16 +1,48 @@
 """
 规则数据库模型
 """
-from sqlalchemy import Column, String, Integer, JSON, DateTime
+import hashlib
+import json
+
+from sqlalchemy import BigInteger, Column, String, Integer, JSON, DateTime, Index, UniqueConstraint, delete, event, insert, inspect, update
 from sqlalchemy.sql import func
 from app.database import Base
 
 
+def _drop_nulls(value):
+    return {k: v for k, v in value.items() if v is not None} if isinstance(value, dict) else value
+
+
+def rule_content_hash(conditions, action) -> str:
+    """
+    规则内容哈希：条件（与顺序无关）+ 动作的规范化 JSON 的 sha256
+    值为 null 的字段不参与（如未填写的 message），同一门店内内容哈希唯一，重复规则由唯一约束拒绝
+    """
+    conds = sorted(json.dumps(_drop_nulls(c), sort_keys=True, ensure_ascii=False) for c in (conditions or []))
+    body = json.dumps([conds, _drop_nulls(action)], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+def _default_content_hash(context) -> str:
+    """插入时（ORM 与 Core executemany 均适用）按本行条件、动作计算"""
+    params = context.get_current_parameters()
+    return rule_content_hash(params.get("conditions"), params.get("action"))
+
+
 class Rule(Base):
     """
     规则表模型
     """
     __tablename__ = "rules"
+    __table_args__ = (
+        UniqueConstraint("store_id", "content_hash", name="uq_rules_store_content"),
+        # 导出按 (store_id, id) 流式读取
+        Index("ix_rules_store_id_id", "store_id", "id"),
+        # 规则列表按 (priority 降序, id) 键集分页
+        Index("ix_rules_store_priority_id", "store_id", "priority", "id"),
+        Index("ix_rules_created_at", "created_at"),
+        Index("ix_rules_updated_at", "updated_at"),
+    )
 
     id = Column(String(36), primary_key=True, index=True)
     store_id = Column(String(50), index=True, nullable=False)
@@ -18,6 +50,7 @@ class Rule(Base):
     priority = Column(Integer, default=1, nullable=False)
     conditions = Column(JSON, nullable=False)  # 存储条件列表
     action = Column(JSON, nullable=False)      # 存储动作对象
+    content_hash = Column(String(64), nullable=True, default=_default_content_hash)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -32,6 +65,58 @@ class Rule(Base):
             "priority": self.priority,
             "conditions": self.conditions,
             "action": self.action,
+            "content_hash": self.content_hash,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None
         }
+
+
+# rules_version 表的唯一一行
+RULES_VERSION_ROW = 1
+
+
+class RulesVersion(Base):
+    """
+    rules_version 表：单行计数器，每次写入规则时在同一事务内递增（bump_rules_version）
+    规则仓库据此（连同行数、最新创建/更新时间）判断内存副本是否过期
+    """
+    __tablename__ = "rules_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+
+def bump_rules_version():
+    """版本号 +1 的 UPDATE 语句（同步 / 异步会话均可执行，须与规则写入在同一事务）"""
+    return (
+        update(RulesVersion)
+        .where(RulesVersion.id == RULES_VERSION_ROW)
+        .values(version=RulesVersion.version + 1)
+    )
+
+
+@event.listens_for(Rule, "before_update")
+def _refresh_content_hash(mapper, connection, target):
+    """条件或动作被修改时重算内容哈希"""
+    target.content_hash = rule_content_hash(target.conditions, target.action)
+
+
+@event.listens_for(Rule, "after_insert")
+def _insert_conditions(mapper, connection, target):
+    """ORM 插入规则后写入 rule_conditions（同一事务）"""
+    from app.models.rule_condition_model import RuleCondition, condition_rows
+    rows = condition_rows(target.id, target.conditions)
+    if rows:
+        connection.execute(insert(RuleCondition), rows)
+
+
+@event.listens_for(Rule, "after_update")
+def _update_conditions(mapper, connection, target):
+    """条件被修改时重写该规则的 rule_conditions"""
+    from app.models.rule_condition_model import RuleCondition, condition_rows
+    if not inspect(target).attrs.conditions.history.has_changes():
+        return
+    connection.execute(delete(RuleCondition).where(RuleCondition.rule_id == target.id))
+    rows = condition_rows(target.id, target.conditions)
+    if rows:
+        connection.execute(insert(RuleCondition), rows)
@@ -1,3 +1,169 @@
 # 规则存储模块 - 避免循环导入
+"""
+内存模式的规则存储（数据库未启用或写入失败时降级使用）
+接口与规则仓库（app/services/rule_repository.py）的读写函数一致，单条操作均为 O(1)：
+- 主索引：id -> 规则字典
+- 二级索引：store_id -> {id: 规则}、(store_id, content_hash) -> 规则
+- 按门店缓存分页顺序（priority 降序, id），只在该门店写入时失效
+返回的规则字典为共享对象，调用方只读；修改走 update_rule（整条替换，不原地改）
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# 与规则仓库共用分页排序键（rule_repository 只在函数内导入模型，不会反向导入本模块）
+from app.services.rule_repository import page_order_key
+
+
+class DuplicateRuleError(ValueError):
+    """门店内已存在条件与动作相同的规则（对应数据库模式的唯一约束冲突）"""
+
+
+class MemoryRuleStore:
+    """带索引的内存规则表"""
+
+    def __init__(self):
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._by_store: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._by_content: Dict[tuple, Dict[str, Any]] = {}
+        # 按优先级降序的全部规则（写入后失效）
+        self._sorted: Optional[List[Dict[str, Any]]] = None
+        # store_id -> 按分页排序键排好的规则（该门店写入后失效）
+        self._page_order: Dict[str, List[Dict[str, Any]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(list(self._by_id.values()))
+
+    def _invalidate(self, store_id: str) -> None:
+        self._sorted = None
+        self._page_order.pop(store_id, None)
+
+    def _index(self, rule: Dict[str, Any]) -> None:
+        store_id = rule.get("store_id") or ""
+        self._by_id[rule["id"]] = rule
+        self._by_store.setdefault(store_id, {})[rule["id"]] = rule
+        if rule.get("content_hash"):
+            self._by_content[(store_id, rule["content_hash"])] = rule
+        self._invalidate(store_id)
+
+    def _unindex(self, rule_id: str) -> Optional[Dict[str, Any]]:
+        old = self._by_id.pop(rule_id, None)
+        if old is None:
+            return None
+        store_id = old.get("store_id") or ""
+        bucket = self._by_store.get(store_id)
+        if bucket is not None:
+            bucket.pop(rule_id, None)
+            if not bucket:
+                del self._by_store[store_id]
+        key = (store_id, old.get("content_hash"))
+        if self._by_content.get(key) is old:
+            del self._by_content[key]
+        self._invalidate(store_id)
+        return old
+
+    # ---------- 读取 ----------
+
+    def all_rules(self) -> List[Dict[str, Any]]:
+        """全部规则，按优先级降序"""
+        if self._sorted is None:
+            self._sorted = sorted(self._by_id.values(), key=lambda r: r.get("priority") or 0, reverse=True)
+        return self._sorted
+
+    def rules_for_stores(self, store_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        """指定门店（可含全局 '*'）的规则"""
+        out: List[Dict[str, Any]] = []
+        for sid in dict.fromkeys(store_ids):
+            out.extend(self._by_store.get(sid, {}).values())
+        return out
+
+    def store_rule_count(self, store_id: str) -> int:
+        return len(self._by_store.get(store_id, {}))
+
+    def store_ids(self) -> List[str]:
+        """有规则的门店 / 作用域（含 '*' 与模板）"""
+        return list(self._by_store)
+
+    def rules_in_page_order(self, store_id: str) -> List[Dict[str, Any]]:
+        """门店规则按分页排序键排好（缓存到该门店下次写入）"""
+        ordered = self._page_order.get(store_id)
+        if ordered is None:
+            ordered = self._page_order[store_id] = sorted(
+                self._by_store.get(store_id, {}).values(), key=page_order_key
+            )
+        return ordered
+
+    def get_rule(self, rule_id: str, store_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        rule = self._by_id.get(rule_id)
+        if rule is None or (store_id is not None and rule.get("store_id") != store_id):
+            return None
+        return rule
+
+    def find_by_content(self, store_id: str, content_hash: str) -> Optional[Dict[str, Any]]:
+        """按内容哈希查门店内的同内容规则"""
+        return self._by_content.get((store_id or "", content_hash))
+
+    # ---------- 写入 ----------
+
+    def add_rule(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        写入一条规则，返回保存后的字典（content_hash 缺失时补算）
+        门店内已有同内容规则时不写入，返回已存在的那条（与数据库模式一致）
+        """
+        from app.models.rule_model import rule_content_hash
+        rule = dict(values)
+        if not rule.get("content_hash"):
+            rule["content_hash"] = rule_content_hash(rule.get("conditions"), rule.get("action"))
+        existing = self.find_by_content(rule.get("store_id"), rule["content_hash"])
+        if existing is not None:
+            return existing
+        self._unindex(rule["id"])
+        self._index(rule)
+        return rule
+
+    def add_rules(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """批量写入（调用方已去重、已算 content_hash），返回写入条数"""
+        count = 0
+        for row in rows:
+            self._unindex(row["id"])
+            self._index(row)
+            count += 1
+        return count
+
+    def update_rule(self, store_id: str, rule_id: str, values: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        部分更新，规则不存在时返回 None
+        条件或动作变化时重算 content_hash，与门店内其他规则相同则抛 DuplicateRuleError
+        """
+        from app.models.rule_model import rule_content_hash
+        current = self.get_rule(rule_id, store_id)
+        if current is None:
+            return None
+        rule = {**current, **{k: v for k, v in values.items() if k in current or k == "content_hash"}}
+        if "conditions" in values or "action" in values:
+            rule["content_hash"] = rule_content_hash(rule.get("conditions"), rule.get("action"))
+            other = self.find_by_content(store_id, rule["content_hash"])
+            if other is not None and other is not current:
+                raise DuplicateRuleError(rule["content_hash"])
+        self._unindex(rule_id)
+        self._index(rule)
+        return rule
+
+    def delete_rule(self, store_id: str, rule_id: str) -> bool:
+        """删除一条规则，返回是否存在"""
+        if self.get_rule(rule_id, store_id) is None:
+            return False
+        self._unindex(rule_id)
+        return True
+
+    def delete_store_rules(self, store_id: str) -> int:
+        """删除门店全部规则，返回删除条数"""
+        ids = list(self._by_store.get(store_id, {}))
+        for rid in ids:
+            self._unindex(rid)
+        return len(ids)
+
+
 # 全局内存数据库
-MOCK_DB = []
+MOCK_DB = MemoryRuleStore()
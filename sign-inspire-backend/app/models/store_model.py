@@ -1,7 +1,7 @@
 """
 门店数据库模型
 """
-from sqlalchemy import Column, String, Integer, Float, JSON, Boolean, DateTime
+from sqlalchemy import Column, String, Integer, Float, JSON, Boolean, DateTime, Index
 from sqlalchemy.sql import func
 from app.database import Base
 
@@ -9,6 +9,13 @@ from app.database import Base
 class Store(Base):
     """门店表"""
     __tablename__ = "stores"
+    __table_args__ = (
+        # 按城市列出活跃门店、门店列表 city / active 过滤（按 id 分页）
+        Index("ix_stores_city_active", "city", "is_active", "id"),
+        # sign 索引版本检查 max(created_at) / max(updated_at)
+        Index("ix_stores_created_at", "created_at"),
+        Index("ix_stores_updated_at", "updated_at"),
+    )
 
     id = Column(String(50), primary_key=True, index=True)
     name = Column(String(100), nullable=False)
@@ -18,6 +25,13 @@ class Store(Base):
     sign_id = Column(String(50), unique=True, index=True, nullable=True)
     opening_hours = Column(JSON, nullable=True)  # {"mon":"09:00-17:00","tue":"09:00-17:00",...}
     timezone = Column(String(50), default="Australia/Adelaide")
+    # 开通时由城市地理编码推断（为空时 bundle 等按城市实时解析）
+    country_code = Column(String(2), nullable=True)
+    region = Column(String(20), nullable=True)
+    china_subregion = Column(String(20), nullable=True)
+    # 订阅的共享规则模板（按引用继承，见 rule_templates）与屏蔽的模板规则 id 列表
+    rule_template = Column(String(50), nullable=True)
+    disabled_rules = Column(JSON, nullable=True)
     is_active = Column(Boolean, default=True, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -32,6 +46,11 @@ class Store(Base):
             "sign_id": self.sign_id,
             "opening_hours": self.opening_hours,
             "timezone": self.timezone,
+            "country_code": self.country_code,
+            "region": self.region,
+            "china_subregion": self.china_subregion,
+            "rule_template": self.rule_template,
+            "disabled_rules": self.disabled_rules or [],
             "is_active": self.is_active,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
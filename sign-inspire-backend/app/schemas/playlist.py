@@ -0,0 +1,12 @@
+"""播放内容 Schema"""
+from pydantic import BaseModel, Field
+from typing import List
+
+# 单次批量查询的 ID 上限（store_ids + sign_ids）
+MAX_BATCH_IDS = 10000
+
+
+class CurrentContentBatchRequest(BaseModel):
+    """批量查询当前内容：按门店 ID 和/或屏幕 ID"""
+    store_ids: List[str] = Field(default_factory=list, description="门店 ID 列表")
+    sign_ids: List[str] = Field(default_factory=list, description="屏幕 ID 列表")
@@ -25,3 +25,8 @@ class RuleUpdate(BaseModel):
     priority: Optional[int] = None
     conditions: Optional[List[Condition]] = None
     action: Optional[Action] = None
+
+
+class RuleImportItem(RuleCreate):
+    """批量导入（NDJSON 每行一条）：在 RuleCreate 基础上带门店 ID；id / 时间戳等字段忽略，入库时重新生成"""
+    store_id: str = Field(..., min_length=1, max_length=50)
@@ -1,6 +1,6 @@
 """门店 Schema"""
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 
 class StoreCreate(BaseModel):
@@ -12,6 +12,8 @@ class StoreCreate(BaseModel):
     opening_hours: Optional[Dict[str, str]] = None
     timezone: str = "Australia/Adelaide"
     is_active: bool = True
+    # 订阅的共享规则模板名（如 "default"），为空则只用门店自有规则
+    rule_template: Optional[str] = None
 
 
 class StoreUpdate(BaseModel):
@@ -23,3 +25,19 @@ class StoreUpdate(BaseModel):
     opening_hours: Optional[Dict[str, str]] = None
     timezone: Optional[str] = None
     is_active: Optional[bool] = None
+    rule_template: Optional[str] = None
+    # 屏蔽的模板规则 id（整体替换）
+    disabled_rules: Optional[List[str]] = None
+
+
+class StoreBulkItem(BaseModel):
+    """批量开通中的一行：经纬度、时区未填时由城市地理编码推断"""
+    name: str
+    city: str = "Adelaide"
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    sign_id: Optional[str] = None
+    opening_hours: Optional[Dict[str, str]] = None
+    timezone: Optional[str] = None
+    is_active: bool = True
+    rule_template: Optional[str] = None
@@ -6,6 +6,9 @@ https://lbs.amap.com/api/webservice/summary
 import os
 from typing import List, Dict, Any, Optional
 import httpx
+from app.logging_config import get_logger
+
+logger = get_logger("providers")
 
 API_KEY = os.getenv("AMAP_API_KEY")
 BASE_URL = "https://restapi.amap.com/v3/place"
@@ -75,7 +78,7 @@ def search_stores_amap(
                 return []
             pois = data.get("pois") or []
     except Exception as e:
-        print(f"⚠️ [Amap] 请求失败: {e}")
+        logger.warning(f"⚠️ [Amap] 请求失败: {e}")
         return []
 
     out = []
@@ -0,0 +1,148 @@
+"""
+屏幕端 edge bundle：让 Player 在本地自行求值选择内容
+bundle 包含门店已编译规则、门店所在网格未来 48 小时逐小时预报、营业时间、时区与已解析的媒体 URL，
+Player 用与服务端相同的 rule_evaluator 语义逐小时求值，仅在 version 变化时重新下载。
+"""
+import asyncio
+import hashlib
+import json
+from datetime import date, datetime
+from time import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.logging_config import get_logger
+
+logger = get_logger("api")
+
+FORECAST_HOURS = 48
+CHINA_COUNTRY_CODES = ("CN", "HK", "MO", "TW")
+
+# 构建结果缓存：{store_id: (bundle, ts)}，屏幕带 If-None-Match 复查版本时不必重建
+_BUNDLE_CACHE: Dict[str, tuple] = {}
+_BUNDLE_TTL = 60
+
+# 内存模式下 sign_001 对应的默认门店（与 database.py 种子一致）
+_FALLBACK_STORE = {
+    "id": "store_001",
+    "name": "Adelaide 试点门店",
+    "city": "Adelaide",
+    "latitude": -34.9285,
+    "longitude": 138.6007,
+    "sign_id": "sign_001",
+    "opening_hours": None,
+    "timezone": "Australia/Adelaide",
+    "is_active": True,
+}
+
+
+def resolve_sign_store(sign_id: str) -> Optional[Dict[str, Any]]:
+    """sign_id -> 门店字典（内存索引；sign_001 在无数据库时回退到默认门店）"""
+    from app.services.sign_index_service import get_store_by_sign
+    store = get_store_by_sign(sign_id)
+    if store is None and sign_id == "sign_001":
+        return _FALLBACK_STORE
+    return store
+
+
+async def load_store_rules(
+    store_id: str, db: Optional[AsyncSession] = None, subscription: Optional[tuple] = None
+) -> List[Dict[str, Any]]:
+    """
+    加载适用于门店的规则（本店 + 全局 '*' + 订阅模板中未屏蔽的规则；数据库模式读规则仓库内存副本）
+    subscription 为 (模板名, 屏蔽集合)，未传时按门店查询
+    """
+    from app.services import rule_repository
+    from app.services.rule_templates import get_subscription, template_scope
+    from app.models.rule_storage import MOCK_DB
+    name, disabled = subscription if subscription is not None else await get_subscription(store_id, db)
+    source = rule_repository if await rule_repository.ensure_fresh(db) else MOCK_DB
+    rules = source.rules_for_stores((store_id, "*", ""))
+    if name:
+        rules += [r for r in source.rules_for_stores([template_scope(name)]) if r["id"] not in disabled]
+    return rules
+
+
+def _store_geo_context(store: Dict[str, Any]) -> Dict[str, Any]:
+    """门店城市 -> 文化圈 / 中国子区域（开通时已推断的字段优先，其次预设，未知城市走地理编码）"""
+    from app.services.geocoding_service import geocode_city
+    from app.services.region_service import get_region_from_country
+    city = store.get("city") or ""
+    if store.get("country_code"):
+        return {
+            "city": city,
+            "country_code": store["country_code"],
+            "region": store.get("region") or get_region_from_country(store["country_code"]),
+            "china_subregion": store.get("china_subregion") if store["country_code"] in CHINA_COUNTRY_CODES else None,
+        }
+    geo = geocode_city(city) if city else None
+    country_code = (geo or {}).get("country_code")
+    china_subregion = (geo or {}).get("china_subregion") if country_code in CHINA_COUNTRY_CODES else None
+    return {
+        "city": city,
+        "country_code": country_code,
+        "region": get_region_from_country(country_code),
+        "china_subregion": china_subregion,
+    }
+
+
+def _solar_terms_by_date(forecast: List[Dict[str, Any]], country_code: Optional[str]) -> Dict[str, List[str]]:
+    """预报覆盖的每个日期 -> 当日节气（仅中国地区）"""
+    from app.services.solar_term_service import get_active_solar_terms
+    if country_code not in CHINA_COUNTRY_CODES:
+        return {}
+    days = sorted({f["time"][:10] for f in forecast}) or [date.today().isoformat()]
+    return {d: get_active_solar_terms(date.fromisoformat(d)) for d in days}
+
+
+async def build_sign_bundle(store: Dict[str, Any], db: Optional[AsyncSession] = None) -> Dict[str, Any]:
+    """
+    构建门店 bundle，version 为内容摘要（规则、预报、营业时间、媒体任一变化即变化）
+    """
+    from app.services.matching_engine import compile_rules_for_matching
+    from app.services.rule_templates import store_subscription, template_scope
+    from app.services import rule_table
+    from app.services.scheduler_service import get_hourly_forecast
+    from app.services.media_service import get_image_urls
+
+    store_id = store["id"]
+    cached = _BUNDLE_CACHE.get(store_id)
+    if cached and time() - cached[1] < _BUNDLE_TTL:
+        return cached[0]
+
+    # 多进程部署下非写入方 worker 读共享规则表（mmap），无需加载、编译规则
+    table = rule_table.follower_table()
+    name, disabled = store_subscription(store)
+    if table is not None:
+        rules = table.compiled_rules(store_id, template_scope(name), disabled)
+    else:
+        rules = compile_rules_for_matching(await load_store_rules(store_id, db, (name, disabled)))
+    timezone = store.get("timezone") or "Australia/Adelaide"
+    geo_ctx = await asyncio.to_thread(_store_geo_context, store)
+    lat, lon = store.get("latitude"), store.get("longitude")
+    forecast = await get_hourly_forecast(lat, lon, FORECAST_HOURS, timezone) if lat is not None and lon is not None else []
+    media = await get_image_urls({r["target_id"] for r in rules} | {"default"})
+
+    body = {
+        "store": {
+            "id": store_id,
+            "name": store.get("name"),
+            "city": store.get("city"),
+            "timezone": timezone,
+            "opening_hours": store.get("opening_hours"),
+        },
+        "context": {
+            "city": geo_ctx["city"],
+            "region": geo_ctx["region"],
+            "china_subregion": geo_ctx["china_subregion"],
+            "solar_terms": _solar_terms_by_date(forecast, geo_ctx["country_code"]),
+        },
+        "rules": [{k: v for k, v in r.items() if k != "store_id"} for r in rules],
+        "forecast": forecast,
+        "media": media,
+    }
+    version = hashlib.sha256(json.dumps(body, sort_keys=True, ensure_ascii=False).encode()).hexdigest()[:16]
+    bundle = {"version": version, "generated_at": datetime.now().isoformat(), **body}
+    _BUNDLE_CACHE[store_id] = (bundle, time())
+    return bundle
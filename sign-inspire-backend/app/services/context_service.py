@@ -29,7 +29,7 @@ async def get_current_context(location_id: str) -> Optional[EnvironmentContext]:
     调用 Open-Meteo 获取实时天气、温度。
     返回标准化的 EnvironmentContext 对象。
     """
-    lat, lon, location_name, timezone = _resolve_location(location_id)
+    lat, lon, location_name, timezone = await _resolve_location(location_id)
     if lat is None or lon is None:
         return None
 
@@ -56,7 +56,7 @@ async def get_current_context(location_id: str) -> Optional[EnvironmentContext]:
     )
 
 
-def _resolve_location(location_id: str) -> tuple:
+async def _resolve_location(location_id: str) -> tuple:
     """
     解析 location_id -> (lat, lon, location_name, timezone)
     返回 (None, None, None, "Australia/Adelaide") 表示解析失败
@@ -68,7 +68,7 @@ def _resolve_location(location_id: str) -> tuple:
 
     # 1. 门店 ID：store_001 等，从数据库或预设获取
     if lid.startswith("store_"):
-        store_info = _get_store_coords(lid)
+        store_info = await _get_store_coords(lid)
         if store_info:
             return store_info
 
@@ -86,7 +86,7 @@ def _resolve_location(location_id: str) -> tuple:
     return (None, None, None, "Australia/Adelaide")
 
 
-def _get_store_coords(store_id: str) -> Optional[tuple]:
+async def _get_store_coords(store_id: str) -> Optional[tuple]:
     """从数据库或预设获取门店经纬度"""
     # 预设门店（与 database.py 默认一致）
     PRESETS = {
@@ -98,17 +98,17 @@ def _get_store_coords(store_id: str) -> Optional[tuple]:
 
     # 尝试从数据库查
     try:
-        from app.database import USE_DATABASE, SessionLocal
+        from sqlalchemy import select
+        from app.database_async import async_session_scope
         from app.models.store_model import Store
-        if USE_DATABASE and SessionLocal:
-            db = SessionLocal()
-            try:
-                store = db.query(Store).filter(Store.id == store_id, Store.is_active == True).first()
+        async with async_session_scope() as db:
+            if db is not None:
+                store = (await db.execute(
+                    select(Store).where(Store.id == store_id, Store.is_active == True)
+                )).scalars().first()
                 if store:
                     tz = store.timezone or "Australia/Adelaide"
                     return (store.latitude, store.longitude, store.city or store.name, tz)
-            finally:
-                db.close()
     except Exception:
         pass
 
@@ -4,6 +4,9 @@ AI 决策引擎：根据环境上下文、用户规则与广告库，由 LLM 选
 from typing import Optional, List
 
 from app.schemas.decide import AdAsset, EnvironmentContext, UserRule
+from app.logging_config import get_logger
+
+logger = get_logger("matching")
 
 
 class DecideResult:
@@ -108,9 +111,6 @@ async def run_ai_decide(
         return DecideResult(selected_ad_id=ad_id, reason=reason or "AI 推荐")
 
     except Exception as e:
-        try:
-            print(f"[Decide] LLM fail: {e}")
-        except UnicodeEncodeError:
-            pass
+        logger.warning(f"[Decide] LLM fail: {e}")
         # 回退：选第一个
         return DecideResult(selected_ad_id=ads[0].id, reason=f"LLM  fallback: {str(e)}")
@@ -8,6 +8,9 @@ from typing import Optional
 import httpx
 
 from app.schemas.decide import AdAsset
+from app.logging_config import get_logger
+
+logger = get_logger("providers")
 
 
 def get_device_url(device_id: str) -> Optional[str]:
@@ -57,8 +60,8 @@ def push_content_to_device(device_id: str, ad_content: AdAsset, timeout: float =
             resp = client.post(url, json=payload)
             if resp.status_code in (200, 201, 204):
                 return True
-            print(f"⚠️ [Device Push] {device_id} 返回 {resp.status_code}: {resp.text[:200]}")
+            logger.warning(f"⚠️ [Device Push] {device_id} 返回 {resp.status_code}: {resp.text[:200]}")
             return False
     except Exception as e:
-        print(f"⚠️ [Device Push] {device_id} 请求失败: {e}")
+        logger.warning(f"⚠️ [Device Push] {device_id} 请求失败: {e}")
         return False
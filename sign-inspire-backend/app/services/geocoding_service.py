@@ -1,10 +1,15 @@
 """
 地理编码：将城市名转为经纬度与 bbox
 使用 OpenStreetMap Nominatim，免费无需 API Key
+批量（门店批量开通）：城市名去重后共用一个连接依次请求，按 GEOCODE_MIN_INTERVAL 限速（Nominatim 要求每秒不超过 1 次）
 """
+import os
 import httpx
-from typing import Optional, Tuple, Dict, Any
-from time import time
+from typing import Optional, Tuple, Dict, Any, Iterable
+from time import sleep, time
+from app.logging_config import get_logger
+
+logger = get_logger("providers")
 
 # 地理编码缓存：Nominatim 国内访问慢，缓存 30 分钟
 _GEO_CACHE: Dict[str, tuple] = {}
@@ -12,6 +17,8 @@ _GEO_CACHE_TTL = 1800
 
 NOMINATIM_SEARCH = "https://nominatim.openstreetmap.org/search"
 NOMINATIM_REVERSE = "https://nominatim.openstreetmap.org/reverse"
+# 批量地理编码时两次 Nominatim 请求的最小间隔（秒）
+GEOCODE_MIN_INTERVAL = float(os.getenv("GEOCODE_MIN_INTERVAL", "1.0"))
 
 # 常用城市预设：(lat, lon, bbox, country_code, china_subregion?)
 # china_subregion: south_china / east_china / north_china，仅 CN 有效
@@ -37,6 +44,20 @@ _CITY_PRESETS_RAW: Dict[str, tuple] = {
 }
 CITY_PRESETS = {k: (v[0], v[1], v[2]) for k, v in _CITY_PRESETS_RAW.items()}
 
+# 预设城市的时区（同一国家跨多个时区时国家级推断不准）
+_CITY_TIMEZONES = {
+    "adelaide": "Australia/Adelaide", "sydney": "Australia/Sydney", "melbourne": "Australia/Melbourne",
+    "brisbane": "Australia/Brisbane", "perth": "Australia/Perth", "new york": "America/New_York",
+}
+# 单时区国家/地区 -> 时区
+_COUNTRY_TIMEZONES = {
+    "CN": "Asia/Shanghai", "HK": "Asia/Hong_Kong", "MO": "Asia/Macau", "TW": "Asia/Taipei",
+    "JP": "Asia/Tokyo", "KR": "Asia/Seoul", "SG": "Asia/Singapore", "MY": "Asia/Kuala_Lumpur",
+    "TH": "Asia/Bangkok", "VN": "Asia/Ho_Chi_Minh", "PH": "Asia/Manila", "IN": "Asia/Kolkata",
+    "GB": "Europe/London", "IE": "Europe/Dublin", "FR": "Europe/Paris", "DE": "Europe/Berlin",
+    "IT": "Europe/Rome", "ES": "Europe/Madrid", "NL": "Europe/Amsterdam", "NZ": "Pacific/Auckland",
+}
+
 
 def geocode_city(city: str) -> Optional[Dict[str, Any]]:
     """
@@ -77,39 +98,111 @@ def geocode_city_sync(city: str) -> Optional[Dict[str, Any]]:
         return out
     try:
         with httpx.Client(timeout=10) as client:
-            resp = client.get(
-                NOMINATIM_SEARCH,
-                params={"q": city, "format": "json", "limit": 1},
-                headers={"User-Agent": "SignInspire/1.0"},
-            )
-            if resp.status_code != 200:
-                return None
-            data = resp.json()
-            if not data:
-                return None
-            d = data[0]
-            lat = float(d.get("lat", 0))
-            lon = float(d.get("lon", 0))
-            bbox_raw = d.get("boundingbox")
-            if bbox_raw:
-                s, n, w, e = [float(x) for x in bbox_raw]
-                bbox = (s, w, n, e)
-            else:
-                delta = 0.15
-                bbox = (lat - delta, lon - delta, lat + delta, lon + delta)
-            addr = d.get("address", {}) or {}
-            country_code = (addr.get("country_code") or "").upper()
-            state = addr.get("state") or addr.get("province") or ""
-            from app.services.china_region_service import get_china_subregion
-            china_sub = get_china_subregion(d.get("name") or city, state, lat) if country_code == "CN" else None
-            out = {"lat": lat, "lon": lon, "bbox": bbox, "city": d.get("display_name", city), "country_code": country_code}
-            if china_sub:
-                out["china_subregion"] = china_sub
-            _GEO_CACHE[key] = (out, now)
-            return out
+            return _nominatim_search(client, city)
     except Exception as e:
-        print(f"⚠️ [Geocoding] {city} 解析失败: {e}")
+        logger.warning(f"⚠️ [Geocoding] {city} 解析失败: {e}")
+        return None
+
+
+def _nominatim_search(client: httpx.Client, city: str) -> Optional[Dict[str, Any]]:
+    """Nominatim 查询单个城市并写入缓存"""
+    resp = client.get(
+        NOMINATIM_SEARCH,
+        params={"q": city, "format": "json", "limit": 1, "addressdetails": 1},
+        headers={"User-Agent": "SignInspire/1.0"},
+    )
+    if resp.status_code != 200:
+        return None
+    data = resp.json()
+    if not data:
+        return None
+    d = data[0]
+    lat = float(d.get("lat", 0))
+    lon = float(d.get("lon", 0))
+    bbox_raw = d.get("boundingbox")
+    if bbox_raw:
+        s, n, w, e = [float(x) for x in bbox_raw]
+        bbox = (s, w, n, e)
+    else:
+        delta = 0.15
+        bbox = (lat - delta, lon - delta, lat + delta, lon + delta)
+    addr = d.get("address", {}) or {}
+    country_code = (addr.get("country_code") or "").upper()
+    state = addr.get("state") or addr.get("province") or ""
+    from app.services.china_region_service import get_china_subregion
+    china_sub = get_china_subregion(d.get("name") or city, state, lat) if country_code == "CN" else None
+    out = {"lat": lat, "lon": lon, "bbox": bbox, "city": d.get("display_name", city), "country_code": country_code}
+    if china_sub:
+        out["china_subregion"] = china_sub
+    _GEO_CACHE[city.strip().lower()] = (out, time())
+    return out
+
+
+def geocode_cities(cities: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    批量地理编码：按小写城市名去重，预设与缓存直接返回，其余共用一个连接依次查询（限速）
+    返回 {小写城市名: 结果或 None}；同步阻塞，调用方放到线程中执行
+    """
+    keys = {c.strip().lower(): c.strip() for c in cities if c and c.strip()}
+    out: Dict[str, Optional[Dict[str, Any]]] = {}
+    pending = []
+    now = time()
+    for key, city in keys.items():
+        cached = _GEO_CACHE.get(key)
+        if key in _CITY_PRESETS_RAW:
+            out[key] = geocode_city(city)
+        elif cached and now - cached[1] < _GEO_CACHE_TTL:
+            out[key] = cached[0]
+        else:
+            pending.append((key, city))
+    if not pending:
+        return out
+    last = 0.0
+    with httpx.Client(timeout=10) as client:
+        for key, city in pending:
+            wait = GEOCODE_MIN_INTERVAL - (time() - last)
+            if wait > 0:
+                sleep(wait)
+            last = time()
+            try:
+                out[key] = _nominatim_search(client, city)
+            except Exception as e:
+                logger.warning(f"⚠️ [Geocoding] {city} 解析失败: {e}")
+                out[key] = None
+    logger.info(f"[Geocoding] Batch resolved {len(keys)} cities ({len(pending)} via Nominatim)")
+    return out
+
+
+def derive_timezone(city: Optional[str], country_code: Optional[str], lon: Optional[float], lat: Optional[float] = None) -> Optional[str]:
+    """
+    由城市 / 国家 / 经纬度推断 IANA 时区：预设城市优先，其次单时区国家，
+    澳洲与美国、加拿大按经度带划分；无法推断返回 None（调用方使用默认时区）
+    """
+    key = (city or "").strip().lower()
+    if key in _CITY_TIMEZONES:
+        return _CITY_TIMEZONES[key]
+    cc = (country_code or "").upper()
+    if cc in _COUNTRY_TIMEZONES:
+        return _COUNTRY_TIMEZONES[cc]
+    if lon is None:
         return None
+    if cc == "AU":
+        if lon < 129:
+            return "Australia/Perth"
+        if lon < 141:
+            return "Australia/Darwin" if lat is not None and lat > -26 else "Australia/Adelaide"
+        if lat is not None and lat > -28.2:
+            return "Australia/Brisbane"
+        return "Australia/Hobart" if lat is not None and lat < -39.2 else "Australia/Sydney"
+    if cc in ("US", "CA"):
+        bands = [(-87.5, "America/New_York" if cc == "US" else "America/Toronto"),
+                 (-101, "America/Chicago" if cc == "US" else "America/Winnipeg"),
+                 (-115, "America/Denver" if cc == "US" else "America/Edmonton")]
+        for edge, tz in bands:
+            if lon > edge:
+                return tz
+        return "America/Los_Angeles" if cc == "US" else "America/Vancouver"
+    return None
 
 
 def reverse_geocode_sync(lat: float, lon: float) -> Optional[Dict[str, Any]]:
@@ -149,5 +242,5 @@ def reverse_geocode_sync(lat: float, lon: float) -> Optional[Dict[str, Any]]:
                 out["china_subregion"] = china_sub
             return out
     except Exception as e:
-        print(f"⚠️ [Geocoding] 逆解析 ({lat},{lon}) 失败: {e}")
+        logger.warning(f"⚠️ [Geocoding] 逆解析 ({lat},{lon}) 失败: {e}")
         return None
@@ -7,6 +7,9 @@ import os
 from typing import List, Dict, Any, Optional
 
 import httpx
+from app.logging_config import get_logger
+
+logger = get_logger("providers")
 
 # 优先使用 Places 专用 key，否则用通用 Google API Key
 API_KEY = os.getenv("GOOGLE_PLACES_API_KEY") or os.getenv("GOOGLE_API_KEY")
@@ -137,7 +140,7 @@ def _search_text_legacy(
                 return []
             return data.get("results", [])[:limit * 2]  # 多取一些供过滤
     except Exception as e:
-        print(f"⚠️ [Places] Text Search 失败: {e}")
+        logger.warning(f"⚠️ [Places] Text Search 失败: {e}")
         return []
 
 
@@ -168,7 +171,7 @@ def _search_nearby_legacy(
                 return []
             return data.get("results", [])[:limit * 2]
     except Exception as e:
-        print(f"⚠️ [Places] Legacy 请求失败: {e}")
+        logger.warning(f"⚠️ [Places] Legacy 请求失败: {e}")
         return []
 
 
@@ -288,14 +291,14 @@ def _search_nearby(
         with httpx.Client(timeout=15) as client:
             resp = client.post(url, json=body, headers=headers)
             if resp.status_code == 403:
-                print(f"⚠️ [Places] Nearby Search (New) 被限制，将使用 Legacy API")
+                logger.warning(f"⚠️ [Places] Nearby Search (New) 被限制，将使用 Legacy API")
                 return None  # 触发 fallback
             if resp.status_code != 200:
-                print(f"⚠️ [Places] Nearby Search 失败: {resp.status_code}")
+                logger.warning(f"⚠️ [Places] Nearby Search 失败: {resp.status_code}")
                 return []
             data = resp.json()
     except Exception as e:
-        print(f"⚠️ [Places] 请求失败: {e}")
+        logger.warning(f"⚠️ [Places] 请求失败: {e}")
         return []
     places = data.get("places", [])
     return places
@@ -35,27 +35,22 @@ AD_INVENTORY = [
 ]
 
 
-def fetch_available_ads(db=None) -> List[AdAsset]:
+async def fetch_available_ads(db=None) -> List[AdAsset]:
     """
     获取所有可用广告素材。
-    1. 从内置广告库 + media_service 获取 content_url
+    1. 从内置广告库 + media_service 批量获取 content_url
     2. 返回 List[AdAsset]，每个广告都有 tags 和 description 供 LLM 理解
     """
-    from app.services.media_service import get_image_url
+    from app.services.media_service import get_image_urls
 
-    result = []
-    for ad_id, tags, description in AD_INVENTORY:
-        content_url = get_image_url(ad_id, db)
-        result.append(AdAsset(
-            id=ad_id,
-            tags=tags,
-            description=description,
-            content_url=content_url or "",
-        ))
-    return result
+    urls = await get_image_urls([item[0] for item in AD_INVENTORY], db)
+    return [
+        AdAsset(id=ad_id, tags=tags, description=description, content_url=urls.get(ad_id) or "")
+        for ad_id, tags, description in AD_INVENTORY
+    ]
 
 
-def get_ad_by_id(ad_id: str, db=None) -> Optional[AdAsset]:
+async def get_ad_by_id(ad_id: str, db=None) -> Optional[AdAsset]:
     """根据 ID 获取单个广告素材"""
     for item in AD_INVENTORY:
         if item[0] == ad_id:
@@ -64,6 +59,6 @@ def get_ad_by_id(ad_id: str, db=None) -> Optional[AdAsset]:
                 id=item[0],
                 tags=list(item[1]),
                 description=item[2],
-                content_url=get_image_url(ad_id, db) or "",
+                content_url=await get_image_url(ad_id, db) or "",
             )
     return None
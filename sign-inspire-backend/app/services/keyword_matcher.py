@@ -0,0 +1,108 @@
+"""
+关键词多模式匹配（Aho-Corasick）：词汇表关键词编译为一个自动机，文本只扫描一遍
+- 结果与「按关键词长度降序逐个 kw in text」一致：返回文本中出现的最长关键词，同长时取先加入的
+- 每个状态预先算好沿失败链可输出的最佳关键词，扫描时每个字符 O(1)，与词汇表大小无关
+- add 只把新关键词插入 trie，失败指针与最佳输出不做增量维护：下次匹配前对整个自动机全量重算一次
+  （O(状态数)，连续多次 add 只重算一次）。新关键词的状态可能成为已有状态失败链的新目标
+  （如已有 "大雨" 后加入 "雨"，"大雨" 末状态的失败指针要改指向新状态），增量修正需找出全部受影响的
+  已有状态；新增词汇（add_mapping）很少，全量重算简单可靠
+"""
+from collections import deque
+from typing import Dict, List, Mapping, Optional, Tuple
+
+_NONE = -1
+
+
+class KeywordMatcher:
+    """关键词 -> 映射值 的 Aho-Corasick 自动机"""
+
+    def __init__(self, mapping: Optional[Mapping[str, str]] = None):
+        # 状态 0 为根；goto[s] 为字符 -> 下一状态
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 恰好在该状态结束的关键词下标
+        self._word: List[int] = [_NONE]
+        # 该状态及其失败链上的最佳关键词下标（最长，同长取下标小者）
+        self._best: List[int] = [_NONE]
+        self._keywords: List[str] = []
+        self._values: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._linked = True
+        for keyword, value in (mapping or {}).items():
+            self.add(keyword, value)
+
+    def __len__(self) -> int:
+        return len(self._keywords)
+
+    def add(self, keyword: str, value: str) -> None:
+        """
+        加入关键词；已存在时只更新映射值（保持原有先后顺序）
+        新关键词使自动机需要重链接：下次 search 时全量重算失败指针（见模块说明）
+        """
+        i = self._index.get(keyword)
+        if i is not None:
+            self._values[i] = value
+            return
+        i = len(self._keywords)
+        self._keywords.append(keyword)
+        self._values.append(value)
+        self._index[keyword] = i
+        state = 0
+        for ch in keyword:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._word.append(_NONE)
+                self._best.append(_NONE)
+                self._goto[state][ch] = nxt
+            state = nxt
+        self._word[state] = i
+        self._linked = False
+
+    def _better(self, a: int, b: int) -> int:
+        if a == _NONE:
+            return b
+        if b == _NONE:
+            return a
+        la, lb = len(self._keywords[a]), len(self._keywords[b])
+        return a if la > lb or (la == lb and a < b) else b
+
+    def _link(self) -> None:
+        """按层（BFS）重算失败指针与每个状态的最佳输出"""
+        goto, fail, word, best = self._goto, self._fail, self._word, self._best
+        best[0] = word[0]
+        queue = deque()
+        for s in goto[0].values():
+            fail[s] = 0
+            best[s] = self._better(word[s], best[0])
+            queue.append(s)
+        while queue:
+            r = queue.popleft()
+            for ch, s in goto[r].items():
+                f = fail[r]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[s] = goto[f].get(ch, 0)
+                best[s] = self._better(word[s], best[fail[s]])
+                queue.append(s)
+        self._linked = True
+
+    def search(self, text: str) -> Optional[Tuple[str, str]]:
+        """文本中出现的最长关键词 (关键词, 映射值)，无匹配返回 None"""
+        if not self._linked:
+            self._link()
+        goto, fail, best = self._goto, self._fail, self._best
+        state = 0
+        found = best[0]
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            hit = best[state]
+            if hit != _NONE and hit != found:
+                found = self._better(found, hit)
+        if found == _NONE:
+            return None
+        return self._keywords[found], self._values[found]
@@ -6,11 +6,14 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
 from app.schemas.rule import RuleCreate
 from app.services.vocabulary_service import (
-    get_weather_mappings,
-    get_action_mappings,
     ensure_action_mapping,
     ensure_weather_mapping,
+    find_keyword,
+    load_vocabulary,
 )
+from app.logging_config import get_logger
+
+logger = get_logger("matching")
 
 # 懒加载：无 API Key 时应用可启动，仅自然语言解析不可用
 _llm = None
@@ -39,34 +42,25 @@ def _get_llm():
 parser = PydanticOutputParser(pydantic_object=RuleCreate)
 
 
-def _parse_with_vocab(text: str, db=None):
+def _parse_with_vocab(text: str):
     """
     使用动态词汇表解析规则（优先路径）
     若词汇表中存在匹配则直接返回；遇到新词则自动创建并写入词汇表
     """
     from app.schemas.rule import RuleCreate, Condition, Action
 
-    weather_map = get_weather_mappings(db)
-    action_map = get_action_mappings(db)
-
-    # 按关键词长度降序匹配
-    condition_value = None
-    for kw in sorted(weather_map.keys(), key=len, reverse=True):
-        if kw in text:
-            condition_value = kw  # 保持中文用于规则展示
-            break
+    # 文本中出现的最长关键词
+    weather_hit = find_keyword("weather", text)
+    condition_value = weather_hit[0] if weather_hit else None  # 保持中文用于规则展示
 
-    target_id = None
-    for kw in sorted(action_map.keys(), key=len, reverse=True):
-        if kw in text:
-            target_id = action_map[kw]
-            break
+    action_hit = find_keyword("action", text)
+    target_id = action_hit[1] if action_hit else None
 
     # 新词：自动创建
     if target_id is None:
         extracted = _extract_action_with_llm(text)
         if extracted:
-            target_id = ensure_action_mapping(extracted, db)
+            target_id = ensure_action_mapping(extracted)
         else:
             # LLM 失败时（如配额用尽）：从文本中移除天气关键词，剩余部分作为动作
             remainder = text.strip()
@@ -74,8 +68,8 @@ def _parse_with_vocab(text: str, db=None):
                 remainder = remainder.replace(condition_value, "", 1).strip()
             remainder = remainder.replace("  ", " ").strip()
             if remainder and len(remainder) >= 2:
-                target_id = ensure_action_mapping(remainder, db)
-                print(f"   [Fallback] LLM 不可用，从文本提取动作: '{remainder}' -> {target_id}")
+                target_id = ensure_action_mapping(remainder)
+                logger.info(f"[Fallback] LLM 不可用，从文本提取动作: '{remainder}' -> {target_id}")
             else:
                 target_id = "coffee_ad"
 
@@ -83,14 +77,12 @@ def _parse_with_vocab(text: str, db=None):
         extracted_weather = _extract_weather_with_llm(text)
         if extracted_weather:
             condition_value = extracted_weather
-            ensure_weather_mapping(extracted_weather, db)
+            ensure_weather_mapping(extracted_weather)
         else:
             condition_value = "多云"
 
     rule_name = text.strip()[:50]
-    print(f"🔧 [Vocab Parser] 解析规则: {text}")
-    print(f"   天气条件: {condition_value}")
-    print(f"   播放内容: {target_id}")
+    logger.info(f"🔧 [Vocab Parser] 解析规则: {text} -> 天气条件: {condition_value}, 播放内容: {target_id}")
 
     return RuleCreate(
         name=rule_name,
@@ -113,7 +105,7 @@ def _extract_action_with_llm(text: str) -> str:
         if content and content != "未知":
             return content
     except Exception as e:
-        print(f"⚠️ [LLM] 提取动作失败: {e}")
+        logger.warning(f"⚠️ [LLM] 提取动作失败: {e}")
     return ""
 
 
@@ -130,26 +122,27 @@ def _extract_weather_with_llm(text: str) -> str:
         if content:
             return content
     except Exception as e:
-        print(f"⚠️ [LLM] 提取天气失败: {e}")
+        logger.warning(f"⚠️ [LLM] 提取天气失败: {e}")
     return ""
 
 
-async def parse_rule_with_langchain(text: str, store_id: str, db=None) -> RuleCreate:
+async def parse_rule_with_langchain(text: str, store_id: str) -> RuleCreate:
     """
     解析自然语言规则。
     优先使用动态词汇表（含自动创建新词），复杂输入或词汇无法覆盖时再调用完整 Gemini 解析。
     """
-    # 1. 优先使用词汇表解析（支持新词自动创建）
+    # 1. 优先使用词汇表解析（支持新词自动创建）；词汇缓存失效时先异步加载
+    await load_vocabulary()
     try:
-        return _parse_with_vocab(text, db)
+        return _parse_with_vocab(text)
     except Exception as e:
-        print(f"⚠️ [Vocab] 词汇解析异常，尝试 Gemini: {e}")
+        logger.warning(f"⚠️ [Vocab] 词汇解析异常，尝试 Gemini: {e}")
 
     # 2. 降级：使用 Gemini 完整解析
-    return await _parse_rule_with_gemini_full(text, store_id, db)
+    return await _parse_rule_with_gemini_full(text, store_id)
 
 
-async def _parse_rule_with_gemini_full(text: str, store_id: str, db=None) -> RuleCreate:
+async def _parse_rule_with_gemini_full(text: str, store_id: str) -> RuleCreate:
     """Gemini 完整规则解析（原有逻辑）"""
     system_prompt = """
     你是一个专业的数字标牌调度助手。
@@ -174,21 +167,21 @@ async def _parse_rule_with_gemini_full(text: str, store_id: str, db=None) -> Rul
     try:
         llm = _get_llm()
     except ValueError:
-        return _parse_with_vocab(text, db)
+        return _parse_with_vocab(text)
     chain = prompt | llm | parser
 
-    print(f"🧠 [Gemini] 正在解析（复杂输入）: {text}")
+    logger.info(f"🧠 [Gemini] 正在解析（复杂输入）: {text}")
     try:
         result = await chain.ainvoke({"text": text, "store_id": store_id})
         # 若 Gemini 返回了新的 target_id，可顺手写入词汇表（可选）
         if result.action and result.action.target_id:
             from app.services.vocabulary_service import add_mapping
-            add_mapping("action", text[:30], result.action.target_id, db)
+            add_mapping("action", text[:30], result.action.target_id)
         return result
     except Exception as e:
         error_msg = str(e)
         if "RESOURCE_EXHAUSTED" in error_msg or "429" in error_msg or "quota" in error_msg.lower():
-            print("⚠️ Gemini API 配额已用完，使用词汇解析")
-            return _parse_with_vocab(text, db)
-        print(f"⚠️ Gemini 解析错误，使用词汇解析: {e}")
-        return _parse_with_vocab(text, db)
+            logger.warning("⚠️ Gemini API 配额已用完，使用词汇解析")
+            return _parse_with_vocab(text)
+        logger.warning(f"⚠️ Gemini 解析错误，使用词汇解析: {e}")
+        return _parse_with_vocab(text)
@@ -1,81 +1,54 @@
 """
 匹配引擎：天气 + 城市 + 门店营业状态 -> 应播放的广告
 """
-from typing import Optional, Dict, Any, List
-from sqlalchemy.orm import Session
+from typing import Callable, Optional, Dict, Any, Iterable, List
+from sqlalchemy import select as sa_select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.services.scheduler_service import normalize_weather_value
 from app.services.store_service import is_store_open
+from app.services import rule_table
+from app.services.rule_evaluator import (
+    ScopedRules,
+    compile_conditions,
+    compile_rules,
+    evaluate_conditions,
+    select_target,
+)
+from app.services.rule_templates import store_subscription, template_scope
 
 
-def _parse_temp_range(value: str) -> Optional[tuple]:
-    """解析温度范围: '0,15' -> (0,15) 闭区间; '>30' -> (30,999); '<=10' -> (-999,10)"""
-    if not value or not str(value).strip():
-        return None
-    s = str(value).strip().replace(" ", "")
-    if "," in s:
-        parts = s.split(",")
-        if len(parts) == 2:
-            try:
-                return (float(parts[0]), float(parts[1]))
-            except ValueError:
-                return None
-    if s.startswith(">="):
-        try:
-            t = float(s[2:])
-            return (t, 999)
-        except ValueError:
-            return None
-    if s.startswith("<="):
-        try:
-            t = float(s[2:])
-            return (-999, t)
-        except ValueError:
-            return None
-    if s.startswith(">"):
-        try:
-            t = float(s[1:])
-            return (t, 999)
-        except ValueError:
-            return None
-    if s.startswith("<"):
-        try:
-            t = float(s[1:])
-            return (-999, t)
-        except ValueError:
-            return None
-    return None
-
-
-def _parse_time_range(value: str) -> Optional[tuple]:
-    """解析时段: '8,11' -> (8,11) 闭区间小时; '14,18' -> 下午2-6点"""
-    if not value or not str(value).strip():
-        return None
-    s = str(value).strip().replace(" ", "")
-    if "," in s:
-        parts = s.split(",")
-        if len(parts) == 2:
-            try:
-                return (int(parts[0]), int(parts[1]))
-            except ValueError:
-                return None
-    return None
-
-
-def _parse_day_value(value: str) -> Optional[set]:
-    """解析星期: '6'=周日; '4,5,6'=五/六/日; 'fri,sat,sun' 或 'sun'"""
-    from app.services.scheduler_service import _DAY_ALIAS
-    if not value or not str(value).strip():
-        return None
-    s = str(value).strip().lower()
-    days = set()
-    for part in s.split(","):
-        part = part.strip()
-        if part.isdigit():
-            days.add(int(part))
-        elif part in _DAY_ALIAS:
-            days.add(_DAY_ALIAS[part])
-    return days if days else None
+def _normalize_context_weather(weather: str) -> set:
+    """上下文天气标准化为英文值集合（无法识别时保留原值）"""
+    return normalize_weather_value(weather) or {weather}
+
+
+def compile_rules_for_matching(rules: List[Dict]) -> List[Dict]:
+    """编译规则（天气值经词汇表标准化），按优先级降序"""
+    return compile_rules(rules, normalize_weather_value)
+
+
+def build_match_context(
+    weather: str,
+    city: str = "Adelaide",
+    temp_c: Optional[float] = None,
+    region: str = "western",
+    hour: Optional[int] = None,
+    weekday: Optional[int] = None,
+    china_subregion: Optional[str] = None,
+    solar_terms: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """构造求值上下文（供 rule_evaluator 使用）"""
+    return {
+        "weather": _normalize_context_weather(weather),
+        "city": city,
+        "temp_c": temp_c,
+        "region": region,
+        "hour": hour,
+        "weekday": weekday,
+        "china_subregion": china_subregion,
+        "solar_terms": solar_terms or [],
+    }
 
 
 def _conditions_match(
@@ -90,62 +63,40 @@ def _conditions_match(
     solar_terms: Optional[List[str]] = None,
 ) -> bool:
     """检查规则条件是否全部匹配（天气、温度、文化圈、城市、时段、星期）"""
-    weather_normalized = normalize_weather_value(weather)
-    if not weather_normalized:
-        weather_normalized = {weather}
-
-    for cond in conditions or []:
-        ctype = cond.get("type")
-        value = cond.get("value", "")
-        op = cond.get("operator", "==")
-
-        if ctype == "weather":
-            cond_normalized = normalize_weather_value(str(value))
-            matched = False
-            if op == "==" and (weather_normalized & cond_normalized):
-                matched = True
-            elif op == "in":
-                for v in [x.strip() for x in str(value).split(",")]:
-                    if weather_normalized & normalize_weather_value(v):
-                        matched = True
-                        break
-            if not matched:
-                return False
-        elif ctype == "city" and op == "==":
-            if value and str(value).lower() != city.lower():
-                return False
-        elif ctype == "temp" and temp_c is not None:
-            tr = _parse_temp_range(str(value))
-            if tr:
-                lo, hi = tr
-                if not (lo <= temp_c <= hi):
-                    return False
-        elif ctype == "region" and op == "==":
-            if value and str(value).lower() != region.lower():
-                return False
-        elif ctype == "time" and hour is not None:
-            tr = _parse_time_range(str(value))
-            if tr:
-                lo, hi = tr
-                if not (lo <= hour <= hi):
-                    return False
-        elif ctype == "day" and weekday is not None:
-            days = _parse_day_value(str(value))
-            if days and weekday not in days:
-                return False
-        elif ctype == "china_region":
-            # 规则含 china_region 时：非中国地区（china_subregion 为空）必定不匹配
-            if not china_subregion:
-                return False
-            if value and str(value).lower() != china_subregion.lower():
-                return False
-        elif ctype == "solar_term":
-            # 规则含 solar_term 时：非节气日（solar_terms 为空）必定不匹配
-            if not solar_terms:
-                return False
-            if value and str(value).strip() not in (solar_terms or []):
-                return False
-    return True
+    ctx = build_match_context(weather, city, temp_c, region, hour, weekday, china_subregion, solar_terms)
+    return evaluate_conditions(compile_conditions(conditions, normalize_weather_value), ctx)
+
+
+def _select_for_store(store_id: str, store: Dict, select: Callable[..., str], ctx: Dict[str, Any]) -> str:
+    """
+    门店停用/未营业返回 default，否则用 select(store_id, ctx, 模板作用域, 屏蔽集合) 求值
+    （已编译规则或共享规则表；门店订阅的模板规则与自有规则一起参与）
+    """
+    if not store.get("is_active", True):
+        return "default"
+    if not is_store_open(store.get("opening_hours"), store.get("timezone", "Australia/Adelaide")):
+        return "default"
+    name, disabled = store_subscription(store)
+    return select(store_id, ctx, template_scope(name), disabled)
+
+
+def match_with_rule_table(store: Dict, context: Dict[str, Any]) -> Optional[str]:
+    """
+    非写入方 worker：在共享规则表上为门店求值（门店尚未出现在共享播放状态中，如刚在本 worker 创建），
+    context 为写入方发布的 CURRENT_CONTEXT（与 tick 相同的 Adelaide 上下文）；无共享规则表时返回 None
+    """
+    table = rule_table.follower_table()
+    if table is None:
+        return None
+    ctx = build_match_context(
+        context.get("weather") or "unknown",
+        "Adelaide",
+        temp_c=context.get("temp_c"),
+        region=context.get("region") or "western",
+        hour=context.get("hour"),
+        weekday=context.get("weekday"),
+    )
+    return _select_for_store(store["id"], store, table.select_target, ctx)
 
 
 def match_content_for_store(
@@ -165,40 +116,29 @@ def match_content_for_store(
     为指定门店匹配应播放的内容。
     返回 target_id 或 "default"
     """
-    if not store.get("is_active", True):
-        return "default"
-
-    opening_hours = store.get("opening_hours")
-    if not is_store_open(opening_hours, store.get("timezone", "Australia/Adelaide")):
-        return "default"
-
-    for rule in sorted(rules, key=lambda r: -(r.get("priority") or 1)):
-        rule_store_id = rule.get("store_id", "")
-        if rule_store_id and rule_store_id != "*" and rule_store_id != store_id:
-            continue
-        conditions = rule.get("conditions", [])
-        if _conditions_match(conditions, weather, city, temp_c=temp_c, region=region, hour=hour, weekday=weekday,
-                            china_subregion=china_subregion, solar_terms=solar_terms):
-            return rule.get("action", {}).get("target_id", "default")
-
-    return "default"
+    ctx = build_match_context(weather, city, temp_c, region, hour, weekday, china_subregion, solar_terms)
+    scoped = ScopedRules(compile_rules_for_matching(rules))
+    return _select_for_store(store_id, store, lambda sid, c, *sub: select_target(scoped.for_store(sid, *sub), c), ctx)
 
 
 async def run_matching_for_all_stores(
-    db: Optional[Session],
+    db: Optional[AsyncSession],
     lat: Optional[float] = None,
     lon: Optional[float] = None,
     city: str = "Adelaide",
     country_code: Optional[str] = None,
     china_subregion: Optional[str] = None,
+    store_ids: Optional[Iterable[str]] = None,
 ) -> Dict[str, str]:
     """
     为所有活跃门店执行匹配，返回 {store_id: target_id}
     支持传入 lat/lon 获取该位置天气+温度，country_code 获取文化圈层
+    store_ids: 只重算这些门店（增量，如批量开通后），不做 store_001 兜底
     """
-    from app.database import USE_DATABASE, SessionLocal
-    from app.models.rule_model import Rule
+    from app.database_async import async_session_scope
+    from app.services.vocabulary_service import load_vocabulary, vocabulary_version
     from app.models.store_model import Store
+    from app.services import rule_repository
     from app.services.scheduler_service import get_weather_context
     from app.services.region_service import get_region_from_country
 
@@ -214,39 +154,39 @@ async def run_matching_for_all_stores(
     region = get_region_from_country(country_code)
     solar_terms = get_active_solar_terms(date.today()) if country_code in ("CN", "HK", "MO", "TW") else []
 
-    session = db
-    own = False
-    if not session and USE_DATABASE and SessionLocal:
-        session = SessionLocal()
-        own = True
-
     result = {}
-    try:
-        if not session:
+    async with async_session_scope(db) as session:
+        if session is None:
             return {"store_001": "default"}
 
-        stores = session.query(Store).filter(Store.is_active == True).all()
-        rules = session.query(Rule).order_by(Rule.priority.desc()).all()
-        rules_list = [r.to_dict() for r in rules]
+        stmt = sa_select(Store).where(Store.is_active == True)
+        if store_ids is not None:
+            stmt = stmt.where(Store.id.in_(list(store_ids)))
+        stores = (await session.execute(stmt)).scalars().all()
+        # 只有写入方执行 tick（非写入方在 check_rules_job 中提前返回），读取方经共享规则表求值
+        # 规则读自规则仓库内存副本（定期版本检查，有库外修改才重载），tick 不再全量查询
+        await rule_repository.ensure_fresh(session)
+        await load_vocabulary(session)
+        # 每个 tick 只编译一次规则、构造一次上下文，所有门店共用；
+        # 模板规则只有一份，按作用域分组后订阅同一模板的门店共用同一个有序列表
+        compiled = compile_rules_for_matching(rule_repository.all_rules())
+        rule_table.publish_rule_table(compiled, (rule_repository.version(), vocabulary_version()))
+        scoped = ScopedRules(compiled)
+        select = lambda sid, c, *sub: select_target(scoped.for_store(sid, *sub), c)
+        ctx = build_match_context(
+            weather,
+            city,
+            temp_c=temp_c,
+            region=region,
+            hour=hour,
+            weekday=weekday,
+            china_subregion=china_subregion if country_code in ("CN", "HK", "MO", "TW") else None,
+            solar_terms=solar_terms,
+        )
 
         for s in stores:
-            store_dict = s.to_dict()
-            target = match_content_for_store(
-                s.id,
-                store_dict,
-                rules_list,
-                weather,
-                city,
-                temp_c=temp_c,
-                region=region,
-                hour=hour,
-                weekday=weekday,
-                china_subregion=china_subregion if country_code in ("CN", "HK", "MO", "TW") else None,
-                solar_terms=solar_terms,
-            )
-            result[s.id] = target
-    finally:
-        if own and session:
-            session.close()
+            result[s.id] = _select_for_store(s.id, s.to_dict(), select, ctx)
 
+    if store_ids is not None:
+        return result
     return result if result else {"store_001": "default"}
@@ -0,0 +1,173 @@
+"""
+媒体预缓存清单：门店规则可能产出的全部 target_id -> 图片 URL / 内容哈希 / 字节数 / 尺寸
+屏幕据此提前下载全部素材，内容切换时直接从本地读取。
+- 素材元数据按 URL 缓存（同一 URL 只下载一次），由后台循环（refresh_asset_meta）下载，接口只读缓存
+- 下载失败的 URL 在 MEDIA_MANIFEST_FAILURE_TTL 秒内不再重试
+- 清单按门店缓存，以 target_id -> URL 映射为指纹：规则或 MediaCache 变化后才重新生成
+"""
+import asyncio
+import hashlib
+import json
+import os
+import struct
+from datetime import datetime
+from time import monotonic
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import httpx
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.logging_config import get_logger
+
+logger = get_logger("providers")
+
+# URL -> {"sha256", "bytes", "width", "height", "content_type"}
+_ASSET_META: Dict[str, Dict[str, Any]] = {}
+# 下载失败的 URL -> 可重试时刻（monotonic）
+_FAILED_UNTIL: Dict[str, float] = {}
+FAILURE_TTL = float(os.getenv("MEDIA_MANIFEST_FAILURE_TTL", "600"))
+# 接口发现未缓存素材时调度的后台下载（同一时刻只有一个）
+_refresh_task: Optional[asyncio.Task] = None
+# store_id -> (指纹, 清单)
+_MANIFEST_CACHE: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+_FETCH_CONCURRENCY = 8
+_FETCH_TIMEOUT = 15
+
+
+def _image_size(data: bytes) -> Tuple[Optional[int], Optional[int]]:
+    """从图片头解析宽高（PNG / JPEG / GIF / WebP），无法识别返回 (None, None)"""
+    try:
+        if data[:8] == b"\x89PNG\r\n\x1a\n":
+            return struct.unpack(">II", data[16:24])
+        if data[:6] in (b"GIF87a", b"GIF89a"):
+            return struct.unpack("<HH", data[6:10])
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            chunk = data[12:16]
+            if chunk == b"VP8 ":
+                w, h = struct.unpack("<HH", data[26:30])
+                return w & 0x3FFF, h & 0x3FFF
+            if chunk == b"VP8L":
+                b = data[21:25]
+                return 1 + (((b[1] & 0x3F) << 8) | b[0]), 1 + (((b[3] & 0x0F) << 10) | (b[2] << 2) | ((b[1] & 0xC0) >> 6))
+            if chunk == b"VP8X":
+                return 1 + int.from_bytes(data[24:27], "little"), 1 + int.from_bytes(data[27:30], "little")
+        if data[:2] == b"\xff\xd8":
+            i = 2
+            while i + 9 < len(data):
+                if data[i] != 0xFF:
+                    i += 1
+                    continue
+                marker = data[i + 1]
+                # SOF0..SOF15（排除 DHT/JPG/DAC）携带尺寸
+                if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                    h, w = struct.unpack(">HH", data[i + 5:i + 9])
+                    return w, h
+                i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    except (struct.error, IndexError):
+        pass
+    return None, None
+
+
+def _needs_fetch(url: str) -> bool:
+    """未缓存且不在失败冷却期内"""
+    return url not in _ASSET_META and _FAILED_UNTIL.get(url, 0) <= monotonic()
+
+
+async def _fetch_asset_meta(client: httpx.AsyncClient, url: str, sem: asyncio.Semaphore) -> Optional[Dict[str, Any]]:
+    """下载素材并计算元数据；失败时记入失败冷却"""
+    async with sem:
+        try:
+            resp = await client.get(url)
+            resp.raise_for_status()
+        except Exception as e:
+            _FAILED_UNTIL[url] = monotonic() + FAILURE_TTL
+            logger.warning(f"[Manifest] Asset fetch failed: {url} ({type(e).__name__}), retry in {FAILURE_TTL:.0f}s")
+            return None
+    data = resp.content
+    width, height = _image_size(data)
+    meta = {
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "bytes": len(data),
+        "width": width,
+        "height": height,
+        "content_type": resp.headers.get("content-type"),
+    }
+    _ASSET_META[url] = meta
+    _FAILED_UNTIL.pop(url, None)
+    return meta
+
+
+async def fetch_missing_meta(urls: Iterable[str]) -> int:
+    """下载未缓存（且不在失败冷却期内）的素材元数据，返回成功数"""
+    missing = sorted({u for u in urls if u and _needs_fetch(u)})
+    if not missing:
+        return 0
+    sem = asyncio.Semaphore(_FETCH_CONCURRENCY)
+    async with httpx.AsyncClient(timeout=_FETCH_TIMEOUT, follow_redirects=True) as client:
+        metas = await asyncio.gather(*(_fetch_asset_meta(client, u, sem) for u in missing))
+    fetched = sum(1 for m in metas if m is not None)
+    logger.info(f"[Manifest] Asset meta fetched {fetched}/{len(missing)}")
+    return fetched
+
+
+async def refresh_asset_meta(db: Optional[AsyncSession] = None) -> int:
+    """后台循环调用：全部规则可能产出的 target_id 的素材元数据预先下载"""
+    from app.models.rule_storage import MOCK_DB
+    from app.services import rule_repository
+    from app.services.media_service import get_image_urls
+    source = rule_repository if await rule_repository.ensure_fresh(db) else MOCK_DB
+    target_ids = {(r.get("action") or {}).get("target_id") or "default" for r in source.all_rules()} | {"default"}
+    urls = await get_image_urls(target_ids, db)
+    return await fetch_missing_meta(urls.values())
+
+
+def _schedule_fetch(urls: Iterable[str]) -> None:
+    """后台下载清单中缺失的素材（上一次尚未完成时不重复调度）"""
+    global _refresh_task
+    if _refresh_task is not None and not _refresh_task.done():
+        return
+    _refresh_task = asyncio.create_task(fetch_missing_meta(list(urls)))
+
+
+async def build_media_manifest(store_id: str, db: Optional[AsyncSession] = None) -> Dict[str, Any]:
+    """
+    由缓存的素材元数据构建门店媒体清单，version 为清单内容摘要（可直接作为 ETag）
+    尚未下载或下载失败的素材 sha256 / bytes / width / height 为 null：调度后台下载，不阻塞本次请求；
+    补齐后 version 随之变化
+    """
+    from app.services.bundle_service import load_store_rules
+    from app.services.media_service import get_image_urls
+
+    rules = await load_store_rules(store_id, db)
+    target_ids = {(r.get("action") or {}).get("target_id") or "default" for r in rules} | {"default"}
+    urls = await get_image_urls(target_ids, db)
+
+    fingerprint = json.dumps(urls, sort_keys=True)
+    cached = _MANIFEST_CACHE.get(store_id)
+    if cached and cached[0] == fingerprint:
+        return cached[1]
+
+    metas = [_ASSET_META.get(urls[t]) for t in sorted(urls)]
+    if any(_needs_fetch(u) for u in urls.values()):
+        _schedule_fetch(urls.values())
+
+    items = []
+    complete = True
+    for target_id, meta in zip(sorted(urls), metas):
+        complete = complete and meta is not None
+        items.append({
+            "target_id": target_id,
+            "url": urls[target_id],
+            **{k: (meta or {}).get(k) for k in ("sha256", "bytes", "width", "height", "content_type")},
+        })
+    version = hashlib.sha256(json.dumps(items, sort_keys=True).encode()).hexdigest()[:16]
+    manifest = {
+        "store_id": store_id,
+        "version": version,
+        "generated_at": datetime.now().isoformat(),
+        "items": items,
+    }
+    # 有素材尚无元数据时不缓存清单，补齐后重新生成
+    if complete:
+        _MANIFEST_CACHE[store_id] = (fingerprint, manifest)
+    return manifest
@@ -2,9 +2,15 @@
 媒体服务 - 根据广告/产品类型自动从互联网搜索相关图片
 """
 import os
+import asyncio
 import httpx
-from typing import Optional
-from sqlalchemy.orm import Session
+from typing import Optional, Dict, Iterable
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database_async import async_session_scope
+from app.logging_config import get_logger
+
+logger = get_logger("providers")
 
 # 常见中文关键词 -> 英文搜索词（提升 Unsplash 搜索结果质量）
 SEARCH_TERM_MAP = {
@@ -23,14 +29,14 @@ def _get_search_term(keyword: str) -> str:
     return SEARCH_TERM_MAP.get(kw, kw) or keyword
 
 
-def _search_unsplash(query: str) -> Optional[str]:
+async def _search_unsplash(query: str) -> Optional[str]:
     """调用 Unsplash API 搜索图片"""
     key = os.getenv("UNSPLASH_ACCESS_KEY", "").strip()
     if not key:
         return None
     try:
-        with httpx.Client(timeout=10) as client:
-            resp = client.get(
+        async with httpx.AsyncClient(timeout=10) as client:
+            resp = await client.get(
                 "https://api.unsplash.com/search/photos",
                 params={"query": query, "per_page": 1},
                 headers={"Authorization": f"Client-ID {key}"},
@@ -45,10 +51,7 @@ def _search_unsplash(query: str) -> Optional[str]:
             # regular: 1080px 宽，适合展示
             return urls.get("regular") or urls.get("full") or urls.get("raw")
     except Exception as e:
-        try:
-            print(f"[Media] Unsplash search failed: {e}")
-        except UnicodeEncodeError:
-            pass
+        logger.warning(f"[Media] Unsplash search failed: {e}")
         return None
 
 
@@ -58,24 +61,40 @@ def _placeholder_url(target_id: str) -> str:
     return f"https://picsum.photos/seed/{safe_id}/1920/1080"
 
 
-def _get_keyword_for_target(target_id: str, db: Optional[Session] = None) -> Optional[str]:
-    """从词汇表反向查找：target_id -> 关键词（用于搜索）"""
+def _get_keyword_for_target(target_id: str) -> Optional[str]:
+    """从词汇表反向查找：target_id -> 关键词（用于搜索；只读内存缓存）"""
     try:
         from app.services.vocabulary_service import get_action_mappings
-        action_map = get_action_mappings(db)
+        action_map = get_action_mappings()
         for kw, val in action_map.items():
             if val == target_id:
                 return kw
         return None
     except Exception as e:
-        try:
-            print(f"[Media] Vocab lookup failed: {e}")
-        except UnicodeEncodeError:
-            pass
+        logger.warning(f"[Media] Vocab lookup failed: {e}")
         return None
 
 
-def get_image_url(target_id: str, db: Optional[Session] = None) -> str:
+async def _search_and_cache(target_id: str) -> str:
+    """未命中缓存：按关键词搜索 Unsplash 并写入 MediaCache，失败返回占位图"""
+    from app.models.media_model import MediaCache
+    keyword = _get_keyword_for_target(target_id)
+    search_term = _get_search_term(keyword or target_id.replace("_ad", "").replace("_", " "))
+    url = await _search_unsplash(search_term)
+    if not url:
+        return _placeholder_url(target_id)
+    try:
+        async with async_session_scope() as session:
+            if session is not None:
+                await session.merge(MediaCache(target_id=target_id, image_url=url, search_term=search_term))
+                await session.commit()
+                logger.info(f"[Media] Cached: {target_id} <- {search_term}")
+    except Exception as e:
+        logger.warning(f"[Media] Cache write failed: {e}")
+    return url
+
+
+async def get_image_url(target_id: str, db: Optional[AsyncSession] = None) -> str:
     """
     获取 target_id 对应的图片 URL。
     1. 查缓存
@@ -84,56 +103,36 @@ def get_image_url(target_id: str, db: Optional[Session] = None) -> str:
     """
     if not target_id or target_id == "default":
         return _placeholder_url("default")
+    urls = await get_image_urls([target_id], db)
+    return urls[target_id]
+
+
+async def get_image_urls(target_ids: Iterable[str], db: Optional[AsyncSession] = None) -> Dict[str, str]:
+    """
+    批量获取 target_id -> 图片 URL。
+    缓存命中部分一次 IN 查询取回，未命中的并发搜索 + 写缓存
+    """
+    wanted = {t for t in target_ids if t}
+    result: Dict[str, str] = {}
+    if "default" in wanted:
+        result["default"] = _placeholder_url("default")
+        wanted.discard("default")
+    if not wanted:
+        return result
 
     try:
         from app.models.media_model import MediaCache
-        from app.database import SessionLocal, USE_DATABASE
-        session = db
-        own_session = False
-        if session is None and USE_DATABASE and SessionLocal:
-            session = SessionLocal()
-            own_session = True
-
-        if session:
-            try:
-                cached = session.query(MediaCache).filter(MediaCache.target_id == target_id).first()
-                if cached:
-                    return cached.image_url
-            finally:
-                if own_session and session:
-                    session.close()
+        async with async_session_scope(db) as session:
+            if session is not None:
+                rows = (await session.execute(
+                    select(MediaCache).where(MediaCache.target_id.in_(wanted))
+                )).scalars().all()
+                result.update({row.target_id: row.image_url for row in rows})
     except Exception as e:
-        try:
-            print(f"[Media] Cache query failed: {e}")
-        except UnicodeEncodeError:
-            pass
+        logger.warning(f"[Media] Batch cache query failed: {e}")
 
-    # 未命中缓存：搜索
-    keyword = _get_keyword_for_target(target_id, db)
-    search_term = _get_search_term(keyword or target_id.replace("_ad", "").replace("_", " "))
-    url = _search_unsplash(search_term)
-
-    if url:
-        # 写入缓存
-        try:
-            from app.models.media_model import MediaCache
-            from app.database import SessionLocal, USE_DATABASE
-            if USE_DATABASE and SessionLocal:
-                session = SessionLocal()
-                try:
-                    session.merge(MediaCache(target_id=target_id, image_url=url, search_term=search_term))
-                    session.commit()
-                    try:
-                        print(f"[Media] Cached: {target_id} <- {search_term}")
-                    except UnicodeEncodeError:
-                        pass
-                finally:
-                    session.close()
-        except Exception as e:
-            try:
-                print(f"[Media] Cache write failed: {e}")
-            except UnicodeEncodeError:
-                pass
-        return url
-
-    return _placeholder_url(target_id)
+    misses = sorted(wanted - result.keys())
+    if misses:
+        urls = await asyncio.gather(*(_search_and_cache(t) for t in misses))
+        result.update(zip(misses, urls))
+    return result
@@ -0,0 +1,153 @@
+"""
+播放状态：按门店的当前应播内容 + 单调递增的代数（generation）
+- 每次 tick 有门店内容变化时 generation +1，并记录各门店最后变化的代数
+- 有界变更日志，支持 /playlists/changes?since=<gen> 增量同步
+- 长轮询：内容变化时唤醒所有等待者
+"""
+import asyncio
+from collections import deque
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
+
+# 变更日志默认保留条数，超出后最旧的记录被丢弃（落后太多的客户端需全量同步）
+DEFAULT_CHANGE_LOG_SIZE = 10000
+
+
+class PlaylistState:
+    """按门店播放状态，整表不可变替换，读取方拿到的快照始终一致"""
+
+    def __init__(self, max_log: int = DEFAULT_CHANGE_LOG_SIZE):
+        self.generation = 0
+        self._targets: Mapping[str, str] = MappingProxyType({})
+        self._changed_gen: Dict[str, int] = {}
+        # (generation, store_id, target_id)；target_id 为 None 表示门店已移除
+        self._log: deque = deque(maxlen=max_log)
+        # 已被挤出日志的最大代数：since 小于它时无法增量同步
+        self._log_floor = 0
+        self._changed_event: Optional[asyncio.Event] = None
+
+    def get(self, store_id: str) -> Optional[str]:
+        """门店当前目标内容，未知门店返回 None"""
+        return self._targets.get(store_id)
+
+    def version(self, store_id: str) -> int:
+        """门店内容最后一次变化时的代数（从未出现过为 0）"""
+        return self._changed_gen.get(store_id, 0)
+
+    def snapshot(self) -> Tuple[int, Mapping[str, str]]:
+        """一致性快照 (generation, {store_id: target_id})，只读，无拷贝"""
+        return self.generation, self._targets
+
+    def __len__(self) -> int:
+        return len(self._targets)
+
+    def apply(self, by_store: Dict[str, str]) -> List[str]:
+        """
+        用本次 tick 的完整匹配结果替换状态，返回内容有变化的门店 ID
+        无变化时 generation 不变
+        """
+        old = self._targets
+        changed = [sid for sid in old.keys() | by_store.keys() if old.get(sid) != by_store.get(sid)]
+        return self._commit(changed, dict(by_store))
+
+    def merge(self, by_store: Dict[str, str]) -> List[str]:
+        """
+        只更新给定门店（增量重算，如批量开通新门店后），其余门店保持不变
+        返回内容有变化的门店 ID
+        """
+        old = self._targets
+        changed = [sid for sid, target in by_store.items() if old.get(sid) != target]
+        if not changed:
+            return changed
+        return self._commit(changed, {**old, **by_store})
+
+    def _commit(self, changed: List[str], targets: Dict[str, str]) -> List[str]:
+        """记录变更日志并整表替换（无变化时 generation 不变）"""
+        if not changed:
+            return changed
+        self.generation += 1
+        gen = self.generation
+        for sid in changed:
+            self._changed_gen[sid] = gen
+            if len(self._log) == self._log.maxlen:
+                self._log_floor = self._log[0][0]
+            self._log.append((gen, sid, targets.get(sid)))
+        self._targets = MappingProxyType(targets)
+        self._notify()
+        return changed
+
+    def replay(self, entries: List[Tuple[int, str, Optional[str]]]) -> None:
+        """
+        按写入方的代数重放变更日志 [(generation, store_id, target_id), ...]（升序）
+        用于多 worker 共享状态的只读副本，保证各 worker 的 generation / version 一致
+        """
+        if not entries:
+            return
+        targets = dict(self._targets)
+        for gen, sid, target in entries:
+            if target is None:
+                targets.pop(sid, None)
+            else:
+                targets[sid] = target
+            self._changed_gen[sid] = gen
+            if len(self._log) == self._log.maxlen:
+                self._log_floor = self._log[0][0]
+            self._log.append((gen, sid, target))
+        self.generation = max(self.generation, entries[-1][0])
+        self._targets = MappingProxyType(targets)
+        self._notify()
+
+    def reset(self, generation: int, targets: Dict[str, str], changed_gen: Dict[str, int]) -> None:
+        """整体替换为写入方的全量状态（副本落后超出日志范围时使用），本地日志清空"""
+        self.generation = generation
+        self._targets = MappingProxyType(dict(targets))
+        self._changed_gen = dict(changed_gen)
+        self._log.clear()
+        self._log_floor = generation
+        self._notify()
+
+    def _notify(self) -> None:
+        """唤醒所有长轮询等待者"""
+        if self._changed_event is not None:
+            event, self._changed_event = self._changed_event, None
+            event.set()
+
+    def changes_since(self, since: int) -> dict:
+        """
+        返回 since 之后内容变化的门店（每个门店只保留最新一条）
+        since 早于日志保留范围时返回全量快照并标记 reset=True
+        """
+        generation, targets = self.snapshot()
+        if since < self._log_floor or since > generation:
+            changes = [
+                {"store_id": sid, "target_id": target, "generation": self._changed_gen.get(sid, 0)}
+                for sid, target in targets.items()
+            ]
+            return {"generation": generation, "reset": True, "changes": changes}
+        latest: Dict[str, dict] = {}
+        for gen, sid, target in reversed(self._log):
+            if gen <= since:
+                break
+            if sid not in latest:
+                latest[sid] = {"store_id": sid, "target_id": target, "generation": gen}
+        changes = sorted(latest.values(), key=lambda c: c["generation"])
+        return {"generation": generation, "reset": False, "changes": changes}
+
+    async def wait_for_change(self, store_id: str, version: int, timeout: float) -> bool:
+        """
+        长轮询：挂起直到门店版本不再等于 version 或超时
+        返回 True 表示内容已变化
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.version(store_id) == version:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            if self._changed_event is None:
+                self._changed_event = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._changed_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
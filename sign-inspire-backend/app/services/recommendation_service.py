@@ -5,6 +5,9 @@
 import httpx
 from typing import List, Dict, Any, Optional
 from time import time
+from app.logging_config import get_logger
+
+logger = get_logger("providers")
 
 # 推荐结果缓存：减少重复请求，提升门店推送响应速度
 _REC_CACHE: Dict[str, tuple] = {}
@@ -127,7 +130,7 @@ def fetch_places_overpass(key: str, value: str, bbox: tuple, limit: int = 10) ->
             data = resp.json()
             return _parse_overpass_result(data)
     except Exception as e:
-        print(f"⚠️ [Recommendation] Overpass 请求失败: {e}")
+        logger.warning(f"⚠️ [Recommendation] Overpass 请求失败: {e}")
         return []
 
 
@@ -155,7 +158,7 @@ def get_recommended_stores(
         if stores:
             return stores
     except Exception as e:
-        print(f"⚠️ [Recommendation] 高德跳过: {e}")
+        logger.warning(f"⚠️ [Recommendation] 高德跳过: {e}")
 
     try:
         from app.services.google_places_service import search_stores_google
@@ -163,7 +166,7 @@ def get_recommended_stores(
         if stores:
             return stores
     except Exception as e:
-        print(f"⚠️ [Recommendation] Google Places 跳过: {e}")
+        logger.warning(f"⚠️ [Recommendation] Google Places 跳过: {e}")
 
     # 未知 target_id 时用 restaurant 而非 cafe，避免总是显示咖啡店
     filters = TARGET_TO_OVERPASS.get(target_id)
@@ -0,0 +1,266 @@
+"""
+规则求值器（纯函数，无 I/O）：服务端匹配引擎与屏幕端 bundle 共用
+- compile_rule：把 DB/内存中的规则编译为紧凑、可 JSON 序列化的形式（范围预解析、天气值预标准化）
+- evaluate_conditions / select_target：对编译后的规则按上下文求值
+
+编译后条件格式（与 /signs/{sign_id}/bundle 下发给 Player 的一致）：
+    {"type": "weather", "any": ["rain", "cloudy"]}       当前天气命中任一值
+    {"type": "temp" | "time", "range": [lo, hi]}         闭区间，上下文缺失该值时跳过
+    {"type": "day", "days": [4, 5, 6]}                   0=周一 .. 6=周日，上下文缺失时跳过
+    {"type": "city" | "region", "eq": "adelaide"}        忽略大小写
+    {"type": "china_region" | "solar_term", "eq": ...}   上下文为空时必不匹配；eq 为 null 时仅要求非空
+"""
+import heapq
+from typing import Any, Callable, Collection, Dict, Iterable, List, Optional
+
+# 星期映射：mon=0..sun=6（与 datetime.weekday() 一致，0=周一）
+DAY_ALIAS = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+DAY_KEYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+# 模板规则的 store_id 前缀（rule_templates 复用）
+TEMPLATE_PREFIX = "template:"
+
+
+def parse_temp_range(value: str) -> Optional[tuple]:
+    """解析温度范围: '0,15' -> (0,15) 闭区间; '>30' -> (30,999); '<=10' -> (-999,10)"""
+    if not value or not str(value).strip():
+        return None
+    s = str(value).strip().replace(" ", "")
+    if "," in s:
+        parts = s.split(",")
+        if len(parts) == 2:
+            try:
+                return (float(parts[0]), float(parts[1]))
+            except ValueError:
+                return None
+    for prefix, build in ((">=", lambda t: (t, 999)), ("<=", lambda t: (-999, t)),
+                          (">", lambda t: (t, 999)), ("<", lambda t: (-999, t))):
+        if s.startswith(prefix):
+            try:
+                return build(float(s[len(prefix):]))
+            except ValueError:
+                return None
+    return None
+
+
+def parse_time_range(value: str) -> Optional[tuple]:
+    """解析时段: '8,11' -> (8,11) 闭区间小时; '14,18' -> 下午2-6点"""
+    if not value or not str(value).strip():
+        return None
+    s = str(value).strip().replace(" ", "")
+    if "," in s:
+        parts = s.split(",")
+        if len(parts) == 2:
+            try:
+                return (int(parts[0]), int(parts[1]))
+            except ValueError:
+                return None
+    return None
+
+
+def parse_day_value(value: str) -> Optional[set]:
+    """解析星期: '6'=周日; '4,5,6'=五/六/日; 'fri,sat,sun' 或 'sun'"""
+    if not value or not str(value).strip():
+        return None
+    s = str(value).strip().lower()
+    days = set()
+    for part in s.split(","):
+        part = part.strip()
+        if part.isdigit():
+            days.add(int(part))
+        elif part in DAY_ALIAS:
+            days.add(DAY_ALIAS[part])
+    return days if days else None
+
+
+def compile_condition(cond: Dict[str, Any], normalize_weather: Callable[[str], set]) -> Optional[Dict[str, Any]]:
+    """
+    编译单个条件；对匹配结果无影响的条件（未知类型、无法解析的范围等）返回 None
+    normalize_weather 由调用方注入（依赖词汇表），保持本模块无 I/O
+    """
+    ctype = cond.get("type")
+    value = cond.get("value", "")
+    op = cond.get("operator", "==")
+
+    if ctype == "weather":
+        if op == "==":
+            values = normalize_weather(str(value))
+        elif op == "in":
+            values = set()
+            for v in str(value).split(","):
+                values |= normalize_weather(v.strip())
+        else:
+            values = set()
+        return {"type": "weather", "any": sorted(values)}
+    if ctype in ("city", "region"):
+        if op != "==" or not value:
+            return None
+        return {"type": ctype, "eq": str(value).lower()}
+    if ctype == "temp":
+        tr = parse_temp_range(str(value))
+        return {"type": "temp", "range": list(tr)} if tr else None
+    if ctype == "time":
+        tr = parse_time_range(str(value))
+        return {"type": "time", "range": list(tr)} if tr else None
+    if ctype == "day":
+        days = parse_day_value(str(value))
+        return {"type": "day", "days": sorted(days)} if days else None
+    if ctype == "china_region":
+        return {"type": "china_region", "eq": str(value).lower() if value else None}
+    if ctype == "solar_term":
+        return {"type": "solar_term", "eq": str(value).strip() if value else None}
+    return None
+
+
+def compile_conditions(conditions: Optional[List[Dict]], normalize_weather: Callable[[str], set]) -> List[Dict[str, Any]]:
+    """编译条件列表，丢弃不影响结果的条件"""
+    compiled = (compile_condition(c, normalize_weather) for c in conditions or [])
+    return [c for c in compiled if c is not None]
+
+
+def compile_rule(rule: Dict[str, Any], normalize_weather: Callable[[str], set]) -> Dict[str, Any]:
+    """编译单条规则：保留匹配所需字段 + 预编译条件"""
+    action = rule.get("action") or {}
+    return {
+        "id": rule.get("id"),
+        "store_id": rule.get("store_id") or "",
+        "priority": rule.get("priority") or 1,
+        "target_id": action.get("target_id", "default"),
+        "message": action.get("message"),
+        "conditions": compile_conditions(rule.get("conditions"), normalize_weather),
+    }
+
+
+def scope_rank(store_id: Optional[str]) -> int:
+    """同优先级时的作用域次序：门店自有 0、全局（'' / '*'）1、模板 2"""
+    if not store_id or store_id == "*":
+        return 1
+    return 2 if store_id.startswith(TEMPLATE_PREFIX) else 0
+
+
+def rule_order_key(rule: Dict[str, Any]) -> tuple:
+    """
+    求值顺序（全序）：优先级降序 -> 作用域次序 -> id
+    与规则来源的加载顺序无关，服务端 tick、共享规则表与屏幕端 bundle 对同一门店得到相同的规则顺序
+    """
+    return (-rule["priority"], scope_rank(rule["store_id"]), rule["id"] or "")
+
+
+def compile_rules(rules: Iterable[Dict[str, Any]], normalize_weather: Callable[[str], set]) -> List[Dict[str, Any]]:
+    """编译规则列表并按求值顺序（rule_order_key）排列"""
+    compiled = [compile_rule(r, normalize_weather) for r in rules]
+    compiled.sort(key=rule_order_key)
+    return compiled
+
+
+def rules_for_store(
+    compiled_rules: Iterable[Dict[str, Any]],
+    store_id: str,
+    template_scope: Optional[str] = None,
+    disabled: Collection[str] = (),
+) -> List[Dict[str, Any]]:
+    """
+    筛选适用于门店的规则：store_id 为空、'*' 或等于该门店，
+    以及门店订阅的模板（template_scope）中未被屏蔽（disabled）的规则
+    """
+    return [
+        r for r in compiled_rules
+        if not r["store_id"] or r["store_id"] in ("*", store_id)
+        or (template_scope and r["store_id"] == template_scope and r["id"] not in disabled)
+    ]
+
+
+class ScopedRules:
+    """
+    已编译规则按作用域（store_id）分组，供一次 tick 内所有门店共用
+    门店的适用规则与 rules_for_store 相同、按 rule_order_key 排序，但只合并相关分组，不再逐店扫描全部规则；
+    无自有规则、无屏蔽的门店直接共用按模板缓存的合并结果（每个模板只合并一次）
+    """
+
+    def __init__(self, compiled_rules: List[Dict[str, Any]]):
+        """compiled_rules 为 compile_rules 的输出（已按 rule_order_key 排序，各分组因此有序）"""
+        self._by_scope: Dict[str, List[Dict[str, Any]]] = {}
+        for r in compiled_rules:
+            self._by_scope.setdefault(r["store_id"], []).append(r)
+        self._global = self._merge(self._by_scope.get("", ()), self._by_scope.get("*", ()))
+        self._shared: Dict[Optional[str], List[Dict[str, Any]]] = {}
+
+    @staticmethod
+    def _merge(*groups: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return list(heapq.merge(*groups, key=rule_order_key))
+
+    def for_store(
+        self, store_id: str, template_scope: Optional[str] = None, disabled: Collection[str] = ()
+    ) -> List[Dict[str, Any]]:
+        """门店适用的规则（已按优先级排序）；返回的列表可能被多个门店共用，调用方只读"""
+        own = self._by_scope.get(store_id, ()) if store_id not in ("", "*") else ()
+        template = self._by_scope.get(template_scope, ()) if template_scope else ()
+        if disabled and template:
+            template = [r for r in template if r["id"] not in disabled]
+        elif not own:
+            shared = self._shared.get(template_scope)
+            if shared is None:
+                shared = self._shared[template_scope] = self._merge(self._global, template)
+            return shared
+        return self._merge(own, self._global, template)
+
+
+def evaluate_conditions(conditions: List[Dict[str, Any]], ctx: Dict[str, Any]) -> bool:
+    """
+    对编译后的条件求值，全部满足返回 True
+    ctx: weather (标准化天气值集合), city, temp_c, region, hour, weekday, china_subregion, solar_terms
+    """
+    for cond in conditions:
+        ctype = cond["type"]
+        if ctype == "weather":
+            if ctx["weather"].isdisjoint(cond["any"]):
+                return False
+        elif ctype == "city":
+            if cond["eq"] != (ctx.get("city") or "").lower():
+                return False
+        elif ctype == "region":
+            if cond["eq"] != (ctx.get("region") or "").lower():
+                return False
+        elif ctype in ("temp", "time"):
+            current = ctx.get("temp_c" if ctype == "temp" else "hour")
+            if current is not None:
+                lo, hi = cond["range"]
+                if not (lo <= current <= hi):
+                    return False
+        elif ctype == "day":
+            weekday = ctx.get("weekday")
+            if weekday is not None and weekday not in cond["days"]:
+                return False
+        elif ctype == "china_region":
+            sub = ctx.get("china_subregion")
+            if not sub or (cond["eq"] and cond["eq"] != sub.lower()):
+                return False
+        elif ctype == "solar_term":
+            terms = ctx.get("solar_terms")
+            if not terms or (cond["eq"] and cond["eq"] not in terms):
+                return False
+    return True
+
+
+def select_target(compiled_rules: Iterable[Dict[str, Any]], ctx: Dict[str, Any]) -> str:
+    """按求值顺序返回第一条命中规则的 target_id，均未命中返回 "default"（规则需已按 rule_order_key 排序）"""
+    for rule in compiled_rules:
+        if evaluate_conditions(rule["conditions"], ctx):
+            return rule["target_id"]
+    return "default"
+
+
+def is_open_at(opening_hours: Optional[Dict[str, str]], weekday: int, hhmm: str) -> bool:
+    """
+    营业判断：opening_hours 格式 {"mon":"09:00-17:00", ...}，hhmm 为 "HH:MM"
+    未配置或格式异常时视为营业中
+    """
+    if not opening_hours:
+        return True
+    day_key = DAY_KEYS[weekday]
+    hours_str = opening_hours.get(day_key) or opening_hours.get(day_key.capitalize())
+    if not hours_str:
+        return True
+    parts = hours_str.split("-")
+    if len(parts) != 2:
+        return True
+    return parts[0].strip() <= hhmm <= parts[1].strip()
@@ -0,0 +1,120 @@
+"""
+规则 SQL 查询：数据库模式下门店规则列表直接由 SQL 按作用域筛选、排序，只加载需要返回的规则
+- 作用域：门店自有规则 + 订阅模板中未屏蔽的规则（带 "template": 模板名）
+- 上下文预筛选：基于 rule_conditions 表，按 region / china_region / solar_term / weather 排除必不命中当前上下文的规则，
+  结果是精确求值（rule_evaluator）的超集，调用方对候选规则仍需求值
+- 动作 target_id / 条件类型过滤与 (priority 降序, id) 键集分页同样在 SQL 中完成
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, exists, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def weather_aliases(canonical: Iterable[str]) -> List[str]:
+    """标准化天气值 -> 所有会被标准化为这些值的写法（天气别名索引中的规范化键），用于匹配 rule_conditions.value"""
+    from app.services.scheduler_service import weather_alias_index
+    wanted = set(canonical)
+    if not wanted:
+        return []
+    return sorted(
+        alias for alias, values in weather_alias_index().items()
+        if alias == alias.lower().strip() and not values.isdisjoint(wanted)
+    )
+
+
+def context_criteria(ctx: Dict[str, Any]) -> list:
+    """
+    排除必不命中 ctx 的规则的 WHERE 条件（作用于 Rule）
+    ctx 为求值上下文（matching_engine.build_match_context）：weather 为标准化值集合
+    """
+    from app.models.rule_condition_model import RuleCondition as RC
+    from app.models.rule_model import Rule
+
+    def has(ctype: str, *criteria):
+        return exists().where(RC.rule_id == Rule.id, RC.type == ctype, *criteria)
+
+    # region：值与当前文化圈不同则必不命中
+    criteria = [~has("region", RC.value != (ctx.get("region") or "").lower())]
+    # china_region：当前无子区域时必不命中；有值且不同也不命中
+    sub = (ctx.get("china_subregion") or "").lower()
+    criteria.append(~has("china_region", RC.value.isnot(None), RC.value != sub) if sub else ~has("china_region"))
+    # solar_term：当前无节气时必不命中；有值且不在当前节气中也不命中
+    terms = list(ctx.get("solar_terms") or [])
+    criteria.append(~has("solar_term", RC.value.isnot(None), RC.value.notin_(terms)) if terms else ~has("solar_term"))
+    # weather：有天气条件时至少一个取值能标准化为当前天气（value 为 NULL 的行未建索引，不据此排除）
+    aliases = weather_aliases(ctx.get("weather") or ())
+    criteria.append(or_(~has("weather"), has("weather", or_(RC.value.is_(None), RC.value.in_(aliases)))))
+    return criteria
+
+
+def scope_criterion(store_id: str, subscription: tuple):
+    """门店自有规则 + 订阅模板中未屏蔽的规则"""
+    from app.models.rule_model import Rule
+    from app.services.rule_templates import template_scope
+    name, disabled = subscription
+    if not name:
+        return Rule.store_id == store_id
+    inherited = Rule.store_id == template_scope(name)
+    if disabled:
+        inherited = and_(inherited, Rule.id.notin_(sorted(disabled)))
+    return or_(Rule.store_id == store_id, inherited)
+
+
+def filter_criteria(target: Optional[str], condition_type: Optional[str]) -> list:
+    """按动作 target_id、按包含的条件类型过滤（条件类型经 rule_conditions，每个条件至少一行）"""
+    from app.models.rule_condition_model import RuleCondition as RC
+    from app.models.rule_model import Rule
+    criteria = []
+    if target:
+        criteria.append(Rule.action["target_id"].as_string() == target)
+    if condition_type:
+        criteria.append(exists().where(RC.rule_id == Rule.id, RC.type == condition_type))
+    return criteria
+
+
+def after_criterion(after: Tuple[int, str]):
+    """分页排序键 (-priority, id) 之后的规则"""
+    from app.models.rule_model import Rule
+    priority, rule_id = -after[0], after[1]
+    return or_(Rule.priority < priority, and_(Rule.priority == priority, Rule.id > rule_id))
+
+
+async def count_store_rules(db: AsyncSession, store_id: str, subscription: tuple) -> int:
+    """门店规则数（自有 + 继承）"""
+    from app.models.rule_model import Rule
+    stmt = select(func.count()).select_from(Rule).where(scope_criterion(store_id, subscription))
+    return (await db.execute(stmt)).scalar_one()
+
+
+async def query_store_rules(
+    db: AsyncSession,
+    store_id: str,
+    subscription: tuple,
+    ctx: Optional[Dict[str, Any]] = None,
+    target: Optional[str] = None,
+    condition_type: Optional[str] = None,
+    after: Optional[Tuple[int, str]] = None,
+    limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    门店规则（自有 + 继承），按 (priority 降序, id) 排序；ctx 给定时只返回可能命中的候选规则
+    subscription 为 (模板名, 屏蔽集合)；after 为分页排序键（rule_repository.page_order_key），只取其后的规则
+    """
+    from app.models.rule_model import Rule
+    name = subscription[0]
+    stmt = select(Rule).where(scope_criterion(store_id, subscription), *filter_criteria(target, condition_type))
+    if ctx is not None:
+        stmt = stmt.where(*context_criteria(ctx))
+    if after is not None:
+        stmt = stmt.where(after_criterion(after))
+    stmt = stmt.order_by(Rule.priority.desc(), Rule.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    rules = []
+    for row in (await db.execute(stmt)).scalars():
+        rule = row.to_dict()
+        if rule["store_id"] != store_id:
+            rule["template"] = name
+        rules.append(rule)
+    return rules
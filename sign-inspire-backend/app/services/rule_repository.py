@@ -0,0 +1,305 @@
+"""
+规则仓库：数据库模式下规则的内存副本（写穿透）
+tick 与规则列表接口不再每次查询、反序列化全部规则：
+- 首次使用时全量加载，读取直接走内存索引（按 id、按 store_id）
+- 接口写入时先写数据库，提交成功后同步更新内存索引
+- 定期比对规则表状态（一次查询）：rules_version 计数器 + 行数 + MAX(created_at) + MAX(updated_at)，
+  有变化时全量重载。应用内的写入（其他 worker、种子写入、批量导入）在同一事务内递增计数器，
+  同一秒内的修改也能发现；未递增计数器的库外修改（手工 SQL 增删、改动时间戳）由行数与时间戳发现
+
+环境变量：RULE_REPO_RECONCILE_INTERVAL 版本检查最小间隔秒数（默认 30）
+返回的规则字典为共享对象，调用方只读；需要修改时先复制
+"""
+import asyncio
+import os
+from time import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database_async import async_session_scope
+from app.logging_config import get_logger
+
+logger = get_logger("matching")
+
+RECONCILE_INTERVAL = float(os.getenv("RULE_REPO_RECONCILE_INTERVAL", "30"))
+
+# id -> 规则字典
+_BY_ID: Dict[str, Dict[str, Any]] = {}
+# store_id -> {id: 规则字典}
+_BY_STORE: Dict[str, Dict[str, Dict[str, Any]]] = {}
+# (store_id, content_hash) -> 规则字典，去重时一次探测
+_BY_CONTENT: Dict[tuple, Dict[str, Any]] = {}
+# 按优先级降序的全部规则（写入后失效，下次读取时重建）
+_sorted: Optional[List[Dict[str, Any]]] = None
+# store_id -> 按 (priority 降序, id) 排好的规则，分页列表用（写入后失效）
+_page_order: Dict[str, List[Dict[str, Any]]] = {}
+# 内存副本对应的规则表状态 _rules_state（None 表示未知，下次检查时重载）
+_state: Optional[tuple] = None
+_loaded = False
+_last_check = 0.0
+_lock: Optional[asyncio.Lock] = None
+
+
+def _get_lock() -> asyncio.Lock:
+    global _lock
+    if _lock is None:
+        _lock = asyncio.Lock()
+    return _lock
+
+
+async def _rules_state(session: AsyncSession) -> tuple:
+    """规则表状态 (rules_version 版本号, 行数, 最新创建时间, 最新更新时间)，一次查询（计数器行缺失时版本号为 None）"""
+    from app.models.rule_model import RULES_VERSION_ROW, Rule, RulesVersion
+    version = select(RulesVersion.version).where(RulesVersion.id == RULES_VERSION_ROW).scalar_subquery()
+    result = await session.execute(
+        select(version, func.count(Rule.id), func.max(Rule.created_at), func.max(Rule.updated_at))
+    )
+    return tuple(result.one())
+
+
+async def _bump_version(session: AsyncSession) -> tuple:
+    """
+    写入事务内递增版本号并返回写入后的状态（随写入一起提交或回滚；行锁使并发写入按顺序递增）
+    会话不自动 flush：先 flush 待写入的规则，唯一约束冲突在这里抛出，写入后的状态也包含本次修改
+    """
+    from app.models.rule_model import bump_rules_version
+    await session.flush()
+    await session.execute(bump_rules_version())
+    return await _rules_state(session)
+
+
+def _index(rule: Dict[str, Any]) -> None:
+    global _sorted
+    _unindex(rule["id"])
+    _BY_ID[rule["id"]] = rule
+    _BY_STORE.setdefault(rule.get("store_id") or "", {})[rule["id"]] = rule
+    if rule.get("content_hash"):
+        _BY_CONTENT[(rule.get("store_id") or "", rule["content_hash"])] = rule
+    _sorted = None
+    _page_order.clear()
+
+
+def _unindex(rule_id: str) -> Optional[Dict[str, Any]]:
+    global _sorted
+    old = _BY_ID.pop(rule_id, None)
+    if old is not None:
+        bucket = _BY_STORE.get(old.get("store_id") or "")
+        if bucket is not None:
+            bucket.pop(rule_id, None)
+            if not bucket:
+                del _BY_STORE[old.get("store_id") or ""]
+        key = (old.get("store_id") or "", old.get("content_hash"))
+        if _BY_CONTENT.get(key) is old:
+            del _BY_CONTENT[key]
+        _sorted = None
+        _page_order.clear()
+    return old
+
+
+async def reload(db: Optional[AsyncSession] = None) -> bool:
+    """从数据库全量加载，返回是否成功"""
+    global _BY_ID, _BY_STORE, _BY_CONTENT, _sorted, _state, _loaded, _last_check
+    from app.models.rule_model import Rule
+    try:
+        async with async_session_scope(db) as session:
+            if session is None:
+                return False
+            state = await _rules_state(session)
+            rows = (await session.execute(select(Rule))).scalars().all()
+            by_id = {r.id: r.to_dict() for r in rows}
+    except Exception as e:
+        logger.warning(f"[RuleRepo] Load failed: {e}")
+        return False
+    by_store: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    by_content: Dict[tuple, Dict[str, Any]] = {}
+    for rid, rule in by_id.items():
+        by_store.setdefault(rule.get("store_id") or "", {})[rid] = rule
+        if rule.get("content_hash"):
+            by_content[(rule.get("store_id") or "", rule["content_hash"])] = rule
+    _BY_ID, _BY_STORE, _BY_CONTENT, _sorted = by_id, by_store, by_content, None
+    _page_order.clear()
+    _state, _loaded, _last_check = state, True, time()
+    logger.info(f"[RuleRepo] Loaded {len(by_id)} rules")
+    return True
+
+
+async def ensure_fresh(db: Optional[AsyncSession] = None, force: bool = False) -> bool:
+    """
+    未加载时全量加载；已加载时每 RECONCILE_INTERVAL 秒做一次版本检查，有库外修改则重载
+    数据库不可用时返回 False（调用方走内存数据库）
+    """
+    global _last_check
+    if _loaded and not force and time() - _last_check < RECONCILE_INTERVAL:
+        return True
+    async with _get_lock():
+        if _loaded and not force and time() - _last_check < RECONCILE_INTERVAL:
+            return True
+        try:
+            async with async_session_scope(db) as session:
+                if session is None:
+                    return False
+                if _loaded and _state is not None and await _rules_state(session) == _state:
+                    _last_check = time()
+                    return True
+                return await reload(session)
+        except Exception as e:
+            logger.warning(f"[RuleRepo] Version check failed: {e}")
+            return _loaded
+
+
+def _sync_version(before: tuple, written: tuple) -> None:
+    """
+    写入提交后：写入前的状态与内存副本一致、且本次写入恰好是下一个版本时记录写入后的状态，
+    避免下次检查把本进程的写入当成库外修改；否则（中间有其他写入或库外修改）作废，下次读取时全量重载
+    """
+    global _state, _last_check
+    if (
+        _loaded and _state is not None and before == _state
+        and before[0] is not None and written[0] == before[0] + 1
+    ):
+        _state, _last_check = written, time()
+    else:
+        _state, _last_check = None, 0.0
+
+
+def version() -> Optional[int]:
+    """内存副本对应的 rules_version 版本号（未知时为 None）"""
+    return _state[0] if _state is not None else None
+
+
+def is_loaded() -> bool:
+    return _loaded
+
+
+def all_rules() -> List[Dict[str, Any]]:
+    """全部规则，按优先级降序（内存读取）"""
+    global _sorted
+    if _sorted is None:
+        _sorted = sorted(_BY_ID.values(), key=lambda r: r.get("priority") or 0, reverse=True)
+    return _sorted
+
+
+def rules_for_stores(store_ids: Iterable[str]) -> List[Dict[str, Any]]:
+    """指定门店（可含全局 '*'）的规则"""
+    out: List[Dict[str, Any]] = []
+    for sid in dict.fromkeys(store_ids):
+        out.extend(_BY_STORE.get(sid, {}).values())
+    return out
+
+
+def store_rule_count(store_id: str) -> int:
+    return len(_BY_STORE.get(store_id, {}))
+
+
+def store_ids() -> List[str]:
+    """有规则的门店 / 作用域（含 '*' 与模板）"""
+    return list(_BY_STORE)
+
+
+def page_order_key(rule: Dict[str, Any]) -> tuple:
+    """分页排序键：优先级降序，同优先级按 id"""
+    return (-(rule.get("priority") or 0), rule.get("id") or "")
+
+
+def rules_in_page_order(store_id: str) -> List[Dict[str, Any]]:
+    """门店规则按分页排序键排好（缓存到下次写入）"""
+    ordered = _page_order.get(store_id)
+    if ordered is None:
+        ordered = _page_order[store_id] = sorted(_BY_STORE.get(store_id, {}).values(), key=page_order_key)
+    return ordered
+
+
+def get_rule(rule_id: str, store_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    rule = _BY_ID.get(rule_id)
+    if rule is None or (store_id is not None and rule.get("store_id") != store_id):
+        return None
+    return rule
+
+
+def find_by_content(store_id: str, content_hash: str) -> Optional[Dict[str, Any]]:
+    """按内容哈希查门店内的同内容规则"""
+    return _BY_CONTENT.get((store_id or "", content_hash))
+
+
+async def add_rule(db: AsyncSession, values: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    写入一条规则（先提交数据库，再更新索引），返回保存后的字典
+    并发写入同内容规则时唯一约束拒绝后者：重载后返回已存在的那条
+    """
+    from app.models.rule_model import Rule, rule_content_hash
+    before = await _rules_state(db)
+    db_rule = Rule(**values)
+    db.add(db_rule)
+    try:
+        written = await _bump_version(db)
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        await ensure_fresh(db, force=True)
+        existing = find_by_content(values["store_id"], rule_content_hash(values.get("conditions"), values.get("action")))
+        if existing is None:
+            raise
+        return existing
+    await db.refresh(db_rule)
+    rule = db_rule.to_dict()
+    _index(rule)
+    _sync_version(before, written)
+    return rule
+
+
+async def update_rule(db: AsyncSession, store_id: str, rule_id: str, values: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """部分更新，规则不存在时返回 None"""
+    from app.models.rule_model import Rule
+    before = await _rules_state(db)
+    db_rule = (await db.execute(
+        select(Rule).where(Rule.id == rule_id, Rule.store_id == store_id)
+    )).scalars().first()
+    if db_rule is None:
+        return None
+    for key, value in values.items():
+        if hasattr(db_rule, key):
+            setattr(db_rule, key, value)
+    try:
+        written = await _bump_version(db)
+        await db.commit()
+    except IntegrityError:
+        # 改后与门店内其他规则内容相同
+        await db.rollback()
+        raise
+    await db.refresh(db_rule)
+    rule = db_rule.to_dict()
+    _index(rule)
+    _sync_version(before, written)
+    return rule
+
+
+async def delete_rule(db: AsyncSession, store_id: str, rule_id: str) -> bool:
+    """删除一条规则，返回是否存在"""
+    from app.models.rule_model import Rule
+    before = await _rules_state(db)
+    result = await db.execute(delete(Rule).where(Rule.id == rule_id, Rule.store_id == store_id))
+    if result.rowcount == 0:
+        # 不属于该门店（如继承的模板规则）：不动内存索引与版本号
+        await db.rollback()
+        return False
+    written = await _bump_version(db)
+    await db.commit()
+    _unindex(rule_id)
+    _sync_version(before, written)
+    return True
+
+
+async def delete_store_rules(db: AsyncSession, store_id: str) -> int:
+    """删除门店全部规则，返回删除条数"""
+    from app.models.rule_model import Rule
+    before = await _rules_state(db)
+    result = await db.execute(delete(Rule).where(Rule.store_id == store_id))
+    written = await _bump_version(db)
+    await db.commit()
+    for rid in list(_BY_STORE.get(store_id, {})):
+        _unindex(rid)
+    _sync_version(before, written)
+    return result.rowcount
@@ -0,0 +1,274 @@
+"""
+共享只读规则表：已编译规则序列化为扁平二进制布局，经内存映射文件在多进程间共享
+- 写入方（tick 所在进程）编译规则后发布；指纹为 (规则仓库版本号, 词汇表版本号)，未变化时不重写
+- 读取方（非写入方 worker，follower_table）mmap 文件，直接在映射区上求值（struct.unpack_from，
+  不复制规则数据），每次使用前 stat 一次文件，发现被替换（版本递增）才重新映射；
+  用于 bundle 与共享播放状态中尚无结果的门店的 current-content
+
+布局（小端）：
+    header   <4sHHQIIII   magic "SIRT", 格式版本, 保留, 规则表版本, 规则数, 条件数, 参数数, 字符串数
+    rules    <iIIIIII     priority, id, store_id, target_id, message（字符串下标）, 条件起始, 条件数
+    conds    <B3xddII     类型码, lo, hi, a, b
+    args     <I * n       weather 条件的取值（字符串下标）
+    str_offs <I * (n+1)   字符串表偏移
+    str_blob              UTF-8 字符串
+条件编码（与 rule_evaluator 编译格式一一对应）：
+    weather: a=args 起始, b=个数; temp/time: [lo, hi]; day: a=星期位掩码;
+    city/region/china_region/solar_term: a=字符串下标（NONE 表示 eq 为 null）
+
+环境变量：RULE_TABLE_PATH 规则表文件路径，未设置时关闭
+"""
+import mmap
+import os
+import struct
+from typing import Any, Collection, Dict, List, Optional
+
+from app.logging_config import get_logger
+from app.services import shared_state
+from app.services.rule_evaluator import rule_order_key
+
+logger = get_logger("matching")
+
+RULE_TABLE_PATH = os.getenv("RULE_TABLE_PATH", "").strip()
+
+MAGIC = b"SIRT"
+FORMAT_VERSION = 1
+NONE = 0xFFFFFFFF
+
+_HEADER = struct.Struct("<4sHHQIIII")
+_RULE = struct.Struct("<iIIIIII")
+_COND = struct.Struct("<B3xddII")
+_U32 = struct.Struct("<I")
+
+COND_CODES = {"weather": 1, "temp": 2, "time": 3, "day": 4, "city": 5, "region": 6, "china_region": 7, "solar_term": 8}
+COND_TYPES = {v: k for k, v in COND_CODES.items()}
+_WEATHER, _TEMP, _TIME, _DAY, _CITY, _REGION, _CHINA_REGION, _SOLAR_TERM = range(1, 9)
+
+_published_fingerprint: Optional[tuple] = None
+_table: Optional["RuleTable"] = None
+_table_stat: Optional[tuple] = None
+
+
+def enabled() -> bool:
+    return bool(RULE_TABLE_PATH)
+
+
+def pack_rules(compiled_rules: List[Dict[str, Any]], version: int) -> bytes:
+    """已编译规则（rule_evaluator.compile_rules 的输出）-> 二进制规则表，规则按 rule_order_key 排列"""
+    compiled_rules = sorted(compiled_rules, key=rule_order_key)
+    strings: List[str] = []
+    index: Dict[str, int] = {}
+
+    def sid(value: Optional[str]) -> int:
+        if value is None:
+            return NONE
+        value = str(value)
+        if value not in index:
+            index[value] = len(strings)
+            strings.append(value)
+        return index[value]
+
+    rules_buf = bytearray()
+    conds_buf = bytearray()
+    args: List[int] = []
+    n_conds = 0
+    for rule in compiled_rules:
+        cond_start = n_conds
+        for cond in rule["conditions"]:
+            ctype = cond["type"]
+            lo = hi = 0.0
+            a = b = 0
+            if ctype == "weather":
+                a, b = len(args), len(cond["any"])
+                args.extend(sid(v) for v in cond["any"])
+            elif ctype in ("temp", "time"):
+                lo, hi = cond["range"]
+            elif ctype == "day":
+                a = sum(1 << d for d in cond["days"] if 0 <= d < 32)
+            else:
+                a = sid(cond["eq"])
+            conds_buf += _COND.pack(COND_CODES[ctype], float(lo), float(hi), a, b)
+            n_conds += 1
+        rules_buf += _RULE.pack(
+            int(rule["priority"]), sid(rule["id"]), sid(rule["store_id"] or ""), sid(rule["target_id"]),
+            sid(rule["message"]), cond_start, n_conds - cond_start,
+        )
+
+    blob = bytearray()
+    offsets = []
+    for s in strings:
+        offsets.append(len(blob))
+        blob += s.encode("utf-8")
+    offsets.append(len(blob))
+
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, 0, version, len(compiled_rules), n_conds, len(args), len(strings))
+    return b"".join([
+        header, bytes(rules_buf), bytes(conds_buf),
+        struct.pack(f"<{len(args)}I", *args), struct.pack(f"<{len(offsets)}I", *offsets), bytes(blob),
+    ])
+
+
+class RuleTable:
+    """只读规则表视图：规则与条件留在映射区，仅字符串表在打开时解码一次"""
+
+    def __init__(self, buf):
+        self._buf = buf
+        magic, fmt, _, self.version, self.n_rules, self.n_conds, n_args, n_strings = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            raise ValueError("不是有效的规则表文件")
+        self._rules_off = _HEADER.size
+        self._conds_off = self._rules_off + self.n_rules * _RULE.size
+        self._args_off = self._conds_off + self.n_conds * _COND.size
+        offs_off = self._args_off + n_args * _U32.size
+        blob_off = offs_off + (n_strings + 1) * _U32.size
+        offsets = struct.unpack_from(f"<{n_strings + 1}I", buf, offs_off)
+        self.strings = tuple(
+            bytes(buf[blob_off + offsets[i]:blob_off + offsets[i + 1]]).decode("utf-8") for i in range(n_strings)
+        )
+        self._string_ids = {s: i for i, s in enumerate(self.strings)}
+        self._global_ids = {self._string_ids.get(""), self._string_ids.get("*")} - {None}
+
+    def _str(self, i: int) -> Optional[str]:
+        return None if i == NONE else self.strings[i]
+
+    def _rule(self, i: int) -> tuple:
+        return _RULE.unpack_from(self._buf, self._rules_off + i * _RULE.size)
+
+    def _applies(self, store_sid: int, store_id_sid: Optional[int]) -> bool:
+        return store_sid in self._global_ids or store_sid == store_id_sid
+
+    def _template(self, template_scope: Optional[str], disabled: Collection[str]) -> tuple:
+        """订阅模板的字符串下标 + 屏蔽规则 id 的字符串下标"""
+        template_sid = self._string_ids.get(template_scope) if template_scope else None
+        return template_sid, {self._string_ids[r] for r in disabled if r in self._string_ids}
+
+    def _conditions_match(self, start: int, count: int, ctx: Dict[str, Any]) -> bool:
+        """在映射区上对条件求值，语义与 rule_evaluator.evaluate_conditions 一致"""
+        buf, strings, unpack_cond = self._buf, self.strings, _COND.unpack_from
+        base = self._conds_off + start * _COND.size
+        for k in range(count):
+            code, lo, hi, a, b = unpack_cond(buf, base + k * _COND.size)
+            if code == _WEATHER:
+                weather = ctx["weather"]
+                off = self._args_off + a * _U32.size
+                if not any(strings[v] in weather for v in struct.unpack_from(f"<{b}I", buf, off)):
+                    return False
+            elif code == _TEMP or code == _TIME:
+                current = ctx.get("temp_c" if code == _TEMP else "hour")
+                if current is not None and not (lo <= current <= hi):
+                    return False
+            elif code == _DAY:
+                weekday = ctx.get("weekday")
+                if weekday is not None and not (a >> weekday) & 1:
+                    return False
+            elif code == _CITY or code == _REGION:
+                if strings[a] != (ctx.get("city" if code == _CITY else "region") or "").lower():
+                    return False
+            elif code == _CHINA_REGION:
+                sub = ctx.get("china_subregion")
+                if not sub or (a != NONE and strings[a] != sub.lower()):
+                    return False
+            elif code == _SOLAR_TERM:
+                terms = ctx.get("solar_terms")
+                if not terms or (a != NONE and strings[a] not in terms):
+                    return False
+        return True
+
+    def select_target(
+        self, store_id: str, ctx: Dict[str, Any], template_scope: Optional[str] = None, disabled: Collection[str] = ()
+    ) -> str:
+        """按优先级返回门店（含订阅模板中未屏蔽的规则）第一条命中规则的 target_id，均未命中返回 "default" """
+        store_id_sid = self._string_ids.get(store_id)
+        template_sid, disabled_sids = self._template(template_scope, disabled)
+        global_ids = self._global_ids
+        for _, rid, store_sid, target, _, start, count in _RULE.iter_unpack(self._rules_view()):
+            applies = store_sid in global_ids or store_sid == store_id_sid or (
+                store_sid == template_sid and rid not in disabled_sids
+            )
+            if applies and self._conditions_match(start, count, ctx):
+                return self.strings[target]
+        return "default"
+
+    def _rules_view(self) -> memoryview:
+        return memoryview(self._buf)[self._rules_off:self._conds_off]
+
+    def compiled_rules(
+        self, store_id: Optional[str] = None, template_scope: Optional[str] = None, disabled: Collection[str] = ()
+    ) -> List[Dict[str, Any]]:
+        """解码为 rule_evaluator 编译格式（store_id 给定时只返回适用于该门店及其订阅模板的规则）"""
+        store_id_sid = self._string_ids.get(store_id) if store_id is not None else None
+        template_sid, disabled_sids = self._template(template_scope, disabled)
+        out = []
+        for i in range(self.n_rules):
+            priority, rid, store_sid, target, message, start, count = self._rule(i)
+            inherited = template_sid is not None and store_sid == template_sid and rid not in disabled_sids
+            if store_id is not None and not (inherited or self._applies(store_sid, store_id_sid)):
+                continue
+            conditions = []
+            for j in range(start, start + count):
+                code, lo, hi, a, b = _COND.unpack_from(self._buf, self._conds_off + j * _COND.size)
+                ctype = COND_TYPES[code]
+                if ctype == "weather":
+                    values = struct.unpack_from(f"<{b}I", self._buf, self._args_off + a * _U32.size)
+                    conditions.append({"type": ctype, "any": [self.strings[v] for v in values]})
+                elif ctype in ("temp", "time"):
+                    bounds = (lo, hi) if ctype == "temp" else (int(lo), int(hi))
+                    conditions.append({"type": ctype, "range": list(bounds)})
+                elif ctype == "day":
+                    conditions.append({"type": ctype, "days": [d for d in range(7) if (a >> d) & 1]})
+                else:
+                    conditions.append({"type": ctype, "eq": self._str(a)})
+            out.append({
+                "id": self._str(rid), "store_id": self._str(store_sid), "priority": priority,
+                "target_id": self._str(target), "message": self._str(message), "conditions": conditions,
+            })
+        return out
+
+
+def publish_rule_table(compiled_rules: List[Dict[str, Any]], fingerprint: tuple) -> bool:
+    """
+    写入方：规则有变化时发布新版本（临时文件 + 原子替换，读取方不会看到半写文件）
+    fingerprint 为编译输入的版本号（含 None 表示未知，总是发布）；返回是否写入了新版本
+    """
+    global _published_fingerprint
+    if not enabled():
+        return False
+    if None not in fingerprint and fingerprint == _published_fingerprint and os.path.exists(RULE_TABLE_PATH):
+        return False
+    current = get_rule_table()
+    version = (current.version if current else 0) + 1
+    tmp = f"{RULE_TABLE_PATH}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(pack_rules(compiled_rules, version))
+    os.replace(tmp, RULE_TABLE_PATH)
+    _published_fingerprint = fingerprint
+    logger.info(f"[RuleTable] Published v{version} ({len(compiled_rules)} rules)")
+    return True
+
+
+def follower_table() -> Optional[RuleTable]:
+    """非写入方 worker 的规则来源：共享规则表；写入方（或未启用多 worker）返回 None，直接用规则仓库"""
+    if not enabled() or not shared_state.enabled() or shared_state.is_leader():
+        return None
+    return get_rule_table()
+
+
+def get_rule_table() -> Optional[RuleTable]:
+    """读取方：返回当前规则表（文件被替换时重新映射），未启用或文件不存在返回 None"""
+    global _table, _table_stat
+    if not enabled():
+        return None
+    try:
+        st = os.stat(RULE_TABLE_PATH)
+    except FileNotFoundError:
+        return None
+    key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    if key != _table_stat:
+        try:
+            with open(RULE_TABLE_PATH, "rb") as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            _table, _table_stat = RuleTable(buf), key
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"[RuleTable] Map failed: {e}")
+            return None
+    return _table
@@ -0,0 +1,138 @@
+"""
+共享规则模板：门店按引用继承模板规则，不再把默认规则逐店复制一份
+- 模板规则即 store_id 为 "template:<名称>" 的普通规则（同一张 rules 表 / 内存规则表），
+  增删改走门店规则接口：/stores/template:default/rules
+- 门店订阅：stores.rule_template（模板名）+ stores.disabled_rules（屏蔽的模板规则 id）
+- 门店适用规则 = 自有规则 + 全局规则 + 订阅模板中未屏蔽的规则，按优先级合并；
+  覆盖某条模板规则 = 复制为门店自有规则并屏蔽原规则
+- 匹配时每个模板只编译一次，所有订阅门店共用（rule_evaluator.ScopedRules）
+内存模式没有 stores 表，门店订阅保存在本模块
+"""
+import heapq
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database_async import async_session_scope
+from app.logging_config import get_logger
+from app.services.rule_evaluator import TEMPLATE_PREFIX
+
+logger = get_logger("stores")
+
+DEFAULT_TEMPLATE = "default"
+
+Subscription = Tuple[Optional[str], FrozenSet[str]]
+_NO_SUBSCRIPTION: Subscription = (None, frozenset())
+
+# 内存模式：store_id -> (模板名, 屏蔽的模板规则 id)
+_MEMORY_SUBSCRIPTIONS: Dict[str, Subscription] = {}
+
+
+def template_scope(name: Optional[str]) -> Optional[str]:
+    """模板名 -> 模板规则的 store_id"""
+    return f"{TEMPLATE_PREFIX}{name}" if name else None
+
+
+def is_template_scope(store_id: Optional[str]) -> bool:
+    return bool(store_id) and store_id.startswith(TEMPLATE_PREFIX)
+
+
+def store_subscription(store: Dict[str, Any]) -> Subscription:
+    """门店字典 -> (模板名, 屏蔽集合)；字典不含订阅字段（内存模式的兜底门店）时查内存订阅"""
+    if "rule_template" not in store:
+        return _MEMORY_SUBSCRIPTIONS.get(store.get("id"), _NO_SUBSCRIPTION)
+    return store.get("rule_template"), frozenset(store.get("disabled_rules") or ())
+
+
+def memory_subscription(store_id: str) -> Optional[Subscription]:
+    return _MEMORY_SUBSCRIPTIONS.get(store_id)
+
+
+def subscribe_in_memory(store_id: str, name: Optional[str], disabled: Iterable[str] = ()) -> None:
+    """内存模式下写入门店订阅"""
+    _MEMORY_SUBSCRIPTIONS[store_id] = (name, frozenset(disabled))
+
+
+async def get_subscription(store_id: str, db: Optional[AsyncSession] = None) -> Subscription:
+    """门店当前订阅（数据库模式查 stores 表，门店不存在时视为未订阅）"""
+    from app.models.store_model import Store
+    async with async_session_scope(db) as session:
+        if session is None:
+            return _MEMORY_SUBSCRIPTIONS.get(store_id, _NO_SUBSCRIPTION)
+        row = (await session.execute(
+            select(Store.rule_template, Store.disabled_rules).where(Store.id == store_id)
+        )).first()
+    if row is None:
+        return _NO_SUBSCRIPTION
+    return row[0], frozenset(row[1] or ())
+
+
+async def _save(db: Optional[AsyncSession], store_id: str, name: Optional[str], disabled: Iterable[str]) -> bool:
+    """写入门店订阅，数据库模式下门店不存在返回 False"""
+    from app.models.store_model import Store
+    from app.services import sign_index_service
+    if db is None:
+        subscribe_in_memory(store_id, name, disabled)
+        return True
+    db_store = await db.get(Store, store_id)
+    if db_store is None:
+        return False
+    db_store.rule_template = name
+    db_store.disabled_rules = sorted(disabled) or None
+    await db.commit()
+    await db.refresh(db_store)
+    sign_index_service.upsert_store(db_store.to_dict())
+    return True
+
+
+async def subscribe(db: Optional[AsyncSession], store_id: str, name: Optional[str]) -> bool:
+    """门店改为订阅模板 name（None 为取消订阅），同时清空屏蔽列表"""
+    saved = await _save(db, store_id, name, ())
+    if saved:
+        logger.info(f"[Template] {store_id} subscribed to {name}")
+    return saved
+
+
+async def disable_rules(db: Optional[AsyncSession], store_id: str, rule_ids: Iterable[str]) -> bool:
+    """在门店屏蔽列表中加入模板规则（该门店不再继承这些规则）"""
+    name, disabled = await get_subscription(store_id, db)
+    return await _save(db, store_id, name, disabled | set(rule_ids))
+
+
+def template_names(source) -> List[str]:
+    """规则来源（rule_repository 或 MOCK_DB）中已有规则的模板名"""
+    return sorted(sid[len(TEMPLATE_PREFIX):] for sid in source.store_ids() if is_template_scope(sid))
+
+
+def list_templates(source) -> List[Dict[str, Any]]:
+    return [
+        {"name": name, "store_id": template_scope(name), "rule_count": source.store_rule_count(template_scope(name))}
+        for name in template_names(source)
+    ]
+
+
+def inherited_rule(source, subscription: Subscription, rule_id: str) -> Optional[Dict[str, Any]]:
+    """门店继承（未屏蔽）的模板规则，不是则返回 None"""
+    name, disabled = subscription
+    if not name or rule_id in disabled:
+        return None
+    return source.get_rule(rule_id, template_scope(name))
+
+
+def effective_rules(source, store_id: str, subscription: Subscription) -> List[Dict[str, Any]]:
+    """
+    门店规则列表：自有规则 + 继承的模板规则（副本，带 "template": 模板名），按 (priority 降序, id) 排序
+    """
+    from app.services.rule_repository import page_order_key
+    own = source.rules_in_page_order(store_id)
+    name, disabled = subscription
+    if not name:
+        return own
+    inherited = [
+        {**r, "template": name}
+        for r in source.rules_in_page_order(template_scope(name)) if r["id"] not in disabled
+    ]
+    if not own:
+        return inherited
+    return list(heapq.merge(own, inherited, key=page_order_key))
@@ -0,0 +1,178 @@
+"""
+规则批量导入 / 导出（NDJSON，每行一条规则）
+- 导入：逐行校验、去重（同门店内容哈希相同视为重复，与单条创建一致），
+  按批 executemany 插入、每批一个事务，全部写完后只触发一次规则检查
+- 导出：服务端游标流式读取，边读边输出，不在内存中组装整表
+导出行即 Rule.to_dict()，可直接作为导入输入（克隆到其他门店时改 store_id 即可）
+"""
+import asyncio
+import json
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from app.database_async import async_session_scope
+from app.logging_config import get_logger
+from app.models.rule_model import rule_content_hash
+from app.schemas.rule import RuleImportItem
+
+logger = get_logger("api")
+
+IMPORT_BATCH_SIZE = 500
+EXPORT_BATCH_SIZE = 500
+# 响应中最多列出的错误行数（其余只计数）
+MAX_REPORTED_ERRORS = 100
+
+
+def _dedupe_key(rule: Dict[str, Any]) -> Tuple[str, str]:
+    """去重键：门店 + 内容哈希（与 rules 表唯一约束一致）"""
+    content_hash = rule.get("content_hash") or rule_content_hash(rule.get("conditions"), rule.get("action"))
+    return (rule.get("store_id") or "", content_hash)
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, str]]:
+    """请求体字节流 -> (行号, 行内容)，跳过空行"""
+    buf = b""
+    line_no = 0
+    async for chunk in chunks:
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for raw in lines:
+            line_no += 1
+            if raw.strip():
+                yield line_no, raw.decode("utf-8", errors="replace")
+    if buf.strip():
+        yield line_no + 1, buf.decode("utf-8", errors="replace")
+
+
+def _is_existing(key: Tuple[str, str], use_db: bool) -> bool:
+    """已有规则中是否有同内容规则（数据库模式查规则仓库，内存模式查 MOCK_DB，均为哈希索引一次探测）"""
+    from app.services import rule_repository
+    from app.models.rule_storage import MOCK_DB
+    store = rule_repository if use_db else MOCK_DB
+    return store.find_by_content(*key) is not None
+
+
+async def import_rules(chunks: AsyncIterator[bytes], db=None) -> Dict[str, Any]:
+    """
+    导入 NDJSON 规则，返回 {"imported", "duplicates", "failed", "stores", "errors"}
+    数据库不可用时写入内存数据库
+    """
+    from app.services import rule_repository
+
+    use_db = db is not None and await rule_repository.ensure_fresh(db)
+    # 本次上传内已出现的去重键（已有规则走索引查询，不复制整表）
+    seen = set()
+    stats = {"imported": 0, "duplicates": 0, "failed": 0}
+    errors: List[Dict[str, Any]] = []
+    stores = set()
+    batch: List[Tuple[int, Dict[str, Any]]] = []
+
+    def fail(line_no: int, message: str) -> None:
+        stats["failed"] += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line_no, "error": message})
+
+    async def flush() -> None:
+        if not batch:
+            return
+        rows = [row for _, row in batch]
+        if use_db:
+            from app.models.rule_model import Rule, bump_rules_version
+            from app.models.rule_condition_model import RuleCondition, condition_rows
+
+            async def insert_rows(part: List[Dict[str, Any]]) -> None:
+                # executemany 不触发 ORM 事件，rule_conditions 在同一事务内显式写入
+                await db.execute(insert(Rule), part)
+                conds = [c for row in part for c in condition_rows(row["id"], row["conditions"])]
+                if conds:
+                    await db.execute(insert(RuleCondition), conds)
+                await db.execute(bump_rules_version())
+
+            try:
+                await insert_rows(rows)
+                await db.commit()
+            except IntegrityError:
+                # 导入期间有并发写入同内容规则：逐行重试，被唯一约束拒绝的记为重复
+                await db.rollback()
+                rows = []
+                for line_no, row in batch:
+                    try:
+                        await insert_rows([row])
+                        await db.commit()
+                        rows.append(row)
+                    except IntegrityError:
+                        await db.rollback()
+                        stats["duplicates"] += 1
+            except Exception as e:
+                await db.rollback()
+                logger.warning(f"[Import] Batch of {len(rows)} failed: {e}")
+                for line_no, row in batch:
+                    seen.discard(_dedupe_key(row))
+                    fail(line_no, f"写入失败: {type(e).__name__}")
+                batch.clear()
+                return
+        else:
+            from app.models.rule_storage import MOCK_DB
+            MOCK_DB.add_rules(rows)
+        stats["imported"] += len(rows)
+        stores.update(row["store_id"] for row in rows)
+        batch.clear()
+
+    async for line_no, line in _iter_lines(chunks):
+        try:
+            item = RuleImportItem.model_validate_json(line)
+        except ValidationError as e:
+            fail(line_no, e.errors(include_url=False)[0].get("msg", "格式错误"))
+            continue
+        row = {"id": str(uuid.uuid4()), **item.model_dump()}
+        row["content_hash"] = rule_content_hash(row["conditions"], row["action"])
+        key = _dedupe_key(row)
+        if key in seen or _is_existing(key, use_db):
+            stats["duplicates"] += 1
+            continue
+        seen.add(key)
+        batch.append((line_no, row))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await flush()
+    await flush()
+
+    if stats["imported"]:
+        if use_db:
+            # 批量插入绕过了规则仓库的写穿透，导入后重载一次
+            await rule_repository.ensure_fresh(db, force=True)
+        from app.services import scheduler_service
+        asyncio.create_task(scheduler_service.check_rules_job())
+    logger.info(
+        f"[Import] imported={stats['imported']} duplicates={stats['duplicates']} failed={stats['failed']}",
+        extra={**stats, "stores": len(stores), "mode": "db" if use_db else "memory"},
+    )
+    return {**stats, "stores": len(stores), "errors": errors}
+
+
+async def export_rules(store_id: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    逐行输出 NDJSON（按 store_id, id 排序）
+    数据库模式用服务端游标按批读取；生成器自行打开会话，不依赖请求作用域的会话
+    """
+    async with async_session_scope() as session:
+        if session is None:
+            from app.models.rule_storage import MOCK_DB
+            rules = sorted(
+                MOCK_DB if store_id is None else MOCK_DB.rules_for_stores([store_id]),
+                key=lambda r: (r.get("store_id") or "", r.get("id") or ""),
+            )
+            for r in rules:
+                yield json.dumps(r, ensure_ascii=False, default=str) + "\n"
+            return
+
+        from app.models.rule_model import Rule
+        stmt = select(Rule).order_by(Rule.store_id, Rule.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        if store_id is not None:
+            stmt = stmt.where(Rule.store_id == store_id)
+        result = await session.stream_scalars(stmt)
+        async for rule in result:
+            yield json.dumps(rule.to_dict(), ensure_ascii=False) + "\n"
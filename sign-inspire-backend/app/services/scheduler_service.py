@@ -1,11 +1,17 @@
 # APScheduler 逻辑 (执行官)
 import httpx
 from datetime import datetime
-from typing import Optional
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, FrozenSet, List, Mapping, Optional
 import asyncio
+import logging
 from sqlalchemy.orm import Session
-from app.database import SessionLocal
-from app.models.rule_model import Rule
+from app.services.playlist_state import PlaylistState
+from app.services import shared_state, vocabulary_service
+from app.logging_config import get_logger
+
+logger = get_logger("scheduler")
 
 # 阿德莱德的经纬度 (Adelaide Uni)
 ADELAIDE_LAT = -34.9285
@@ -16,8 +22,8 @@ CURRENT_CONTEXT = {"weather": "unknown", "temp_c": None, "region": "western", "u
 
 # 当前播放列表，存储最新的触发结果（兼容单门店）
 CURRENT_PLAYLIST = "default"
-# 按门店存储：{store_id: target_id}，支持多门店
-CURRENT_PLAYLIST_BY_STORE = {}
+# 按门店播放状态：{store_id: target_id} + 代数/变更日志，支持多门店与增量同步
+PLAYLIST_STATE = PlaylistState()
 
 # 锁，防止并发执行 check_rules_job
 _check_rules_lock = None
@@ -33,6 +39,53 @@ def _ensure_lock():
             asyncio.set_event_loop(loop)
         _check_rules_lock = asyncio.Lock()
 
+
+def _unmatched_content(store_id: str) -> str:
+    """
+    播放状态中没有该门店时的内容：非写入方 worker 在共享规则表上按写入方发布的上下文求值
+    （门店在写入方下次 tick 前就能拿到结果），否则 store_001 回退到 CURRENT_PLAYLIST，其余 default
+    """
+    if shared_state.enabled():
+        from app.services.matching_engine import match_with_rule_table
+        from app.services.sign_index_service import get_store
+        store = get_store(store_id)
+        content = match_with_rule_table(store, CURRENT_CONTEXT) if store else None
+        if content is not None:
+            return content
+    return CURRENT_PLAYLIST if store_id == "store_001" else "default"
+
+
+def get_store_content(store_id: str) -> tuple:
+    """
+    返回门店当前应播内容及其版本号 (content, version)
+    version 为该门店内容最后变化时的 generation；无按门店结果时回退到 CURRENT_PLAYLIST
+    """
+    content = PLAYLIST_STATE.get(store_id) if len(PLAYLIST_STATE) else CURRENT_PLAYLIST
+    if content is None:
+        content = _unmatched_content(store_id)
+    return content, PLAYLIST_STATE.version(store_id)
+
+
+def get_store_contents(store_ids) -> tuple:
+    """
+    批量读取：从同一份快照返回 (generation, {store_id: (content, version)})
+    纯同步执行，期间不会有 tick 写入，保证所有条目来自同一代
+    """
+    generation, targets = PLAYLIST_STATE.snapshot()
+    out = {}
+    for store_id in store_ids:
+        content = targets.get(store_id) if targets else CURRENT_PLAYLIST
+        if content is None:
+            content = _unmatched_content(store_id)
+        out[store_id] = (content, PLAYLIST_STATE.version(store_id))
+    return generation, out
+
+
+async def wait_for_store_change(store_id: str, version: int, timeout: float) -> bool:
+    """长轮询：挂起直到门店内容变化或超时，返回 True 表示已变化"""
+    return await PLAYLIST_STATE.wait_for_change(store_id, version, timeout)
+
+
 # 天气 + 温度上下文（全球规则用）
 WeatherContext = dict  # {"weather": str, "temp_c": float, "is_day": int}
 
@@ -51,8 +104,21 @@ async def get_real_weather(lat: Optional[float] = None, lon: Optional[float] = N
     return ctx.get("weather", "sunny")
 
 
-# 星期映射：mon=0..sun=6（与 datetime.weekday() 一致，0=周一）
-_DAY_ALIAS = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+def _weather_from_code(code: int) -> str:
+    """Open-Meteo WMO weather_code -> 标准天气值"""
+    if code in [0, 1]:
+        return "sunny"
+    if code in [2, 3]:
+        return "cloudy"
+    if code in [45, 48]:
+        return "fog"
+    if code in [51, 53, 55, 61, 63, 65, 80, 81, 82]:
+        return "rain"
+    if code in [71, 73, 75, 85, 86]:
+        return "snow"
+    if code in [95, 96, 99]:
+        return "storm"
+    return "cloudy"
 
 
 async def get_weather_context(lat: Optional[float] = None, lon: Optional[float] = None, timezone: str = "Australia/Adelaide") -> WeatherContext:
@@ -95,20 +161,7 @@ async def get_weather_context(lat: Optional[float] = None, lon: Optional[float]
         is_day = data["current"].get("is_day", 1)
         temp_c = float(data["current"].get("temperature_2m", 20))
 
-        if code in [0, 1]:
-            weather = "sunny"
-        elif code in [2, 3]:
-            weather = "cloudy"
-        elif code in [45, 48]:
-            weather = "fog"
-        elif code in [51, 53, 55, 61, 63, 65, 80, 81, 82]:
-            weather = "rain"
-        elif code in [71, 73, 75, 85, 86]:
-            weather = "snow"
-        elif code in [95, 96, 99]:
-            weather = "storm"
-        else:
-            weather = "cloudy"
+        weather = _weather_from_code(code)
 
         # 季节：南半球(lat<0)与北半球相反
         month = now.month
@@ -121,7 +174,7 @@ async def get_weather_context(lat: Optional[float] = None, lon: Optional[float]
         return result
 
     except Exception as e:
-        print(f"⚠️ 天气 API 不可用，使用本地估算: {type(e).__name__}")
+        logger.warning(f"⚠️ 天气 API 不可用，使用本地估算: {type(e).__name__}")
         now = datetime.now()
         month = now.month
         season = "summer" if month in (6, 7, 8) else "winter" if month in (12, 1, 2) else "spring" if month in (3, 4, 5) else "autumn"
@@ -129,6 +182,48 @@ async def get_weather_context(lat: Optional[float] = None, lon: Optional[float]
         _WEATHER_CACHE[cache_key] = {**fallback, "_ts": now_ts}
         return fallback
 
+# 逐小时预报缓存（edge bundle 用）：按 0.01° 网格缓存 1 小时
+_FORECAST_CACHE: dict = {}
+_FORECAST_TTL = 3600
+_FORECAST_RETRY = 300
+
+
+async def get_hourly_forecast(lat: float, lon: float, hours: int = 48, timezone: str = "Australia/Adelaide") -> list:
+    """
+    获取未来 hours 小时逐小时预报（当地时间）
+    返回 [{"time": "2025-01-01T09:00", "weather": "sunny", "temp_c": 21.3, "is_day": 1}, ...]，失败返回 []
+    """
+    cache_key = (round(lat, 2), round(lon, 2), hours, timezone)
+    now_ts = datetime.now().timestamp()
+    cached = _FORECAST_CACHE.get(cache_key)
+    if cached and now_ts - cached[1] < _FORECAST_TTL:
+        return cached[0]
+    try:
+        params = {
+            "latitude": lat, "longitude": lon,
+            "hourly": "weather_code,temperature_2m,is_day",
+            "forecast_hours": hours,
+            "timezone": timezone,
+        }
+        async with httpx.AsyncClient(timeout=8) as client:
+            resp = await client.get("https://api.open-meteo.com/v1/forecast", params=params)
+            data = resp.json()
+        if resp.status_code != 200 or "hourly" not in data:
+            raise ValueError(f"Open-Meteo 返回异常: status={resp.status_code}")
+        hourly = data["hourly"]
+        forecast = [
+            {"time": t, "weather": _weather_from_code(code), "temp_c": temp, "is_day": is_day}
+            for t, code, temp, is_day in zip(hourly["time"], hourly["weather_code"], hourly["temperature_2m"], hourly["is_day"])
+        ]
+        _FORECAST_CACHE[cache_key] = (forecast, now_ts)
+        return forecast
+    except Exception as e:
+        logger.warning(f"⚠️ 逐小时预报不可用: {type(e).__name__}")
+        # 失败结果只缓存 _FORECAST_RETRY 秒，避免每次请求都等待超时
+        _FORECAST_CACHE[cache_key] = ([], now_ts - _FORECAST_TTL + _FORECAST_RETRY)
+        return []
+
+
 # 天气值中英文映射（内置 + 动态词汇表会合并）
 WEATHER_MAP = {
     "sunny": ["sunny", "晴天", "晴"],
@@ -139,51 +234,101 @@ WEATHER_MAP = {
     "fog": ["fog", "雾天", "雾", "大雾"],
 }
 
-def normalize_weather_value(value: str) -> set:
+# 天气别名索引：alias -> 标准化值集合（冻结，按词汇表版本重建），及其查询记忆
+_WEATHER_INDEX: Mapping[str, FrozenSet[str]] = MappingProxyType({})
+_weather_index_version: Optional[int] = None
+_NO_WEATHER: FrozenSet[str] = frozenset()
+
+
+def _build_weather_index() -> Dict[str, FrozenSet[str]]:
     """
-    将天气值（可能是中文或英文）标准化为英文值集合
-    支持动态词汇表中的新词
+    合并词汇表与 WEATHER_MAP 为 alias -> 标准化值，优先级与逐项查找时一致：
+    词汇表原样关键词 > 词汇表关键词小写 / 映射值（按词汇表顺序）> WEATHER_MAP 标准值与别名
     """
-    from app.services.vocabulary_service import get_weather_mappings
-    value_lower = value.lower().strip()
-    result = set()
-
-    # 使用动态词汇表（含内置 + DB 中客户添加的新词）
-    vocab = get_weather_mappings()
-    if value_lower in vocab:
-        result.add(vocab[value_lower])
-        return result
-    # 反向查找：通过关键词匹配
+    vocab = vocabulary_service.get_weather_mappings()
+    index: Dict[str, str] = dict(vocab)
     for kw, eng_value in vocab.items():
-        if kw.lower() == value_lower or value_lower == eng_value:
-            result.add(eng_value)
-            return result
-    # 回退：使用内置 WEATHER_MAP 的别名
+        index.setdefault(kw.lower(), eng_value)
+        index.setdefault(eng_value, eng_value)
     for eng_value, aliases in WEATHER_MAP.items():
-        if value_lower == eng_value:
-            result.add(eng_value)
-            return result
+        index.setdefault(eng_value, eng_value)
         for alias in aliases:
-            if value_lower == alias.lower():
-                result.add(eng_value)
-                return result
-    return result
+            index.setdefault(alias.lower(), eng_value)
+    # 同一标准值共用一个 frozenset，查询时不再分配
+    canonical = {v: frozenset([v]) for v in set(index.values())}
+    return {alias: canonical[v] for alias, v in index.items()}
+
+
+def weather_alias_index() -> Mapping[str, FrozenSet[str]]:
+    """当前天气别名索引（只读）；词汇表版本变化时重建并清空查询记忆"""
+    global _WEATHER_INDEX, _weather_index_version
+    version = vocabulary_service.vocabulary_version()
+    if version != _weather_index_version:
+        _WEATHER_INDEX = MappingProxyType(_build_weather_index())
+        _weather_index_version = version
+        _lookup_weather.cache_clear()
+    return _WEATHER_INDEX
+
+
+@lru_cache(maxsize=4096)
+def _lookup_weather(value: str) -> FrozenSet[str]:
+    return _WEATHER_INDEX.get(value.lower().strip(), _NO_WEATHER)
+
+
+def normalize_weather_value(value: str) -> FrozenSet[str]:
+    """
+    将天气值（可能是中文或英文）标准化为英文值集合（无法识别时为空集）
+    支持动态词汇表中的新词；返回 frozenset（原为每次新建的 set）：同一标准值的结果是
+    索引中共享的同一对象，不能原地修改（add / |=），需要修改时先 set(...) 复制
+    """
+    if vocabulary_service.vocabulary_version() != _weather_index_version:
+        weather_alias_index()
+    return _lookup_weather(value)
+
+async def sync_shared_state() -> bool:
+    """
+    多 worker 模式：把共享状态文件中的新变更同步到本进程（PLAYLIST_STATE / CURRENT_*）
+    返回是否有变化；未启用共享状态时直接返回 False
+    读文件在线程池执行，状态替换（含唤醒长轮询）在事件循环内执行
+    """
+    global CURRENT_PLAYLIST
+    if not shared_state.enabled():
+        return False
+    update = await asyncio.to_thread(shared_state.read_since, PLAYLIST_STATE.generation)
+    if update is None:
+        return False
+    if "entries" in update:
+        PLAYLIST_STATE.replay(update["entries"])
+    else:
+        PLAYLIST_STATE.reset(update["generation"], *update["full"])
+    CURRENT_PLAYLIST = update["current_playlist"]
+    CURRENT_CONTEXT.update(update["context"])
+    return True
+
 
 async def check_rules_job():
     """
     检查规则并触发匹配的规则（按门店维度）
+    多 worker 模式下只有写入方（持有 flock 的 worker）执行匹配并发布，其余 worker 仅同步共享状态
     """
-    global CURRENT_PLAYLIST, CURRENT_PLAYLIST_BY_STORE
+    global CURRENT_PLAYLIST
 
     _ensure_lock()
 
     async with _check_rules_lock:
+        if shared_state.enabled():
+            # 写入方也先同步：接管或重启后从共享状态的代数继续，版本号在各 worker 间保持一致
+            await sync_shared_state()
+            if not shared_state.is_leader():
+                logger.debug("[Tick] Follower worker, synced shared state generation=%d", PLAYLIST_STATE.generation)
+                return
+
         from app.services.matching_engine import run_matching_for_all_stores
 
         by_store = await run_matching_for_all_stores(
             None, lat=ADELAIDE_LAT, lon=ADELAIDE_LON, city="Adelaide", country_code="AU"
         )
-        CURRENT_PLAYLIST_BY_STORE = dict(by_store)
+        changed = PLAYLIST_STATE.apply(by_store)
         CURRENT_PLAYLIST = by_store.get("store_001", "default")
 
         ctx = await get_weather_context(timezone="Australia/Adelaide")
@@ -193,7 +338,53 @@ async def check_rules_job():
         CURRENT_CONTEXT["weekday"] = ctx.get("weekday")
         CURRENT_CONTEXT["region"] = "western"
         CURRENT_CONTEXT["updated_at"] = datetime.now().isoformat()
+        if shared_state.enabled():
+            entries = [(PLAYLIST_STATE.generation, sid, by_store.get(sid)) for sid in changed]
+            await asyncio.to_thread(
+                shared_state.publish, PLAYLIST_STATE.generation, entries, CURRENT_PLAYLIST, dict(CURRENT_CONTEXT)
+            )
+
+        logger.info(
+            "[Tick] Adelaide %s %s°C, stores=%d changed=%d generation=%d, store_001 -> %s",
+            CURRENT_CONTEXT["weather"], CURRENT_CONTEXT.get("temp_c"), len(by_store), len(changed),
+            PLAYLIST_STATE.generation, CURRENT_PLAYLIST,
+            extra={"weather": CURRENT_CONTEXT["weather"], "temp_c": CURRENT_CONTEXT.get("temp_c"),
+                   "stores": len(by_store), "changed": len(changed), "generation": PLAYLIST_STATE.generation},
+        )
+        # 全量结果仅在 DEBUG 级别输出（门店多时体积大）
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📋 匹配结果: %s", by_store)
+
+
+async def rematch_stores(store_ids) -> List[str]:
+    """
+    增量重算：只为给定门店执行匹配并合并进播放状态（批量开通门店后调用，不重算全部门店）
+    返回内容有变化的门店；多 worker 模式下仅写入方执行，其余 worker 等下次同步
+    """
+    _ensure_lock()
+    store_ids = list(store_ids)
+    if not store_ids:
+        return []
+    async with _check_rules_lock:
+        if shared_state.enabled():
+            await sync_shared_state()
+            if not shared_state.is_leader():
+                return []
+
+        from app.services.matching_engine import run_matching_for_all_stores
 
-        print(f"[Tick] Adelaide Weather: {CURRENT_CONTEXT['weather']} {CURRENT_CONTEXT.get('temp_c')}°C")
-        print(f"📋 匹配结果: {by_store}")
-        print(f"🔍 [Final] check_rules_job 完成, store_001 -> {CURRENT_PLAYLIST}")
+        by_store = await run_matching_for_all_stores(
+            None, lat=ADELAIDE_LAT, lon=ADELAIDE_LON, city="Adelaide", country_code="AU", store_ids=store_ids
+        )
+        changed = PLAYLIST_STATE.merge(by_store)
+        if shared_state.enabled() and changed:
+            entries = [(PLAYLIST_STATE.generation, sid, by_store.get(sid)) for sid in changed]
+            await asyncio.to_thread(
+                shared_state.publish, PLAYLIST_STATE.generation, entries, CURRENT_PLAYLIST, dict(CURRENT_CONTEXT)
+            )
+        logger.info(
+            "[Tick] Incremental rematch stores=%d changed=%d generation=%d",
+            len(by_store), len(changed), PLAYLIST_STATE.generation,
+            extra={"stores": len(by_store), "changed": len(changed), "generation": PLAYLIST_STATE.generation},
+        )
+        return changed
@@ -0,0 +1,153 @@
+"""
+多 worker 共享播放状态（uvicorn --workers N）
+- 状态文件：SQLite WAL 模式，一个写入方、多个读取方并发读互不阻塞
+- 选主：对 <状态文件>.lock 加 flock 排他锁，持锁的 worker 执行 tick 并写入；
+  持锁进程退出时锁由内核释放，其余 worker 下次检查时接管
+- 读取方：后台按 SHARED_STATE_SYNC_INTERVAL 比对 generation（meta 表主键读取），
+  有变化才拉取增量变更日志并重放到本进程 PLAYLIST_STATE；请求处理仍是纯内存读取
+
+环境变量：
+- SHARED_STATE_PATH：状态文件路径，未设置时关闭（单进程，行为与原来一致）
+- SHARED_STATE_SYNC_INTERVAL：读取方同步间隔秒数（默认 1）
+- SHARED_STATE_LOG_SIZE：共享变更日志保留条数（默认 10000）
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.logging_config import get_logger
+
+logger = get_logger("scheduler")
+
+try:
+    import fcntl
+except ImportError:  # Windows：无 flock，退化为每个进程都是写入方（仅适用于单 worker）
+    fcntl = None
+
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "").strip()
+SYNC_INTERVAL = float(os.getenv("SHARED_STATE_SYNC_INTERVAL", "1"))
+LOG_SIZE = int(os.getenv("SHARED_STATE_LOG_SIZE", "10000"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS playlist (store_id TEXT PRIMARY KEY, target_id TEXT, generation INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS changes (generation INTEGER NOT NULL, store_id TEXT NOT NULL, target_id TEXT);
+CREATE INDEX IF NOT EXISTS ix_changes_generation ON changes (generation);
+"""
+
+_conn: Optional[sqlite3.Connection] = None
+_conn_lock = threading.Lock()
+_lock_fd: Optional[int] = None
+
+
+def enabled() -> bool:
+    """是否启用跨 worker 共享状态"""
+    return bool(SHARED_STATE_PATH)
+
+
+def _connect() -> sqlite3.Connection:
+    """本进程共享连接（WAL + NORMAL 同步：写入方崩溃不损坏，只可能丢最后一次提交）"""
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(SHARED_STATE_PATH, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _conn = conn
+    return _conn
+
+
+def is_leader() -> bool:
+    """
+    当前 worker 是否为写入方；未持锁时尝试非阻塞获取（原写入方退出后自动接管）
+    未启用共享状态时始终为 True
+    """
+    global _lock_fd
+    if not enabled() or fcntl is None:
+        return True
+    if _lock_fd is not None:
+        return True
+    fd = os.open(f"{SHARED_STATE_PATH}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    _lock_fd = fd
+    logger.info(f"[SharedState] Became leader (pid={os.getpid()})")
+    return True
+
+
+def release_leadership() -> None:
+    """进程退出前释放写入锁，其他 worker 可立即接管"""
+    global _lock_fd
+    if _lock_fd is not None:
+        os.close(_lock_fd)
+        _lock_fd = None
+
+
+def publish(generation: int, entries: List[Tuple[int, str, Optional[str]]],
+            current_playlist: str, context: Dict[str, Any]) -> None:
+    """写入方：提交本次 tick 的变更（单个事务），并裁剪共享变更日志"""
+    with _conn_lock:
+        conn = _connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if entries:
+                conn.executemany(
+                    "INSERT INTO playlist (store_id, target_id, generation) VALUES (?, ?, ?) "
+                    "ON CONFLICT(store_id) DO UPDATE SET target_id = excluded.target_id, generation = excluded.generation",
+                    [(sid, target, gen) for gen, sid, target in entries],
+                )
+                conn.executemany("INSERT INTO changes (generation, store_id, target_id) VALUES (?, ?, ?)", entries)
+                # 超出保留条数的旧记录删除，并记下被删除的最大代数（读取方据此判断能否增量同步）
+                cutoff = conn.execute("SELECT MAX(rowid) - ? FROM changes", (LOG_SIZE,)).fetchone()[0]
+                trimmed = conn.execute("SELECT MAX(generation) FROM changes WHERE rowid <= ?", (cutoff,)).fetchone()[0]
+                if trimmed is not None:
+                    conn.execute("DELETE FROM changes WHERE rowid <= ?", (cutoff,))
+                    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('log_floor', ?)", (str(trimmed),))
+            conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [("generation", str(generation)), ("current_playlist", current_playlist),
+                 ("context", json.dumps(context, ensure_ascii=False, default=str))],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def read_since(since: int) -> Optional[Dict[str, Any]]:
+    """
+    读取方：返回 since 之后的变更；since 早于共享日志范围时返回全量
+    结果：{"generation", "entries" | "full": (targets, changed_gen), "current_playlist", "context"}
+    无变化返回 None；同一读事务内完成，保证各部分来自同一次提交
+    """
+    with _conn_lock:
+        conn = _connect()
+        conn.execute("BEGIN")
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+            generation = int(meta.get("generation", 0))
+            if generation == since:
+                return None
+            result: Dict[str, Any] = {
+                "generation": generation,
+                "current_playlist": meta.get("current_playlist", "default"),
+                "context": json.loads(meta.get("context") or "{}"),
+            }
+            if int(meta.get("log_floor", 0)) <= since < generation:
+                result["entries"] = conn.execute(
+                    "SELECT generation, store_id, target_id FROM changes WHERE generation > ? ORDER BY rowid", (since,)
+                ).fetchall()
+            else:
+                rows = conn.execute("SELECT store_id, target_id, generation FROM playlist").fetchall()
+                result["full"] = (
+                    {sid: target for sid, target, _ in rows if target is not None},
+                    {sid: gen for sid, _, gen in rows},
+                )
+            return result
+        finally:
+            conn.execute("COMMIT")
@@ -0,0 +1,97 @@
+"""
+屏幕索引服务：sign_id -> 门店 的内存索引
+Player 每 2 秒轮询一次，按 sign_id 查门店不再走数据库：
+- 启动时全量构建
+- 门店 CRUD 接口写入时同步更新
+- 后台定期做版本检查（count + max(created_at) + max(updated_at)），发现库外修改时重建
+"""
+from typing import Dict, Any, Optional
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database_async import async_session_scope
+from app.logging_config import get_logger
+
+logger = get_logger("stores")
+
+# sign_id -> 门店字典（仅活跃门店）
+_SIGN_INDEX: Dict[str, Dict[str, Any]] = {}
+# store_id -> sign_id，更新/停用时 O(1) 删除旧映射
+_SIGN_BY_STORE: Dict[str, str] = {}
+# 上次构建时 stores 表的版本指纹
+_index_version: Optional[tuple] = None
+
+
+async def _stores_version(session: AsyncSession) -> tuple:
+    """stores 表的廉价版本指纹：行数 + 最新创建/更新时间"""
+    from app.models.store_model import Store
+    result = await session.execute(
+        select(func.count(Store.id), func.max(Store.created_at), func.max(Store.updated_at))
+    )
+    return tuple(result.one())
+
+
+def upsert_store(store: Dict[str, Any]) -> None:
+    """门店创建/更新后调用：刷新该门店的 sign_id 映射"""
+    store_id = store.get("id")
+    if not store_id:
+        return
+    remove_store(store_id)
+    sign_id = store.get("sign_id")
+    if sign_id and store.get("is_active", True):
+        _SIGN_INDEX[sign_id] = dict(store)
+        _SIGN_BY_STORE[store_id] = sign_id
+
+
+def remove_store(store_id: str) -> None:
+    """门店停用/删除后调用：移除该门店的 sign_id 映射"""
+    sign_id = _SIGN_BY_STORE.pop(store_id, None)
+    if sign_id is not None and _SIGN_INDEX.get(sign_id, {}).get("id") == store_id:
+        del _SIGN_INDEX[sign_id]
+
+
+async def rebuild_sign_index(db: Optional[AsyncSession] = None) -> bool:
+    """从数据库全量重建索引，返回是否成功"""
+    global _SIGN_INDEX, _SIGN_BY_STORE, _index_version
+    try:
+        from app.models.store_model import Store
+        async with async_session_scope(db) as session:
+            if session is None:
+                return False
+            version = await _stores_version(session)
+            result = await session.execute(
+                select(Store).where(Store.is_active == True, Store.sign_id.isnot(None))
+            )
+            index = {s.sign_id: s.to_dict() for s in result.scalars()}
+        _SIGN_INDEX = index
+        _SIGN_BY_STORE = {d["id"]: sign_id for sign_id, d in index.items()}
+        _index_version = version
+        logger.info(f"[SignIndex] Built {len(index)} entries")
+        return True
+    except Exception as e:
+        logger.warning(f"[SignIndex] Rebuild failed: {e}")
+        return False
+
+
+async def refresh_sign_index_if_stale(db: Optional[AsyncSession] = None) -> bool:
+    """版本检查：stores 表有库外修改（其他进程/手工 SQL）时重建，返回是否重建"""
+    try:
+        async with async_session_scope(db) as session:
+            if session is None:
+                return False
+            if await _stores_version(session) == _index_version:
+                return False
+            return await rebuild_sign_index(session)
+    except Exception as e:
+        logger.warning(f"[SignIndex] Version check failed: {e}")
+        return False
+
+
+def get_store(store_id: str) -> Optional[Dict[str, Any]]:
+    """按 store_id 查活跃门店（纯内存）"""
+    sign_id = _SIGN_BY_STORE.get(store_id)
+    return _SIGN_INDEX.get(sign_id) if sign_id is not None else None
+
+
+def get_store_by_sign(sign_id: str) -> Optional[Dict[str, Any]]:
+    """按 sign_id 查活跃门店（纯内存，无数据库访问）"""
+    return _SIGN_INDEX.get(sign_id)
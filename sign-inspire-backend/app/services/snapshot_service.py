@@ -0,0 +1,146 @@
+"""
+热重启快照：进程缓存与播放状态落盘，重启后先加载再对外服务
+- 内容：天气 / 逐小时预报 / 地理编码 / 推荐缓存 + PLAYLIST_STATE + CURRENT_PLAYLIST / CURRENT_CONTEXT
+- 时机：关闭时写入，运行中每 SNAPSHOT_INTERVAL 秒写入一次（先写临时文件再原子替换）
+- 加载时按各缓存原有 TTL 丢弃过期条目；播放状态超过 SNAPSHOT_PLAYLIST_MAX_AGE 不恢复
+
+环境变量：
+- SNAPSHOT_PATH：快照文件绝对路径，未设置时关闭（相对路径不启用，避免随启动目录读写）
+- SNAPSHOT_INTERVAL：运行中写入间隔秒数（默认 300）
+- SNAPSHOT_PLAYLIST_MAX_AGE：播放状态最长可恢复秒数（默认 3600）
+
+快照为 JSON：缓存只含字典、列表与字符串；元组键 / 元组值按 [键, 值] 对写入，加载时还原为元组
+"""
+import json
+import os
+from time import time
+from typing import Any, Dict, List
+
+from app.logging_config import get_logger
+
+logger = get_logger("scheduler")
+
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "").strip()
+SNAPSHOT_INTERVAL = int(os.getenv("SNAPSHOT_INTERVAL", "300"))
+PLAYLIST_MAX_AGE = int(os.getenv("SNAPSHOT_PLAYLIST_MAX_AGE", "3600"))
+# 快照格式版本：结构变化时递增，旧快照直接忽略
+SNAPSHOT_VERSION = 2
+
+_last_saved = 0.0
+
+if SNAPSHOT_PATH and not os.path.isabs(SNAPSHOT_PATH):
+    logger.warning(f"[Snapshot] SNAPSHOT_PATH must be absolute, snapshot disabled: {SNAPSHOT_PATH}")
+    SNAPSHOT_PATH = ""
+
+
+def enabled() -> bool:
+    return bool(SNAPSHOT_PATH)
+
+
+def _dump_cache(cache: Dict) -> List[list]:
+    """缓存 -> [[键, 值], ...]（元组键、元组值转为列表）"""
+    return [[list(k) if isinstance(k, tuple) else k, list(v) if isinstance(v, tuple) else v] for k, v in cache.items()]
+
+
+def _load_cache(pairs: List[list], tuple_values: bool = True) -> Dict:
+    """[[键, 值], ...] -> 缓存（列表键还原为元组；tuple_values 时 (数据, 时间戳) 值也还原为元组）"""
+    return {
+        tuple(k) if isinstance(k, list) else k: tuple(v) if tuple_values and isinstance(v, list) else v
+        for k, v in pairs
+    }
+
+
+def _fresh(cache: Dict, ttl: float, ts_of, now: float) -> Dict:
+    """按缓存各自的时间戳格式过滤掉已过期条目"""
+    return {k: v for k, v in cache.items() if now - ts_of(v) < ttl}
+
+
+def _collect() -> Dict[str, Any]:
+    """收集需要落盘的进程状态"""
+    from app.services import scheduler_service, geocoding_service, recommendation_service
+    state = scheduler_service.PLAYLIST_STATE
+    generation, targets = state.snapshot()
+    return {
+        "version": SNAPSHOT_VERSION,
+        "saved_at": time(),
+        "weather": _dump_cache(scheduler_service._WEATHER_CACHE),
+        "forecast": _dump_cache(scheduler_service._FORECAST_CACHE),
+        "geo": _dump_cache(geocoding_service._GEO_CACHE),
+        "rec": _dump_cache(recommendation_service._REC_CACHE),
+        "playlist": {
+            "generation": generation,
+            "targets": dict(targets),
+            "changed_gen": {sid: state.version(sid) for sid in targets},
+            "current_playlist": scheduler_service.CURRENT_PLAYLIST,
+            "context": dict(scheduler_service.CURRENT_CONTEXT),
+        },
+    }
+
+
+def save_snapshot() -> bool:
+    """写入快照（临时文件 + 原子替换，写到一半崩溃不会留下损坏文件），返回是否成功"""
+    global _last_saved
+    if not enabled():
+        return False
+    try:
+        data = _collect()
+        tmp = f"{SNAPSHOT_PATH}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, SNAPSHOT_PATH)
+        _last_saved = time()
+        logger.info(f"[Snapshot] Saved {SNAPSHOT_PATH} (stores={len(data['playlist']['targets'])})")
+        return True
+    except Exception as e:
+        logger.warning(f"[Snapshot] Save failed: {e}")
+        return False
+
+
+def save_snapshot_if_due() -> bool:
+    """距上次写入超过 SNAPSHOT_INTERVAL 秒时写入"""
+    if time() - _last_saved < SNAPSHOT_INTERVAL:
+        return False
+    return save_snapshot()
+
+
+def load_snapshot() -> bool:
+    """
+    启动时加载快照：缓存按原 TTL 过滤后合并，播放状态未超龄时恢复
+    返回是否恢复了播放状态（恢复后首次 tick 可放到后台执行）
+    """
+    if not enabled() or not os.path.exists(SNAPSHOT_PATH):
+        return False
+    try:
+        with open(SNAPSHOT_PATH, encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        logger.warning(f"[Snapshot] Load failed: {e}")
+        return False
+    if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+        logger.info("[Snapshot] Ignored snapshot with unknown format")
+        return False
+
+    from app.services import scheduler_service, geocoding_service, recommendation_service
+    now = time()
+    scheduler_service._WEATHER_CACHE.update(
+        _fresh(_load_cache(data["weather"], tuple_values=False), scheduler_service._CACHE_TTL, lambda v: v.get("_ts", 0), now))
+    scheduler_service._FORECAST_CACHE.update(
+        _fresh(_load_cache(data["forecast"]), scheduler_service._FORECAST_TTL, lambda v: v[1], now))
+    geocoding_service._GEO_CACHE.update(
+        _fresh(_load_cache(data["geo"]), geocoding_service._GEO_CACHE_TTL, lambda v: v[1], now))
+    recommendation_service._REC_CACHE.update(
+        _fresh(_load_cache(data["rec"]), recommendation_service._REC_CACHE_TTL, lambda v: v[1], now))
+
+    playlist = data["playlist"]
+    age = now - data["saved_at"]
+    restored = age < PLAYLIST_MAX_AGE and bool(playlist["targets"])
+    if restored:
+        scheduler_service.PLAYLIST_STATE.reset(playlist["generation"], playlist["targets"], playlist["changed_gen"])
+        scheduler_service.CURRENT_PLAYLIST = playlist["current_playlist"]
+        scheduler_service.CURRENT_CONTEXT.update(playlist["context"])
+    logger.info(
+        f"[Snapshot] Loaded (age={age:.0f}s, playlist_restored={restored}, "
+        f"weather={len(scheduler_service._WEATHER_CACHE)}, geo={len(geocoding_service._GEO_CACHE)}, "
+        f"rec={len(recommendation_service._REC_CACHE)})"
+    )
+    return restored
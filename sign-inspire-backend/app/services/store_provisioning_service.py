@@ -0,0 +1,183 @@
+"""
+门店批量开通（整条零售链一次请求）：CSV 或 NDJSON，每行一个门店
+- 城市名去重后批量地理编码（geocoding_service.geocode_cities），推断经纬度、时区、文化圈、中国子区域
+- 分批 executemany 插入、每批一个事务，未指定 sign_id 时按门店 ID 分配
+- 完成后重建一次 sign 索引，并只为新门店触发一次增量重算
+CSV 需表头：name,city,latitude,longitude,sign_id,opening_hours,timezone,is_active,rule_template（opening_hours 为 JSON 字符串，空单元格视为未填）
+"""
+import asyncio
+import csv
+import io
+import json
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.logging_config import get_logger
+from app.schemas.store import StoreBulkItem
+
+logger = get_logger("stores")
+
+INSERT_BATCH_SIZE = 500
+# 响应中最多列出的错误行数（其余只计数）
+MAX_REPORTED_ERRORS = 100
+CHINA_COUNTRY_CODES = ("CN", "HK", "MO", "TW")
+DEFAULT_TIMEZONE = "Australia/Adelaide"
+
+
+def _is_csv(body: bytes, content_type: Optional[str]) -> bool:
+    if content_type and "csv" in content_type:
+        return True
+    if content_type and "json" in content_type:
+        return False
+    return not body.lstrip().startswith(b"{")
+
+
+def _parse(body: bytes, content_type: Optional[str]) -> Tuple[List[Tuple[int, StoreBulkItem]], List[Tuple[int, str]]]:
+    """解析请求体，返回 ([(行号, 门店)], [(行号, 错误)])"""
+    items: List[Tuple[int, StoreBulkItem]] = []
+    errors: List[Tuple[int, str]] = []
+    text = body.decode("utf-8-sig", errors="replace")
+    if _is_csv(body, content_type):
+        reader = csv.DictReader(io.StringIO(text))
+        for row in reader:
+            line_no = reader.line_num
+            data: Dict[str, Any] = {k.strip(): v.strip() for k, v in row.items() if k and v is not None and v.strip()}
+            try:
+                if "opening_hours" in data:
+                    data["opening_hours"] = json.loads(data["opening_hours"])
+                items.append((line_no, StoreBulkItem.model_validate(data)))
+            except json.JSONDecodeError:
+                errors.append((line_no, "opening_hours 不是合法 JSON"))
+            except ValidationError as e:
+                errors.append((line_no, e.errors(include_url=False)[0].get("msg", "格式错误")))
+        return items, errors
+    for line_no, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            items.append((line_no, StoreBulkItem.model_validate_json(line)))
+        except ValidationError as e:
+            errors.append((line_no, e.errors(include_url=False)[0].get("msg", "格式错误")))
+    return items, errors
+
+
+def _build_row(item: StoreBulkItem, geo: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """门店行 + 推断字段；无法解析城市且未提供经纬度时返回 None"""
+    from app.services.china_region_service import get_china_subregion
+    from app.services.geocoding_service import derive_timezone
+    from app.services.region_service import get_region_from_country
+    lat = item.latitude if item.latitude is not None else (geo or {}).get("lat")
+    lon = item.longitude if item.longitude is not None else (geo or {}).get("lon")
+    if lat is None or lon is None:
+        return None
+    country_code = (geo or {}).get("country_code") or None
+    china_subregion = None
+    if country_code in CHINA_COUNTRY_CODES:
+        china_subregion = (geo or {}).get("china_subregion") or get_china_subregion(item.city, None, lat)
+    store_id = f"store_{uuid.uuid4().hex[:12]}"
+    return {
+        "id": store_id,
+        "name": item.name,
+        "city": item.city.strip(),
+        "latitude": lat,
+        "longitude": lon,
+        "sign_id": item.sign_id or f"sign_{store_id}",
+        "opening_hours": item.opening_hours,
+        "timezone": item.timezone or derive_timezone(item.city, country_code, lon, lat) or DEFAULT_TIMEZONE,
+        "is_active": item.is_active,
+        "country_code": country_code,
+        "region": get_region_from_country(country_code) if country_code else None,
+        "china_subregion": china_subregion,
+        "rule_template": item.rule_template,
+    }
+
+
+async def provision_stores(body: bytes, content_type: Optional[str], db: AsyncSession) -> Dict[str, Any]:
+    """
+    批量开通门店，返回 {"created", "failed", "cities", "store_ids", "errors"}
+    """
+    from app.models.store_model import Store
+    from app.services import rule_repository, scheduler_service, sign_index_service
+    from app.services.geocoding_service import geocode_cities
+    from app.services.rule_templates import template_scope
+
+    items, parse_errors = _parse(body, content_type)
+    errors: List[Dict[str, Any]] = []
+    failed = 0
+
+    def fail(line_no: int, message: str) -> None:
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line_no, "error": message})
+
+    for line_no, message in parse_errors:
+        fail(line_no, message)
+
+    # sign_id 冲突：与已有门店、与本次上传内其他行
+    supplied = list({item.sign_id for _, item in items if item.sign_id})
+    taken = set()
+    for start in range(0, len(supplied), INSERT_BATCH_SIZE):
+        chunk = supplied[start:start + INSERT_BATCH_SIZE]
+        taken.update((await db.execute(select(Store.sign_id).where(Store.sign_id.in_(chunk)))).scalars())
+
+    # 订阅的规则模板须已存在（整条零售链通常都订阅同一个模板，按名称查一次）
+    templates = {item.rule_template for _, item in items if item.rule_template}
+    if templates and await rule_repository.ensure_fresh(db):
+        missing = {name for name in templates if not rule_repository.store_rule_count(template_scope(name))}
+        if missing:
+            kept = []
+            for line_no, item in items:
+                if item.rule_template in missing:
+                    fail(line_no, f"规则模板不存在: {item.rule_template}")
+                else:
+                    kept.append((line_no, item))
+            items = kept
+
+    cities = {item.city for _, item in items}
+    geo = await asyncio.to_thread(geocode_cities, cities)
+
+    rows: List[Tuple[int, Dict[str, Any]]] = []
+    for line_no, item in items:
+        if item.sign_id and item.sign_id in taken:
+            fail(line_no, f"sign_id 已存在: {item.sign_id}")
+            continue
+        row = _build_row(item, geo.get(item.city.strip().lower()))
+        if row is None:
+            fail(line_no, f"无法解析城市且未提供经纬度: {item.city}")
+            continue
+        taken.add(row["sign_id"])
+        rows.append((line_no, row))
+
+    created: List[str] = []
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        batch = rows[start:start + INSERT_BATCH_SIZE]
+        try:
+            await db.execute(insert(Store), [row for _, row in batch])
+            await db.commit()
+            created.extend(row["id"] for _, row in batch)
+        except IntegrityError:
+            # 与并发创建的门店冲突：逐行重试，冲突行记为失败
+            await db.rollback()
+            for line_no, row in batch:
+                try:
+                    await db.execute(insert(Store), [row])
+                    await db.commit()
+                    created.append(row["id"])
+                except IntegrityError:
+                    await db.rollback()
+                    fail(line_no, f"sign_id 冲突: {row['sign_id']}")
+
+    if created:
+        await sign_index_service.rebuild_sign_index(db)
+        asyncio.create_task(scheduler_service.rematch_stores(created))
+    logger.info(
+        f"[Provision] created={len(created)} failed={failed} cities={len(cities)}",
+        extra={"stores_created": len(created), "failed": failed, "cities": len(cities)},
+    )
+    return {"created": len(created), "failed": failed, "cities": len(cities), "store_ids": created, "errors": errors}
@@ -2,6 +2,8 @@
 from datetime import datetime
 from typing import Optional, Dict, Any
 
+from app.services.rule_evaluator import is_open_at
+
 
 def is_store_open(opening_hours: Optional[Dict[str, str]], timezone: str = "Australia/Adelaide") -> bool:
     """
@@ -13,16 +15,6 @@ def is_store_open(opening_hours: Optional[Dict[str, str]], timezone: str = "Aust
         return True
     try:
         now = datetime.now()
-        day_key = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"][now.weekday()]
-        hours_str = opening_hours.get(day_key) or opening_hours.get(day_key.capitalize())
-        if not hours_str:
-            return True
-        parts = hours_str.split("-")
-        if len(parts) != 2:
-            return True
-        start = parts[0].strip()
-        end = parts[1].strip()
-        current = now.strftime("%H:%M")
-        return start <= current <= end
+        return is_open_at(opening_hours, now.weekday(), now.strftime("%H:%M"))
     except Exception:
         return True
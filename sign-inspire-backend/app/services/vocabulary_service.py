@@ -2,9 +2,16 @@
 动态词汇服务 - 客户使用新词时自动创建，无需修改后端
 """
 import re
+import asyncio
 import hashlib
-from typing import Dict, Optional
-from sqlalchemy.orm import Session
+from typing import Dict, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database_async import async_session_scope
+from app.logging_config import get_logger
+from app.services.keyword_matcher import KeywordMatcher
+
+logger = get_logger("matching")
 
 # 尝试使用 pypinyin 生成可读的 target_id，失败则用 hash
 try:
@@ -37,50 +44,45 @@ def _slugify_chinese(text: str) -> str:
         return "ad_" + hashlib.md5(text.encode()).hexdigest()[:10]
 
 
-# 内存缓存，减少 DB 查询
+# 内存缓存：读取只走缓存（无 DB I/O），由 load_vocabulary 在异步路径上加载/刷新
 _vocab_cache: Dict[str, Dict[str, str]] = {"weather": {}, "action": {}}
 _cache_dirty = True
+# 缓存内容版本号：每次替换或写入 _vocab_cache 时递增，派生索引据此判断是否需要重建
+_vocab_version = 0
+# 关键词匹配自动机（按词汇类型，首次匹配时构建；替换缓存时清空，add_mapping 增量插入）
+_matchers: Dict[str, KeywordMatcher] = {}
+# 后台持久化任务（保持引用，避免被回收）
+_pending_writes: set = set()
 
 
-def _get_db_session():
-    """获取数据库会话（用于无依赖注入场景）"""
-    from app.database import SessionLocal, USE_DATABASE
-    if not USE_DATABASE or SessionLocal is None:
-        return None
-    return SessionLocal()
-
-
-def _load_vocabulary(db: Optional[Session] = None) -> None:
-    """从数据库加载词汇到缓存"""
-    global _vocab_cache, _cache_dirty
+async def load_vocabulary(db: Optional[AsyncSession] = None) -> None:
+    """从数据库加载词汇到缓存（缓存未失效时直接返回）"""
+    global _vocab_cache, _cache_dirty, _vocab_version
     if not _cache_dirty:
         return
 
     try:
         from app.models.vocabulary_model import Vocabulary
-        session = db or _get_db_session()
-        if session is None:
-            return
-        try:
-            rows = session.query(Vocabulary).all()
-            _vocab_cache["weather"] = {}
-            _vocab_cache["action"] = {}
-            for row in rows:
-                if row.type in _vocab_cache:
-                    _vocab_cache[row.type][row.keyword] = row.mapped_value
-            _cache_dirty = False
-            try:
-                print(f"[Vocab] Loaded {len(rows)} entries")
-            except UnicodeEncodeError:
-                pass
-        finally:
-            if db is None and session is not None:
-                session.close()
+        async with async_session_scope(db) as session:
+            if session is None:
+                return
+            rows = (await session.execute(select(Vocabulary))).scalars().all()
+        cache = {"weather": {}, "action": {}}
+        for row in rows:
+            if row.type in cache:
+                cache[row.type][row.keyword] = row.mapped_value
+        _vocab_cache = cache
+        _matchers.clear()
+        _cache_dirty = False
+        _vocab_version += 1
+        logger.info(f"[Vocab] Loaded {len(rows)} entries")
     except Exception as e:
-        try:
-            print(f"[Vocab] Load failed, using builtin: {e}")
-        except UnicodeEncodeError:
-            pass
+        logger.warning(f"[Vocab] Load failed, using builtin: {e}")
+
+
+def vocabulary_version() -> int:
+    """词汇缓存版本号（内容变化时递增）"""
+    return _vocab_version
 
 
 def invalidate_cache():
@@ -89,7 +91,7 @@ def invalidate_cache():
     _cache_dirty = True
 
 
-def get_weather_mappings(db: Optional[Session] = None) -> Dict[str, str]:
+def get_weather_mappings() -> Dict[str, str]:
     """获取天气关键词映射，包含内置默认 + 数据库动态词汇"""
     builtin = {
         "多云": "cloudy", "阴": "cloudy",
@@ -99,13 +101,12 @@ def get_weather_mappings(db: Optional[Session] = None) -> Dict[str, str]:
         "雷暴": "storm", "雷雨": "storm",
         "雾天": "fog", "雾": "fog", "大雾": "fog",
     }
-    _load_vocabulary(db)
     merged = dict(builtin)
     merged.update(_vocab_cache.get("weather", {}))
     return merged
 
 
-def get_action_mappings(db: Optional[Session] = None) -> Dict[str, str]:
+def get_action_mappings() -> Dict[str, str]:
     """获取动作/广告关键词映射，包含内置默认 + 数据库动态词汇"""
     builtin = {
         "咖啡广告": "coffee_ad", "咖啡": "coffee_ad",
@@ -115,62 +116,70 @@ def get_action_mappings(db: Optional[Session] = None) -> Dict[str, str]:
         "西瓜": "xigua_ad", "西瓜广告": "xigua_ad",
         "寿司": "sushi_ad", "寿司广告": "sushi_ad",
     }
-    _load_vocabulary(db)
     merged = dict(builtin)
     merged.update(_vocab_cache.get("action", {}))
     return merged
 
 
-def add_mapping(
-    vocab_type: str,
-    keyword: str,
-    mapped_value: str,
-    db: Optional[Session] = None
-) -> bool:
-    """添加或更新词汇映射"""
-    global _cache_dirty
-    keyword = keyword.strip()
-    if not keyword:
-        return False
+_MAPPINGS = {"weather": get_weather_mappings, "action": get_action_mappings}
 
+
+def find_keyword(vocab_type: str, text: str) -> Optional[Tuple[str, str]]:
+    """
+    文本中出现的最长关键词及其映射值 (关键词, 映射值)，无匹配返回 None
+    同长关键词取映射中靠前者（内置词在前，动态词按加入顺序）
+    """
+    matcher = _matchers.get(vocab_type)
+    if matcher is None:
+        matcher = _matchers[vocab_type] = KeywordMatcher(_MAPPINGS[vocab_type]())
+    return matcher.search(text)
+
+
+async def _persist_mapping(vocab_type: str, keyword: str, mapped_value: str) -> None:
+    """把词汇映射写入数据库（异步会话），完成后使缓存失效以便下次加载合并"""
     try:
         from app.models.vocabulary_model import Vocabulary
-        session = db or _get_db_session()
-        if session is None:
-            # 无 DB 时只更新缓存
-            _vocab_cache.get(vocab_type, {})[keyword] = mapped_value
-            return True
-        try:
-            existing = session.query(Vocabulary).filter(
-                Vocabulary.type == vocab_type,
-                Vocabulary.keyword == keyword
-            ).first()
+        async with async_session_scope() as session:
+            if session is None:
+                return
+            existing = (await session.execute(
+                select(Vocabulary).where(Vocabulary.type == vocab_type, Vocabulary.keyword == keyword)
+            )).scalars().first()
             if existing:
                 existing.mapped_value = mapped_value
             else:
                 session.add(Vocabulary(type=vocab_type, keyword=keyword, mapped_value=mapped_value))
-            session.commit()
-            _cache_dirty = True
-            try:
-                print(f"[Vocab] New mapping: {vocab_type} '{keyword}' -> '{mapped_value}'")
-            except UnicodeEncodeError:
-                pass
-            return True
-        finally:
-            if db is None and session is not None:
-                session.close()
+            await session.commit()
+        invalidate_cache()
+        logger.info(f"[Vocab] New mapping: {vocab_type} '{keyword}' -> '{mapped_value}'")
     except Exception as e:
-        try:
-            print(f"[Vocab] Add mapping failed: {e}")
-        except UnicodeEncodeError:
-            pass
+        logger.warning(f"[Vocab] Add mapping failed: {e}")
+
+
+def add_mapping(vocab_type: str, keyword: str, mapped_value: str) -> bool:
+    """
+    添加或更新词汇映射：立即写入缓存（后续解析马上可用），数据库写入在后台异步完成
+    无事件循环（脚本调用）时只更新缓存
+    """
+    global _vocab_version
+    keyword = keyword.strip()
+    if not keyword:
         return False
+    _vocab_cache.setdefault(vocab_type, {})[keyword] = mapped_value
+    _vocab_version += 1
+    if vocab_type in _matchers:
+        _matchers[vocab_type].add(keyword, mapped_value)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return True
+    task = loop.create_task(_persist_mapping(vocab_type, keyword, mapped_value))
+    _pending_writes.add(task)
+    task.add_done_callback(_pending_writes.discard)
+    return True
 
 
-def ensure_action_mapping(
-    action_text: str,
-    db: Optional[Session] = None
-) -> str:
+def ensure_action_mapping(action_text: str) -> str:
     """
     确保动作词汇存在：若已有映射则返回 target_id，
     否则根据文本生成 target_id、写入词汇表并返回。
@@ -179,22 +188,17 @@ def ensure_action_mapping(
     if not action_text:
         return "coffee_ad"
 
-    mappings = get_action_mappings(db)
-    # 按关键词长度降序匹配
-    for kw, target_id in sorted(mappings.items(), key=lambda x: -len(x[0])):
-        if kw in action_text:
-            return target_id
+    found = find_keyword("action", action_text)
+    if found:
+        return found[1]
 
     # 新词：生成 target_id 并保存
     target_id = _slugify_chinese(action_text)
-    add_mapping("action", action_text, target_id, db)
+    add_mapping("action", action_text, target_id)
     return target_id
 
 
-def ensure_weather_mapping(
-    weather_text: str,
-    db: Optional[Session] = None
-) -> str:
+def ensure_weather_mapping(weather_text: str) -> str:
     """
     确保天气词汇存在：若已有映射则返回标准化值，
     否则尝试推断或默认 cloudy，并写入词汇表。
@@ -203,10 +207,9 @@ def ensure_weather_mapping(
     if not weather_text:
         return "cloudy"
 
-    mappings = get_weather_mappings(db)
-    for kw, value in sorted(mappings.items(), key=lambda x: -len(x[0])):
-        if kw in weather_text:
-            return value
+    found = find_keyword("weather", weather_text)
+    if found:
+        return found[1]
 
     # 新词：尝试根据常见字推断，否则默认 cloudy
     inferred = "cloudy"
@@ -214,5 +217,5 @@ def ensure_weather_mapping(
         inferred = "fog"
     elif "风" in weather_text and "龙" in weather_text:
         inferred = "storm"
-    add_mapping("weather", weather_text, inferred, db)
+    add_mapping("weather", weather_text, inferred)
     return inferred
@@ -0,0 +1,5 @@
+"""测试从 sign-inspire-backend 目录运行：python -m pytest -q"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
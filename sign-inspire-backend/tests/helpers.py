@@ -0,0 +1,49 @@
+"""测试共用：注入式天气标准化、随机条件 / 上下文生成"""
+import random
+
+WEATHER_ALIASES = {
+    "sunny": {"sunny"}, "晴": {"sunny"}, "晴天": {"sunny"},
+    "rain": {"rain"}, "雨": {"rain"}, "下雨": {"rain"},
+    "cloudy": {"cloudy"}, "多云": {"cloudy"}, "阴": {"cloudy"},
+}
+
+
+def normalize(value: str) -> set:
+    return set(WEATHER_ALIASES.get(value.strip().lower(), set()))
+
+
+CONDITION_VALUES = {
+    "weather": ["晴", "sunny", "雨", "多云,雨", "rain, 晴", "snow", ""],
+    "city": ["Adelaide", "shanghai", ""],
+    "region": ["western", "East_Asian", ""],
+    "temp": ["0,15", ">30", "<=10", ">=20", "abc", ""],
+    "time": ["8,11", "14,18", "x,y", ""],
+    "day": ["6", "4,5,6", "fri,sat,sun", "mon", "xyz", ""],
+    "china_region": ["south_china", "North_China", ""],
+    "solar_term": ["冬至", "立秋", ""],
+    "holiday": ["春节"],
+}
+OPERATORS = ["==", "in", "between"]
+
+
+def random_condition(rnd: random.Random) -> dict:
+    ctype = rnd.choice(list(CONDITION_VALUES))
+    return {"type": ctype, "operator": rnd.choice(OPERATORS), "value": rnd.choice(CONDITION_VALUES[ctype])}
+
+
+def random_context(rnd: random.Random) -> dict:
+    return {
+        "weather": rnd.choice(["sunny", "晴", "rain", "多云", "unknown"]),
+        "city": rnd.choice(["Adelaide", "Shanghai", "beijing"]),
+        "temp_c": rnd.choice([None, -5.0, 10.0, 15.0, 25.0, 35.0]),
+        "region": rnd.choice(["western", "east_asian"]),
+        "hour": rnd.choice([None, 0, 9, 12, 16, 23]),
+        "weekday": rnd.choice([None, 0, 4, 6]),
+        "china_subregion": rnd.choice([None, "", "south_china", "north_china"]),
+        "solar_terms": rnd.choice([None, [], ["冬至"], ["立秋", "冬至"]]),
+    }
+
+
+def to_match_context(ctx: dict) -> dict:
+    """与 matching_engine.build_match_context 相同的构造（天气标准化为集合）"""
+    return {**ctx, "weather": normalize(ctx["weather"]) or {ctx["weather"]}, "solar_terms": ctx["solar_terms"] or []}
@@ -0,0 +1,69 @@
+"""同优先级规则：屏幕端 bundle 与服务端 tick / 共享规则表选出相同的内容，与规则加载顺序无关"""
+import asyncio
+import itertools
+
+import pytest
+
+from app.services import bundle_service, media_service, scheduler_service
+from app.services.matching_engine import build_match_context, compile_rules_for_matching, match_content_for_store
+from app.services.rule_evaluator import select_target
+from app.services.rule_table import RuleTable, pack_rules
+
+SUNNY = [{"type": "weather", "operator": "==", "value": "sunny"}]
+STORE = {
+    "id": "store_001", "name": "试点门店", "city": "Adelaide", "latitude": -34.9, "longitude": 138.6,
+    "timezone": "Australia/Adelaide", "opening_hours": None, "is_active": True,
+    "rule_template": "default", "disabled_rules": [],
+}
+
+
+def rule(rid, store_id, priority, target):
+    return {"id": rid, "store_id": store_id, "priority": priority, "conditions": SUNNY,
+            "action": {"type": "switch_playlist", "target_id": target}}
+
+
+RULES = [
+    rule("tpl-coffee", "template:default", 5, "coffee_ad"),
+    rule("zz-tie", "store_001", 5, "tie_ad"),
+    rule("global-tea", "*", 5, "tea_ad"),
+    rule("tpl-low", "template:default", 1, "low_ad"),
+]
+
+
+def build_bundle(monkeypatch, store_rules):
+    async def load_store_rules(store_id, db=None, subscription=None):
+        return list(store_rules)
+
+    async def hourly_forecast(lat, lon, hours=48, timezone=""):
+        return [{"time": "2026-10-19T12:00", "weather": "sunny", "temp_c": 20.0, "is_day": 1}]
+
+    async def image_urls(target_ids, db=None):
+        return {t: f"https://img/{t}.jpg" for t in target_ids}
+
+    monkeypatch.setattr(bundle_service, "load_store_rules", load_store_rules)
+    monkeypatch.setattr(bundle_service, "_store_geo_context", lambda store: {
+        "city": "Adelaide", "country_code": "AU", "region": "western", "china_subregion": None,
+    })
+    monkeypatch.setattr(scheduler_service, "get_hourly_forecast", hourly_forecast)
+    monkeypatch.setattr(media_service, "get_image_urls", image_urls)
+    bundle_service._BUNDLE_CACHE.clear()
+    return asyncio.run(bundle_service.build_sign_bundle(STORE))
+
+
+@pytest.mark.parametrize("repo_order", list(itertools.permutations(RULES))[:12])
+def test_bundle_matches_server_on_priority_tie(monkeypatch, repo_order):
+    # 服务端：规则仓库顺序的全部规则；bundle：门店自有 -> 全局 -> 模板（load_store_rules 的顺序）
+    server = match_content_for_store("store_001", STORE, list(repo_order), "sunny", "Adelaide", 20.0, "western", 12, 0)
+    bundle_rules = [r for scope in ("store_001", "*", "template:default") for r in RULES if r["store_id"] == scope]
+    bundle = build_bundle(monkeypatch, bundle_rules)
+    ctx = build_match_context("sunny", bundle["context"]["city"], 20.0, bundle["context"]["region"], 12, 0)
+    assert select_target(bundle["rules"], ctx) == server == "tie_ad"
+
+    table = RuleTable(pack_rules(compile_rules_for_matching(list(repo_order)), version=1))
+    assert table.select_target("store_001", ctx, "template:default") == server
+    assert [r["id"] for r in table.compiled_rules("store_001", "template:default")] == [r["id"] for r in bundle["rules"]]
+
+
+def test_tie_order_is_own_then_global_then_template():
+    compiled = compile_rules_for_matching(list(reversed(RULES)))
+    assert [r["id"] for r in compiled] == ["zz-tie", "global-tea", "tpl-coffee", "tpl-low"]
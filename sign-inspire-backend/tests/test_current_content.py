@@ -0,0 +1,61 @@
+"""current-content 条件请求：ETag / If-None-Match 返回 304，?wait= 长轮询在内容变化时立即返回"""
+import asyncio
+import json
+
+import pytest
+
+from app.api.v1.endpoints import rules as rules_api
+from app.api.v1.http_cache import etag_matches
+from app.services import scheduler_service
+from app.services.playlist_state import PlaylistState
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False), ("", False), ('"abc"', True), ('W/"abc"', True),
+    ('"x", "abc"', True), ("*", True), ('"abcd"', False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, '"abc"') is expected
+
+
+@pytest.fixture
+def state(monkeypatch):
+    playlist = PlaylistState()
+    playlist.apply({"store_001": "coffee_ad", "store_002": "tea_ad"})
+    monkeypatch.setattr(scheduler_service, "PLAYLIST_STATE", playlist)
+    return playlist
+
+
+def _get(store_id, wait=0, if_none_match=None, change=None):
+    async def main():
+        if change is not None:
+            asyncio.get_running_loop().call_later(0.05, change)
+        return await rules_api.get_current_content(store_id, wait=wait, if_none_match=if_none_match)
+    return asyncio.run(main())
+
+
+def test_not_modified_until_store_changes(state):
+    first = _get("store_001")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and json.loads(first.body) == {"content": "coffee_ad"}
+    assert _get("store_001", if_none_match=etag).status_code == 304
+    # 其他门店变化不影响本门店的 ETag
+    state.apply({"store_001": "coffee_ad", "store_002": "soup_ad"})
+    assert _get("store_001", if_none_match=etag).status_code == 304
+    state.apply({"store_001": "pizza_ad", "store_002": "soup_ad"})
+    changed = _get("store_001", if_none_match=etag)
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+
+
+def test_long_poll_returns_on_change(state):
+    etag = _get("store_001").headers["ETag"]
+    response = _get("store_001", wait=5, if_none_match=etag,
+                    change=lambda: state.apply({"store_001": "soup_ad", "store_002": "tea_ad"}))
+    assert response.status_code == 200 and json.loads(response.body) == {"content": "soup_ad"}
+
+
+def test_long_poll_times_out_with_304(state):
+    etag = _get("store_001").headers["ETag"]
+    response = _get("store_001", wait=1, if_none_match=etag,
+                    change=lambda: state.apply({"store_001": "coffee_ad", "store_002": "soup_ad"}))
+    assert response.status_code == 304 and response.headers["ETag"] == etag
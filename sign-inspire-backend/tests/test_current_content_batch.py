@@ -0,0 +1,66 @@
+"""批量当前内容：同一快照、每个 target 只解析一次媒体；流式输出与普通响应内容一致"""
+import asyncio
+import json
+
+import pytest
+
+from app.api.v1.endpoints import rules as rules_api
+from app.schemas.playlist import CurrentContentBatchRequest
+from app.services import media_service, scheduler_service, sign_index_service
+
+SNAPSHOT = {"store_001": ("coffee_ad", 3), "store_002": ("hot_drink_ad", 1), "store_003": ("coffee_ad", 7)}
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    calls = {"snapshot": 0, "media": []}
+
+    def get_store_contents(store_ids):
+        calls["snapshot"] += 1
+        return 42, {sid: SNAPSHOT[sid] for sid in store_ids}
+
+    async def image_urls(target_ids, db=None):
+        calls["media"].append(set(target_ids))
+        return {t: f"https://img/{t}.jpg" for t in target_ids}
+
+    monkeypatch.setattr(scheduler_service, "get_store_contents", get_store_contents)
+    monkeypatch.setattr(media_service, "get_image_urls", image_urls)
+    monkeypatch.setattr(sign_index_service, "get_store_by_sign",
+                        lambda sign_id: {"id": "store_002"} if sign_id == "sign_b" else None)
+    return calls
+
+
+def _batch(req):
+    async def main():
+        response = await rules_api.get_current_content_batch(req)
+        if isinstance(response, dict):
+            return response
+        return json.loads("".join([chunk async for chunk in response.body_iterator]))
+    return asyncio.run(main())
+
+
+REQUEST = CurrentContentBatchRequest(store_ids=["store_001", "store_003", "store_001"], sign_ids=["sign_b", "sign_x"])
+
+
+def test_batch_items_in_request_order(lookups):
+    body = _batch(REQUEST)
+    assert body["generation"] == 42
+    assert [(i.get("sign_id"), i["store_id"], i["content"], i["version"]) for i in body["items"]] == [
+        (None, "store_001", "coffee_ad", 3),
+        (None, "store_003", "coffee_ad", 7),
+        (None, "store_001", "coffee_ad", 3),
+        ("sign_b", "store_002", "hot_drink_ad", 1),
+        ("sign_x", None, "default", 0),
+    ]
+    assert all(i["media_url"] == f"https://img/{i['content']}.jpg" for i in body["items"])
+    assert lookups["snapshot"] == 1
+    assert lookups["media"] == [{"coffee_ad", "hot_drink_ad", "default"}]
+
+
+def test_streamed_batch_matches_plain_response(lookups, monkeypatch):
+    plain = _batch(REQUEST)
+    monkeypatch.setattr(rules_api, "_BATCH_STREAM_THRESHOLD", 2)
+    response = asyncio.run(rules_api.get_current_content_batch(REQUEST))
+    assert not isinstance(response, dict)
+    assert _batch(REQUEST) == plain
+    assert lookups["snapshot"] == 3 and len(lookups["media"]) == 3
@@ -0,0 +1,57 @@
+"""异步数据库层：驱动地址推导、SQLite 引擎初始化、会话复用与数据库未启用时的 None 会话"""
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+from app import database, database_async
+
+
+@pytest.mark.parametrize("sync_url, async_url", [
+    ("mysql+pymysql://u:p@db:3306/signs", "mysql+aiomysql://u:p@db:3306/signs"),
+    ("mysql://u:p@db/signs", "mysql+aiomysql://u:p@db/signs"),
+    ("sqlite:////data/signs.db", "sqlite+aiosqlite:////data/signs.db"),
+    ("postgresql+asyncpg://db/signs", "postgresql+asyncpg://db/signs"),
+])
+def test_async_database_url(sync_url, async_url, monkeypatch):
+    monkeypatch.delenv("ASYNC_DATABASE_URL", raising=False)
+    assert database_async.async_database_url(sync_url) == async_url
+    monkeypatch.setenv("ASYNC_DATABASE_URL", "sqlite+aiosqlite:///override.db")
+    assert database_async.async_database_url(sync_url) == "sqlite+aiosqlite:///override.db"
+
+
+@pytest.fixture
+def no_async_engine(monkeypatch):
+    monkeypatch.setattr(database_async, "async_engine", None)
+    monkeypatch.setattr(database_async, "AsyncSessionLocal", None)
+    monkeypatch.delenv("ASYNC_DATABASE_URL", raising=False)
+
+
+def test_sessions_are_none_without_database(no_async_engine, monkeypatch):
+    monkeypatch.setattr(database, "USE_DATABASE", False)
+
+    async def main():
+        assert not await database_async.init_async_db()
+        async with database_async.async_session_scope() as session:
+            assert session is None
+        assert [s async for s in database_async.get_async_db_optional()] == [None]
+    asyncio.run(main())
+
+
+def test_sqlite_engine_and_session_scope(no_async_engine, monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "USE_DATABASE", True)
+    monkeypatch.setattr(database, "DATABASE_URL", f"sqlite:///{tmp_path / 'signs.db'}")
+
+    async def main():
+        assert await database_async.init_async_db()
+        try:
+            assert database_async.async_db_available()
+            async with database_async.async_session_scope() as session:
+                assert (await session.execute(text("SELECT 1"))).scalar() == 1
+                # 传入会话时直接复用，不新建、不关闭
+                async with database_async.async_session_scope(session) as inner:
+                    assert inner is session
+        finally:
+            await database_async.dispose_async_db()
+        assert not database_async.async_db_available()
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+"""数据库连接生命周期：导入时不连接、连接失败走内存模式、连接成功切到数据库模式、探活失败切回、退避重连"""
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app import database, database_async, db_connect
+from app.db_sqlite import sqlite_engine_options
+from app.services import scheduler_service
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def lifecycle(monkeypatch):
+    """隔离的连接状态：同步 / 异步引擎、模式开关与重连任务"""
+    for module, name, value in (
+        (database, "engine", None), (database, "SessionLocal", None), (database, "USE_DATABASE", False),
+        (database_async, "async_engine", None), (database_async, "AsyncSessionLocal", None),
+        (db_connect, "_reconnect_task", None), (db_connect, "_health_failures", 0), (db_connect, "_lock", None),
+    ):
+        monkeypatch.setattr(module, name, value)
+    monkeypatch.delenv("ASYNC_DATABASE_URL", raising=False)
+    yield
+    if database.engine is not None:
+        database.engine.dispose()
+
+
+def test_import_does_not_connect():
+    # 不可路由地址：若导入时连接，会等到驱动超时
+    env = dict(os.environ, DATABASE_URL="mysql+pymysql://u:p@10.255.255.1:3306/signs", DB_CONNECT_TIMEOUT="30")
+    out = subprocess.run(
+        [sys.executable, "-c", "import app.database as d; print(d.USE_DATABASE, d.engine)"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=20,
+    )
+    assert out.stdout.split() == ["False", "None"]
+
+
+def test_connect_options(monkeypatch):
+    monkeypatch.setattr(db_connect, "CONNECT_TIMEOUT", 0.5)
+    assert db_connect.connect_options("mysql+pymysql://db/signs") == {"connect_args": {"connect_timeout": 1}}
+    assert db_connect.connect_options("sqlite:///x.db") == sqlite_engine_options("sqlite:///x.db")
+    assert db_connect.connect_options("postgresql://db/signs") == {}
+
+
+def test_unreachable_database_stays_in_memory_mode(lifecycle, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_URL", "mysql+pymysql://u:p@127.0.0.1:1/signs")
+    assert not asyncio.run(db_connect.connect(verbose=False))
+    assert not database.USE_DATABASE and not database_async.async_db_available()
+
+
+class _DeadEngine:
+    """探活用：连接一律失败的异步引擎"""
+
+    def connect(self):
+        raise ConnectionError("gone")
+
+    async def dispose(self):
+        pass
+
+
+def test_connect_then_fall_back_after_failed_health_checks(lifecycle, monkeypatch, tmp_path):
+    calls = []
+
+    async def warm_up():
+        calls.append("warm_up")
+
+    monkeypatch.setattr(database, "DATABASE_URL", f"sqlite:///{tmp_path / 'signs.db'}")
+    monkeypatch.setattr(db_connect, "_warm_up", warm_up)
+    monkeypatch.setattr(db_connect, "HEALTH_FAILURES", 2)
+    monkeypatch.setattr(db_connect, "use_memory_mode", lambda: calls.append("memory"))
+    monkeypatch.setattr(db_connect, "start_reconnect", lambda: calls.append("reconnect"))
+
+    async def main():
+        assert await db_connect.connect(verbose=False)
+        live = database_async.async_engine
+        try:
+            assert database.USE_DATABASE and database_async.async_db_available()
+            # 已连接时再次调用直接返回，不重复初始化
+            assert await db_connect.connect(verbose=False)
+            assert await db_connect.check_health()
+            database_async.async_engine = _DeadEngine()
+            assert not await db_connect.check_health()
+            assert database.USE_DATABASE  # 单次失败不切换
+            assert not await db_connect.check_health()
+        finally:
+            await live.dispose()
+        assert not database.USE_DATABASE and not database_async.async_db_available()
+        # 内存模式下不再探活
+        assert not await db_connect.check_health()
+
+    asyncio.run(main())
+    assert calls == ["warm_up", "memory", "reconnect"]
+
+
+def test_reconnect_backs_off_until_connected(monkeypatch):
+    sleep = asyncio.sleep
+    delays, results, ticks = [], [False, False, False, True], []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+        await sleep(0)
+
+    async def fake_connect(verbose=True):
+        return results.pop(0)
+
+    async def check_rules_job():
+        ticks.append(1)
+
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+    monkeypatch.setattr(db_connect.random, "uniform", lambda a, b: 1.0)
+    monkeypatch.setattr(db_connect, "connect", fake_connect)
+    monkeypatch.setattr(db_connect, "RETRY_INITIAL", 2)
+    monkeypatch.setattr(db_connect, "RETRY_MAX", 5)
+    monkeypatch.setattr(scheduler_service, "check_rules_job", check_rules_job)
+
+    async def main():
+        await db_connect._reconnect_loop()
+        await sleep(0)
+
+    asyncio.run(main())
+    assert delays == [2, 4, 5, 5]
+    # 重连成功后触发一次规则检查
+    assert results == [] and ticks == [1]
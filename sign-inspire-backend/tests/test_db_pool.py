@@ -0,0 +1,55 @@
+"""连接池：按配置创建、检出计数与峰值占用、池满超时计入统计，dispose 后埋点保留"""
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app import db_pool
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_pool, "_STATS", {})
+    monkeypatch.setattr(db_pool, "POOL_SIZE", 1)
+    monkeypatch.setattr(db_pool, "MAX_OVERFLOW", 1)
+    monkeypatch.setattr(db_pool, "POOL_TIMEOUT", 0.2)
+    monkeypatch.setattr(db_pool, "WAIT_WARN_MS", 10_000)
+    url = f"sqlite:///{tmp_path / 'pool.db'}"
+    eng = create_engine(url, **db_pool.pool_options("test", url))
+    db_pool.instrument_engine("test", eng)
+    yield eng
+    eng.dispose()
+
+
+def test_memory_sqlite_keeps_default_pool(monkeypatch):
+    monkeypatch.setattr(db_pool, "_STATS", {})
+    assert db_pool.pool_options("mem", "sqlite:///:memory:") == {}
+    assert db_pool.pool_status() == {}
+
+
+def test_checkouts_and_peak_usage(engine):
+    with engine.connect() as a, engine.connect() as b:
+        a.execute(text("SELECT 1"))
+        b.execute(text("SELECT 1"))
+    snap = db_pool.pool_status()["test"]
+    assert snap["checkouts"] == 2 and snap["connects"] == 2
+    assert snap["peak_in_use"] == 2 and snap["peak_overflow"] == 1
+    assert snap["in_use"] == 0 and snap["max_overflow"] == 1
+    assert snap["timeouts"] == 0 and snap["wait_max_ms"] >= snap["wait_p95_ms"] >= 0
+
+
+def test_exhausted_pool_records_timeout(engine):
+    with engine.connect(), engine.connect():
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+    snap = db_pool.pool_status()["test"]
+    assert snap["timeouts"] == 1 and snap["wait_max_ms"] >= 200
+
+
+def test_instrumentation_survives_dispose(engine):
+    pool_class = type(engine.pool)
+    assert pool_class.__name__ == "InstrumentedQueuePool"
+    engine.dispose()
+    assert type(engine.pool) is pool_class
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    assert db_pool.pool_status()["test"]["checkouts"] == 1
@@ -0,0 +1,57 @@
+"""嵌入式 SQLite 后端：文件库启用 WAL 与连接 pragma，外键级联删除生效，读写可并发"""
+import pytest
+from sqlalchemy import create_engine, text
+
+from app import db_sqlite
+from app.models.rule_condition_model import RuleCondition
+from app.models.rule_model import Rule
+
+
+def _engine(url):
+    eng = create_engine(url, **db_sqlite.sqlite_engine_options(url))
+    db_sqlite.tune_sqlite_engine(eng, url)
+    return eng
+
+
+@pytest.fixture
+def engine(tmp_path):
+    # 父目录不存在时自动创建
+    eng = _engine(f"sqlite:///{tmp_path / 'data' / 'signs.db'}")
+    yield eng
+    eng.dispose()
+
+
+def test_file_database_pragmas(engine):
+    with engine.connect() as conn:
+        pragma = lambda name: conn.execute(text(f"PRAGMA {name}")).scalar()  # noqa: E731
+        assert pragma("journal_mode") == "wal"
+        assert pragma("foreign_keys") == 1
+        assert pragma("busy_timeout") == db_sqlite.BUSY_TIMEOUT_MS
+        assert pragma("cache_size") == -db_sqlite.CACHE_SIZE_MB * 1024
+        assert pragma("synchronous") == 1  # NORMAL
+
+
+def test_memory_database_skips_wal():
+    eng = _engine("sqlite://")
+    with eng.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "memory"
+        assert conn.execute(text("PRAGMA foreign_keys")).scalar() == 1
+    assert db_sqlite.sqlite_engine_options("mysql+pymysql://db/signs") == {}
+    assert (db_sqlite.backend_name("sqlite:///x.db"), db_sqlite.backend_name("mysql://db")) == ("SQLite", "MySQL")
+
+
+def test_condition_rows_cascade_and_reads_do_not_block_writes(engine):
+    Rule.__table__.create(engine)
+    RuleCondition.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO rules (id, store_id, name, priority, conditions, action)"
+                          " VALUES ('r1', 's1', '雨', 1, '[]', '{}')"))
+        conn.execute(text("INSERT INTO rule_conditions (rule_id, type, value) VALUES ('r1', 'weather', 'rain')"))
+    with engine.connect() as reader:
+        # 读连接上有未读完的结果集时写入仍可提交（不等待 busy_timeout）
+        rows = reader.execute(text("SELECT id FROM rules"))
+        with engine.begin() as writer:
+            writer.execute(text("DELETE FROM rules WHERE id = 'r1'"))
+        rows.close()
+        # 外键级联：删除规则时条件行一并删除
+        assert reader.execute(text("SELECT COUNT(*) FROM rule_conditions")).scalar() == 0
@@ -0,0 +1,48 @@
+"""Aho-Corasick 关键词匹配：与「按关键词长度降序逐个 kw in text，同长取先加入的」逐一对照"""
+import random
+
+from app.services.keyword_matcher import KeywordMatcher
+
+
+def legacy_search(mapping: dict, text: str):
+    """原实现：按长度降序扫描全部关键词（sorted 稳定，同长保持加入顺序）"""
+    for kw in sorted(mapping, key=len, reverse=True):
+        if kw in text:
+            return kw, mapping[kw]
+    return None
+
+
+def random_word(rnd: random.Random, alphabet: str, max_len: int) -> str:
+    return "".join(rnd.choice(alphabet) for _ in range(rnd.randint(1, max_len)))
+
+
+def test_fuzz_matches_legacy_scan():
+    rnd = random.Random(50)
+    for alphabet in ("ab", "abc", "晴雨阴天下"):
+        for _ in range(300):
+            mapping = {}
+            matcher = KeywordMatcher()
+            for _ in range(rnd.randint(0, 12)):
+                kw, value = random_word(rnd, alphabet, 5), random_word(rnd, "xyz", 3)
+                mapping[kw] = value
+                matcher.add(kw, value)
+                # 增量加入后立即查询，覆盖失败指针按需重算
+                if rnd.random() < 0.3:
+                    text = random_word(rnd, alphabet, 12)
+                    assert matcher.search(text) == legacy_search(mapping, text), (mapping, text)
+            assert len(matcher) == len(mapping)
+            for _ in range(20):
+                text = random_word(rnd, alphabet, 20)
+                assert matcher.search(text) == legacy_search(mapping, text), (mapping, text)
+
+
+def test_constructor_mapping_and_value_update_keep_order():
+    matcher = KeywordMatcher({"雨": "rain", "下雨": "rain", "阴": "cloudy"})
+    assert matcher.search("今天下雨") == ("下雨", "rain")
+    # 同长时取先加入的
+    assert matcher.search("阴转雨") == ("雨", "rain")
+    matcher.add("阴", "overcast")
+    assert matcher.search("阴天") == ("阴", "overcast")
+    assert matcher.search("阴转雨") == ("雨", "rain")
+    assert matcher.search("晴") is None
+    assert KeywordMatcher().search("anything") is None
@@ -0,0 +1,80 @@
+"""日志：JSON 结构化输出、子系统级别、高频事件采样、队列后台输出"""
+import json
+import logging
+import logging.handlers
+
+import pytest
+
+from app import logging_config
+from app.logging_config import JsonFormatter, get_logger, log_sampled
+
+
+class _Collect(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def collected():
+    logger = logging.getLogger("test_logging_config.sampled")
+    handler = _Collect()
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    yield logger, handler.records
+    logger.removeHandler(handler)
+
+
+def test_json_formatter_includes_extra_fields():
+    record = logging.LogRecord("sign_inspire.api", logging.INFO, __file__, 1, "tick %s", ("ok",), None)
+    record.store_id = "store_001"
+    record._private = "hidden"
+    out = json.loads(JsonFormatter().format(record))
+    assert out["level"] == "INFO" and out["logger"] == "sign_inspire.api" and out["msg"] == "tick ok"
+    assert out["store_id"] == "store_001" and "_private" not in out
+    assert out["ts"].endswith("+00:00")
+
+
+def test_log_sampled_emits_one_in_n(collected, monkeypatch):
+    logger, records = collected
+    monkeypatch.setattr(logging_config, "_SAMPLE_EVERY", 3)
+    monkeypatch.setattr(logging_config, "_sample_counts", {})
+    for i in range(7):
+        log_sampled(logger, logging.INFO, "poll", "poll %d", i, store_id="s1")
+    assert [r.getMessage() for r in records] == ["poll 0", "poll 3", "poll 6"]
+    assert all(r.sampled == 3 and r.store_id == "s1" for r in records)
+    # 级别未启用时不计数
+    for _ in range(5):
+        log_sampled(logger, logging.DEBUG, "poll", "debug")
+    assert logging_config._sample_counts == {"poll": 7}
+
+
+def test_setup_logging_routes_through_queue_with_subsystem_levels(monkeypatch, capsys):
+    root = logging.getLogger(logging_config.ROOT_LOGGER)
+    saved = (root.handlers[:], root.propagate, root.level,
+             {name: get_logger(name).level for name in logging_config.SUBSYSTEMS})
+    monkeypatch.setattr(logging_config, "_listener", None)
+    monkeypatch.setenv("LOG_LEVEL", "INFO")
+    monkeypatch.setenv("LOG_LEVEL_API", "WARNING")
+    monkeypatch.setenv("LOG_FORMAT", "json")
+    try:
+        logging_config.setup_logging()
+        assert isinstance(root.handlers[0], logging.handlers.QueueHandler)
+        get_logger("api").info("dropped")
+        get_logger("api").warning("kept", extra={"sign_id": "sign_001"})
+        get_logger("scheduler").info("tick")
+        logging_config.shutdown_logging()
+        lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert [(line["logger"], line["msg"]) for line in lines] == [
+            ("sign_inspire.api", "kept"), ("sign_inspire.scheduler", "tick"),
+        ]
+        assert lines[0]["sign_id"] == "sign_001"
+    finally:
+        logging_config.shutdown_logging()
+        root.handlers[:], root.propagate, root.level = saved[0], saved[1], saved[2]
+        for name, level in saved[3].items():
+            get_logger(name).setLevel(level)
@@ -0,0 +1,85 @@
+"""媒体清单：图片尺寸解析、后台下载与失败冷却、清单只读缓存且补齐后版本变化"""
+import asyncio
+import struct
+
+import httpx
+import pytest
+
+from app.services import bundle_service, media_manifest_service as manifest, media_service
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00\x00\x00\rIHDR" + struct.pack(">II", 640, 480) + b"\x08\x02\x00\x00\x00"
+GIF = b"GIF89a" + struct.pack("<HH", 32, 16) + b"\x00" * 8
+JPEG = b"\xff\xd8" + b"\xff\xe0\x00\x04\x00\x00" + b"\xff\xc0\x00\x11\x08" + struct.pack(">HH", 720, 1280) + b"\x00" * 12
+WEBP = b"RIFF\x00\x00\x00\x00WEBPVP8X" + b"\x00" * 8 + (1919).to_bytes(3, "little") + (1079).to_bytes(3, "little")
+
+
+@pytest.mark.parametrize("data, size", [
+    (PNG, (640, 480)), (GIF, (32, 16)), (JPEG, (1280, 720)), (WEBP, (1920, 1080)),
+    (b"not an image", (None, None)), (b"\xff\xd8\xff", (None, None)),
+])
+def test_image_size(data, size):
+    assert tuple(manifest._image_size(data)) == size
+
+
+@pytest.fixture
+def assets(monkeypatch):
+    """素材服务器：/ok.png 返回 PNG，其余 404；记录请求"""
+    requests = []
+
+    def handler(request):
+        requests.append(str(request.url))
+        if request.url.path == "/ok.png":
+            return httpx.Response(200, content=PNG, headers={"content-type": "image/png"})
+        return httpx.Response(404)
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(manifest.httpx, "AsyncClient",
+                        lambda **kw: real_client(transport=httpx.MockTransport(handler), **kw))
+    monkeypatch.setattr(manifest, "_ASSET_META", {})
+    monkeypatch.setattr(manifest, "_FAILED_UNTIL", {})
+    monkeypatch.setattr(manifest, "_MANIFEST_CACHE", {})
+    monkeypatch.setattr(manifest, "_refresh_task", None)
+    return requests
+
+
+def test_failed_assets_wait_for_ttl(assets, monkeypatch):
+    urls = ["https://img/ok.png", "https://img/missing.png"]
+    assert asyncio.run(manifest.fetch_missing_meta(urls)) == 1
+    assert manifest._ASSET_META["https://img/ok.png"]["width"] == 640
+    # 已缓存与冷却期内的 URL 都不再请求
+    assert asyncio.run(manifest.fetch_missing_meta(urls)) == 0
+    assert len(assets) == 2
+    now = manifest.monotonic()
+    monkeypatch.setattr(manifest, "monotonic", lambda: now + manifest.FAILURE_TTL + 1)
+    asyncio.run(manifest.fetch_missing_meta(urls))
+    assert assets[-1] == "https://img/missing.png" and len(assets) == 3
+
+
+def test_manifest_reads_cache_and_schedules_download(assets, monkeypatch):
+    async def load_store_rules(store_id, db=None, subscription=None):
+        return [{"action": {"type": "switch_playlist", "target_id": "coffee_ad"}}]
+
+    async def image_urls(target_ids, db=None):
+        return {t: f"https://img/{'ok' if t == 'coffee_ad' else t}.png" for t in target_ids}
+
+    monkeypatch.setattr(bundle_service, "load_store_rules", load_store_rules)
+    monkeypatch.setattr(media_service, "get_image_urls", image_urls)
+
+    async def main():
+        first = await manifest.build_media_manifest("store_001")
+        # 接口本身不下载：元数据为空，后台任务补齐
+        assert [(i["target_id"], i["sha256"]) for i in first["items"]] == [("coffee_ad", None), ("default", None)]
+        await manifest._refresh_task
+        second = await manifest.build_media_manifest("store_001")
+        # 补齐后清单缓存，URL 映射不变时直接返回
+        manifest._ASSET_META["https://img/default.png"] = {"sha256": "d", "bytes": 1}
+        third = await manifest.build_media_manifest("store_001")
+        assert await manifest.build_media_manifest("store_001") is third
+        return first, second
+
+    first, second = asyncio.run(main())
+    coffee = second["items"][0]
+    assert (coffee["width"], coffee["height"], coffee["bytes"]) == (640, 480, len(PNG))
+    assert second["version"] != first["version"]
+    # default 素材下载失败时清单不完整：second 没有被缓存
+    assert manifest._MANIFEST_CACHE["store_001"][1]["version"] != second["version"]
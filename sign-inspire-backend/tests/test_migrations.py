@@ -0,0 +1,124 @@
+"""结构迁移：旧结构的 SQLite 库（重复规则、完整默认规则副本）迁移后的数据，以及重复执行不再改动"""
+import json
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from app import migrations
+from app.database import DEFAULT_RULES, Base
+from app.models import media_model, rule_condition_model, rule_model, store_model, vocabulary_model  # noqa: F401
+from app.models.rule_condition_model import condition_rows
+
+# 迁移前（content_hash / 地理字段 / 模板字段 / 复合索引之前）的表结构
+OLD_SCHEMA = [
+    """CREATE TABLE stores (
+        id VARCHAR(50) PRIMARY KEY, name VARCHAR(100) NOT NULL, city VARCHAR(50) NOT NULL,
+        latitude FLOAT, longitude FLOAT, sign_id VARCHAR(50) UNIQUE, opening_hours JSON,
+        timezone VARCHAR(50), is_active BOOLEAN NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP, updated_at DATETIME)""",
+    """CREATE TABLE rules (
+        id VARCHAR(36) PRIMARY KEY, store_id VARCHAR(50) NOT NULL, name VARCHAR(200) NOT NULL,
+        priority INTEGER NOT NULL, conditions JSON NOT NULL, action JSON NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP, updated_at DATETIME)""",
+    "CREATE INDEX ix_rules_store_id ON rules (store_id)",
+]
+
+RAIN = [{"type": "weather", "operator": "in", "value": "rain,snow"}, {"type": "time", "operator": "==", "value": "11,14"}]
+SUN = [{"type": "weather", "operator": "==", "value": "sunny"}]
+SOUP = {"type": "switch_playlist", "target_id": "hot_soup"}
+
+
+def _rule(rid, store_id, conditions, action, priority=1, created_at="2024-01-01 00:00:00"):
+    return {"id": rid, "store_id": store_id, "name": rid, "priority": priority,
+            "conditions": json.dumps(conditions, ensure_ascii=False), "action": json.dumps(action, ensure_ascii=False),
+            "created_at": created_at}
+
+
+@pytest.fixture
+def engine(tmp_path):
+    eng = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with eng.begin() as conn:
+        for ddl in OLD_SCHEMA:
+            conn.execute(text(ddl))
+        conn.execute(text(
+            "INSERT INTO stores (id, name, city, is_active) VALUES (:id, :id, 'Adelaide', 1)"
+        ), [{"id": "s_copy"}, {"id": "s_partial"}, {"id": "s_custom"}])
+        rows = [
+            # 重复规则：保留最早一条的哈希
+            _rule("dup_b", "s_custom", RAIN, SOUP, created_at="2024-02-01 00:00:00"),
+            _rule("dup_a", "s_custom", list(reversed(RAIN)), SOUP, created_at="2024-01-01 00:00:00"),
+            _rule("own", "s_custom", SUN, {"type": "switch_playlist", "target_id": "coffee_ad"}),
+        ]
+        for i, d in enumerate(DEFAULT_RULES):
+            rows.append(_rule(f"copy_{i}", "s_copy", d["conditions"], d["action"], d["priority"]))
+            # 改过一条优先级的副本不是完整默认副本，保持原样
+            priority = d["priority"] + 1 if i == 0 else d["priority"]
+            rows.append(_rule(f"partial_{i}", "s_partial", d["conditions"], d["action"], priority))
+        conn.execute(text(
+            "INSERT INTO rules (id, store_id, name, priority, conditions, action, created_at)"
+            " VALUES (:id, :store_id, :name, :priority, :conditions, :action, :created_at)"
+        ), rows)
+    # 启动流程：create_all 只建缺失的表（rule_conditions、rules_version 等），随后执行迁移
+    Base.metadata.create_all(bind=eng)
+    yield eng
+    eng.dispose()
+
+
+def _sorted_rows(rows):
+    """value 列可能为 NULL，按字符串排序"""
+    return sorted((tuple(r) for r in rows), key=lambda r: tuple(str(v) for v in r))
+
+
+def _snapshot(eng):
+    with eng.connect() as conn:
+        return {
+            "rules": conn.execute(text(
+                "SELECT id, store_id, priority, content_hash FROM rules ORDER BY id")).all(),
+            "stores": conn.execute(text(
+                "SELECT id, rule_template, disabled_rules, country_code FROM stores ORDER BY id")).all(),
+            "conditions": _sorted_rows(conn.execute(text("SELECT rule_id, type, value FROM rule_conditions"))),
+            "version": conn.execute(text("SELECT id, version FROM rules_version")).all(),
+            "indexes": sorted(migrations._index_names(eng, "rules") | migrations._index_names(eng, "stores")),
+        }
+
+
+def test_migrations_convert_old_database(engine):
+    assert migrations.run_migrations(engine) == len(migrations.MIGRATIONS)
+    with engine.connect() as conn:
+        hashes = dict(conn.execute(text("SELECT id, content_hash FROM rules")).all())
+        templates = dict(conn.execute(text("SELECT id, rule_template FROM stores")).all())
+        rule_ids = set(conn.execute(text("SELECT id FROM rules")).scalars())
+        conditions = conn.execute(text("SELECT rule_id, type, value FROM rule_conditions")).all()
+        stored = conn.execute(text("SELECT id, conditions FROM rules")).all()
+        versions = conn.execute(text("SELECT id, version FROM rules_version")).all()
+
+    # content_hash：重复规则只有最早一条有哈希
+    assert hashes["dup_a"] == rule_model.rule_content_hash(RAIN, SOUP)
+    assert hashes["dup_b"] is None
+    assert all(hashes[rid] for rid in rule_ids if rid != "dup_b")
+
+    # 完整默认副本改为订阅模板并删除；不完整的副本与自定义门店不变
+    assert templates == {"s_copy": "default", "s_partial": None, "s_custom": None}
+    assert not any(rid.startswith("copy_") for rid in rule_ids)
+    assert len([rid for rid in rule_ids if rid.startswith("partial_")]) == len(DEFAULT_RULES)
+
+    # rule_conditions 与剩余规则的条件逐行一致（被删除副本的行不残留）
+    expected = []
+    for rid, conds in stored:
+        expected.extend((row["rule_id"], row["type"], row["value"]) for row in condition_rows(rid, json.loads(conds)))
+    assert _sorted_rows(conditions) == _sorted_rows(expected)
+
+    assert versions == [(rule_model.RULES_VERSION_ROW, 0)]
+    columns = {c["name"] for c in inspect(engine).get_columns("stores")}
+    assert {"country_code", "region", "china_subregion", "rule_template", "disabled_rules"} <= columns
+    assert {"uq_rules_store_content", "ix_rules_store_priority_id", "ix_rules_store_id_id"} <= migrations._index_names(engine, "rules")
+
+
+def test_migrations_are_idempotent(engine):
+    migrations.run_migrations(engine)
+    before = _snapshot(engine)
+    assert migrations.run_migrations(engine) == 0
+    # 每个迁移本身也可重复执行（多 worker 同时启动、中途失败后重试）
+    for _, _, migrate in migrations.MIGRATIONS:
+        migrate(engine)
+    assert _snapshot(engine) == before
@@ -0,0 +1,85 @@
+"""键集分页：游标编解码、page_after 翻页语义"""
+import pytest
+from fastapi import HTTPException
+
+from app.api.v1.pagination import decode_cursor, encode_cursor, page_after
+from app.models.rule_storage import MemoryRuleStore
+from app.services import rule_repository
+from app.services.rule_repository import page_order_key
+
+
+def rules(*pairs):
+    items = [{"id": rid, "priority": p} for p, rid in pairs]
+    return sorted(items, key=page_order_key)
+
+
+def walk(items, limit):
+    pages, cursor = [], None
+    while True:
+        page, cursor = page_after(items, page_order_key, limit, cursor)
+        pages.append([r["id"] for r in page])
+        if cursor is None:
+            return pages
+
+
+def test_cursor_round_trip():
+    for key in [(-5, "abc"), (0, ""), (-1, "规则-ü"), (3,)]:
+        token = encode_cursor(key)
+        assert "=" not in token
+        assert decode_cursor(token, len(key)) == key
+
+
+@pytest.mark.parametrize("token", ["", "!!!", encode_cursor([1]), encode_cursor({"a": 1}), "bm90IGpzb24"])
+def test_decode_rejects_bad_cursor(token):
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(token, 2)
+    assert exc.value.status_code == 400
+
+
+def test_page_after_walks_in_priority_order():
+    items = rules((1, "a"), (5, "b"), (5, "a"), (3, "c"), (1, "b"))
+    assert walk(items, 2) == [["a", "b"], ["c", "a"], ["b"]]
+    assert walk(items, 5) == [["a", "b", "c", "a", "b"]]
+    assert page_after([], page_order_key, 10, None) == ([], None)
+
+
+def test_page_after_is_stable_across_writes():
+    items = rules((5, "a"), (4, "b"), (3, "c"), (2, "d"))
+    page, cursor = page_after(items, page_order_key, 2, None)
+    assert [r["id"] for r in page] == ["a", "b"]
+    # 翻页之间删除已返回的规则、在游标前后插入新规则
+    changed = rules((4, "b"), (9, "new_before"), (3, "c"), (3, "cc"), (2, "d"))
+    page, cursor = page_after(changed, page_order_key, 10, cursor)
+    assert [r["id"] for r in page] == ["c", "cc", "d"]
+    assert cursor is None
+
+
+def test_page_after_rejects_mistyped_cursor():
+    items = rules((5, "a"), (4, "b"))
+    with pytest.raises(HTTPException) as exc:
+        page_after(items, page_order_key, 1, encode_cursor(["x", 1]))
+    assert exc.value.status_code == 400
+
+
+def test_rule_cursor_requires_int_priority_and_str_id():
+    from app.api.v1.endpoints.rules import _rule_cursor
+    assert _rule_cursor(encode_cursor([-5, "a"])) == (-5, "a")
+    for key in (["x", "a"], [True, "a"], [-5, 3], [1.5, "a"]):
+        with pytest.raises(HTTPException):
+            _rule_cursor(encode_cursor(key))
+
+
+def test_memory_store_pages_in_repository_order(monkeypatch):
+    """内存模式与数据库模式的分页顺序一致（同一游标在两种模式下含义相同）"""
+    store = MemoryRuleStore()
+    by_id = {}
+    for priority, rid in [(1, "a"), (5, "b"), (5, "a2"), (None, "c"), (3, "c2"), (1, "b2")]:
+        rule = store.add_rule({"id": rid, "store_id": "s1", "name": rid, "priority": priority,
+                               "conditions": [{"type": "city", "operator": "==", "value": rid}],
+                               "action": {"type": "switch_playlist", "target_id": "x"}})
+        by_id[rid] = rule
+    monkeypatch.setattr(rule_repository, "_BY_STORE", {"s1": by_id})
+    monkeypatch.setattr(rule_repository, "_page_order", {})
+    memory = [r["id"] for r in store.rules_in_page_order("s1")]
+    assert memory == [r["id"] for r in rule_repository.rules_in_page_order("s1")]
+    assert memory == ["a2", "b", "c2", "a", "b2", "c"]
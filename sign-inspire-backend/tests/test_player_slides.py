@@ -0,0 +1,59 @@
+"""Player 城市模式聚合接口：商家照片优先，无照片时品类图，再兜底 coffee_ad；品类图只在缺失时补查"""
+import asyncio
+
+import pytest
+
+from app.api.v1.endpoints import player
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    calls = {"rec": [], "media": []}
+    state = {"rec": {}, "urls": {}}
+
+    async def recommended(limit, city, lat, lon, target_id):
+        calls["rec"].append({"limit": limit, "city": city, "target_id": target_id})
+        return dict(state["rec"])
+
+    async def image_urls(target_ids, db=None):
+        calls["media"].append(set(target_ids))
+        return {t: state["urls"][t] for t in target_ids if t in state["urls"]}
+
+    monkeypatch.setattr(player, "get_current_recommended_stores", recommended)
+    monkeypatch.setattr(player, "get_image_urls", image_urls)
+    return state, calls
+
+
+def _slides(**params):
+    return asyncio.run(player.get_player_slides(**{"city": "Adelaide", "lat": None, "lon": None,
+                                                    "target_id": None, "limit": 15, **params}))
+
+
+def test_store_photos_come_first(backend):
+    state, calls = backend
+    state["rec"] = {"target_id": "sushi_ad", "message": "寿司", "stores": [
+        {"name": "A", "photos": ["https://p/a1.jpg", "https://p/a2.jpg"]}, {"name": "B", "photos": []},
+        {"name": "C", "photos": ["https://p/c1.jpg"]},
+    ]}
+    state["urls"] = {"sushi_ad": "https://img/sushi.jpg", "coffee_ad": "https://img/coffee.jpg"}
+    out = _slides(city=" Adelaide ", target_id=" sushi_ad ", limit=50)
+    assert out["slides"] == ["https://p/a1.jpg", "https://p/a2.jpg", "https://p/c1.jpg"]
+    assert out["category_image_url"] == "https://img/sushi.jpg" and out["message"] == "寿司"
+    assert calls["rec"] == [{"limit": 20, "city": "Adelaide", "target_id": "sushi_ad"}]
+    # 指定的 target 与推荐一致：预取已覆盖，不再补查
+    assert calls["media"] == [{"coffee_ad", "sushi_ad"}]
+
+
+def test_category_image_then_fallback(backend):
+    state, calls = backend
+    state["rec"] = {"target_id": "bbq_ad", "stores": [{"name": "A"}]}
+    state["urls"] = {"bbq_ad": "https://img/bbq.jpg", "coffee_ad": "https://img/coffee.jpg"}
+    assert _slides()["slides"] == ["https://img/bbq.jpg"]
+    assert calls["media"] == [{"coffee_ad"}, {"bbq_ad"}]
+
+    state["urls"] = {"coffee_ad": "https://img/coffee.jpg"}
+    out = _slides()
+    assert out["slides"] == ["https://img/coffee.jpg"] and out["category_image_url"] is None
+
+    state["rec"] = {"stores": []}
+    assert _slides()["target_id"] == "default"
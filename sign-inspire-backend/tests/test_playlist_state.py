@@ -0,0 +1,78 @@
+"""播放状态：apply / merge / changes_since / replay"""
+from app.services.playlist_state import PlaylistState
+
+
+def test_apply_bumps_generation_only_on_change():
+    state = PlaylistState()
+    assert sorted(state.apply({"a": "coffee", "b": "tea"})) == ["a", "b"]
+    assert state.generation == 1
+    assert state.apply({"a": "coffee", "b": "tea"}) == []
+    assert state.generation == 1
+    assert state.apply({"a": "soup", "b": "tea"}) == ["a"]
+    assert state.generation == 2
+    assert state.version("a") == 2 and state.version("b") == 1 and state.version("x") == 0
+
+
+def test_apply_removes_missing_stores():
+    state = PlaylistState()
+    state.apply({"a": "coffee", "b": "tea"})
+    assert state.apply({"a": "coffee"}) == ["b"]
+    assert state.get("b") is None
+    assert state.changes_since(1)["changes"] == [{"store_id": "b", "target_id": None, "generation": 2}]
+
+
+def test_merge_keeps_other_stores():
+    state = PlaylistState()
+    state.apply({"a": "coffee"})
+    assert state.merge({"b": "tea"}) == ["b"]
+    assert dict(state.snapshot()[1]) == {"a": "coffee", "b": "tea"}
+    assert state.merge({"b": "tea"}) == []
+    assert state.generation == 2
+
+
+def test_changes_since_keeps_latest_change_per_store():
+    state = PlaylistState()
+    state.apply({"a": "coffee", "b": "tea"})
+    state.apply({"a": "soup", "b": "tea"})
+    state.apply({"a": "noodles", "b": "tea"})
+    result = state.changes_since(1)
+    assert result == {
+        "generation": 3,
+        "reset": False,
+        "changes": [{"store_id": "a", "target_id": "noodles", "generation": 3}],
+    }
+    assert state.changes_since(3)["changes"] == []
+
+
+def test_changes_since_resets_when_log_truncated_or_ahead():
+    state = PlaylistState(max_log=2)
+    for target in ("coffee", "soup", "noodles"):
+        state.apply({"a": target})
+    stale = state.changes_since(0)
+    assert stale["reset"] is True
+    assert stale["changes"] == [{"store_id": "a", "target_id": "noodles", "generation": 3}]
+    assert state.changes_since(2)["reset"] is False
+    assert state.changes_since(99)["reset"] is True
+
+
+def test_replay_reproduces_leader_state():
+    leader = PlaylistState()
+    leader.apply({"a": "coffee", "b": "tea"})
+    leader.apply({"a": "soup"})
+    entries = list(leader._log)
+
+    follower = PlaylistState()
+    follower.replay(entries)
+    assert follower.generation == leader.generation
+    assert dict(follower.snapshot()[1]) == dict(leader.snapshot()[1])
+    assert {s: follower.version(s) for s in "ab"} == {s: leader.version(s) for s in "ab"}
+    assert follower.changes_since(1) == leader.changes_since(1)
+
+
+def test_reset_replaces_state_and_clears_log():
+    state = PlaylistState()
+    state.apply({"a": "coffee"})
+    state.reset(10, {"b": "tea"}, {"b": 9})
+    assert state.generation == 10 and state.get("a") is None and state.version("b") == 9
+    assert state.changes_since(5)["reset"] is True
+    assert state.changes_since(10) == {"generation": 10, "reset": False, "changes": []}
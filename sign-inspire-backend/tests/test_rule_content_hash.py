@@ -0,0 +1,58 @@
+"""规则内容哈希与去重：条件顺序、null 字段不影响哈希；同门店同内容只保存一条"""
+import pytest
+
+from app.models.rule_model import rule_content_hash
+from app.models.rule_storage import DuplicateRuleError, MemoryRuleStore
+
+RAIN = {"type": "weather", "operator": "==", "value": "雨"}
+LUNCH = {"type": "time", "operator": "between", "value": "11,14"}
+ACTION = {"type": "switch_playlist", "target_id": "hot_soup"}
+
+
+def test_hash_ignores_condition_order_and_null_fields():
+    base = rule_content_hash([RAIN, LUNCH], ACTION)
+    assert rule_content_hash([LUNCH, RAIN], ACTION) == base
+    assert rule_content_hash([RAIN, LUNCH], {**ACTION, "message": None}) == base
+    assert rule_content_hash([dict(reversed(list(RAIN.items()))), LUNCH], ACTION) == base
+
+
+@pytest.mark.parametrize("conditions, action", [
+    ([RAIN], ACTION),
+    ([RAIN, LUNCH], {**ACTION, "target_id": "iced_tea"}),
+    ([RAIN, LUNCH], {**ACTION, "message": "下雨喝汤"}),
+    ([RAIN, {**LUNCH, "value": "11,15"}], ACTION),
+    ([RAIN, RAIN, LUNCH], ACTION),
+])
+def test_hash_changes_with_content(conditions, action):
+    assert rule_content_hash(conditions, action) != rule_content_hash([RAIN, LUNCH], ACTION)
+
+
+def test_memory_store_dedups_per_store():
+    store = MemoryRuleStore()
+    first = store.add_rule({"id": "r1", "store_id": "s1", "name": "汤", "priority": 1,
+                            "conditions": [RAIN, LUNCH], "action": ACTION})
+    again = store.add_rule({"id": "r2", "store_id": "s1", "name": "另一个名字", "priority": 9,
+                            "conditions": [LUNCH, RAIN], "action": ACTION})
+    assert again is first and len(store) == 1
+    assert store.find_by_content("s1", rule_content_hash([RAIN, LUNCH], ACTION)) is first
+
+    other = store.add_rule({"id": "r3", "store_id": "s2", "name": "汤", "priority": 1,
+                            "conditions": [RAIN, LUNCH], "action": ACTION})
+    assert other["id"] == "r3" and len(store) == 2
+
+    store.delete_rule("s1", "r1")
+    assert store.find_by_content("s1", first["content_hash"]) is None
+    readded = store.add_rule({"id": "r4", "store_id": "s1", "name": "汤", "priority": 1,
+                              "conditions": [RAIN, LUNCH], "action": ACTION})
+    assert readded["id"] == "r4"
+
+
+def test_memory_store_rejects_update_into_duplicate():
+    store = MemoryRuleStore()
+    store.add_rule({"id": "r1", "store_id": "s1", "name": "汤", "priority": 1, "conditions": [RAIN], "action": ACTION})
+    store.add_rule({"id": "r2", "store_id": "s1", "name": "午餐", "priority": 1, "conditions": [LUNCH], "action": ACTION})
+    with pytest.raises(DuplicateRuleError):
+        store.update_rule("s1", "r2", {"conditions": [RAIN]})
+    assert store.get_rule("r2")["conditions"] == [LUNCH]
+    updated = store.update_rule("s1", "r2", {"priority": 5})
+    assert updated["content_hash"] == rule_content_hash([LUNCH], ACTION)
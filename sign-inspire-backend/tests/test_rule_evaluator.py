@@ -0,0 +1,100 @@
+"""规则求值器：编译 + 求值与原 matching_engine._conditions_match（逐条解析条件）结果一致"""
+import random
+from typing import List, Optional
+
+from app.services.rule_evaluator import (
+    compile_conditions, compile_rules, evaluate_conditions, is_open_at,
+    parse_day_value, parse_temp_range, parse_time_range, select_target,
+)
+
+from tests.helpers import normalize, random_condition, random_context, to_match_context
+
+
+def legacy_conditions_match(
+    conditions, weather, city="Adelaide", temp_c=None, region="western", hour=None,
+    weekday=None, china_subregion=None, solar_terms: Optional[List[str]] = None,
+) -> bool:
+    """重构前 matching_engine._conditions_match 的逐条求值（天气标准化改为注入）"""
+    weather_normalized = normalize(weather) or {weather}
+    for cond in conditions or []:
+        ctype = cond.get("type")
+        value = cond.get("value", "")
+        op = cond.get("operator", "==")
+        if ctype == "weather":
+            matched = False
+            if op == "==" and (weather_normalized & normalize(str(value))):
+                matched = True
+            elif op == "in":
+                matched = any(weather_normalized & normalize(v.strip()) for v in str(value).split(","))
+            if not matched:
+                return False
+        elif ctype == "city" and op == "==":
+            if value and str(value).lower() != city.lower():
+                return False
+        elif ctype == "temp" and temp_c is not None:
+            tr = parse_temp_range(str(value))
+            if tr and not (tr[0] <= temp_c <= tr[1]):
+                return False
+        elif ctype == "region" and op == "==":
+            if value and str(value).lower() != region.lower():
+                return False
+        elif ctype == "time" and hour is not None:
+            tr = parse_time_range(str(value))
+            if tr and not (tr[0] <= hour <= tr[1]):
+                return False
+        elif ctype == "day" and weekday is not None:
+            days = parse_day_value(str(value))
+            if days and weekday not in days:
+                return False
+        elif ctype == "china_region":
+            if not china_subregion:
+                return False
+            if value and str(value).lower() != china_subregion.lower():
+                return False
+        elif ctype == "solar_term":
+            if not solar_terms:
+                return False
+            if value and str(value).strip() not in (solar_terms or []):
+                return False
+    return True
+
+
+def test_compiled_evaluation_matches_legacy_fuzz():
+    rnd = random.Random(20261019)
+    for _ in range(5000):
+        conditions = [random_condition(rnd) for _ in range(rnd.randint(0, 4))]
+        ctx = random_context(rnd)
+        expected = legacy_conditions_match(conditions, **ctx)
+        compiled = compile_conditions(conditions, normalize)
+        assert evaluate_conditions(compiled, to_match_context(ctx)) == expected, (conditions, ctx)
+
+
+def test_compile_drops_ignored_conditions():
+    compiled = compile_conditions([
+        {"type": "city", "operator": "in", "value": "Adelaide"},
+        {"type": "temp", "operator": "==", "value": "abc"},
+        {"type": "holiday", "operator": "==", "value": "春节"},
+        {"type": "weather", "operator": "in", "value": "晴, 雨"},
+    ], normalize)
+    assert compiled == [{"type": "weather", "any": ["rain", "sunny"]}]
+
+
+def test_select_target_uses_priority_order():
+    rules = compile_rules([
+        {"id": "low", "priority": 1, "conditions": [], "action": {"target_id": "fallback"}},
+        {"id": "high", "priority": 5, "conditions": [{"type": "weather", "value": "雨"}], "action": {"target_id": "umbrella"}},
+    ], normalize)
+    assert [r["id"] for r in rules] == ["high", "low"]
+    assert select_target(rules, to_match_context({**random_context(random.Random(1)), "weather": "rain"})) == "umbrella"
+    assert select_target(rules, to_match_context({**random_context(random.Random(1)), "weather": "晴"})) == "fallback"
+    assert select_target([], to_match_context(random_context(random.Random(1)))) == "default"
+
+
+def test_is_open_at():
+    hours = {"mon": "09:00-17:00", "Tue": "10:00-12:00", "wed": "bad"}
+    assert is_open_at(hours, 0, "09:00") and is_open_at(hours, 0, "17:00")
+    assert not is_open_at(hours, 0, "17:01")
+    assert not is_open_at(hours, 1, "09:59")
+    assert is_open_at(hours, 2, "03:00")
+    assert is_open_at(hours, 3, "03:00")
+    assert is_open_at(None, 0, "03:00")
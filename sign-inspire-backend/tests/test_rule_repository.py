@@ -0,0 +1,135 @@
+"""规则仓库版本检查：本进程写入不触发重载，库外修改（递增计数器或手工 SQL）都会触发重载"""
+import asyncio
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.models.rule_condition_model import RuleCondition
+from app.models.rule_model import RULES_VERSION_ROW, Rule, RulesVersion
+from app.services import rule_repository as repo
+
+ACTION = {"type": "switch_playlist", "target_id": "hot_soup"}
+
+
+def _values(store_id="s1", value="雨"):
+    return {"id": str(uuid.uuid4()), "store_id": store_id, "name": value, "priority": 1,
+            "conditions": [{"type": "weather", "operator": "==", "value": value}], "action": ACTION}
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    path = tmp_path / "rules.db"
+    engine = create_engine(f"sqlite:///{path}")
+    for model in (Rule, RuleCondition, RulesVersion):
+        model.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(RulesVersion.__table__.insert().values(id=RULES_VERSION_ROW, version=0))
+    engine.dispose()
+    for name, value in (("_BY_ID", {}), ("_BY_STORE", {}), ("_BY_CONTENT", {}), ("_page_order", {}),
+                        ("_sorted", None), ("_state", None), ("_loaded", False), ("_last_check", 0.0),
+                        ("_lock", None), ("RECONCILE_INTERVAL", 0.0)):
+        monkeypatch.setattr(repo, name, value)
+    return f"sqlite+aiosqlite:///{path}"
+
+
+def _run(url, scenario):
+    async def main():
+        engine = create_async_engine(url)
+        sessions = async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
+        try:
+            await scenario(sessions, engine)
+        finally:
+            await engine.dispose()
+    asyncio.run(main())
+
+
+def _count_reloads(monkeypatch):
+    calls = []
+    original = repo.reload
+
+    async def counting(db=None):
+        calls.append(1)
+        return await original(db)
+    monkeypatch.setattr(repo, "reload", counting)
+    return calls
+
+
+def test_local_writes_do_not_reload(db, monkeypatch):
+    async def scenario(sessions, engine):
+        async with sessions() as s:
+            assert await repo.ensure_fresh(s)
+            reloads = _count_reloads(monkeypatch)
+            rule = await repo.add_rule(s, _values())
+            await repo.update_rule(s, "s1", rule["id"], {"priority": 5})
+            await repo.add_rule(s, _values(value="雪"))
+            await repo.delete_rule(s, "s1", rule["id"])
+            assert repo.version() == 4
+            assert await repo.ensure_fresh(s)
+        assert reloads == []
+        assert [r["name"] for r in repo.all_rules()] == ["雪"]
+    _run(db, scenario)
+
+
+@pytest.mark.parametrize("sql", [
+    # 其他 worker / 导入脚本：递增计数器
+    "UPDATE rules_version SET version = version + 1",
+    # 手工 SQL 不递增计数器：行数变化
+    "INSERT INTO rules (id, store_id, name, priority, conditions, action, created_at)"
+    " VALUES ('manual', 's1', '手工', 9, '[]', '{\"type\": \"switch_playlist\", \"target_id\": \"x\"}',"
+    " '2099-01-01 00:00:00')",
+    # 手工 SQL 不递增计数器：只改内容与更新时间
+    "UPDATE rules SET priority = 9, updated_at = '2099-01-01 00:00:00'",
+])
+def test_out_of_band_edit_forces_reload(db, monkeypatch, sql):
+    async def scenario(sessions, engine):
+        async with sessions() as s:
+            await repo.ensure_fresh(s)
+            await repo.add_rule(s, _values())
+            async with engine.begin() as conn:
+                await conn.execute(text(sql))
+            reloads = _count_reloads(monkeypatch)
+            assert await repo.ensure_fresh(s)
+            assert repo._state == await repo._rules_state(s)
+        assert reloads == [1]
+    _run(db, scenario)
+
+
+def test_local_write_after_out_of_band_bump_reloads(db, monkeypatch):
+    async def scenario(sessions, engine):
+        async with sessions() as s:
+            await repo.ensure_fresh(s)
+            async with engine.begin() as conn:
+                await conn.execute(text("UPDATE rules_version SET version = version + 1"))
+                await conn.execute(text(
+                    "INSERT INTO rules (id, store_id, name, priority, conditions, action)"
+                    " VALUES ('other', 's1', '其他', 1, '[]', '{}')"
+                ))
+            # 本进程写入时计数器已不是内存副本的下一个版本：作废，而不是把库外修改记成已同步
+            await repo.add_rule(s, _values())
+            assert repo.version() is None
+            reloads = _count_reloads(monkeypatch)
+            assert await repo.ensure_fresh(s)
+        assert reloads == [1]
+        assert repo.version() == 2
+        assert repo.get_rule("other") is not None
+    _run(db, scenario)
+
+
+def test_sync_version(monkeypatch):
+    monkeypatch.setattr(repo, "_loaded", True)
+    monkeypatch.setattr(repo, "_state", (3, 10, "c", "u"))
+    repo._sync_version((3, 10, "c", "u"), (4, 11, "c2", "u"))
+    assert repo._state == (4, 11, "c2", "u")
+    # 写入前状态与内存副本不一致（中间有库外修改）
+    repo._sync_version((4, 12, "c3", "u"), (5, 13, "c4", "u"))
+    assert repo._state is None and repo._last_check == 0.0
+    # 写入事务内计数器跳了不止一个版本（并发写入）
+    monkeypatch.setattr(repo, "_state", (3, 10, "c", "u"))
+    repo._sync_version((3, 10, "c", "u"), (5, 11, "c2", "u"))
+    assert repo._state is None
+    # 计数器行缺失
+    monkeypatch.setattr(repo, "_state", (None, 10, "c", "u"))
+    repo._sync_version((None, 10, "c", "u"), (None, 11, "c2", "u"))
+    assert repo._state is None
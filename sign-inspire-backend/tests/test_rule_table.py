@@ -0,0 +1,63 @@
+"""共享规则表：pack_rules -> RuleTable 往返一致，映射区求值与 rule_evaluator 一致"""
+import random
+
+import pytest
+
+from app.services.rule_evaluator import compile_rules, rules_for_store, select_target
+from app.services.rule_table import RuleTable, pack_rules
+
+from tests.helpers import normalize, random_condition, random_context, to_match_context
+
+STORES = ["store_a", "store_b", "*", "", "template:default", "template:promo"]
+
+
+def random_rules(rnd: random.Random, n: int) -> list:
+    return [
+        {
+            "id": f"r{i}",
+            "store_id": rnd.choice(STORES),
+            "priority": rnd.randint(1, 5),
+            "conditions": [random_condition(rnd) for _ in range(rnd.randint(0, 3))],
+            "action": {"target_id": rnd.choice(["coffee", "tea", "soup", "冰淇淋"]), "message": rnd.choice([None, "欢迎"])},
+        }
+        for i in range(n)
+    ]
+
+
+def test_pack_unpack_round_trip():
+    compiled = compile_rules(random_rules(random.Random(7), 200), normalize)
+    table = RuleTable(pack_rules(compiled, version=42))
+    assert table.version == 42
+    assert table.n_rules == len(compiled)
+    assert table.compiled_rules() == compiled
+
+
+def test_compiled_rules_for_store_matches_evaluator_scope():
+    compiled = compile_rules(random_rules(random.Random(8), 120), normalize)
+    table = RuleTable(pack_rules(compiled, version=1))
+    disabled = {r["id"] for r in compiled if r["store_id"] == "template:default"}
+    disabled = set(sorted(disabled)[: len(disabled) // 2])
+    for store_id in ("store_a", "store_b", "unknown"):
+        for scope, masked in ((None, set()), ("template:default", disabled), ("template:promo", set())):
+            expected = rules_for_store(compiled, store_id, scope, masked)
+            assert table.compiled_rules(store_id, scope, masked) == expected
+
+
+def test_select_target_matches_evaluator():
+    rnd = random.Random(9)
+    compiled = compile_rules(random_rules(rnd, 150), normalize)
+    table = RuleTable(pack_rules(compiled, version=1))
+    for _ in range(500):
+        store_id = rnd.choice(["store_a", "store_b", "unknown"])
+        scope = rnd.choice([None, "template:default"])
+        ctx = to_match_context(random_context(rnd))
+        expected = select_target(rules_for_store(compiled, store_id, scope), ctx)
+        assert table.select_target(store_id, ctx, scope) == expected
+
+
+def test_empty_table_and_bad_magic():
+    table = RuleTable(pack_rules([], version=3))
+    assert table.compiled_rules() == []
+    assert table.select_target("store_a", to_match_context(random_context(random.Random(1)))) == "default"
+    with pytest.raises(ValueError):
+        RuleTable(b"XXXX" + pack_rules([], version=3)[4:])
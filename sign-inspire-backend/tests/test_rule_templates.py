@@ -0,0 +1,126 @@
+"""共享规则模板：按作用域分组求值与逐店筛选一致、门店继承 / 覆盖 / 屏蔽模板规则、重置与无种子模板的重置拒绝"""
+import asyncio
+import random
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.v1.endpoints import rules as rules_api
+from app.database import DEFAULT_RULES
+from app.models import rule_storage
+from app.models.rule_storage import MemoryRuleStore
+from app.schemas.rule import RuleUpdate
+from app.services import rule_templates, scheduler_service
+from app.services.matching_engine import match_content_for_store
+from app.services.rule_evaluator import ScopedRules, rule_order_key, rules_for_store
+
+DEFAULT_SCOPE = rule_templates.template_scope(rule_templates.DEFAULT_TEMPLATE)
+
+
+def test_scoped_rules_match_per_store_filter():
+    rnd = random.Random(7)
+    scopes = ["", "*", "s1", "s2", "template:a", "template:b"]
+    compiled = sorted(
+        ({"id": f"r{i:02d}", "store_id": rnd.choice(scopes), "priority": rnd.randint(0, 3)} for i in range(60)),
+        key=rule_order_key,
+    )
+    scoped = ScopedRules(compiled)
+    template_ids = [r["id"] for r in compiled if r["store_id"] == "template:a"]
+    for store_id in ("s1", "s2", "s3"):
+        for template in (None, "template:a", "template:b"):
+            for disabled in (frozenset(), frozenset(template_ids[:2])):
+                assert scoped.for_store(store_id, template, disabled) == rules_for_store(compiled, store_id, template, disabled)
+    # 无自有规则、无屏蔽的门店共用同一个合并结果
+    assert scoped.for_store("s3", "template:a") is scoped.for_store("s4", "template:a")
+
+
+@pytest.fixture
+def memory(monkeypatch):
+    """内存模式：空规则表、空订阅，规则检查只计数"""
+    store = MemoryRuleStore()
+    ticks = []
+
+    async def check_rules_job():
+        ticks.append(1)
+
+    monkeypatch.setattr(rule_storage, "MOCK_DB", store)
+    monkeypatch.setattr(rules_api, "MOCK_DB", store)
+    monkeypatch.setattr(rule_templates, "_MEMORY_SUBSCRIPTIONS", {})
+    monkeypatch.setattr(scheduler_service, "check_rules_job", check_rules_job)
+    return store
+
+
+def _run(coro):
+    async def main():
+        result = await coro
+        await asyncio.sleep(0)
+        return result
+    return asyncio.run(main())
+
+
+def _list(store_id):
+    return _run(rules_api.get_rules(store_id, limit=None, cursor=None, db=None))
+
+
+def test_stores_inherit_override_and_mask_template_rules(memory):
+    for store_id in ("store_001", "store_002"):
+        _run(rules_api.reset_rules(store_id, db=None))
+    # 默认规则只写一份（模板），两家门店按引用继承
+    assert memory.store_ids() == [DEFAULT_SCOPE] and len(memory) == len(DEFAULT_RULES)
+    assert rule_templates.list_templates(memory) == [
+        {"name": "default", "store_id": DEFAULT_SCOPE, "rule_count": len(DEFAULT_RULES)}]
+    inherited = _list("store_001")
+    assert len(inherited) == len(DEFAULT_RULES) and {r["template"] for r in inherited} == {"default"}
+    first, second = inherited[0], inherited[1]
+
+    # 修改继承规则：复制为门店自有规则并屏蔽原规则，模板与其他门店不变
+    copy = _run(rules_api.update_rule("store_001", first["id"], RuleUpdate(priority=99), db=None))
+    assert copy["id"] != first["id"] and copy["store_id"] == "store_001" and copy["priority"] == 99
+    assert memory.get_rule(first["id"], DEFAULT_SCOPE)["priority"] == first["priority"]
+    listed = _list("store_001")
+    assert listed[0]["id"] == copy["id"] and "template" not in listed[0]
+    assert first["id"] not in {r["id"] for r in listed} and len(listed) == len(DEFAULT_RULES)
+
+    # 删除继承规则 = 屏蔽
+    assert _run(rules_api.delete_rule("store_001", second["id"], db=None))["deleted_id"] == second["id"]
+    assert rule_templates.memory_subscription("store_001") == ("default", frozenset({first["id"], second["id"]}))
+    assert len(memory) == len(DEFAULT_RULES) + 1
+    assert len(_list("store_002")) == len(DEFAULT_RULES)
+    with pytest.raises(HTTPException) as exc:
+        _run(rules_api.delete_rule("store_001", second["id"], db=None))
+    assert exc.value.status_code == 404
+
+    # 重置：清空自有规则与屏蔽列表，恢复为完整继承
+    _run(rules_api.reset_rules("store_001", db=None))
+    assert rule_templates.memory_subscription("store_001") == ("default", frozenset())
+    assert [r["id"] for r in _list("store_001")] == [r["id"] for r in inherited]
+
+
+def test_reset_of_template_without_seed_is_rejected(memory):
+    _run(rules_api.reset_rules("store_001", db=None))
+    memory.add_rule({"id": "t1", "store_id": "template:promo", "name": "促销", "priority": 5,
+                     "conditions": [], "action": {"type": "switch_playlist", "target_id": "promo"},
+                     "content_hash": "h1"})
+    with pytest.raises(HTTPException) as exc:
+        _run(rules_api.reset_rules("template:promo", db=None))
+    assert exc.value.status_code == 409
+    assert memory.store_rule_count("template:promo") == 1
+    # default 模板可重置：恢复为种子规则
+    _run(rules_api.reset_rules(DEFAULT_SCOPE, db=None))
+    assert memory.store_rule_count(DEFAULT_SCOPE) == len(DEFAULT_RULES)
+
+
+def test_matching_honours_subscription_and_mask(memory):
+    rule = {"id": "t1", "store_id": DEFAULT_SCOPE, "name": "雨天", "priority": 5,
+            "conditions": [{"type": "weather", "operator": "==", "value": "rain"}],
+            "action": {"type": "switch_playlist", "target_id": "soup"}}
+
+    def match(**store):
+        return match_content_for_store("store_001", {"id": "store_001", **store}, [rule], "rain", "Adelaide")
+
+    assert match(rule_template="default") == "soup"
+    assert match(rule_template="default", disabled_rules=["t1"]) == "default"
+    assert match(rule_template=None) == "default"
+    # 兜底门店字典不含订阅字段时读内存订阅
+    rule_templates.subscribe_in_memory("store_001", "default")
+    assert match() == "soup"
@@ -0,0 +1,117 @@
+"""规则批量导入 / 导出：按行解析与校验、去重、分批写入（内存与 SQLite 两种模式），导出可直接再导入"""
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import database
+from app.models import rule_storage
+from app.models.rule_condition_model import RuleCondition
+from app.models.rule_model import RULES_VERSION_ROW, Rule, RulesVersion
+from app.models.rule_storage import MemoryRuleStore
+from app.services import rule_repository, rule_transfer_service as transfer, scheduler_service
+
+
+def line(store_id, value, target="hot_soup", **extra):
+    return json.dumps({"store_id": store_id, "name": value, "priority": 2,
+                       "conditions": [{"type": "weather", "operator": "==", "value": value}],
+                       "action": {"type": "switch_playlist", "target_id": target}, **extra}, ensure_ascii=False)
+
+
+BODY = "\n".join([
+    line("s1", "雨"),
+    "",
+    line("s1", "雨", id="ignored"),               # 与第 1 行内容相同
+    "{not json",
+    line("s2", "雨"),                             # 不同门店不算重复
+    json.dumps({"store_id": "s1", "name": "缺条件"}),
+    line("s1", "雪"),
+]).encode()
+
+
+def chunks(data: bytes, size: int):
+    async def gen():
+        for i in range(0, len(data), size):
+            yield data[i:i + size]
+    return gen()
+
+
+@pytest.fixture
+def memory(monkeypatch):
+    store = MemoryRuleStore()
+    ticks = []
+
+    async def check_rules_job():
+        ticks.append(1)
+
+    monkeypatch.setattr(rule_storage, "MOCK_DB", store)
+    monkeypatch.setattr(scheduler_service, "check_rules_job", check_rules_job)
+    monkeypatch.setattr(database, "USE_DATABASE", False)
+    monkeypatch.setattr(transfer, "IMPORT_BATCH_SIZE", 2)
+    return store, ticks
+
+
+def test_iter_lines_across_chunk_boundaries():
+    async def collect(size):
+        return [item async for item in transfer._iter_lines(chunks(b"a\n\nbb\r\nccc", size))]
+    for size in (1, 2, 5, 100):
+        assert asyncio.run(collect(size)) == [(1, "a"), (3, "bb\r"), (4, "ccc")]
+
+
+def test_import_to_memory_and_export_round_trip(memory):
+    store, ticks = memory
+
+    async def main():
+        result = await transfer.import_rules(chunks(BODY, 7))
+        await asyncio.sleep(0)
+        return result
+
+    result = asyncio.run(main())
+    assert (result["imported"], result["duplicates"], result["failed"], result["stores"]) == (3, 1, 2, 2)
+    assert [e["line"] for e in result["errors"]] == [4, 6]
+    assert len(store) == 3 and ticks == [1]
+
+    async def export():
+        return [json.loads(row) async for row in transfer.export_rules("s1")]
+
+    exported = asyncio.run(export())
+    # 导出按分页顺序（优先级、id）；id 随机生成，这里只比较内容
+    assert sorted((r["store_id"], r["name"]) for r in exported) == sorted((r["store_id"], r["name"]) for r in store.rules_for_stores(["s1"]))
+    # 导出结果再导入：全部视为重复
+    again = asyncio.run(transfer.import_rules(chunks("\n".join(json.dumps(r) for r in exported).encode(), 50)))
+    assert (again["imported"], again["duplicates"]) == (0, 2)
+
+
+def test_import_to_sqlite_writes_conditions_and_bumps_version(memory, tmp_path, monkeypatch):
+    path = tmp_path / "rules.db"
+    engine = create_engine(f"sqlite:///{path}")
+    for model in (Rule, RuleCondition, RulesVersion):
+        model.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(RulesVersion.__table__.insert().values(id=RULES_VERSION_ROW, version=0))
+    engine.dispose()
+    for name, value in (("_BY_ID", {}), ("_BY_STORE", {}), ("_BY_CONTENT", {}), ("_page_order", {}),
+                        ("_sorted", None), ("_state", None), ("_loaded", False), ("_last_check", 0.0), ("_lock", None)):
+        monkeypatch.setattr(rule_repository, name, value)
+
+    async def main():
+        aengine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        try:
+            async with async_sessionmaker(aengine, expire_on_commit=False, autoflush=False)() as db:
+                result = await transfer.import_rules(chunks(BODY, 7), db)
+                counts = [(await db.execute(stmt)).scalar() for stmt in (
+                    select(func.count(Rule.id)), select(func.count(RuleCondition.id)), select(RulesVersion.version),
+                )]
+                return result, counts
+        finally:
+            await aengine.dispose()
+
+    result, (rules, conditions, version) = asyncio.run(main())
+    assert (result["imported"], result["duplicates"], result["failed"]) == (3, 1, 2)
+    # 每批一个事务、每批递增一次版本号（批大小 2：两批）
+    assert (rules, conditions, version) == (3, 3, 2)
+    # 批量插入绕过写穿透：导入后规则仓库已重载
+    assert len(rule_repository.rules_for_stores(["s1", "s2"])) == 3
+    assert rule_repository.version() == 2
@@ -0,0 +1,151 @@
+"""多 worker 共享状态：变更日志裁剪后的全量同步、读取方重放与写入方一致、写入方接管"""
+import asyncio
+import os
+
+import pytest
+
+from app.services import matching_engine, scheduler_service, shared_state
+from app.services.playlist_state import PlaylistState
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LOG_SIZE = 5
+
+# 写入方依次得到的匹配结果（含门店移除）
+TICKS = [
+    {"a": "coffee", "b": "tea"},
+    {"a": "soup", "b": "tea"},
+    {"a": "soup", "b": "tea", "c": "pizza"},
+    {"a": "noodles", "c": "pizza"},
+    {"a": "noodles", "c": "bbq", "d": "sushi"},
+    {"a": "coffee", "b": "tea", "d": "sushi"},
+    {"a": "coffee", "b": "soup", "d": "congee"},
+]
+
+
+@pytest.fixture
+def shared(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_state, "SHARED_STATE_PATH", str(tmp_path / "state.db"))
+    monkeypatch.setattr(shared_state, "LOG_SIZE", LOG_SIZE)
+    monkeypatch.setattr(shared_state, "_conn", None)
+    monkeypatch.setattr(shared_state, "_lock_fd", None)
+    yield shared_state
+    shared_state.release_leadership()
+    if shared_state._conn is not None:
+        shared_state._conn.close()
+
+
+def _publish_tick(leader: PlaylistState, by_store) -> None:
+    """与 check_rules_job 一致：apply 后发布本次变更"""
+    changed = leader.apply(by_store)
+    entries = [(leader.generation, sid, by_store.get(sid)) for sid in changed]
+    shared_state.publish(leader.generation, entries, by_store.get("a", "default"), {"weather": "rain"})
+
+
+def _sync(follower: PlaylistState) -> None:
+    """与 sync_shared_state 一致：增量重放或全量替换"""
+    update = shared_state.read_since(follower.generation)
+    if update is None:
+        return
+    if "entries" in update:
+        follower.replay(update["entries"])
+    else:
+        follower.reset(update["generation"], *update["full"])
+
+
+def _assert_same(follower: PlaylistState, leader: PlaylistState) -> None:
+    assert follower.generation == leader.generation
+    assert dict(follower.snapshot()[1]) == dict(leader.snapshot()[1])
+    stores = {sid for tick in TICKS for sid in tick}
+    assert {s: follower.version(s) for s in stores} == {s: leader.version(s) for s in stores}
+
+
+def test_read_below_log_floor_returns_full(shared):
+    leader = PlaylistState()
+    for tick in TICKS:
+        _publish_tick(leader, tick)
+    assert leader.generation == len(TICKS)
+
+    # 共享日志只保留最近 LOG_SIZE 条，更早的 since 只能全量
+    update = shared.read_since(0)
+    assert "entries" not in update
+    targets, _ = update["full"]
+    assert targets == dict(leader.snapshot()[1])
+    assert update["generation"] == leader.generation
+    assert update["current_playlist"] == "coffee" and update["context"] == {"weather": "rain"}
+
+    # 日志范围内的 since 增量返回，且只有该代之后的变更
+    recent = shared.read_since(leader.generation - 1)
+    assert sorted(recent["entries"]) == [(leader.generation, "b", "soup"), (leader.generation, "d", "congee")]
+    assert shared.read_since(leader.generation) is None
+
+    follower = PlaylistState()
+    _sync(follower)
+    _assert_same(follower, leader)
+
+
+def test_follower_replay_matches_leader(shared):
+    leader, follower, late = PlaylistState(), PlaylistState(), PlaylistState()
+    for tick in TICKS:
+        _publish_tick(leader, tick)
+        # 每次 tick 后同步的副本逐条重放
+        _sync(follower)
+        _assert_same(follower, leader)
+    assert follower.changes_since(1) == leader.changes_since(1)
+    # 落后超出日志范围的副本全量同步后一致，之后继续增量
+    _sync(late)
+    _assert_same(late, leader)
+    _publish_tick(leader, {"a": "pizza", "b": "soup", "d": "congee"})
+    before = late.generation
+    _sync(late)
+    _assert_same(late, leader)
+    assert late.changes_since(before) == leader.changes_since(before)
+
+
+@pytest.mark.skipif(fcntl is None, reason="flock 不可用时每个进程都是写入方")
+def test_leader_takeover_continues_from_shared_state(shared, monkeypatch):
+    # 原写入方发布了若干代后退出
+    old_leader = PlaylistState()
+    for tick in TICKS[:4]:
+        _publish_tick(old_leader, tick)
+
+    # 原写入方仍持锁时本 worker 只同步
+    held = os.open(f"{shared.SHARED_STATE_PATH}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+    fcntl.flock(held, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    assert not shared.is_leader()
+
+    results = iter([TICKS[4]])
+
+    async def run_matching(*args, **kwargs):
+        return next(results)
+
+    async def weather_context(*args, **kwargs):
+        return {"weather": "sunny", "temp_c": 20.0, "hour": 12, "weekday": 0}
+
+    monkeypatch.setattr(matching_engine, "run_matching_for_all_stores", run_matching)
+    monkeypatch.setattr(scheduler_service, "get_weather_context", weather_context)
+    monkeypatch.setattr(scheduler_service, "PLAYLIST_STATE", PlaylistState())
+    monkeypatch.setattr(scheduler_service, "CURRENT_CONTEXT", dict(scheduler_service.CURRENT_CONTEXT))
+    monkeypatch.setattr(scheduler_service, "CURRENT_PLAYLIST", "default")
+    monkeypatch.setattr(scheduler_service, "_check_rules_lock", None)
+
+    asyncio.run(scheduler_service.check_rules_job())
+    _assert_same(scheduler_service.PLAYLIST_STATE, old_leader)
+    assert scheduler_service.CURRENT_CONTEXT["weather"] == "rain"
+
+    # 原写入方退出（内核释放锁）后接管：从共享状态的代数继续，不从 1 重新计数
+    os.close(held)
+    asyncio.run(scheduler_service.check_rules_job())
+    assert shared.is_leader()
+    # 参照：原写入方若继续运行会得到的状态
+    old_leader.apply(TICKS[4])
+    _assert_same(scheduler_service.PLAYLIST_STATE, old_leader)
+
+    # 其他读取方从共享状态看到接管后的发布
+    observer = PlaylistState()
+    _sync(observer)
+    _assert_same(observer, old_leader)
+    assert shared.read_since(old_leader.generation - 1)["context"]["weather"] == "sunny"
@@ -0,0 +1,78 @@
+"""屏幕索引：只索引有 sign_id 的活跃门店，写入时同步更新，库外修改由版本指纹发现后重建"""
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.models.store_model import Store
+from app.services import sign_index_service as index
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    path = tmp_path / "stores.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Store.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(Store.__table__.insert(), [
+            {"id": "s1", "name": "一号店", "city": "Adelaide", "sign_id": "sign_1", "is_active": True},
+            {"id": "s2", "name": "停用", "city": "Adelaide", "sign_id": "sign_2", "is_active": False},
+            {"id": "s3", "name": "无屏幕", "city": "Adelaide", "sign_id": None, "is_active": True},
+        ])
+    engine.dispose()
+    monkeypatch.setattr(index, "_SIGN_INDEX", {})
+    monkeypatch.setattr(index, "_SIGN_BY_STORE", {})
+    monkeypatch.setattr(index, "_index_version", None)
+    return f"sqlite+aiosqlite:///{path}"
+
+
+def _run(url, scenario):
+    async def main():
+        engine = create_async_engine(url)
+        try:
+            async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+                return await scenario(session)
+        finally:
+            await engine.dispose()
+    return asyncio.run(main())
+
+
+def test_rebuild_indexes_active_signs_only(db):
+    async def scenario(s):
+        assert await index.rebuild_sign_index(s)
+        # 无修改时版本检查不重建
+        assert not await index.refresh_sign_index_if_stale(s)
+    _run(db, scenario)
+    assert index.get_store_by_sign("sign_1")["id"] == "s1"
+    assert index.get_store("s1")["sign_id"] == "sign_1"
+    assert index.get_store_by_sign("sign_2") is None
+    assert index.get_store("s3") is None
+
+
+def test_out_of_band_change_triggers_rebuild(db):
+    async def scenario(s):
+        await index.rebuild_sign_index(s)
+        await s.execute(text("UPDATE stores SET is_active = 1, updated_at = '2099-01-01 00:00:00' WHERE id = 's2'"))
+        await s.commit()
+        return await index.refresh_sign_index_if_stale(s)
+    assert _run(db, scenario)
+    assert index.get_store_by_sign("sign_2")["id"] == "s2"
+
+
+def test_upsert_and_remove_keep_mappings_consistent(monkeypatch):
+    monkeypatch.setattr(index, "_SIGN_INDEX", {})
+    monkeypatch.setattr(index, "_SIGN_BY_STORE", {})
+    index.upsert_store({"id": "s1", "sign_id": "sign_a", "is_active": True})
+    # 换屏幕：旧 sign_id 失效
+    index.upsert_store({"id": "s1", "sign_id": "sign_b", "is_active": True})
+    assert index.get_store_by_sign("sign_a") is None
+    assert index.get_store_by_sign("sign_b")["id"] == "s1"
+    # 停用
+    index.upsert_store({"id": "s1", "sign_id": "sign_b", "is_active": False})
+    assert index.get_store_by_sign("sign_b") is None and index.get_store("s1") is None
+    # 删除门店不影响已改绑到其他门店的同一 sign_id
+    index.upsert_store({"id": "s1", "sign_id": "sign_c", "is_active": True})
+    index.upsert_store({"id": "s2", "sign_id": "sign_c", "is_active": True})
+    index.remove_store("s1")
+    assert index.get_store_by_sign("sign_c")["id"] == "s2"
@@ -0,0 +1,83 @@
+"""热重启快照：缓存与播放状态写入 JSON 后原样恢复，过期条目、超龄播放状态与未知格式不恢复"""
+import json
+from time import time
+
+import pytest
+
+from app.services import geocoding_service, recommendation_service, scheduler_service, snapshot_service
+from app.services.playlist_state import PlaylistState
+
+
+@pytest.fixture
+def process(tmp_path, monkeypatch):
+    """隔离的进程状态：全部缓存与播放状态换成空对象"""
+    def fresh():
+        monkeypatch.setattr(scheduler_service, "_WEATHER_CACHE", {})
+        monkeypatch.setattr(scheduler_service, "_FORECAST_CACHE", {})
+        monkeypatch.setattr(geocoding_service, "_GEO_CACHE", {})
+        monkeypatch.setattr(recommendation_service, "_REC_CACHE", {})
+        monkeypatch.setattr(scheduler_service, "PLAYLIST_STATE", PlaylistState())
+        monkeypatch.setattr(scheduler_service, "CURRENT_PLAYLIST", "default")
+        monkeypatch.setattr(scheduler_service, "CURRENT_CONTEXT", {"weather": "unknown"})
+    monkeypatch.setattr(snapshot_service, "SNAPSHOT_PATH", str(tmp_path / "snapshot.json"))
+    fresh()
+    return fresh
+
+
+def _populate():
+    now = time()
+    scheduler_service._WEATHER_CACHE[(-34.93, 138.6)] = {"weather": "rain", "temp_c": 12.0, "_ts": now}
+    scheduler_service._WEATHER_CACHE[(31.23, 121.47)] = {"weather": "sunny", "_ts": now - 3600}
+    scheduler_service._FORECAST_CACHE[(-34.93, 138.6, 48, "Australia/Adelaide")] = ([{"time": "t", "weather": "rain"}], now)
+    geocoding_service._GEO_CACHE["adelaide"] = ({"lat": -34.93, "lon": 138.6}, now)
+    recommendation_service._REC_CACHE["adelaide|coffee_ad"] = ({"stores": []}, now - 600)
+    state = scheduler_service.PLAYLIST_STATE
+    state.apply({"store_001": "coffee_ad", "store_002": "tea_ad"})
+    state.apply({"store_001": "soup_ad", "store_002": "tea_ad"})
+    scheduler_service.CURRENT_PLAYLIST = "soup_ad"
+    scheduler_service.CURRENT_CONTEXT["weather"] = "rain"
+
+
+def test_round_trip_restores_fresh_state(process):
+    _populate()
+    assert snapshot_service.save_snapshot()
+    with open(snapshot_service.SNAPSHOT_PATH, encoding="utf-8") as f:
+        assert json.load(f)["version"] == snapshot_service.SNAPSHOT_VERSION
+
+    process()
+    assert snapshot_service.load_snapshot()
+    # 元组键 / 元组值还原；超过各自 TTL 的条目丢弃
+    assert list(scheduler_service._WEATHER_CACHE) == [(-34.93, 138.6)]
+    assert scheduler_service._FORECAST_CACHE[(-34.93, 138.6, 48, "Australia/Adelaide")][0] == [{"time": "t", "weather": "rain"}]
+    assert isinstance(geocoding_service._GEO_CACHE["adelaide"], tuple)
+    assert recommendation_service._REC_CACHE == {}
+    state = scheduler_service.PLAYLIST_STATE
+    assert state.generation == 2 and dict(state.snapshot()[1]) == {"store_001": "soup_ad", "store_002": "tea_ad"}
+    assert (state.version("store_001"), state.version("store_002")) == (2, 1)
+    assert scheduler_service.CURRENT_PLAYLIST == "soup_ad" and scheduler_service.CURRENT_CONTEXT["weather"] == "rain"
+
+
+def test_stale_playlist_is_not_restored(process, monkeypatch):
+    _populate()
+    snapshot_service.save_snapshot()
+    process()
+    monkeypatch.setattr(snapshot_service, "PLAYLIST_MAX_AGE", 0)
+    assert not snapshot_service.load_snapshot()
+    assert scheduler_service.PLAYLIST_STATE.generation == 0
+    # 缓存仍按各自 TTL 恢复
+    assert (-34.93, 138.6) in scheduler_service._WEATHER_CACHE
+
+
+def test_unknown_or_broken_snapshot_is_ignored(process):
+    with open(snapshot_service.SNAPSHOT_PATH, "w", encoding="utf-8") as f:
+        json.dump({"version": snapshot_service.SNAPSHOT_VERSION - 1, "weather": []}, f)
+    assert not snapshot_service.load_snapshot()
+    with open(snapshot_service.SNAPSHOT_PATH, "w", encoding="utf-8") as f:
+        f.write("{not json")
+    assert not snapshot_service.load_snapshot()
+    assert scheduler_service._WEATHER_CACHE == {}
+
+
+def test_disabled_without_path(monkeypatch):
+    monkeypatch.setattr(snapshot_service, "SNAPSHOT_PATH", "")
+    assert not snapshot_service.save_snapshot() and not snapshot_service.load_snapshot()
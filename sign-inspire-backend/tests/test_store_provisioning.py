@@ -0,0 +1,151 @@
+"""门店批量开通：CSV / NDJSON 解析、城市去重批量地理编码、时区推断、分批插入与逐行错误、只为新门店增量重算"""
+import asyncio
+import json
+
+import httpx
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.models.rule_condition_model import RuleCondition
+from app.models.rule_model import RULES_VERSION_ROW, Rule, RulesVersion
+from app.models.store_model import Store
+from app.services import (
+    geocoding_service, rule_repository, scheduler_service, sign_index_service,
+    store_provisioning_service as provisioning,
+)
+from app.services.region_service import get_region_from_country
+
+DUNEDIN = [{"lat": "-45.87", "lon": "170.50", "boundingbox": ["-46", "-45.7", "170.3", "170.7"],
+            "display_name": "Dunedin, New Zealand", "address": {"country_code": "nz"}}]
+
+
+@pytest.fixture
+def nominatim(monkeypatch):
+    """Nominatim 换成本地 MockTransport：Dunedin 有结果，其余城市查无结果；记录请求的城市"""
+    queries = []
+
+    def handler(request):
+        city = request.url.params["q"]
+        queries.append(city)
+        return httpx.Response(200, json=DUNEDIN if city.lower() == "dunedin" else [])
+
+    real_client = httpx.Client
+    monkeypatch.setattr(geocoding_service.httpx, "Client",
+                        lambda **kw: real_client(transport=httpx.MockTransport(handler), **kw))
+    monkeypatch.setattr(geocoding_service, "_GEO_CACHE", {})
+    monkeypatch.setattr(geocoding_service, "GEOCODE_MIN_INTERVAL", 0)
+    return queries
+
+
+def test_parse_csv_and_ndjson():
+    csv_body = (
+        'name,city,latitude,longitude,sign_id,opening_hours\n'
+        'A,Adelaide,,,sign_a,"{""mon"": ""09:00-17:00""}"\n'
+        'B,Perth,,,,{broken\n'
+        ',Sydney,,,,\n'
+    ).encode()
+    items, errors = provisioning._parse(csv_body, "text/csv")
+    assert [(line, item.name, item.sign_id, item.opening_hours) for line, item in items] == [
+        (2, "A", "sign_a", {"mon": "09:00-17:00"})]
+    # 空单元格视为未填：第 4 行缺 name
+    assert [line for line, _ in errors] == [3, 4]
+
+    ndjson = b'{"name": "A", "city": "Tokyo"}\n\n{"city": "Tokyo"}\n{"name": "C", "latitude": 1, "longitude": 2}\n'
+    items, errors = provisioning._parse(ndjson, None)
+    assert [(line, item.name, item.city) for line, item in items] == [(1, "A", "Tokyo"), (4, "C", "Adelaide")]
+    assert [line for line, _ in errors] == [3]
+
+
+def test_geocode_cities_dedupes_and_caches(nominatim):
+    out = geocoding_service.geocode_cities(["Dunedin", " dunedin ", "Adelaide", "Atlantis", ""])
+    # 预设城市不请求；同名城市（大小写、空白不同）只请求一次
+    assert sorted(q.lower() for q in nominatim) == ["atlantis", "dunedin"]
+    assert set(out) == {"dunedin", "adelaide", "atlantis"}
+    assert out["dunedin"]["country_code"] == "NZ" and out["atlantis"] is None
+    assert out["adelaide"]["country_code"] == "AU"
+    geocoding_service.geocode_cities(["DUNEDIN"])
+    assert len(nominatim) == 2
+
+
+@pytest.mark.parametrize("city, cc, lon, lat, tz", [
+    ("Adelaide", "AU", 138.6, -34.9, "Australia/Adelaide"),
+    ("Darwin", "AU", 130.8, -12.5, "Australia/Darwin"),
+    ("Cairns", "AU", 145.8, -16.9, "Australia/Brisbane"),
+    ("Hobart", "AU", 147.3, -42.9, "Australia/Hobart"),
+    ("Dunedin", "NZ", 170.5, -45.9, "Pacific/Auckland"),
+    ("Denver", "US", -104.9, 39.7, "America/Denver"),
+    ("Vancouver", "CA", -123.1, 49.3, "America/Vancouver"),
+    ("Atlantis", None, 2.0, 1.0, None),
+])
+def test_derive_timezone(city, cc, lon, lat, tz):
+    assert geocoding_service.derive_timezone(city, cc, lon, lat) == tz
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    path = tmp_path / "stores.db"
+    engine = create_engine(f"sqlite:///{path}")
+    for model in (Store, Rule, RuleCondition, RulesVersion):
+        model.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(RulesVersion.__table__.insert().values(id=RULES_VERSION_ROW, version=0))
+        conn.execute(Store.__table__.insert().values(id="store_001", name="旧门店", city="Adelaide", sign_id="sign_taken"))
+    engine.dispose()
+    for name, value in (("_BY_ID", {}), ("_BY_STORE", {}), ("_BY_CONTENT", {}), ("_page_order", {}),
+                        ("_sorted", None), ("_state", None), ("_loaded", False), ("_last_check", 0.0), ("_lock", None)):
+        monkeypatch.setattr(rule_repository, name, value)
+    return f"sqlite+aiosqlite:///{path}"
+
+
+def test_provision_stores(database, nominatim, monkeypatch):
+    rebuilt, rematched = [], []
+
+    async def rebuild_sign_index(db=None):
+        rebuilt.append(1)
+        return True
+
+    async def rematch_stores(store_ids):
+        rematched.append(list(store_ids))
+        return []
+
+    monkeypatch.setattr(sign_index_service, "rebuild_sign_index", rebuild_sign_index)
+    monkeypatch.setattr(scheduler_service, "rematch_stores", rematch_stores)
+    monkeypatch.setattr(provisioning, "INSERT_BATCH_SIZE", 2)
+    body = "\n".join([
+        json.dumps({"name": "沪店", "city": "Shanghai"}),
+        json.dumps({"name": "B", "city": "adelaide", "sign_id": "sign_taken"}),   # 与已有门店冲突
+        json.dumps({"name": "C", "city": "Atlantis"}),                           # 无法解析且无经纬度
+        json.dumps({"name": "D", "city": "Atlantis", "latitude": 1, "longitude": 2}),
+        "{not json",
+        json.dumps({"name": "E", "city": "Dunedin", "sign_id": "sign_e"}),
+        json.dumps({"name": "F", "city": "Tokyo", "sign_id": "sign_e"}),         # 与本次上传内其他行冲突
+        json.dumps({"name": "G", "city": "Perth", "rule_template": "nope"}),     # 模板不存在
+    ]).encode()
+
+    async def main():
+        engine = create_async_engine(database)
+        try:
+            async with async_sessionmaker(engine, expire_on_commit=False, autoflush=False)() as db:
+                result = await provisioning.provision_stores(body, "application/x-ndjson", db)
+                await asyncio.sleep(0)
+                rows = (await db.execute(select(Store).where(Store.id != "store_001"))).scalars().all()
+                return result, {row.name: row.to_dict() for row in rows}
+        finally:
+            await engine.dispose()
+
+    result, stores = asyncio.run(main())
+    assert (result["created"], result["failed"]) == (3, 5)
+    assert sorted(e["line"] for e in result["errors"]) == [2, 3, 5, 7, 8]
+    assert set(stores) == {"沪店", "D", "E"} and sorted(result["store_ids"]) == sorted(s["id"] for s in stores.values())
+    # 城市去重：Atlantis、Dunedin 各请求一次，预设城市不请求
+    assert sorted(nominatim) == ["Atlantis", "Dunedin"]
+
+    sh = stores["沪店"]
+    assert sh["sign_id"] == f"sign_{sh['id']}" and sh["id"].startswith("store_")
+    assert (sh["country_code"], sh["timezone"], sh["china_subregion"]) == ("CN", "Asia/Shanghai", "east_china")
+    assert sh["region"] == get_region_from_country("CN")
+    assert (stores["E"]["sign_id"], stores["E"]["timezone"], stores["E"]["latitude"]) == ("sign_e", "Pacific/Auckland", -45.87)
+    assert (stores["D"]["timezone"], stores["D"]["country_code"]) == (provisioning.DEFAULT_TIMEZONE, None)
+    # sign 索引重建一次，只为新门店增量重算一次
+    assert rebuilt == [1] and [sorted(ids) for ids in rematched] == [sorted(result["store_ids"])]
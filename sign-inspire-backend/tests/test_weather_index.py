@@ -0,0 +1,76 @@
+"""天气别名索引：与逐项查找的旧实现结果一致；词汇表变化后重建索引并清空查询记忆"""
+import pytest
+
+from app.services import scheduler_service, vocabulary_service
+from app.services.scheduler_service import WEATHER_MAP, normalize_weather_value
+
+# 动态词汇：大小写不同的关键词、与标准值同名的关键词、覆盖内置词
+VOCAB = {
+    "Drizzle": "rain", "毛毛雨": "rain", "霾": "fog", "fog": "storm",
+    "阴": "rain", "暴雪": "snow", "Hail": "hail", "hail": "storm", "SUNNY": "cloudy",
+}
+INPUTS = [
+    "晴", "晴天", "Sunny", "SUNNY", "sunny", " fog ", "Fog", "Rain", "rain", "drizzle", "Drizzle",
+    "毛毛雨", "霾", "cloudy", "多云", "阴", "snow", "暴雪", "Hail", "hail ", "storm", "雷雨",
+    "x", "", "风", "HAIL", "Storm",
+]
+
+
+def old_normalize(value: str) -> set:
+    """按关键词逐项查找的原实现（参照）"""
+    value_lower = value.lower().strip()
+    vocab = vocabulary_service.get_weather_mappings()
+    if value_lower in vocab:
+        return {vocab[value_lower]}
+    for kw, eng_value in vocab.items():
+        if kw.lower() == value_lower or value_lower == eng_value:
+            return {eng_value}
+    for eng_value, aliases in WEATHER_MAP.items():
+        if value_lower == eng_value:
+            return {eng_value}
+        for alias in aliases:
+            if value_lower == alias.lower():
+                return {eng_value}
+    return set()
+
+
+@pytest.fixture(autouse=True)
+def vocab(monkeypatch):
+    monkeypatch.setattr(vocabulary_service, "_vocab_cache", {"weather": {}, "action": {}})
+    monkeypatch.setattr(vocabulary_service, "_matchers", {})
+    monkeypatch.setattr(vocabulary_service, "_vocab_version", 0)
+    monkeypatch.setattr(scheduler_service, "_WEATHER_INDEX", scheduler_service._WEATHER_INDEX)
+    monkeypatch.setattr(scheduler_service, "_weather_index_version", None)
+    yield
+    scheduler_service._lookup_weather.cache_clear()
+
+
+def test_index_matches_old_lookup_with_vocabulary():
+    assert {v: normalize_weather_value(v) for v in INPUTS} == {v: frozenset(old_normalize(v)) for v in INPUTS}
+    for keyword, value in VOCAB.items():
+        vocabulary_service.add_mapping("weather", keyword, value)
+        assert {v: normalize_weather_value(v) for v in INPUTS} == {v: frozenset(old_normalize(v)) for v in INPUTS}
+
+
+def test_add_mapping_bumps_version_and_clears_memo():
+    assert normalize_weather_value("毛毛雨") == frozenset()
+    assert normalize_weather_value("阴") == {"cloudy"}
+    assert scheduler_service._lookup_weather.cache_info().currsize == 2
+    version = vocabulary_service.vocabulary_version()
+
+    vocabulary_service.add_mapping("weather", "毛毛雨", "rain")
+    vocabulary_service.add_mapping("weather", "阴", "rain")
+    assert vocabulary_service.vocabulary_version() == version + 2
+    # 缓存的旧结果（未命中 / 旧映射）不再返回
+    assert normalize_weather_value("毛毛雨") == {"rain"}
+    assert normalize_weather_value("阴") == {"rain"}
+    assert scheduler_service._weather_index_version == vocabulary_service.vocabulary_version()
+    assert scheduler_service._lookup_weather.cache_info().currsize == 2
+
+
+def test_results_are_shared_frozensets():
+    rain = normalize_weather_value("雨")
+    assert isinstance(rain, frozenset)
+    assert normalize_weather_value("下雨") is rain and normalize_weather_value("RAIN") is rain
+    with pytest.raises(AttributeError):
+        rain.add("snow")
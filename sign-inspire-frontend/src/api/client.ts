@@ -1,5 +1,6 @@
 import axios from 'axios';
 import { config } from '../config';
+import type { SignBundle } from '../types';
 
 const api = axios.create({
   baseURL: config.apiBaseUrl,
@@ -49,6 +50,27 @@ export const getCurrentContentByStore = (storeId: string) =>
   api.get<{ content: string }>(`/stores/${storeId}/current-content`);
 export const getCurrentContentBySign = (signId: string) =>
   api.get<{ content: string; store_id?: string }>(`/signs/${signId}/current-content`);
+/**
+ * 屏幕 edge bundle（已编译规则 + 逐小时预报 + 营业时间 + 媒体 URL），Player 本地求值
+ * 传入当前 version 时带 If-None-Match，未变化返回 304（data 为空）
+ */
+export const getSignBundle = (signId: string, version?: string | null) =>
+  api.get<SignBundle>(`/signs/${signId}/bundle`, {
+    headers: version ? { 'If-None-Match': `"${version}"` } : {},
+    validateStatus: (status) => status === 200 || status === 304,
+  });
+/** 批量获取当前内容（同一快照），一次请求替代逐店轮询 */
+export const getCurrentContentBatch = (ids: { store_ids?: string[]; sign_ids?: string[] }) =>
+  api.post<{
+    generation: number;
+    items: Array<{
+      store_id: string | null;
+      sign_id?: string;
+      content: string;
+      version: number;
+      media_url?: string;
+    }>;
+  }>('/current-content:batch', ids);
 
 // 推荐门店（基于当前天气+规则，支持城市名或用户定位 lat,lon；target_id 指定品类时按该品类推荐）
 export const getRecommendations = (
@@ -76,4 +98,35 @@ export const getRecommendations = (
   }>('/recommendations', {
     params: { limit, city, ...(lat != null && lon != null ? { lat, lon } : {}), ...(targetId ? { target_id: targetId } : {}) },
     timeout: 45000, // 门店推送合并多端 API，适当延长
+  });
+
+// Player 城市模式轮播：推荐 + 门店照片 + 品类图一次返回（替代 /recommendations + 逐个 /media 请求）
+export const getPlayerSlides = (
+  limit = 15,
+  city = 'Adelaide',
+  lat?: number,
+  lon?: number,
+  targetId?: string
+) =>
+  api.get<{
+    weather: string;
+    target_id: string;
+    category_label: string;
+    category_image_url?: string | null;
+    push_message?: string | null;
+    stores: Array<{
+      name: string;
+      address: string;
+      latitude?: number;
+      longitude?: number;
+      type?: string;
+      photos?: string[];
+      google_maps_uri?: string;
+    }>;
+    slides: string[];
+    message: string;
+    city?: string;
+  }>('/player/slides', {
+    params: { limit, city, ...(lat != null && lon != null ? { lat, lon } : {}), ...(targetId ? { target_id: targetId } : {}) },
+    timeout: 45000,
   });
\ No newline at end of file
@@ -3,7 +3,9 @@ import { Link, useSearchParams } from 'react-router-dom';
 import axios from 'axios';
 import { Home } from 'lucide-react';
 import { config } from '../config';
-import { getRecommendations } from '../api/client';
+import { getPlayerSlides, getSignBundle } from '../api/client';
+import { selectBundleContent } from '../lib/ruleEvaluator';
+import type { SignBundle } from '../types';
 
 const API_BASE = config.apiBaseUrl;
 
@@ -12,6 +14,8 @@ const PLACEHOLDER =
 
 const SLIDE_INTERVAL_MS = 8000;
 const REFRESH_INTERVAL_MS = 5 * 60 * 1000;
+// 屏幕模式：bundle 复查间隔（带 If-None-Match，未变化时 304）
+const BUNDLE_REFRESH_INTERVAL_MS = 5 * 60 * 1000;
 
 function Player() {
   const [searchParams] = useSearchParams();
@@ -31,46 +35,16 @@ function Player() {
 
   const intervalRef = useRef<ReturnType<typeof setInterval> | null>(null);
 
-  // 获取 target_id 对应的品类图片（商家无图时兜底）
-  const fetchCategoryImage = useCallback(async (targetId: string): Promise<string> => {
-    try {
-      const res = await axios.get<{ url: string }>(
-        `${API_BASE}/stores/${storeId}/media/${encodeURIComponent(targetId)}`
-      );
-      return res.data?.url || '';
-    } catch {
-      return '';
-    }
-  }, [storeId]);
-
-  // 城市模式：根据天气规则获取推荐门店，收集所有商家照片轮播
+  // 城市模式：一次请求获取轮播图（商家照片优先，服务端已兜底品类图）
   const fetchCitySlides = useCallback(async () => {
     setLoading(true);
     setError(null);
     try {
       const res = userLocation
-        ? await getRecommendations(15, city, userLocation.lat, userLocation.lon, targetIdParam || undefined)
-        : await getRecommendations(15, city, undefined, undefined, targetIdParam || undefined);
-      const data = res.data;
-
-      let urls: string[] = [];
-      for (const store of data.stores || []) {
-        const photos = store.photos || [];
-        if (photos.length > 0) {
-          urls = urls.concat(photos);
-        }
-      }
-
-      if (urls.length === 0 && data.target_id) {
-        const catUrl = await fetchCategoryImage(data.target_id);
-        if (catUrl) urls = [catUrl];
-      }
-      if (urls.length === 0) {
-        urls = [await fetchCategoryImage('coffee_ad')].filter(Boolean);
-      }
-      if (urls.length === 0) urls = [PLACEHOLDER];
-
-      setSlides(urls);
+        ? await getPlayerSlides(15, city, userLocation.lat, userLocation.lon, targetIdParam || undefined)
+        : await getPlayerSlides(15, city, undefined, undefined, targetIdParam || undefined);
+      const urls = res.data.slides || [];
+      setSlides(urls.length > 0 ? urls : [PLACEHOLDER]);
       setCurrentIndex(0);
     } catch (e) {
       console.error('获取推荐失败:', e);
@@ -79,12 +53,26 @@ function Player() {
     } finally {
       setLoading(false);
     }
-  }, [city, userLocation, targetIdParam, fetchCategoryImage]);
+  }, [city, userLocation, targetIdParam]);
 
-  // 门店/屏幕模式：沿用原有逻辑
+  // 门店/屏幕模式：屏幕（sign）有 bundle 时本地求值，否则轮询服务端当前内容
   const [storeContent, setStoreContent] = useState<string>('default');
   const [storeImageUrl, setStoreImageUrl] = useState<string>(PLACEHOLDER);
   const storeContentRef = useRef<string>('default');
+  const [bundle, setBundle] = useState<SignBundle | null>(null);
+
+  const showContent = useCallback(async (content: string, mediaUrl?: string) => {
+    if (content === storeContentRef.current) return;
+    storeContentRef.current = content;
+    if (!mediaUrl) {
+      const mediaRes = await axios.get<{ url: string }>(
+        `${API_BASE}/stores/${storeId}/media/${encodeURIComponent(content)}`
+      );
+      mediaUrl = mediaRes.data?.url;
+    }
+    setStoreImageUrl(mediaUrl || PLACEHOLDER);
+    setStoreContent(content);
+  }, [storeId]);
 
   const fetchStoreContent = useCallback(async () => {
     try {
@@ -92,19 +80,39 @@ function Player() {
         ? `${API_BASE}/signs/${signId}/current-content`
         : `${API_BASE}/stores/${storeId}/current-content`;
       const res = await axios.get<{ content: string }>(url);
-      const content = res.data?.content || 'default';
-      if (content !== storeContentRef.current) {
-        storeContentRef.current = content;
-        const mediaRes = await axios.get<{ url: string }>(
-          `${API_BASE}/stores/${storeId}/media/${encodeURIComponent(content)}`
-        );
-        setStoreImageUrl(mediaRes.data?.url || PLACEHOLDER);
-        setStoreContent(content);
+      await showContent(res.data?.content || 'default');
+    } catch (e) {
+      console.error('获取门店内容失败:', e);
+    }
+  }, [storeId, signId, showContent]);
+
+  // 仅在 version 变化时重新下载 bundle（304 时保留当前 bundle）
+  const bundleVersionRef = useRef<string | null>(null);
+  const fetchBundle = useCallback(async () => {
+    try {
+      const res = await getSignBundle(signId, bundleVersionRef.current);
+      if (res.status === 200) {
+        bundleVersionRef.current = res.data.version;
+        setBundle(res.data);
       }
+    } catch (e) {
+      console.error('获取 bundle 失败:', e);
+    }
+  }, [signId]);
+
+  // 本地求值；bundle 不可用或预报不覆盖当前小时时回退到服务端
+  const tickStoreContent = useCallback(async () => {
+    const local = bundle ? selectBundleContent(bundle) : null;
+    if (local === null) {
+      await fetchStoreContent();
+      return;
+    }
+    try {
+      await showContent(local, bundle?.media[local]);
     } catch (e) {
       console.error('获取门店内容失败:', e);
     }
-  }, [storeId, signId]);
+  }, [bundle, fetchStoreContent, showContent]);
 
   useEffect(() => {
     if (cityParam) setCity(cityParam);
@@ -128,13 +136,20 @@ function Player() {
     }
   }, [signId, searchParams]);
 
+  useEffect(() => {
+    if (mode !== 'store' || !signId) return;
+    fetchBundle();
+    const t = setInterval(fetchBundle, BUNDLE_REFRESH_INTERVAL_MS);
+    return () => clearInterval(t);
+  }, [mode, signId, fetchBundle]);
+
   useEffect(() => {
     if (mode === 'store') {
-      fetchStoreContent();
-      const t = setInterval(fetchStoreContent, 2000);
+      tickStoreContent();
+      const t = setInterval(tickStoreContent, 2000);
       return () => clearInterval(t);
     }
-  }, [mode, fetchStoreContent]);
+  }, [mode, tickStoreContent]);
 
   useEffect(() => {
     if (mode === 'city') {
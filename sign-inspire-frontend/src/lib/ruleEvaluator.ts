@@ -0,0 +1,121 @@
+/**
+ * 屏幕端规则求值：对 /signs/{sign_id}/bundle 下发的已编译规则本地求值选择内容
+ * 语义与后端 app/services/rule_evaluator.py 一致（evaluate_conditions / select_target / is_open_at）
+ */
+import type { CompiledCondition, CompiledRule, SignBundle } from '../types';
+
+const DAY_KEYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun'];
+
+export interface MatchContext {
+  weather: Set<string>; // 标准化天气值集合
+  city: string;
+  temp_c: number | null;
+  region: string;
+  hour: number | null;
+  weekday: number | null; // 0=周一 .. 6=周日
+  china_subregion: string | null;
+  solar_terms: string[];
+}
+
+/** 编译后的条件全部满足返回 true */
+export function evaluateConditions(conditions: CompiledCondition[], ctx: MatchContext): boolean {
+  for (const cond of conditions) {
+    switch (cond.type) {
+      case 'weather':
+        if (!cond.any.some((v) => ctx.weather.has(v))) return false;
+        break;
+      case 'city':
+        if (cond.eq !== (ctx.city || '').toLowerCase()) return false;
+        break;
+      case 'region':
+        if (cond.eq !== (ctx.region || '').toLowerCase()) return false;
+        break;
+      case 'temp':
+      case 'time': {
+        // 上下文缺失该值时跳过
+        const current = cond.type === 'temp' ? ctx.temp_c : ctx.hour;
+        if (current != null && !(cond.range[0] <= current && current <= cond.range[1])) return false;
+        break;
+      }
+      case 'day':
+        if (ctx.weekday != null && !cond.days.includes(ctx.weekday)) return false;
+        break;
+      case 'china_region': {
+        const sub = ctx.china_subregion;
+        if (!sub || (cond.eq && cond.eq !== sub.toLowerCase())) return false;
+        break;
+      }
+      case 'solar_term':
+        if (!ctx.solar_terms.length || (cond.eq && !ctx.solar_terms.includes(cond.eq))) return false;
+        break;
+    }
+  }
+  return true;
+}
+
+/** 按优先级返回第一条命中规则的 target_id，均未命中返回 "default"（规则需已排序） */
+export function selectTarget(rules: CompiledRule[], ctx: MatchContext): string {
+  for (const rule of rules) {
+    if (evaluateConditions(rule.conditions, ctx)) return rule.target_id;
+  }
+  return 'default';
+}
+
+/** 营业判断：未配置或格式异常时视为营业中 */
+export function isOpenAt(openingHours: Record<string, string> | null | undefined, weekday: number, hhmm: string): boolean {
+  if (!openingHours) return true;
+  const dayKey = DAY_KEYS[weekday];
+  const hours = openingHours[dayKey] || openingHours[dayKey[0].toUpperCase() + dayKey.slice(1)];
+  if (!hours) return true;
+  const parts = hours.split('-');
+  if (parts.length !== 2) return true;
+  return parts[0].trim() <= hhmm && hhmm <= parts[1].trim();
+}
+
+/** now 在门店时区的本地时间：日期、小时、"HH:MM"、星期（0=周一） */
+function localTime(now: Date, timeZone: string) {
+  const parts = Object.fromEntries(
+    new Intl.DateTimeFormat('en-US', {
+      timeZone,
+      year: 'numeric',
+      month: '2-digit',
+      day: '2-digit',
+      hour: '2-digit',
+      minute: '2-digit',
+      weekday: 'short',
+      hourCycle: 'h23',
+    })
+      .formatToParts(now)
+      .map((p) => [p.type, p.value])
+  );
+  const date = `${parts.year}-${parts.month}-${parts.day}`;
+  return {
+    date,
+    hourKey: `${date}T${parts.hour}:00`,
+    hour: Number(parts.hour),
+    hhmm: `${parts.hour}:${parts.minute}`,
+    weekday: DAY_KEYS.indexOf(parts.weekday.toLowerCase()),
+  };
+}
+
+/**
+ * 按 bundle 为 now 选择内容（target_id）
+ * 预报不覆盖当前小时（bundle 过旧或预报不可用）时返回 null，调用方回退到服务端当前内容
+ */
+export function selectBundleContent(bundle: SignBundle, now: Date = new Date()): string | null {
+  const local = localTime(now, bundle.store.timezone);
+  const hour = bundle.forecast.find((f) => f.time === local.hourKey);
+  if (!hour) return null;
+  if (!isOpenAt(bundle.store.opening_hours, local.weekday, local.hhmm)) return 'default';
+  const ctx: MatchContext = {
+    weather: new Set([hour.weather]),
+    city: bundle.context.city,
+    temp_c: hour.temp_c,
+    region: bundle.context.region,
+    hour: local.hour,
+    weekday: local.weekday,
+    china_subregion: bundle.context.china_subregion,
+    solar_terms: bundle.context.solar_terms[local.date] || [],
+  };
+  return selectTarget(bundle.rules, ctx);
+}
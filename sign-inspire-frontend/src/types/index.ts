@@ -14,4 +14,48 @@ export interface Rule {
   priority: number;
   conditions: Condition[];
   action: Action;
-}
\ No newline at end of file
+}
+/** 编译后的规则条件（与后端 rule_evaluator 编译格式一致） */
+export type CompiledCondition =
+  | { type: 'weather'; any: string[] }
+  | { type: 'temp' | 'time'; range: [number, number] }
+  | { type: 'day'; days: number[] }
+  | { type: 'city' | 'region'; eq: string }
+  | { type: 'china_region' | 'solar_term'; eq: string | null };
+
+export interface CompiledRule {
+  id: string;
+  priority: number;
+  target_id: string;
+  message?: string | null;
+  conditions: CompiledCondition[];
+}
+
+export interface ForecastHour {
+  time: string; // 门店当地时间 "YYYY-MM-DDTHH:00"
+  weather: string;
+  temp_c: number | null;
+  is_day: number;
+}
+
+/** /signs/{sign_id}/bundle：屏幕本地求值所需的全部数据 */
+export interface SignBundle {
+  version: string;
+  generated_at: string;
+  store: {
+    id: string;
+    name?: string;
+    city?: string;
+    timezone: string;
+    opening_hours?: Record<string, string> | null;
+  };
+  context: {
+    city: string;
+    region: string;
+    china_subregion: string | null;
+    solar_terms: Record<string, string[]>; // 日期 -> 当日节气
+  };
+  rules: CompiledRule[]; // 已按求值顺序排列（优先级降序 -> 门店自有/全局/模板 -> id），与服务端一致
+  forecast: ForecastHour[];
+  media: Record<string, string>; // target_id -> 图片 URL
+}